@@ -0,0 +1,215 @@
+"""
+Pytinerary benchmarks - Deterministic synthetic network generator.
+
+Networks are built from a seed only, so the same parameters always produce the
+same timetable and the same query set on every machine and every commit.
+"""
+import datetime
+import math
+import random
+
+import pytinerary
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+START_DATE = datetime.datetime(2023, 9, 1)
+
+
+def schema() -> pytinerary.TimetableSchema:
+    """
+    Get the schema used by generated timetables.
+    @return: A TimetableSchema object.
+    """
+    return pytinerary.TimetableSchema(
+        "uid", "dep_time", "arr_time", "location", DATETIME_FORMAT, "locations"
+    )
+
+
+def _grid_lines(stops: int, routes: int, rng: random.Random) -> list:
+    """
+    Build stop sequences for a grid network, alternating rows and columns.
+    @param stops: Number of stops.
+    @param routes: Number of routes.
+    @param rng: Random number generator.
+    @return: List of stop sequences, one per route.
+    """
+    width = max(2, math.isqrt(stops))
+    height = max(2, math.ceil(stops / width))
+    lines = []
+    for route in range(routes):
+        if route % 2 == 0:
+            row = (route // 2) % height
+            line = [row * width + col for col in range(width)]
+        else:
+            col = (route // 2) % width
+            line = [row * width + col for row in range(height)]
+        line = [stop for stop in line if stop < stops]
+        if rng.random() < 0.5:
+            line.reverse()
+        lines.append(line)
+    return lines
+
+
+def _radial_lines(stops: int, routes: int, rng: random.Random) -> list:
+    """
+    Build stop sequences for a radial network: spokes meeting at stop 0, with
+    every route running from one spoke through the hub to another.
+    @param stops: Number of stops.
+    @param routes: Number of routes.
+    @param rng: Random number generator.
+    @return: List of stop sequences, one per route.
+    """
+    spokes = max(2, routes)
+    per_spoke = max(1, (stops - 1) // spokes)
+    spoke_stops = [
+        [1 + spoke * per_spoke + i for i in range(per_spoke)]
+        for spoke in range(spokes)
+    ]
+    lines = []
+    for route in range(routes):
+        inbound = spoke_stops[route % spokes]
+        outbound = spoke_stops[(route + 1 + rng.randrange(spokes - 1)) % spokes]
+        lines.append(list(reversed(inbound)) + [0] + outbound)
+    return lines
+
+
+def _regional_lines(stops: int, routes: int, rng: random.Random) -> list:
+    """
+    Build stop sequences for a regional network: towns of 25 stops, each
+    served by its own grid of local routes, and an intercity route linking
+    the first stop of every town.
+    @param stops: Number of stops.
+    @param routes: Number of routes.
+    @param rng: Random number generator.
+    @return: List of stop sequences, one per route.
+    """
+    town_size = 25
+    width = 5
+    towns = max(2, math.ceil(stops / town_size))
+    lines = [[town * town_size for town in range(towns) if town * town_size < stops]]
+    for route in range(max(0, routes - 1)):
+        first = (route % towns) * town_size
+        local = route // towns
+        if local % 2 == 0:
+            row = (local // 2) % width
+            line = [first + row * width + col for col in range(width)]
+        else:
+            col = (local // 2) % width
+            line = [first + row * width + col for row in range(width)]
+        line = [stop for stop in line if stop < stops]
+        if len(line) > 1:
+            lines.append(line)
+    return lines
+
+
+def generate_network(
+    kind: str = "grid",
+    stops: int = 100,
+    routes: int = 20,
+    headway: int = 15,
+    days: int = 1,
+    service_hours: tuple = (5, 24),
+    seed: int = 1,
+) -> tuple:
+    """
+    Generate a synthetic timetable.
+    @param kind: (Optional, default "grid") "grid", "radial" or "regional".
+    @param stops: (Optional, default 100) Number of stops.
+    @param routes: (Optional, default 20) Number of routes. Every route runs in
+    both directions.
+    @param headway: (Optional, default 15) Minutes between trips on a route.
+    @param days: (Optional, default 1) Number of service days.
+    @param service_hours: (Optional, default (5, 24)) First and last hour of
+    service on each day.
+    @param seed: (Optional, default 1) Seed for the random number generator.
+    @return: Tuple of (timetable data as a list of services, dict of Location
+    objects keyed by identifier).
+    """
+    rng = random.Random(seed)
+    if kind == "grid":
+        lines = _grid_lines(stops, routes, rng)
+    elif kind == "radial":
+        lines = _radial_lines(stops, routes, rng)
+    elif kind == "regional":
+        lines = _regional_lines(stops, routes, rng)
+    else:
+        raise ValueError("Network kind must be grid, radial or regional")
+
+    locations = {
+        str(stop): pytinerary.Location(str(stop), f"Stop {stop}", rng.choice([0, 1, 2]))
+        for stop in range(stops)
+    }
+
+    services = []
+    for route, line in enumerate(lines):
+        hop_minutes = [rng.randint(2, 5) for _ in range(len(line) - 1)]
+        offset = rng.randrange(headway)
+        for direction, sequence in enumerate([line, list(reversed(line))]):
+            hops = hop_minutes if direction == 0 else list(reversed(hop_minutes))
+            for day in range(days):
+                service_day = START_DATE + datetime.timedelta(days=day)
+                minute = service_hours[0] * 60 + offset
+                trip = 0
+                while minute < service_hours[1] * 60:
+                    services.append(
+                        _trip(
+                            f"{route}-{direction}-{day}-{trip}",
+                            sequence,
+                            hops,
+                            service_day + datetime.timedelta(minutes=minute),
+                        )
+                    )
+                    minute += headway
+                    trip += 1
+    return services, locations
+
+
+def _trip(uid: str, sequence: list, hops: list, start: datetime.datetime) -> dict:
+    """
+    Build one service in the schema format, with a one minute dwell at every
+    intermediate stop.
+    @param uid: Unique identifier of the service.
+    @param sequence: Stop sequence.
+    @param hops: Minutes between consecutive stops.
+    @param start: Departure time from the first stop.
+    @return: The service as a dict.
+    """
+    stops = [{"dep_time": start.strftime(DATETIME_FORMAT), "location": str(sequence[0])}]
+    time = start
+    for index, stop in enumerate(sequence[1:]):
+        time += datetime.timedelta(minutes=hops[index])
+        entry = {"arr_time": time.strftime(DATETIME_FORMAT), "location": str(stop)}
+        if index < len(sequence) - 2:
+            time += datetime.timedelta(minutes=1)
+            entry["dep_time"] = time.strftime(DATETIME_FORMAT)
+        stops.append(entry)
+    return {"uid": uid, "locations": stops}
+
+
+def generate_queries(
+    locations: dict,
+    count: int,
+    days: int = 1,
+    service_hours: tuple = (5, 24),
+    seed: int = 2,
+) -> list:
+    """
+    Generate a deterministic list of queries over a network.
+    @param locations: Dict of Location objects keyed by identifier.
+    @param count: Number of queries.
+    @param days: (Optional, default 1) Number of service days in the network.
+    @param service_hours: (Optional, default (5, 24)) Service hours the
+    planned times are drawn from.
+    @param seed: (Optional, default 2) Seed for the random number generator.
+    @return: List of (origin, destination, planned time) tuples.
+    """
+    rng = random.Random(seed)
+    keys = sorted(locations.keys(), key=int)
+    queries = []
+    for _ in range(count):
+        origin, destination = rng.sample(keys, 2)
+        minute = rng.randrange(service_hours[0] * 60, service_hours[1] * 60)
+        planned_time = START_DATE + datetime.timedelta(
+            days=rng.randrange(days), minutes=minute
+        )
+        queries.append((locations[origin], locations[destination], planned_time))
+    return queries
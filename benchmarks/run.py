@@ -0,0 +1,342 @@
+"""
+Pytinerary benchmarks - Benchmark runner.
+
+Usage:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json --threshold 0.1
+
+Every metric is "lower is better". When a baseline file is given, the run
+fails with exit code 1 if any metric is worse than the baseline by more than
+the threshold.
+"""
+import argparse
+import gc
+import io
+import json
+import pickle
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pytinerary
+
+from . import network
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """
+    Nearest-rank percentile of a list of samples.
+    @param samples: List of numbers.
+    @param fraction: Percentile as a fraction between 0 and 1.
+    @return: The percentile.
+    """
+    if len(samples) == 0:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _time_queries(engine, queries: list, arrive_by: bool) -> list:
+    """
+    Time each query individually.
+    @return: List of latencies in milliseconds.
+    """
+    latencies = []
+    for origin, destination, planned_time in queries:
+        start = time.perf_counter()
+        engine.generate_itinerary(origin, destination, planned_time, arrive_by)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run(args: argparse.Namespace) -> dict:
+    """
+    Run the benchmark suite.
+    @param args: Parsed command line arguments.
+    @return: Results as a dict.
+    """
+    services, locations = network.generate_network(
+        args.kind, args.stops, args.routes, args.headway, args.days, seed=args.seed
+    )
+    queries = network.generate_queries(
+        locations, args.queries, args.days, seed=args.seed + 1
+    )
+    metrics = {}
+
+    gc.collect()
+    start = time.perf_counter()
+    timetable = pytinerary.Timetable()
+    timetable.parse_list(services, network.schema())
+    metrics["parse_list_s"] = time.perf_counter() - start
+    connections = len(timetable.get_connections())
+
+    # Memory is measured on a second parse, as tracing slows parsing down.
+    gc.collect()
+    tracemalloc.start()
+    traced = pytinerary.Timetable()
+    traced.parse_list(services, network.schema())
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+    metrics["memory_per_connection_bytes"] = memory / max(1, connections)
+
+    start = time.perf_counter()
+    engine = pytinerary.ItineraryEngine(timetable, locations)
+    metrics["compile_s"] = time.perf_counter() - start
+
+    for name, arrive_by in [("query", False), ("arrive_by_query", True)]:
+        latencies = _time_queries(engine, queries, arrive_by)
+        metrics[f"{name}_p50_ms"] = percentile(latencies, 0.50)
+        metrics[f"{name}_p95_ms"] = percentile(latencies, 0.95)
+        metrics[f"{name}_p99_ms"] = percentile(latencies, 0.99)
+
+    # Lower bounds are computed on the first query to each destination, so
+    # they are part of these latencies.
+    goal_directed = pytinerary.ItineraryEngine(timetable, locations, goal_directed=True)
+    latencies = _time_queries(goal_directed, queries, False)
+    metrics["goal_directed_query_p50_ms"] = percentile(latencies, 0.50)
+    metrics["goal_directed_query_p95_ms"] = percentile(latencies, 0.95)
+    metrics["goal_directed_query_p99_ms"] = percentile(latencies, 0.99)
+
+    # Three alternatives per query from a single scan.
+    latencies = []
+    for origin, destination, planned_time in queries:
+        start = time.perf_counter()
+        engine.generate_itinerary(origin, destination, planned_time, alternatives=3)
+        latencies.append((time.perf_counter() - start) * 1000)
+    metrics["alternatives_query_p50_ms"] = percentile(latencies, 0.50)
+    metrics["alternatives_query_p95_ms"] = percentile(latencies, 0.95)
+    metrics["alternatives_query_p99_ms"] = percentile(latencies, 0.99)
+
+    # The same queries with a profiler listening and sampling, to keep an eye
+    # on its overhead.
+    profiler = pytinerary.QueryProfiler()
+    engine.add_query_listener(profiler)
+    profiler.start()
+    latencies = _time_queries(engine, queries, False)
+    profiler.stop()
+    engine.remove_query_listener(profiler)
+    metrics["profiled_query_p50_ms"] = percentile(latencies, 0.50)
+    metrics["profiled_query_p95_ms"] = percentile(latencies, 0.95)
+    metrics["profiled_query_p99_ms"] = percentile(latencies, 0.99)
+
+    # Late evening queries carrying on into the next day, which only applies
+    # when the timetable holds a single day.
+    if args.days == 1:
+        overnight = pytinerary.ItineraryEngine(timetable, locations, horizon=1)
+        late_queries = [
+            (origin, destination, planned_time.replace(hour=23))
+            for origin, destination, planned_time in queries
+        ]
+        latencies = _time_queries(overnight, late_queries, False)
+        metrics["overnight_query_p50_ms"] = percentile(latencies, 0.50)
+        metrics["overnight_query_p95_ms"] = percentile(latencies, 0.95)
+        metrics["overnight_query_p99_ms"] = percentile(latencies, 0.99)
+
+    start = time.perf_counter()
+    raptor = pytinerary.RaptorEngine(timetable, locations)
+    metrics["raptor_build_s"] = time.perf_counter() - start
+    for name, arrive_by in [("raptor_query", False), ("raptor_arrive_by_query", True)]:
+        latencies = _time_queries(raptor, queries, arrive_by)
+        metrics[f"{name}_p50_ms"] = percentile(latencies, 0.50)
+        metrics[f"{name}_p95_ms"] = percentile(latencies, 0.95)
+        metrics[f"{name}_p99_ms"] = percentile(latencies, 0.99)
+
+    # Hub profiles: queries between the first few locations, answered by a
+    # scan and by a profile lookup.
+    hubs = list(locations.values())[: args.hubs]
+    pairs = [(origin, destination) for origin in hubs for destination in hubs if origin is not destination]
+    if pairs:
+        start = time.perf_counter()
+        profiled = pytinerary.ItineraryEngine(timetable, locations)
+        profiled.build_hub_profiles(hubs)
+        metrics["hub_profiles_build_s"] = time.perf_counter() - start
+        hub_queries = [
+            (*pairs[n % len(pairs)], planned_time)
+            for n, (_, _, planned_time) in enumerate(queries)
+        ]
+        for name, hub_engine in [("hub_scan_query", engine), ("hub_profile_query", profiled)]:
+            latencies = _time_queries(hub_engine, hub_queries, False)
+            metrics[f"{name}_p50_ms"] = percentile(latencies, 0.50)
+            metrics[f"{name}_p95_ms"] = percentile(latencies, 0.95)
+            metrics[f"{name}_p99_ms"] = percentile(latencies, 0.99)
+
+    # Partitioned scans only pay off when most services stay within a cell,
+    # as on the regional network.
+    start = time.perf_counter()
+    partitioned = pytinerary.ItineraryEngine(timetable, locations)
+    partitioned.build_partition(args.cell_size)
+    metrics["partition_build_s"] = time.perf_counter() - start
+    for name, arrive_by in [
+        ("partition_query", False),
+        ("partition_arrive_by_query", True),
+    ]:
+        latencies = _time_queries(partitioned, queries, arrive_by)
+        metrics[f"{name}_p50_ms"] = percentile(latencies, 0.50)
+        metrics[f"{name}_p95_ms"] = percentile(latencies, 0.95)
+        metrics[f"{name}_p99_ms"] = percentile(latencies, 0.99)
+
+    # Bulk validation of the whole timetable, which is already compiled.
+    start = time.perf_counter()
+    timetable.validate(locations)
+    metrics["validate_s"] = time.perf_counter() - start
+
+    # Round trip of the timetable and engine through pickle, as when they are
+    # sent to worker processes, with the columns as out-of-band buffers.
+    buffers = []
+    start = time.perf_counter()
+    data = pickle.dumps(engine, protocol=5, buffer_callback=buffers.append)
+    metrics["pickle_dump_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    pickle.loads(data, buffers=buffers)
+    metrics["pickle_load_s"] = time.perf_counter() - start
+    metrics["pickle_bytes_per_connection"] = (
+        len(data) + sum(len(buffer.raw()) for buffer in buffers)
+    ) / max(1, connections)
+
+    # Compressed archive of the timetable, and reading a single window of it
+    # back into columns.
+    buffer = io.BytesIO()
+    start = time.perf_counter()
+    timetable.save_archive(buffer)
+    metrics["archive_write_s"] = time.perf_counter() - start
+    metrics["archive_bytes_per_connection"] = len(buffer.getvalue()) / max(
+        1, connections
+    )
+    buffer.seek(0)
+    archive = pytinerary.TimetableArchive(buffer)
+    window_start, window_end, _ = archive.get_windows()[0]
+    start = time.perf_counter()
+    archive.read(window_start, window_end)
+    metrics["archive_read_window_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _time_queries(engine, queries, False)
+    batch = time.perf_counter() - start
+    metrics["batch_s"] = batch
+    metrics["batch_ms_per_query"] = batch * 1000 / max(1, len(queries))
+
+    # The same queries through the batch API, plus a burst of queries from
+    # the same origins and times to every other location, which share scans.
+    start = time.perf_counter()
+    engine.generate_itineraries(queries)
+    metrics["batch_api_s"] = time.perf_counter() - start
+    burst = [
+        (origin, destination, planned_time)
+        for origin, _, planned_time in queries[:10]
+        for destination in list(locations.values())[:20]
+        if destination is not origin
+    ]
+    start = time.perf_counter()
+    _time_queries(engine, burst, False)
+    metrics["burst_single_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    engine.generate_itineraries(burst)
+    metrics["burst_batch_s"] = time.perf_counter() - start
+
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "parameters": {
+            "kind": args.kind,
+            "stops": args.stops,
+            "routes": args.routes,
+            "headway": args.headway,
+            "days": args.days,
+            "queries": args.queries,
+            "seed": args.seed,
+            "hubs": args.hubs,
+            "cell_size": args.cell_size,
+            "connections": connections,
+        },
+        "metrics": metrics,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Compare results against a baseline.
+    @param results: Results of this run.
+    @param baseline: Results of an earlier run.
+    @param threshold: Allowed relative slowdown, e.g. 0.1 for 10%.
+    @return: List of (metric, baseline value, new value) for every regression.
+    """
+    regressions = []
+    for name, old in baseline["metrics"].items():
+        new = results["metrics"].get(name)
+        if new is not None and old > 0 and new > old * (1 + threshold):
+            regressions.append((name, old, new))
+    return regressions
+
+
+def _commit() -> str | None:
+    """
+    Get the current git commit, if there is one.
+    @return: Commit hash or None.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the pytinerary benchmarks.")
+    parser.add_argument("--kind", choices=["grid", "radial", "regional"], default="grid")
+    parser.add_argument("--stops", type=int, default=100)
+    parser.add_argument("--routes", type=int, default=20)
+    parser.add_argument("--headway", type=int, default=15, help="minutes")
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--hubs", type=int, default=10, help="locations to build hub profiles for"
+    )
+    parser.add_argument(
+        "--cell-size", type=int, default=25, help="locations per partition cell"
+    )
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="allowed relative regression against the baseline (default 0.1)",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["parameters"] != results["parameters"]:
+            print("Baseline was run with different parameters", file=sys.stderr)
+            return 2
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print(
+                f"REGRESSION {name}: {old:.6g} -> {new:.6g} "
+                f"({(new / old - 1) * 100:+.1f}%)",
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1 +1,12 @@
 from .pytinerary import *
+from .cache import *
+from .instrumentation import *
+from .transfers import *
+from .compiled import *
+from .archive import *
+from .journey import *
+from .filters import *
+from .raptor import *
+from .profiles import *
+from .partition import *
+from .validation import *
@@ -0,0 +1,393 @@
+"""
+Pytinerary - Command line batch query tool.
+
+Usage:
+    python -m pytinerary timetable.json --queries queries.jsonl > results.jsonl
+    python -m pytinerary timetable.bin --workers 4 < queries.jsonl
+
+Each query is a JSON object on its own line:
+    {"id": 1, "origin": "A", "destination": "C", "time": "2023-09-01 00:00:00"}
+with optional "arrive_by", "via", "modes", "operators", "avoid" and
+"alternatives" keys. One JSON line is written for each query, in the same
+order, holding its "id" and either its "itinerary", its "itineraries" when
+alternatives were asked for, or an "error". A summary with the throughput and the
+latency percentiles is written to stderr at the end.
+"""
+from collections import deque
+from collections.abc import Iterable, Iterator
+from typing import Any, TextIO
+
+import argparse
+import concurrent.futures
+import datetime
+import itertools
+import json
+import sys
+import time
+import zoneinfo
+
+from .filters import QueryFilter
+from .instrumentation import LatencyHistogram, QueryProfiler
+from .partition import Partition
+from .profiles import HubProfiles
+from .pytinerary import ItineraryEngine, Location, Timetable, TimetableSchema
+from .transfers import TransferGraph
+
+# Engine used by the queries of a worker process.
+_engine: ItineraryEngine | None = None
+
+
+def load_timetable(args: argparse.Namespace) -> Timetable:
+    """
+    Load the timetable named on the command line, either a JSON list of
+    services, the binary compiled format or an archive. Only the connections
+    departing between --start and --end are read from an archive.
+    @param args: Parsed command line arguments.
+    @return: A Timetable object.
+    """
+    file_format = args.format
+    data = b""
+    if file_format in ("auto", "json"):
+        # Only a short prefix is read to detect the format, so binary
+        # timetables and archives are not held in memory twice.
+        with open(args.timetable, "rb") as timetable_file:
+            prefix = timetable_file.read(64)
+            while prefix and not prefix.lstrip():
+                prefix = timetable_file.read(64)
+            if file_format == "auto":
+                if prefix[:4] == b"PYTA":
+                    file_format = "archive"
+                elif prefix.lstrip()[:1] in (b"[", b"{"):
+                    file_format = "json"
+                else:
+                    file_format = "binary"
+            if file_format == "json":
+                data = prefix + timetable_file.read()
+    if file_format == "binary":
+        return Timetable.load(args.timetable)
+    if file_format == "archive":
+        return Timetable.load_archive(
+            args.timetable,
+            datetime.datetime.fromisoformat(args.start) if args.start else None,
+            datetime.datetime.fromisoformat(args.end) if args.end else None,
+        )
+    timetable = Timetable(
+        timezone=zoneinfo.ZoneInfo(args.timezone) if args.timezone else None
+    )
+    schema = TimetableSchema(
+        args.uid_key,
+        args.dep_time_key,
+        args.arr_time_key,
+        args.location_key,
+        args.datetime_format,
+        args.list_key,
+    )
+    timetable.parse_list(json.loads(data), schema)
+    return timetable
+
+
+def load_engine(args: argparse.Namespace) -> ItineraryEngine:
+    """
+    Build the engine described by the command line arguments.
+    @param args: Parsed command line arguments.
+    @return: An ItineraryEngine object.
+    """
+    timetable = load_timetable(args)
+    if args.locations:
+        with open(args.locations, encoding="utf-8") as locations_file:
+            described = json.load(locations_file)
+        locations = {
+            location_id: Location(
+                location_id,
+                location.get("name", location_id),
+                location.get("minimum_connection_time", 0),
+            )
+            for location_id, location in described.items()
+        }
+    else:
+        locations = {
+            location_id: Location(location_id, location_id, 0)
+            for location_id in timetable.compile().get_stop_ids()
+        }
+    return ItineraryEngine(
+        timetable,
+        locations,
+        transfers=TransferGraph.from_gtfs(args.transfers) if args.transfers else None,
+        goal_directed=args.goal_directed,
+        hub_profiles=HubProfiles.load(args.hub_profiles) if args.hub_profiles else None,
+        partition=Partition.load(args.partition) if args.partition else None,
+        horizon=args.horizon,
+        period=args.period,
+    )
+
+
+def parse_query(query: dict, engine: ItineraryEngine) -> tuple:
+    """
+    Turn a decoded query line into generate_itinerary() parameters.
+    @param query: Decoded query.
+    @param engine: Engine the query is for.
+    @return: Tuple of (origin, destination, planned time, arrive by, query
+    filter, via locations).
+    """
+    if isinstance(query, dict) != True:
+        raise TypeError("Query must be a JSON object")
+    locations = engine.get_locations()
+
+    def location(location_id: Any) -> Location:
+        if location_id not in locations:
+            raise ValueError(f"Location {location_id} does not exist")
+        return locations[location_id]
+
+    query_filter = None
+    if any(key in query for key in ("modes", "operators", "avoid")):
+        query_filter = QueryFilter(
+            modes=query.get("modes"),
+            operators=query.get("operators"),
+            avoid=query.get("avoid", ()),
+        )
+    return (
+        location(query["origin"]),
+        location(query["destination"]),
+        datetime.datetime.fromisoformat(query["time"]),
+        query.get("arrive_by", False),
+        query_filter,
+        [location(location_id) for location_id in query.get("via", [])],
+    )
+
+
+def format_itinerary(route: list) -> list[dict]:
+    """
+    Turn an itinerary into JSON-serialisable dicts, one per connection or
+    footpath. Footpaths have a null uid.
+    @param route: List of Connection and Footpath objects.
+    @return: List of dicts.
+    """
+    return [
+        {
+            "uid": leg.get_uid(),
+            "dep_loc": leg.get_dep_loc(),
+            "arr_loc": leg.get_arr_loc(),
+            "dep_time": leg.get_dep_time().isoformat(),
+            "arr_time": leg.get_arr_time().isoformat(),
+        }
+        for leg in route
+    ]
+
+
+def run_queries(
+    engine: ItineraryEngine, lines: list[str]
+) -> list[tuple[str, float | None]]:
+    """
+    Run the queries of some input lines.
+    @param engine: Engine to run the queries with.
+    @param lines: Input lines, each holding one JSON query.
+    @return: List of (output line, latency in milliseconds) tuples, with no
+    latency for queries that failed.
+    """
+    results = []
+    for line in lines:
+        query_id = None
+        try:
+            query = json.loads(line)
+            if isinstance(query, dict):
+                query_id = query.get("id")
+            parameters = parse_query(query, engine)
+            alternatives = query.get("alternatives")
+            start = time.perf_counter()
+            route = engine.generate_itinerary(*parameters, alternatives=alternatives)
+            latency = (time.perf_counter() - start) * 1000
+        except (KeyError, TypeError, ValueError) as error:
+            message = str(error)
+            if isinstance(error, KeyError):
+                message = f"Missing key {error}"
+            results.append((json.dumps({"id": query_id, "error": message}), None))
+            continue
+        if alternatives is None:
+            output = {"id": query_id, "itinerary": format_itinerary(route)}
+        else:
+            output = {
+                "id": query_id,
+                "itineraries": [format_itinerary(itinerary) for itinerary in route],
+            }
+        results.append((json.dumps(output), latency))
+    return results
+
+
+def _init_worker(engine: ItineraryEngine) -> None:
+    """
+    Keep the engine sent to a worker process for its queries.
+    @param engine: Unpickled engine.
+    """
+    global _engine
+    _engine = engine
+
+
+def _run_worker_queries(lines: list[str]) -> list[tuple[str, float | None]]:
+    """
+    Run the queries of some input lines in a worker process.
+    @param lines: Input lines.
+    @return: See run_queries().
+    """
+    return run_queries(_engine, lines)  # type: ignore
+
+
+def _chunks(lines: Iterable[str], size: int) -> Iterator[list[str]]:
+    """
+    Group the non-blank input lines into chunks.
+    @param lines: Input lines.
+    @param size: Number of lines per chunk.
+    @return: Iterator over lists of lines.
+    """
+    lines = (line for line in lines if line.strip())
+    while True:
+        chunk = list(itertools.islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream(
+    engine: ItineraryEngine,
+    lines: Iterable[str],
+    output: TextIO,
+    workers: int = 1,
+    chunk_size: int = 64,
+) -> dict:
+    """
+    Run every query read from the input lines and write the results in input
+    order. With several workers, chunks of lines are run by a pool of
+    processes, each holding a copy of the engine, and only a few chunks per
+    worker are read ahead of the output.
+    @param engine: Engine to run the queries with.
+    @param lines: Input lines, each holding one JSON query.
+    @param output: Text stream the results are written to.
+    @param workers: (Optional, default 1) Number of worker processes, 1 to
+    run the queries in this process.
+    @param chunk_size: (Optional, default 64) Number of lines sent to a worker
+    at a time.
+    @return: Summary of the run.
+    """
+    histogram = LatencyHistogram()
+    errors = 0
+
+    def write(results: list[tuple[str, float | None]]) -> None:
+        nonlocal errors
+        for line, latency in results:
+            output.write(line + "\n")
+            if latency is None:
+                errors += 1
+            else:
+                histogram.record(latency)
+
+    started = time.perf_counter()
+    if workers == 1:
+        for chunk in _chunks(lines, chunk_size):
+            write(run_queries(engine, chunk))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(engine,)
+        ) as executor:
+            pending: deque = deque()
+            for chunk in _chunks(lines, chunk_size):
+                pending.append(executor.submit(_run_worker_queries, chunk))
+                if len(pending) >= 2 * workers:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    output.flush()
+    wall = time.perf_counter() - started
+
+    latency = histogram.to_dict()
+    del latency["buckets"]
+    return {
+        "queries": len(histogram) + errors,
+        "errors": errors,
+        "workers": workers,
+        "wall_s": wall,
+        "queries_per_s": (len(histogram) + errors) / wall if wall > 0 else 0.0,
+        "latency_ms": latency,
+    }
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m pytinerary",
+        description="Run itinerary queries read as JSON lines.",
+    )
+    parser.add_argument(
+        "timetable", help="JSON timetable, binary compiled file or archive"
+    )
+    parser.add_argument(
+        "--format", choices=["auto", "json", "binary", "archive"], default="auto"
+    )
+    parser.add_argument("--start", help="earliest departure to read from an archive")
+    parser.add_argument("--end", help="departure to stop before in an archive")
+    parser.add_argument("--queries", help="JSON lines file (default stdin)")
+    parser.add_argument("--output", help="file to write results to (default stdout)")
+    parser.add_argument(
+        "--locations",
+        help="JSON object of location identifier to name and "
+        "minimum_connection_time (default every timetable location, no "
+        "minimum connection time)",
+    )
+    parser.add_argument("--transfers", help="GTFS transfers.txt file")
+    parser.add_argument("--hub-profiles", help="hub profiles binary file")
+    parser.add_argument("--partition", help="partition binary file")
+    parser.add_argument("--goal-directed", action="store_true")
+    parser.add_argument(
+        "--horizon",
+        type=int,
+        default=0,
+        help="repetitions of the timetable a scan may continue into (default 0)",
+    )
+    parser.add_argument(
+        "--period",
+        type=int,
+        default=86400,
+        help="seconds after which the timetable repeats (default 86400)",
+    )
+    parser.add_argument(
+        "--profile",
+        help="file to write profiling metrics to in the Prometheus text format "
+        "(only with --workers 1)",
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=64, help="lines per task")
+    parser.add_argument("--timezone", help="timezone of a JSON timetable")
+    parser.add_argument("--uid-key", default="uid")
+    parser.add_argument("--dep-time-key", default="dep_time")
+    parser.add_argument("--arr-time-key", default="arr_time")
+    parser.add_argument("--location-key", default="location")
+    parser.add_argument("--list-key", default="locations")
+    parser.add_argument("--datetime-format", default="%Y-%m-%d %H:%M:%S")
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error("--workers and --chunk-size must be at least 1")
+    if args.profile and args.workers != 1:
+        parser.error("--profile can only be used with --workers 1")
+
+    engine = load_engine(args)
+    profiler = None
+    if args.profile:
+        profiler = QueryProfiler()
+        engine.add_query_listener(profiler)
+        profiler.start()
+    queries = open(args.queries, encoding="utf-8") if args.queries else sys.stdin
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        summary = stream(engine, queries, output, args.workers, args.chunk_size)
+    finally:
+        if args.queries:
+            queries.close()
+        if args.output:
+            output.close()
+        if profiler is not None:
+            profiler.stop()
+    if profiler is not None:
+        profiler.write_prometheus(args.profile)
+    print(json.dumps(summary), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
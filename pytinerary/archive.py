@@ -0,0 +1,318 @@
+"""
+Pytinerary - Compressed archive of a compiled timetable.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from array import array
+from typing import BinaryIO
+
+import bisect
+import datetime
+import json
+import operator
+import struct
+import sys
+import zlib
+
+from .compiled import (
+    CompiledTimetable,
+    TimeConverter,
+    _dump_timezone,
+    _little_endian,
+    _load_timezone,
+    _read_header,
+)
+
+_MAGIC = b"PYTA"
+_FORMAT_VERSION = 1
+# Typecodes a chunk column may be stored as, smallest first.
+_TYPECODES = ["B", "b", "H", "h", "I", "i", "q"]
+# Typecodes of the decoded columns: departure time deltas, durations,
+# departure stops, arrival stops, trips and other data positions.
+_COLUMN_TYPECODES = ["q", "q", "i", "i", "i", "i"]
+
+
+class TimetableArchive(object):
+    """
+    Compressed archive of a compiled timetable. Connections are split into
+    chunks by departure time window, and each chunk is compressed on its own,
+    so any window can be read without decoding the others. Within a chunk,
+    the departure time of a connection is stored as the time since the
+    previous departure of its trip in the chunk (or since the start of the
+    window), and its arrival time as the time since its departure. Locations,
+    services and other data are stored once, in the header, and referred to by
+    position.
+    """
+
+    def __init__(self, file: str | BinaryIO) -> None:
+        """
+        Open an archive written by TimetableArchive.write(). Only the header
+        and the chunk index are read; chunks are read when they are asked for.
+        @param file: Path or seekable binary file. A binary file must be kept
+        open while the archive is read.
+        """
+        if isinstance(file, str):
+            with open(file, "rb") as binary_file:
+                self.__read_index(binary_file)
+        else:
+            self.__read_index(file)
+        self.__file = file
+
+    def __read_index(self, file: BinaryIO) -> None:
+        """
+        Read the header and chunk index of the archive.
+        @param file: Binary file positioned at the start of the archive.
+        """
+        header = _read_header(file, _MAGIC, "timetable archive")
+        if header["format"] != _FORMAT_VERSION:
+            raise ValueError("Unsupported timetable archive format")
+        self.__converter = TimeConverter(
+            datetime.datetime.fromisoformat(header["epoch"]),
+            _load_timezone(header["timezone"]),
+            header.get("aware", False),
+        )
+        self.__window = header["window"]
+        self.__count = header["count"]
+        self.__stop_ids = header["stop_ids"]
+        self.__trip_ids = header["trip_ids"]
+        self.__other_data = header["other_data"]
+        self.__chunks = header["chunks"]
+        self.__data_start = file.tell()
+
+    def __len__(self) -> int:
+        return self.__count
+
+    @classmethod
+    def write(
+        cls, compiled: CompiledTimetable, file: str | BinaryIO, window: int = 86400
+    ) -> None:
+        """
+        Write a compiled timetable as an archive. Other data must be JSON
+        serialisable, and the timezone (if any) must be a zoneinfo.ZoneInfo or
+        a fixed datetime.timezone.
+        @param compiled: CompiledTimetable to write.
+        @param file: Path or binary file.
+        @param window: (Optional, default 86400) Length of the departure time
+        windows in seconds. Windows start at multiples of it since the epoch.
+        """
+        if isinstance(window, int) != True or isinstance(window, bool):
+            raise TypeError("Window must be an integer number of seconds")
+        if window < 1:
+            raise ValueError("Window must be at least one second")
+        if isinstance(file, str):
+            with open(file, "wb") as binary_file:
+                return cls.write(compiled, binary_file, window)
+        dep_times, arr_times, dep_stops, arr_stops, trips = compiled.get_columns()
+        other_data, other_data_index = compiled.get_other_data_table()
+        index = []
+        chunks = []
+        offset = 0
+        low = 0
+        while low < len(dep_times):
+            start = dep_times[low] // window * window
+            high = bisect.bisect_left(dep_times, start + window, low)
+            # The first connection of each trip in the chunk is stored from
+            # the start of the window, the others from the previous one.
+            previous: dict[int, int] = {}
+            deltas = []
+            for position in range(low, high):
+                dep_time = dep_times[position]
+                deltas.append(dep_time - previous.get(trips[position], start))
+                previous[trips[position]] = dep_time
+            columns = [
+                deltas,
+                list(map(operator.sub, arr_times[low:high], dep_times[low:high])),
+                dep_stops[low:high],
+                arr_stops[low:high],
+                trips[low:high],
+                other_data_index[low:high],
+            ]
+            packed = [_pack(column) for column in columns]
+            chunk = zlib.compress(b"".join(column.tobytes() for column in packed))
+            index.append(
+                [
+                    start,
+                    high - low,
+                    offset,
+                    len(chunk),
+                    "".join(column.typecode for column in packed),
+                ]
+            )
+            chunks.append(chunk)
+            offset += len(chunk)
+            low = high
+        converter = compiled.get_converter()
+        header = {
+            "format": _FORMAT_VERSION,
+            "epoch": converter.get_epoch().isoformat(),
+            "timezone": _dump_timezone(converter.get_timezone()),
+            "aware": converter.is_aware(),
+            "window": window,
+            "count": len(compiled),
+            "stop_ids": compiled.get_stop_ids(),
+            "trip_ids": compiled.get_trip_ids(),
+            "other_data": other_data,
+            "chunks": index,
+        }
+        encoded = json.dumps(header).encode("utf-8")
+        file.write(_MAGIC + struct.pack("<I", len(encoded)) + encoded)
+        for chunk in chunks:
+            file.write(chunk)
+
+    def get_converter(self) -> TimeConverter:
+        """
+        Get the converter between datetimes and the integer times of the
+        archived timetable.
+        @return: A TimeConverter object.
+        """
+        return self.__converter
+
+    def get_window(self) -> int:
+        """
+        Get the length of the departure time windows.
+        @return: Seconds.
+        """
+        return self.__window
+
+    def get_windows(self) -> list[tuple[datetime.datetime, datetime.datetime, int]]:
+        """
+        Get the windows holding at least one connection.
+        @return: List of (start, end, number of connections) tuples in order
+        of time, each window holding the connections departing at or after its
+        start and before its end.
+        """
+        from_seconds = self.__converter.from_seconds
+        return [
+            (
+                from_seconds(chunk[0]),
+                from_seconds(chunk[0] + self.__window),
+                chunk[1],
+            )
+            for chunk in self.__chunks
+        ]
+
+    def read(
+        self,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+    ) -> CompiledTimetable:
+        """
+        Read the connections departing in a time range as a compiled
+        timetable. Only the chunks of the windows overlapping the range are
+        read and decoded. Locations and services keep the same interned
+        positions as in the whole timetable.
+        @param start: (Optional, default None) Earliest departure time to
+        include, None to start at the first connection.
+        @param end: (Optional, default None) Departure time to stop before,
+        None to go on to the last connection.
+        @return: A CompiledTimetable object.
+        """
+        if isinstance(self.__file, str):
+            with open(self.__file, "rb") as binary_file:
+                return self.__read(binary_file, start, end)
+        return self.__read(self.__file, start, end)
+
+    def __read(
+        self,
+        file: BinaryIO,
+        start: datetime.datetime | None,
+        end: datetime.datetime | None,
+    ) -> CompiledTimetable:
+        """
+        Read the connections departing in a time range from an open file.
+        @param file: Binary file of the archive.
+        @param start: Earliest departure time, or None.
+        @param end: Departure time to stop before, or None.
+        @return: A CompiledTimetable object.
+        """
+        low = None if start is None else self.__converter.to_seconds(start)
+        high = None if end is None else self.__converter.to_seconds(end)
+        columns = [array(typecode) for typecode in _COLUMN_TYPECODES]
+        for window_start, count, offset, length, typecodes in self.__chunks:
+            if low is not None and window_start + self.__window <= low:
+                continue
+            if high is not None and window_start >= high:
+                break
+            file.seek(self.__data_start + offset)
+            data = file.read(length)
+            if len(data) != length:
+                raise ValueError("Timetable archive is truncated")
+            chunk = _unpack(zlib.decompress(data), typecodes, count)
+            columns[0].extend(_departures(window_start, chunk[0], chunk[4]))
+            for column, decoded in zip(columns[1:], chunk[1:]):
+                column.extend(decoded)
+        dep_times = columns[0]
+        first = 0 if low is None else bisect.bisect_left(dep_times, low)
+        last = len(dep_times) if high is None else bisect.bisect_left(dep_times, high)
+        if first > 0 or last < len(dep_times):
+            columns = [column[first:last] for column in columns]
+        dep_times = columns[0]
+        arr_times = array("q", map(operator.add, dep_times, columns[1]))
+        return CompiledTimetable(
+            self.__converter,
+            self.__stop_ids,
+            self.__trip_ids,
+            dep_times,
+            arr_times,
+            *columns[2:5],
+            self.__other_data,
+            columns[5],
+        )
+
+
+def _pack(column) -> array:
+    """
+    Store a column of integers in the smallest typecode that holds them all,
+    with its items in little-endian byte order.
+    """
+    low = min(column, default=0)
+    high = max(column, default=0)
+    for typecode in _TYPECODES:
+        bits = array(typecode).itemsize * 8
+        if typecode.isupper():
+            fits = low >= 0 and high < 2**bits
+        else:
+            fits = -(2 ** (bits - 1)) <= low and high < 2 ** (bits - 1)
+        if fits:
+            break
+    return _little_endian(array(typecode, column))
+
+
+def _unpack(data: bytes, typecodes: str, count: int) -> list[array]:
+    """
+    Split a decompressed chunk into its columns, widened to the typecodes
+    of the compiled timetable.
+    """
+    columns = []
+    offset = 0
+    for typecode, wide in zip(typecodes, _COLUMN_TYPECODES):
+        column = array(typecode)
+        size = column.itemsize * count
+        column.frombytes(data[offset : offset + size])
+        if sys.byteorder == "big":
+            column.byteswap()
+        offset += size
+        columns.append(column if typecode == wide else array(wide, column))
+    if offset != len(data):
+        raise ValueError("Timetable archive chunk is corrupt")
+    return columns
+
+
+def _departures(start: int, deltas: array, trips: array) -> list[int]:
+    """
+    Rebuild the departure times of a chunk from the time since the previous
+    departure of each trip, or since the start of the window.
+    """
+    previous: dict[int, int] = {}
+    dep_times = []
+    for delta, trip in zip(deltas, trips):
+        dep_time = previous[trip] = previous.get(trip, start) + delta
+        dep_times.append(dep_time)
+    return dep_times
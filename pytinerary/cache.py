@@ -0,0 +1,183 @@
+"""
+Pytinerary - Result cache for repeated itinerary queries.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import datetime
+import time
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_ONE_SECOND = datetime.timedelta(seconds=1)
+
+
+class QueryCache(object):
+    """
+    Size- and TTL-bounded LRU cache for itinerary results. Entries are tied to
+    the timetable version they were computed against, so any change to the
+    timetable invalidates the whole cache on the next lookup.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float = 60.0,
+        time_bucket: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Initialise the QueryCache object.
+        @param max_size: (Optional, default 1024) Maximum number of cached
+        results. The least recently used result is evicted first.
+        @param ttl: (Optional, default 60.0) Number of seconds a result stays
+        valid after being stored. 0 disables expiry.
+        @param time_bucket: (Optional, default 0) Width in seconds of the
+        planned time buckets used in the cache key. Queries whose planned times
+        fall into the same bucket share a result, so anything above 0 trades
+        exactness for hit rate. 0 keys on the exact planned time.
+        @param clock: (Optional, default time.monotonic) Function returning the
+        current time in seconds, used for expiry.
+        """
+        if max_size < 1:
+            raise ValueError("Maximum cache size must be at least 1")
+        if ttl < 0:
+            raise ValueError("TTL must not be negative")
+        if time_bucket < 0:
+            raise ValueError("Time bucket must not be negative")
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__time_bucket = time_bucket
+        self.__clock = clock
+        self.__entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self.__version = None
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __repr__(self) -> str:
+        return f"QueryCache({len(self.__entries)}/{self.__max_size}, ttl={self.__ttl})"
+
+    def __str__(self) -> str:
+        return f"QueryCache({len(self.__entries)}/{self.__max_size}, ttl={self.__ttl})"
+
+    def make_key(
+        self,
+        origin_id: str,
+        destination_id: str,
+        planned_time: datetime.datetime,
+        arrive_by: bool,
+        options: tuple = (),
+    ) -> tuple:
+        """
+        Build the cache key for a query.
+        @param origin_id: Origin location identifier.
+        @param destination_id: Destination location identifier.
+        @param planned_time: Planned departure/arrival time.
+        @param arrive_by: Whether planned_time is an arrival time.
+        @param options: (Optional, default ()) Any other hashable query options
+        that affect the result.
+        @return: A hashable key.
+        """
+        if self.__time_bucket == 0:
+            bucket: Any = planned_time
+        else:
+            seconds = (planned_time.replace(tzinfo=None) - _EPOCH) // _ONE_SECOND
+            bucket = (seconds // self.__time_bucket, planned_time.utcoffset())
+        return (origin_id, destination_id, bucket, arrive_by, options)
+
+    def get(self, key: Hashable, version: int) -> Any:
+        """
+        Look up a cached result.
+        @param key: Key built by make_key.
+        @param version: Current version of the timetable.
+        @return: The cached result, or None on a miss.
+        """
+        self.__check_version(version)
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.__misses += 1
+            return None
+        value, expires_at = entry
+        if self.__ttl and self.__clock() >= expires_at:
+            del self.__entries[key]
+            self.__evictions += 1
+            self.__misses += 1
+            return None
+        self.__entries.move_to_end(key)
+        self.__hits += 1
+        return value
+
+    def put(self, key: Hashable, version: int, value: Any) -> None:
+        """
+        Store a result.
+        @param key: Key built by make_key.
+        @param version: Version of the timetable the result was computed with.
+        @param value: Result to store.
+        """
+        self.__check_version(version)
+        self.__entries[key] = (value, self.__clock() + self.__ttl)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+            self.__evictions += 1
+
+    def clear(self) -> None:
+        """
+        Remove all cached results. Counters are kept.
+        """
+        self.__entries.clear()
+
+    def __check_version(self, version: int) -> None:
+        """
+        Drop every entry if the timetable has changed since they were stored.
+        @param version: Current version of the timetable.
+        """
+        if version != self.__version:
+            if len(self.__entries) > 0:
+                self.__invalidations += 1
+            self.__entries.clear()
+            self.__version = version
+
+    def get_hits(self) -> int:
+        """
+        Get the number of lookups that returned a cached result.
+        @return: Number of hits.
+        """
+        return self.__hits
+
+    def get_misses(self) -> int:
+        """
+        Get the number of lookups that found no valid cached result.
+        @return: Number of misses.
+        """
+        return self.__misses
+
+    def stats(self) -> dict:
+        """
+        Return statistics about the cache.
+        @return: A dict of statistics about the cache.
+        """
+        lookups = self.__hits + self.__misses
+        return {
+            "size": len(self.__entries),
+            "max_size": self.__max_size,
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "hit_rate": self.__hits / lookups if lookups else 0.0,
+            "evictions": self.__evictions,
+            "invalidations": self.__invalidations,
+            "version": self.__version,
+        }
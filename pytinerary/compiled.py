@@ -0,0 +1,657 @@
+"""
+Pytinerary - Compiled, column-oriented form of a timetable.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from array import array
+from collections.abc import Iterable
+from typing import Any, BinaryIO
+
+import datetime
+import json
+import pickle
+import struct
+import sys
+import zlib
+import zoneinfo
+
+DEFAULT_EPOCH = datetime.datetime(1970, 1, 1)
+_ONE_SECOND = datetime.timedelta(seconds=1)
+_MAGIC = b"PYTT"
+_FORMAT_VERSION = 1
+
+
+class TimeConverter(object):
+    """
+    Converts between datetimes and the integer seconds used inside the
+    library. Times are whole seconds since the epoch.
+
+    With a timezone, naive datetimes are taken to be local times in that
+    timezone, aware datetimes are converted exactly, and datetimes produced by
+    the converter are local times. Without a timezone, naive datetimes are
+    used as they are and aware datetimes are converted to UTC. Datetimes
+    produced by the converter are naive unless it is aware, in which case
+    they carry the timezone (or UTC without one), matching a timetable given
+    aware datetimes.
+    """
+
+    def __init__(
+        self,
+        epoch: datetime.datetime = DEFAULT_EPOCH,
+        timezone: datetime.tzinfo | None = None,
+        aware: bool = False,
+    ) -> None:
+        """
+        Initialise the TimeConverter object.
+        @param epoch: (Optional, default 1970-01-01) Time counted as 0.
+        @param timezone: (Optional, default None) Timezone of naive datetimes.
+        @param aware: (Optional, default False) True to produce aware
+        datetimes.
+        """
+        self.__timezone = timezone
+        self.__aware = aware
+        self.__epoch = epoch
+        if timezone is None:
+            self.__epoch_utc = _naive_utc(epoch)
+        else:
+            self.__epoch_utc = _naive_utc(_localise(epoch, timezone))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TimeConverter):
+            return (
+                self.__epoch == other.get_epoch()
+                and self.__timezone == other.get_timezone()
+                and self.__aware == other.is_aware()
+            )
+        return False
+
+    def get_epoch(self) -> datetime.datetime:
+        """
+        Get the epoch.
+        @return: Time counted as 0.
+        """
+        return self.__epoch
+
+    def get_timezone(self) -> datetime.tzinfo | None:
+        """
+        Get the timezone of naive datetimes.
+        @return: Timezone, or None.
+        """
+        return self.__timezone
+
+    def is_aware(self) -> bool:
+        """
+        Check whether the converter produces aware datetimes.
+        @return: True if it does.
+        """
+        return self.__aware
+
+    def to_seconds(self, value: datetime.datetime) -> int:
+        """
+        Convert a datetime into seconds since the epoch.
+        @param value: Datetime to convert.
+        @return: Seconds.
+        """
+        if self.__timezone is None:
+            return (_naive_utc(value) - self.__epoch_utc) // _ONE_SECOND
+        return (
+            _naive_utc(_localise(value, self.__timezone)) - self.__epoch_utc
+        ) // _ONE_SECOND
+
+    def from_seconds(self, seconds: int) -> datetime.datetime:
+        """
+        Convert seconds since the epoch into a datetime.
+        @param seconds: Seconds.
+        @return: Naive datetime, or aware if the converter is aware.
+        """
+        value = self.__epoch_utc + datetime.timedelta(seconds=seconds)
+        if self.__timezone is None:
+            if self.__aware:
+                return value.replace(tzinfo=datetime.timezone.utc)
+            return value
+        value = value.replace(tzinfo=datetime.timezone.utc).astimezone(
+            self.__timezone
+        )
+        if self.__aware:
+            return value
+        return value.replace(tzinfo=None)
+
+
+def _localise(value: datetime.datetime, timezone: datetime.tzinfo) -> datetime.datetime:
+    """
+    Attach a timezone to a naive datetime, leaving aware datetimes alone.
+    """
+    if value.utcoffset() is None:
+        return value.replace(tzinfo=timezone)
+    return value
+
+
+def _naive_utc(value: datetime.datetime) -> datetime.datetime:
+    """
+    Convert an aware datetime into a naive UTC one, leaving naive datetimes
+    alone.
+    """
+    offset = value.utcoffset()
+    if offset is None:
+        return value
+    return value.replace(tzinfo=None) - offset
+
+
+class CompiledTimetable(object):
+    """
+    Read-only, column-oriented form of a timetable. Connections are sorted by
+    departure time (then arrival time), and position i in every column
+    describes the same connection. Times are integer seconds since the epoch
+    of the timetable's TimeConverter; locations and services are interned as
+    positions into stop_ids and trip_ids.
+    """
+
+    def __init__(
+        self,
+        converter: TimeConverter,
+        stop_ids: list[str],
+        trip_ids: list[str],
+        dep_times: array,
+        arr_times: array,
+        dep_stops: array,
+        arr_stops: array,
+        trips: array,
+        other_data: list[dict],
+        other_data_index: array,
+        connections: list | None = None,
+    ) -> None:
+        """
+        Initialise the CompiledTimetable object. Use Timetable.compile() or
+        CompiledTimetable.load() rather than calling this directly.
+        @param connections: (Optional, default None) Connection objects in
+        column order. When not provided, connections are created from the
+        columns when they are asked for.
+        """
+        self.__converter = converter
+        self.__stop_ids = stop_ids
+        self.__trip_ids = trip_ids
+        self.__dep_times = dep_times
+        self.__arr_times = arr_times
+        self.__dep_stops = dep_stops
+        self.__arr_stops = arr_stops
+        self.__trips = trips
+        self.__other_data = other_data
+        self.__other_data_index = other_data_index
+        self.__connections = connections
+        self.__stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+        self.__boards: tuple | None = None
+        self.__next_in_trip: array | None = None
+        self.__fingerprint: int | None = None
+
+    @classmethod
+    def from_connections(
+        cls, connections: Iterable, converter: TimeConverter
+    ) -> "CompiledTimetable":
+        """
+        Compile a list of connections. If they have aware datetimes, times
+        are converted back into aware datetimes too.
+        @param connections: Iterable of Connection objects.
+        @param converter: TimeConverter for the timetable.
+        @return: A CompiledTimetable object.
+        """
+        to_seconds = converter.to_seconds
+        rows = sorted(
+            (
+                (
+                    to_seconds(connection.get_dep_time()),
+                    to_seconds(connection.get_arr_time()),
+                    n,
+                    connection,
+                )
+                for n, connection in enumerate(connections)
+            ),
+            key=lambda row: (row[0], row[1], row[2]),
+        )
+        stop_index: dict[str, int] = {}
+        trip_index: dict[str, int] = {}
+        other_data_index: dict[int, int] = {}
+        other_data: list[dict] = []
+        dep_stops = array("i")
+        arr_stops = array("i")
+        trips = array("i")
+        data_positions = array("i")
+        ordered = []
+        for _, _, _, connection in rows:
+            ordered.append(connection)
+            dep_stops.append(
+                stop_index.setdefault(connection.get_dep_loc(), len(stop_index))
+            )
+            arr_stops.append(
+                stop_index.setdefault(connection.get_arr_loc(), len(stop_index))
+            )
+            trips.append(trip_index.setdefault(connection.get_uid(), len(trip_index)))
+            data = connection.get_other_data()
+            position = other_data_index.get(id(data))
+            if position is None:
+                position = other_data_index[id(data)] = len(other_data)
+                other_data.append(data)
+            data_positions.append(position)
+        aware = bool(ordered) and ordered[0].get_dep_time().utcoffset() is not None
+        if aware != converter.is_aware():
+            converter = TimeConverter(
+                converter.get_epoch(), converter.get_timezone(), aware
+            )
+        return cls(
+            converter,
+            list(stop_index),
+            list(trip_index),
+            array("q", [row[0] for row in rows]),
+            array("q", [row[1] for row in rows]),
+            dep_stops,
+            arr_stops,
+            trips,
+            other_data,
+            data_positions,
+            ordered,
+        )
+
+    def __len__(self) -> int:
+        return len(self.__dep_times)
+
+    def get_converter(self) -> TimeConverter:
+        """
+        Get the converter between datetimes and the integer times used here.
+        @return: A TimeConverter object.
+        """
+        return self.__converter
+
+    def to_seconds(self, value: datetime.datetime) -> int:
+        """
+        Convert a datetime into the integer time used by the columns.
+        @param value: Datetime to convert.
+        @return: Seconds since the epoch.
+        """
+        return self.__converter.to_seconds(value)
+
+    def from_seconds(self, seconds: int) -> datetime.datetime:
+        """
+        Convert an integer time from the columns into a datetime.
+        @param seconds: Seconds since the epoch.
+        @return: Datetime.
+        """
+        return self.__converter.from_seconds(seconds)
+
+    def get_stop_ids(self) -> list[str]:
+        """
+        Get the location identifiers, indexed by interned stop.
+        @return: List of location identifiers.
+        """
+        return self.__stop_ids
+
+    def get_stop_index(self, location_id: str) -> int:
+        """
+        Get the interned stop of a location.
+        @param location_id: Location identifier.
+        @return: Interned stop, or -1 if no connection serves the location.
+        """
+        return self.__stop_index.get(location_id, -1)
+
+    def get_trip_ids(self) -> list[str]:
+        """
+        Get the service unique identifiers, indexed by interned trip.
+        @return: List of unique identifiers.
+        """
+        return self.__trip_ids
+
+    def get_columns(self) -> tuple[array, array, array, array, array]:
+        """
+        Get the connection columns.
+        @return: Tuple of (departure times, arrival times, departure stops,
+        arrival stops, trips).
+        """
+        return (
+            self.__dep_times,
+            self.__arr_times,
+            self.__dep_stops,
+            self.__arr_stops,
+            self.__trips,
+        )
+
+    def get_next_in_trip(self) -> array:
+        """
+        Get the next-in-trip pointers: for each connection, the position of
+        the connection of the same trip that leaves from where it arrives, or
+        -1 at the end of the trip. Built the first time it is needed.
+        @return: Array of positions.
+        """
+        if self.__next_in_trip is None:
+            dep_stops = self.__dep_stops
+            arr_stops = self.__arr_stops
+            trips = self.__trips
+            next_in_trip = array("i", [-1]) * len(self)
+            # Walking backwards, departures[trip][stop] is the earliest later
+            # connection of the trip leaving from the stop.
+            departures: dict[int, dict[int, int]] = {}
+            for position in range(len(self) - 1, -1, -1):
+                stops = departures.get(trips[position])
+                if stops is None:
+                    stops = departures[trips[position]] = {}
+                else:
+                    next_in_trip[position] = stops.get(arr_stops[position], -1)
+                stops[dep_stops[position]] = position
+            self.__next_in_trip = next_in_trip
+        return self.__next_in_trip
+
+    def get_other_data_table(self) -> tuple[list[dict], array]:
+        """
+        Get the distinct other data dicts and, for each connection, the
+        position of its other data among them.
+        @return: Tuple of (list of other data, array of positions).
+        """
+        return self.__other_data, self.__other_data_index
+
+    def get_other_data(self, position: int) -> dict:
+        """
+        Get the other data of a connection.
+        @param position: Position of the connection.
+        @return: Dict of other data.
+        """
+        return self.__other_data[self.__other_data_index[position]]
+
+    def get_connection(self, position: int, offset: int = 0):
+        """
+        Get a connection as a Connection object.
+        @param position: Position of the connection.
+        @param offset: (Optional, default 0) Seconds added to its times, to
+        get the connection of a later (or earlier) repetition of the
+        timetable.
+        @return: A Connection object.
+        """
+        if self.__connections is not None and offset == 0:
+            return self.__connections[position]
+        from .pytinerary import Connection
+
+        return Connection(
+            self.__trip_ids[self.__trips[position]],
+            self.from_seconds(self.__dep_times[position] + offset),
+            self.from_seconds(self.__arr_times[position] + offset),
+            self.__stop_ids[self.__dep_stops[position]],
+            self.__stop_ids[self.__arr_stops[position]],
+            other_data=self.get_other_data(position),
+        )
+
+    def get_connections(self) -> list:
+        """
+        Get every connection as a Connection object, in column order.
+        @return: List of Connection objects.
+        """
+        if self.__connections is None:
+            self.__connections = [self.get_connection(i) for i in range(len(self))]
+        return self.__connections
+
+    def get_board(self, location_id: str, arrivals: bool = False) -> tuple:
+        """
+        Get the departure or arrival board of a location.
+        @param location_id: Location identifier.
+        @param arrivals: (Optional, default False) Get the arrival board.
+        @return: Tuple of (times, positions), both sorted by time.
+        """
+        if self.__boards is None:
+            self.__boards = (self.__build_boards(False), self.__build_boards(True))
+        return self.__boards[arrivals].get(self.get_stop_index(location_id), ([], []))
+
+    def __build_boards(self, arrivals: bool) -> dict[int, tuple[list, list]]:
+        """
+        Build the departure or arrival boards of every stop.
+        @param arrivals: Build arrival boards.
+        @return: Dict of interned stop to (times, positions).
+        """
+        stops = self.__arr_stops if arrivals else self.__dep_stops
+        times = self.__arr_times if arrivals else self.__dep_times
+        positions: dict[int, list[int]] = {}
+        for position, stop in enumerate(stops):
+            board = positions.get(stop)
+            if board is None:
+                positions[stop] = [position]
+            else:
+                board.append(position)
+        boards = {}
+        for stop, board in positions.items():
+            if arrivals:
+                board.sort(key=times.__getitem__)
+            boards[stop] = ([times[position] for position in board], board)
+        return boards
+
+    def __reduce_ex__(self, protocol: int) -> tuple:
+        """
+        Pickle the columns and intern tables only. Connection objects, boards
+        and next-in-trip pointers are rebuilt when they are needed. With
+        protocol 5 and above, each column is passed as an out-of-band buffer.
+        @param protocol: Pickle protocol.
+        @return: Tuple of (function rebuilding the object, its arguments).
+        """
+        columns = [*self.get_columns(), self.__other_data_index]
+        return (
+            _unpickle_compiled,
+            (
+                self.__converter,
+                self.__stop_ids,
+                self.__trip_ids,
+                self.__other_data,
+                [
+                    (column.typecode, _pickle_column(column, protocol))
+                    for column in columns
+                ],
+            ),
+        )
+
+    def get_memory_size(self) -> int:
+        """
+        Get the memory used by the columns, intern tables and boards, not
+        counting Connection objects or other data shared with the timetable.
+        @return: Size in bytes.
+        """
+        size = sum(map(sys.getsizeof, self.get_columns()))
+        size += sys.getsizeof(self.__other_data_index) + sys.getsizeof(self.__other_data)
+        size += sys.getsizeof(self.__stop_ids) + sys.getsizeof(self.__trip_ids)
+        size += sys.getsizeof(self.__stop_index)
+        if self.__next_in_trip is not None:
+            size += sys.getsizeof(self.__next_in_trip)
+        if self.__boards is not None:
+            for boards in self.__boards:
+                size += sys.getsizeof(boards)
+                for times, positions in boards.values():
+                    size += sys.getsizeof(times) + sys.getsizeof(positions)
+                    size += sum(map(sys.getsizeof, times))
+        return size
+
+    def get_fingerprint(self) -> int:
+        """
+        Get a checksum of the columns, intern tables and epoch, used to check
+        that data precomputed for a compiled timetable (such as HubProfiles)
+        still matches it.
+        @return: CRC-32 checksum.
+        """
+        if self.__fingerprint is None:
+            fingerprint = zlib.crc32(
+                json.dumps(
+                    [
+                        self.__converter.get_epoch().isoformat(),
+                        self.__stop_ids,
+                        self.__trip_ids,
+                    ]
+                ).encode("utf-8")
+            )
+            for column in self.get_columns():
+                fingerprint = zlib.crc32(_little_endian(column).tobytes(), fingerprint)
+            self.__fingerprint = fingerprint
+        return self.__fingerprint
+
+    def save(self, file: str | BinaryIO) -> None:
+        """
+        Write the compiled timetable in the binary compiled format. Other data
+        must be JSON serialisable, and the timezone (if any) must be a
+        zoneinfo.ZoneInfo or a fixed datetime.timezone.
+        @param file: Path or binary file.
+        """
+        if isinstance(file, str):
+            with open(file, "wb") as binary_file:
+                return self.save(binary_file)
+        header = {
+            "format": _FORMAT_VERSION,
+            "epoch": self.__converter.get_epoch().isoformat(),
+            "timezone": _dump_timezone(self.__converter.get_timezone()),
+            "aware": self.__converter.is_aware(),
+            "count": len(self),
+            "stop_ids": self.__stop_ids,
+            "trip_ids": self.__trip_ids,
+            "other_data": self.__other_data,
+        }
+        _write_binary(file, _MAGIC, header, [*self.get_columns(), self.__other_data_index])
+
+    @classmethod
+    def load(cls, file: str | BinaryIO) -> "CompiledTimetable":
+        """
+        Read a compiled timetable written by save().
+        @param file: Path or binary file.
+        @return: A CompiledTimetable object.
+        """
+        if isinstance(file, str):
+            with open(file, "rb") as binary_file:
+                return cls.load(binary_file)
+        header = _read_header(file, _MAGIC, "compiled timetable")
+        if header["format"] != _FORMAT_VERSION:
+            raise ValueError("Unsupported compiled timetable format")
+        count = header["count"]
+        columns = [
+            _read_column(file, typecode, count, "compiled timetable")
+            for typecode in ["q", "q", "i", "i", "i", "i"]
+        ]
+        converter = TimeConverter(
+            datetime.datetime.fromisoformat(header["epoch"]),
+            _load_timezone(header["timezone"]),
+            header.get("aware", False),
+        )
+        return cls(
+            converter,
+            header["stop_ids"],
+            header["trip_ids"],
+            *columns[:5],
+            header["other_data"],
+            columns[5],
+        )
+
+
+def _unpickle_compiled(
+    converter: TimeConverter,
+    stop_ids: list[str],
+    trip_ids: list[str],
+    other_data: list[dict],
+    columns: list[tuple[str, Any]],
+) -> CompiledTimetable:
+    """
+    Rebuild a compiled timetable pickled by CompiledTimetable.__reduce_ex__.
+    """
+    columns = [_unpickle_column(typecode, data) for typecode, data in columns]
+    return CompiledTimetable(
+        converter, stop_ids, trip_ids, *columns[:5], other_data, columns[5]
+    )
+
+
+def _pickle_column(column: array, protocol: int) -> Any:
+    """
+    Get a column for pickling as little-endian items. With protocol 5 and
+    above it is wrapped in a PickleBuffer, so it can be passed out-of-band
+    instead of being copied into the pickle.
+    """
+    column = _little_endian(column)
+    if protocol >= 5:
+        return pickle.PickleBuffer(column)
+    return column.tobytes()
+
+
+def _unpickle_column(typecode: str, data: Any) -> array:
+    """
+    Rebuild a column pickled by _pickle_column.
+    """
+    column = array(typecode)
+    # Out-of-band buffers may come back as PickleBuffer objects, which
+    # frombytes() only takes as a byte view.
+    column.frombytes(memoryview(data).cast("B"))
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def _little_endian(column: array) -> array:
+    """
+    Get a column with its items in little-endian byte order, as stored in the
+    binary formats.
+    """
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+
+def _write_binary(file: BinaryIO, magic: bytes, header: dict, columns: list) -> None:
+    """
+    Write a binary file: the magic bytes, the length of the JSON header as a
+    little-endian uint32, the header, then each column as little-endian
+    items.
+    """
+    encoded = json.dumps(header).encode("utf-8")
+    file.write(magic + struct.pack("<I", len(encoded)) + encoded)
+    for column in columns:
+        file.write(_little_endian(column).tobytes())
+
+
+def _read_header(file: BinaryIO, magic: bytes, description: str) -> dict:
+    """
+    Read the magic bytes and the JSON header written by _write_binary.
+    """
+    if file.read(len(magic)) != magic:
+        raise ValueError(f"Not a {description}")
+    (length,) = struct.unpack("<I", file.read(4))
+    return json.loads(file.read(length).decode("utf-8"))
+
+
+def _read_column(file: BinaryIO, typecode: str, count: int, description: str) -> array:
+    """
+    Read one column of count items written by _write_binary.
+    """
+    column = array(typecode)
+    data = file.read(column.itemsize * count)
+    if len(data) != column.itemsize * count:
+        raise ValueError(f"{description[0].upper()}{description[1:]} is truncated")
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def _dump_timezone(timezone: datetime.tzinfo | None) -> Any:
+    """
+    Describe a timezone for the compiled format header.
+    """
+    if timezone is None:
+        return None
+    if isinstance(timezone, zoneinfo.ZoneInfo):
+        return {"key": timezone.key}
+    if isinstance(timezone, datetime.timezone):
+        offset = timezone.utcoffset(None)
+        return {"offset": offset // _ONE_SECOND}
+    raise ValueError("Only ZoneInfo and fixed offset timezones can be saved")
+
+
+def _load_timezone(description: Any) -> datetime.tzinfo | None:
+    """
+    Rebuild a timezone described by _dump_timezone.
+    """
+    if description is None:
+        return None
+    if "key" in description:
+        return zoneinfo.ZoneInfo(description["key"])
+    return datetime.timezone(datetime.timedelta(seconds=description["offset"]))
@@ -0,0 +1,135 @@
+"""
+Pytinerary - Mode, operator and avoided location constraints for queries.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from collections.abc import Iterable
+from typing import Hashable
+
+from .compiled import CompiledTimetable
+
+
+class QueryFilter(object):
+    """
+    Constraints on the connections an itinerary may use. Modes and operators
+    are read from the other data of each connection; a connection without the
+    key is only allowed when no modes (or operators) are required. Filters are
+    compiled into a mask over the compiled timetable once, and engines cache
+    the masks of recently used filters.
+    """
+
+    def __init__(
+        self,
+        modes: Iterable[str] | None = None,
+        operators: Iterable[str] | None = None,
+        avoid: Iterable[str] = (),
+        exclude_modes: Iterable[str] = (),
+        exclude_operators: Iterable[str] = (),
+        mode_key: str = "mode",
+        operator_key: str = "operator",
+    ) -> None:
+        """
+        Initialise the QueryFilter object.
+        @param modes: (Optional, default None) Modes that may be used. Every
+        mode is allowed if not provided.
+        @param operators: (Optional, default None) Operators that may be used.
+        Every operator is allowed if not provided.
+        @param avoid: (Optional, default empty) Location identifiers the
+        itinerary must not pass through.
+        @param exclude_modes: (Optional, default empty) Modes that must not be
+        used.
+        @param exclude_operators: (Optional, default empty) Operators that must
+        not be used.
+        @param mode_key: (Optional, default "mode") Other data key holding the
+        mode of a connection.
+        @param operator_key: (Optional, default "operator") Other data key
+        holding the operator of a connection.
+        """
+        self.__modes = frozenset(modes) if modes is not None else None
+        self.__operators = frozenset(operators) if operators is not None else None
+        self.__avoid = frozenset(avoid)
+        self.__exclude_modes = frozenset(exclude_modes)
+        self.__exclude_operators = frozenset(exclude_operators)
+        self.__mode_key = mode_key
+        self.__operator_key = operator_key
+
+    def __repr__(self) -> str:
+        return f"QueryFilter({self.get_key()})"
+
+    def __str__(self) -> str:
+        return f"QueryFilter({self.get_key()})"
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, QueryFilter):
+            return self.get_key() == other.get_key()
+        return False
+
+    def __hash__(self) -> int:
+        return hash(self.get_key())
+
+    def get_key(self) -> Hashable:
+        """
+        Get a hashable key identifying the filter, used to cache its mask and
+        the results of queries using it.
+        @return: Tuple describing the filter.
+        """
+        return (
+            self.__modes,
+            self.__operators,
+            self.__avoid,
+            self.__exclude_modes,
+            self.__exclude_operators,
+            self.__mode_key,
+            self.__operator_key,
+        )
+
+    def get_avoid(self) -> frozenset[str]:
+        """
+        Get the location identifiers the itinerary must not pass through.
+        @return: Set of location identifiers.
+        """
+        return self.__avoid
+
+    def allows(self, other_data: dict) -> bool:
+        """
+        Check whether a connection with the given other data may be used,
+        ignoring avoided locations.
+        @param other_data: Other data of the connection.
+        @return: True if the connection may be used.
+        """
+        mode = other_data.get(self.__mode_key)
+        if self.__modes is not None and mode not in self.__modes:
+            return False
+        if mode in self.__exclude_modes:
+            return False
+        operator = other_data.get(self.__operator_key)
+        if self.__operators is not None and operator not in self.__operators:
+            return False
+        return operator not in self.__exclude_operators
+
+    def compile(self, compiled: CompiledTimetable) -> bytearray:
+        """
+        Build the mask of a compiled timetable: 1 for every connection the
+        filter allows, 0 for the rest. Other data shared between connections
+        is only checked once.
+        @param compiled: A CompiledTimetable object.
+        @return: Mask indexed by connection position.
+        """
+        other_data, other_data_index = compiled.get_other_data_table()
+        allowed = bytes(self.allows(data) for data in other_data)
+        mask = bytearray(allowed[i] for i in other_data_index)
+        avoided = {compiled.get_stop_index(location_id) for location_id in self.__avoid}
+        avoided.discard(-1)
+        if avoided:
+            _, _, dep_stops, arr_stops, _ = compiled.get_columns()
+            for position in range(len(mask)):
+                if dep_stops[position] in avoided or arr_stops[position] in avoided:
+                    mask[position] = 0
+        return mask
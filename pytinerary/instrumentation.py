@@ -0,0 +1,774 @@
+"""
+Pytinerary - Per-query statistics and latency aggregation.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from collections import deque
+from typing import TextIO
+
+import bisect
+import math
+import sys
+import threading
+import time
+
+
+class QueryStats(object):
+    """
+    Statistics describing what a single generate_itinerary call did. Instances
+    are passed to every query listener registered on an ItineraryEngine.
+    """
+
+    def __init__(
+        self,
+        origin_id: str,
+        destination_id: str,
+        arrive_by: bool,
+        connections_scanned: int = 0,
+        relaxations: int = 0,
+        scan_start: int = -1,
+        scan_stop: int = -1,
+        early_termination: bool = False,
+        cache_hit: bool = False,
+        phase_times: dict[str, float] | None = None,
+        result_length: int = 0,
+    ) -> None:
+        """
+        Initialise the QueryStats object.
+        @param origin_id: Origin location identifier.
+        @param destination_id: Destination location identifier.
+        @param arrive_by: Whether the query was an arrive by query.
+        @param connections_scanned: (Optional, default 0) Number of connections
+        looked at by the scan.
+        @param relaxations: (Optional, default 0) Number of times a stop's best
+        time was improved.
+        @param scan_start: (Optional, default -1) Index of the first connection
+        scanned, -1 if nothing was scanned.
+        @param scan_stop: (Optional, default -1) Index of the last connection
+        scanned, -1 if nothing was scanned.
+        @param early_termination: (Optional, default False) Whether the scan
+        stopped before the end of the connection list.
+        @param cache_hit: (Optional, default False) Whether the result came from
+        the query cache.
+        @param phase_times: (Optional, default None) Wall time in seconds spent
+        in each phase of the query, keyed by phase name.
+        @param result_length: (Optional, default 0) Number of connections in
+        the returned itinerary.
+        """
+        self.__origin_id = origin_id
+        self.__destination_id = destination_id
+        self.__arrive_by = arrive_by
+        self.__connections_scanned = connections_scanned
+        self.__relaxations = relaxations
+        self.__scan_start = scan_start
+        self.__scan_stop = scan_stop
+        self.__early_termination = early_termination
+        self.__cache_hit = cache_hit
+        self.__phase_times = phase_times if phase_times is not None else {}
+        self.__result_length = result_length
+
+    def __repr__(self) -> str:
+        return f"QueryStats({self.to_dict()})"
+
+    def __str__(self) -> str:
+        return f"QueryStats({self.to_dict()})"
+
+    def get_origin_id(self) -> str:
+        """
+        Get the origin location identifier.
+        @return: Origin location identifier.
+        """
+        return self.__origin_id
+
+    def get_destination_id(self) -> str:
+        """
+        Get the destination location identifier.
+        @return: Destination location identifier.
+        """
+        return self.__destination_id
+
+    def get_arrive_by(self) -> bool:
+        """
+        Get whether the query was an arrive by query.
+        @return: True for arrive by queries.
+        """
+        return self.__arrive_by
+
+    def get_connections_scanned(self) -> int:
+        """
+        Get the number of connections looked at by the scan.
+        @return: Number of connections scanned.
+        """
+        return self.__connections_scanned
+
+    def get_relaxations(self) -> int:
+        """
+        Get the number of times a stop's best time was improved.
+        @return: Number of relaxations.
+        """
+        return self.__relaxations
+
+    def get_scan_start(self) -> int:
+        """
+        Get the index of the first connection scanned.
+        @return: Index, or -1 if nothing was scanned.
+        """
+        return self.__scan_start
+
+    def get_scan_stop(self) -> int:
+        """
+        Get the index of the last connection scanned.
+        @return: Index, or -1 if nothing was scanned.
+        """
+        return self.__scan_stop
+
+    def get_early_termination(self) -> bool:
+        """
+        Get whether the scan stopped before the end of the connection list.
+        @return: True if the scan terminated early.
+        """
+        return self.__early_termination
+
+    def get_cache_hit(self) -> bool:
+        """
+        Get whether the result came from the query cache.
+        @return: True on a cache hit.
+        """
+        return self.__cache_hit
+
+    def get_phase_times(self) -> dict[str, float]:
+        """
+        Get the wall time spent in each phase of the query.
+        @return: Dict of phase name to seconds.
+        """
+        return self.__phase_times
+
+    def get_total_time(self) -> float:
+        """
+        Get the total wall time of the query.
+        @return: Seconds.
+        """
+        return sum(self.__phase_times.values())
+
+    def get_result_length(self) -> int:
+        """
+        Get the number of connections in the returned itinerary.
+        @return: Number of connections.
+        """
+        return self.__result_length
+
+    def to_dict(self) -> dict:
+        """
+        Get the statistics as a dict.
+        @return: Dict of statistics.
+        """
+        return {
+            "origin_id": self.__origin_id,
+            "destination_id": self.__destination_id,
+            "arrive_by": self.__arrive_by,
+            "connections_scanned": self.__connections_scanned,
+            "relaxations": self.__relaxations,
+            "scan_start": self.__scan_start,
+            "scan_stop": self.__scan_stop,
+            "early_termination": self.__early_termination,
+            "cache_hit": self.__cache_hit,
+            "phase_times": dict(self.__phase_times),
+            "total_time": self.get_total_time(),
+            "result_length": self.__result_length,
+        }
+
+
+class BatchStats(object):
+    """
+    Statistics describing what a single generate_itineraries call did, returned
+    with its results.
+    """
+
+    def __init__(
+        self,
+        queries: int,
+        shared_scans: int = 0,
+        shared_queries: int = 0,
+        single_queries: int = 0,
+        profile_lookups: int = 0,
+        cache_hits: int = 0,
+        phase_times: dict[str, float] | None = None,
+    ) -> None:
+        """
+        Initialise the BatchStats object.
+        @param queries: Number of queries in the batch.
+        @param shared_scans: (Optional, default 0) Number of scans shared by
+        several queries from the same origin at the same time.
+        @param shared_queries: (Optional, default 0) Number of queries answered
+        by a shared scan.
+        @param single_queries: (Optional, default 0) Number of queries run on
+        their own.
+        @param profile_lookups: (Optional, default 0) Number of queries
+        answered from the hub profiles.
+        @param cache_hits: (Optional, default 0) Number of queries answered
+        from the query cache.
+        @param phase_times: (Optional, default None) Wall time in seconds spent
+        in each phase of the batch, keyed by phase name.
+        """
+        self.__queries = queries
+        self.__shared_scans = shared_scans
+        self.__shared_queries = shared_queries
+        self.__single_queries = single_queries
+        self.__profile_lookups = profile_lookups
+        self.__cache_hits = cache_hits
+        self.__phase_times = phase_times if phase_times is not None else {}
+
+    def __repr__(self) -> str:
+        return f"BatchStats({self.to_dict()})"
+
+    def __str__(self) -> str:
+        return f"BatchStats({self.to_dict()})"
+
+    def get_queries(self) -> int:
+        """
+        Get the number of queries in the batch.
+        @return: Number of queries.
+        """
+        return self.__queries
+
+    def get_shared_scans(self) -> int:
+        """
+        Get the number of scans shared by several queries.
+        @return: Number of shared scans.
+        """
+        return self.__shared_scans
+
+    def get_shared_queries(self) -> int:
+        """
+        Get the number of queries answered by a shared scan.
+        @return: Number of queries.
+        """
+        return self.__shared_queries
+
+    def get_single_queries(self) -> int:
+        """
+        Get the number of queries run on their own.
+        @return: Number of queries.
+        """
+        return self.__single_queries
+
+    def get_profile_lookups(self) -> int:
+        """
+        Get the number of queries answered from the hub profiles.
+        @return: Number of queries.
+        """
+        return self.__profile_lookups
+
+    def get_cache_hits(self) -> int:
+        """
+        Get the number of queries answered from the query cache.
+        @return: Number of queries.
+        """
+        return self.__cache_hits
+
+    def get_phase_times(self) -> dict[str, float]:
+        """
+        Get the wall time spent in each phase of the batch.
+        @return: Dict of phase name to seconds.
+        """
+        return self.__phase_times
+
+    def get_total_time(self) -> float:
+        """
+        Get the total wall time of the batch.
+        @return: Seconds.
+        """
+        return sum(self.__phase_times.values())
+
+    def to_dict(self) -> dict:
+        """
+        Get the statistics as a dict.
+        @return: Dict of statistics.
+        """
+        return {
+            "queries": self.__queries,
+            "shared_scans": self.__shared_scans,
+            "shared_queries": self.__shared_queries,
+            "single_queries": self.__single_queries,
+            "profile_lookups": self.__profile_lookups,
+            "cache_hits": self.__cache_hits,
+            "phase_times": dict(self.__phase_times),
+            "total_time": self.get_total_time(),
+        }
+
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+DEFAULT_LATENCY_BUCKETS = (
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    25.0,
+    50.0,
+    100.0,
+    250.0,
+    500.0,
+    1000.0,
+    2500.0,
+    math.inf,
+)
+
+
+class LatencyHistogram(object):
+    """
+    Fixed-bucket histogram of latencies in milliseconds.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_LATENCY_BUCKETS) -> None:
+        """
+        Initialise the LatencyHistogram object.
+        @param buckets: (Optional, default DEFAULT_LATENCY_BUCKETS) Sorted upper
+        bounds of the buckets in milliseconds. The last bound should be
+        math.inf so every sample has a bucket.
+        """
+        if list(buckets) != sorted(buckets) or len(buckets) == 0:
+            raise ValueError("Buckets must be a non-empty sorted sequence")
+        self.__buckets = tuple(buckets)
+        self.__counts = [0] * len(self.__buckets)
+        self.__count = 0
+        self.__sum = 0.0
+        self.__min = math.inf
+        self.__max = 0.0
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def record(self, milliseconds: float) -> None:
+        """
+        Add a sample.
+        @param milliseconds: Latency in milliseconds.
+        """
+        index = bisect.bisect_left(self.__buckets, milliseconds)
+        if index < len(self.__counts):
+            self.__counts[index] += 1
+        self.__count += 1
+        self.__sum += milliseconds
+        self.__min = min(self.__min, milliseconds)
+        self.__max = max(self.__max, milliseconds)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Estimate a percentile from the buckets. The result is the upper bound
+        of the bucket holding the percentile, capped at the largest sample.
+        @param fraction: Percentile as a fraction between 0 and 1.
+        @return: Latency in milliseconds, or 0 if there are no samples.
+        """
+        if self.__count == 0:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.__count))
+        seen = 0
+        for bound, count in zip(self.__buckets, self.__counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.__max)
+        return self.__max
+
+    def to_dict(self) -> dict:
+        """
+        Get the histogram as a dict.
+        @return: Dict with the bucket counts and summary statistics.
+        """
+        return {
+            "buckets": [
+                [bound, count] for bound, count in zip(self.__buckets, self.__counts)
+            ],
+            "count": self.__count,
+            "sum": self.__sum,
+            "min": self.__min if self.__count else 0.0,
+            "max": self.__max,
+            "mean": self.__sum / self.__count if self.__count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class QueryStatsAggregator(object):
+    """
+    Query listener building latency histograms for an engine, both for whole
+    queries and for each phase. Register it with
+    ItineraryEngine.add_query_listener().
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_LATENCY_BUCKETS) -> None:
+        """
+        Initialise the QueryStatsAggregator object.
+        @param buckets: (Optional, default DEFAULT_LATENCY_BUCKETS) Bucket
+        upper bounds in milliseconds used for every histogram.
+        """
+        self.__buckets = buckets
+        self.__total = LatencyHistogram(buckets)
+        self.__phases: dict[str, LatencyHistogram] = {}
+        self.__queries = 0
+        self.__cache_hits = 0
+        self.__early_terminations = 0
+        self.__connections_scanned = 0
+        self.__relaxations = 0
+
+    def __call__(self, stats: QueryStats) -> None:
+        self.record(stats)
+
+    def record(self, stats: QueryStats) -> None:
+        """
+        Add the statistics of one query.
+        @param stats: A QueryStats object.
+        """
+        self.__queries += 1
+        self.__cache_hits += stats.get_cache_hit()
+        self.__early_terminations += stats.get_early_termination()
+        self.__connections_scanned += stats.get_connections_scanned()
+        self.__relaxations += stats.get_relaxations()
+        self.__total.record(stats.get_total_time() * 1000)
+        for phase, seconds in stats.get_phase_times().items():
+            histogram = self.__phases.get(phase)
+            if histogram is None:
+                histogram = self.__phases[phase] = LatencyHistogram(self.__buckets)
+            histogram.record(seconds * 1000)
+
+    def get_histogram(self, phase: str | None = None) -> LatencyHistogram:
+        """
+        Get a latency histogram.
+        @param phase: (Optional, default None) Phase name. The histogram of
+        whole queries is returned if not provided.
+        @return: A LatencyHistogram object.
+        """
+        if phase is None:
+            return self.__total
+        return self.__phases[phase]
+
+    def snapshot(self) -> dict:
+        """
+        Get everything recorded so far as a dict.
+        @return: Dict of aggregated statistics.
+        """
+        queries = max(1, self.__queries)
+        return {
+            "queries": self.__queries,
+            "cache_hits": self.__cache_hits,
+            "early_terminations": self.__early_terminations,
+            "mean_connections_scanned": self.__connections_scanned / queries,
+            "mean_relaxations": self.__relaxations / queries,
+            "latency_ms": self.__total.to_dict(),
+            "phase_latency_ms": {
+                phase: histogram.to_dict()
+                for phase, histogram in self.__phases.items()
+            },
+        }
+
+
+class QueryProfiler(object):
+    """
+    Query listener profiling the queries of an engine. Register it with
+    ItineraryEngine.add_query_listener(), which times every phase of each
+    query while at least one listener is registered; without listeners a
+    query only checks that there are none. The profiler adds the phase times
+    up as integer nanoseconds. Once started, it also runs a sampler thread
+    that periodically records which ItineraryEngine method each thread is
+    in, and the connection being scanned if it is in a scan, into a ring
+    buffer. Samples can only be taken when the sampler thread gets the
+    interpreter lock, so they are at most about sys.getswitchinterval() apart
+    while queries keep it busy. Everything can be read as a dict or in the
+    Prometheus text exposition format.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.001,
+        capacity: int = 10000,
+        buckets: tuple = DEFAULT_LATENCY_BUCKETS,
+    ) -> None:
+        """
+        Initialise the QueryProfiler object.
+        @param interval: (Optional, default 0.001) Seconds between samples.
+        @param capacity: (Optional, default 10000) Number of samples kept, the
+        oldest being dropped first.
+        @param buckets: (Optional, default DEFAULT_LATENCY_BUCKETS) Bucket
+        upper bounds in milliseconds of the query latency histogram.
+        """
+        if isinstance(interval, (int, float)) != True or interval <= 0:
+            raise ValueError("Interval must be a positive number of seconds")
+        if isinstance(capacity, int) != True or capacity < 1:
+            raise ValueError("Capacity must be a positive integer")
+        self.__interval = interval
+        self.__lock = threading.Lock()
+        self.__latency = LatencyHistogram(buckets)
+        self.__queries = 0
+        self.__cache_hits = 0
+        self.__connections_scanned = 0
+        self.__relaxations = 0
+        self.__phase_ns: dict[str, int] = {}
+        self.__phase_calls: dict[str, int] = {}
+        # (perf_counter_ns, thread identifier, method, connection or -1).
+        self.__samples: deque = deque(maxlen=capacity)
+        self.__sample_counts: dict[str, int] = {}
+        self.__methods: dict = {}
+        self.__thread: threading.Thread | None = None
+        self.__stopping = threading.Event()
+
+    def __call__(self, stats: QueryStats) -> None:
+        self.record(stats)
+
+    def record(self, stats: QueryStats) -> None:
+        """
+        Add the phase times and counters of one query.
+        @param stats: A QueryStats object.
+        """
+        with self.__lock:
+            self.__queries += 1
+            self.__cache_hits += stats.get_cache_hit()
+            self.__connections_scanned += stats.get_connections_scanned()
+            self.__relaxations += stats.get_relaxations()
+            self.__latency.record(stats.get_total_time() * 1000)
+            for phase, seconds in stats.get_phase_times().items():
+                self.__phase_ns[phase] = self.__phase_ns.get(phase, 0) + round(
+                    seconds * 1_000_000_000
+                )
+                self.__phase_calls[phase] = self.__phase_calls.get(phase, 0) + 1
+
+    def start(self) -> None:
+        """
+        Start the sampler thread. It is a daemon thread, so it does not keep
+        the program running.
+        """
+        if self.__thread is not None:
+            raise ValueError("Profiler is already sampling")
+        self.__stopping.clear()
+        self.__thread = threading.Thread(
+            target=self.__run, name="pytinerary-profiler", daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the sampler thread and wait for it to finish. Samples taken so
+        far are kept.
+        """
+        if self.__thread is None:
+            return
+        self.__stopping.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def is_sampling(self) -> bool:
+        """
+        Check whether the sampler thread is running.
+        @return: True while sampling.
+        """
+        return self.__thread is not None
+
+    def __run(self) -> None:
+        """
+        Take samples until the profiler is stopped.
+        """
+        while not self.__stopping.wait(self.__interval):
+            self.sample()
+
+    def sample(self) -> int:
+        """
+        Take one sample of every thread that is inside an ItineraryEngine
+        method. The sampler thread calls this periodically, but it can also
+        be called directly.
+        @return: Number of samples recorded.
+        """
+        now = time.perf_counter_ns()
+        recorded = 0
+        for thread_id, frame in sys._current_frames().items():
+            while frame is not None:
+                method = self.__get_method(frame.f_code)
+                if method is not None:
+                    break
+                frame = frame.f_back
+            if frame is None:
+                continue
+            position = -1
+            if method.startswith("scan"):
+                position = frame.f_locals.get("index", -1)
+            with self.__lock:
+                self.__samples.append((now, thread_id, method, position))
+                self.__sample_counts[method] = self.__sample_counts.get(method, 0) + 1
+            recorded += 1
+        return recorded
+
+    def __get_method(self, code) -> str | None:
+        """
+        Get the name of the ItineraryEngine method a code object belongs to.
+        @param code: Code object of a frame.
+        @return: Method name without leading underscores, or None for code
+        outside the engine.
+        """
+        if not self.__methods:
+            self.__load_methods()
+        return self.__methods.get(code)
+
+    def __load_methods(self) -> None:
+        """
+        Map the code objects of the ItineraryEngine methods, and of the
+        functions nested in them, to their names. Code objects are compared
+        rather than qualified names, which code objects only carry from
+        Python 3.11.
+        """
+        from .pytinerary import ItineraryEngine
+
+        prefix = f"_{ItineraryEngine.__name__}__"
+        pending = []
+        for name, value in vars(ItineraryEngine).items():
+            if isinstance(value, (staticmethod, classmethod)):
+                value = value.__func__
+            elif isinstance(value, property):
+                value = value.fget
+            code = getattr(value, "__code__", None)
+            if code is not None:
+                if name.startswith(prefix):
+                    name = name[len(prefix) :]
+                pending.append((code, name.lstrip("_")))
+        while pending:
+            code, name = pending.pop()
+            self.__methods[code] = name
+            for constant in code.co_consts:
+                if isinstance(constant, type(code)):
+                    pending.append((constant, f"{name}.<locals>.{constant.co_name}"))
+
+    def get_samples(self) -> list[tuple[int, int, str, int]]:
+        """
+        Get the samples in the ring buffer.
+        @return: List of (perf_counter_ns time, thread identifier, method,
+        connection position or -1) tuples, oldest first.
+        """
+        with self.__lock:
+            return list(self.__samples)
+
+    def snapshot(self) -> dict:
+        """
+        Get everything recorded so far as a dict.
+        @return: Dict of counters, phase times in nanoseconds, the query
+        latency histogram, sample counts by method and the samples in the ring
+        buffer.
+        """
+        with self.__lock:
+            return {
+                "queries": self.__queries,
+                "cache_hits": self.__cache_hits,
+                "connections_scanned": self.__connections_scanned,
+                "relaxations": self.__relaxations,
+                "phase_ns": dict(self.__phase_ns),
+                "phase_calls": dict(self.__phase_calls),
+                "latency_ms": self.__latency.to_dict(),
+                "sample_counts": dict(self.__sample_counts),
+                "samples": [list(sample) for sample in self.__samples],
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Get the counters, phase times, latency histogram and sample counts in
+        the Prometheus text exposition format.
+        @return: Text of the metrics.
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, values: list) -> None:
+            lines.append(f"# HELP pytinerary_{name} {help_text}")
+            lines.append(f"# TYPE pytinerary_{name} {kind}")
+            for labels, value in values:
+                lines.append(f"pytinerary_{labels} {value}")
+
+        metric(
+            "queries_total",
+            "counter",
+            "Queries profiled.",
+            [("queries_total", snapshot["queries"])],
+        )
+        metric(
+            "cache_hits_total",
+            "counter",
+            "Queries answered from the query cache.",
+            [("cache_hits_total", snapshot["cache_hits"])],
+        )
+        metric(
+            "connections_scanned_total",
+            "counter",
+            "Connections looked at by scans.",
+            [("connections_scanned_total", snapshot["connections_scanned"])],
+        )
+        metric(
+            "relaxations_total",
+            "counter",
+            "Times a stop's best time was improved.",
+            [("relaxations_total", snapshot["relaxations"])],
+        )
+        metric(
+            "phase_seconds_total",
+            "counter",
+            "Time spent in each phase of the queries.",
+            [
+                (f'phase_seconds_total{{phase="{phase}"}}', ns / 1_000_000_000)
+                for phase, ns in sorted(snapshot["phase_ns"].items())
+            ],
+        )
+        metric(
+            "phase_calls_total",
+            "counter",
+            "Queries that went through each phase.",
+            [
+                (f'phase_calls_total{{phase="{phase}"}}', calls)
+                for phase, calls in sorted(snapshot["phase_calls"].items())
+            ],
+        )
+        latency = snapshot["latency_ms"]
+        buckets = []
+        seen = 0
+        for bound, count in latency["buckets"]:
+            seen += count
+            le = "+Inf" if math.isinf(bound) else repr(bound / 1000)
+            buckets.append((f'query_duration_seconds_bucket{{le="{le}"}}', seen))
+        if not math.isinf(latency["buckets"][-1][0]):
+            buckets.append(
+                ('query_duration_seconds_bucket{le="+Inf"}', latency["count"])
+            )
+        metric(
+            "query_duration_seconds",
+            "histogram",
+            "Wall time of the queries.",
+            buckets
+            + [
+                ("query_duration_seconds_sum", latency["sum"] / 1000),
+                ("query_duration_seconds_count", latency["count"]),
+            ],
+        )
+        metric(
+            "samples_total",
+            "counter",
+            "Sampler observations of threads in each engine method.",
+            [
+                (f'samples_total{{method="{method}"}}', count)
+                for method, count in sorted(snapshot["sample_counts"].items())
+            ],
+        )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file: str | TextIO) -> None:
+        """
+        Write the metrics in the Prometheus text exposition format, for
+        example for the node exporter's textfile collector.
+        @param file: Path or text file.
+        """
+        if isinstance(file, str):
+            with open(file, "w", encoding="utf-8") as text_file:
+                return self.write_prometheus(text_file)
+        file.write(self.to_prometheus())
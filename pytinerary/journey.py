@@ -0,0 +1,228 @@
+"""
+Pytinerary - Compact journeys made of trip legs.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from collections.abc import Iterator
+
+import datetime
+
+from .compiled import CompiledTimetable
+from .transfers import Footpath
+
+
+class Leg(object):
+    """
+    One ride on a single service, or one walk, in a Journey. A leg only holds
+    positions into the compiled timetable; Connection objects are created when
+    the leg is iterated.
+    """
+
+    __slots__ = (
+        "__compiled",
+        "__board",
+        "__alight",
+        "__stop_count",
+        "__walk",
+        "__offset",
+    )
+
+    def __init__(
+        self,
+        compiled: CompiledTimetable,
+        board: int,
+        alight: int,
+        stop_count: int,
+        walk: tuple[str, str, int, int] | None = None,
+        offset: int = 0,
+    ) -> None:
+        """
+        Initialise the Leg object.
+        @param compiled: Compiled timetable the positions refer to.
+        @param board: Position of the first connection ridden.
+        @param alight: Position of the last connection ridden.
+        @param stop_count: Number of connections ridden.
+        @param walk: (Optional, default None) (from location, to location,
+        departure, arrival) for a walk, with integer times. Positions are
+        ignored for walks.
+        @param offset: (Optional, default 0) Seconds added to the times of the
+        connections ridden, for rides on a later (or earlier) repetition of
+        the timetable.
+        """
+        self.__compiled = compiled
+        self.__board = board
+        self.__alight = alight
+        self.__stop_count = stop_count
+        self.__walk = walk
+        self.__offset = offset
+
+    def __repr__(self) -> str:
+        return (
+            f"Leg({self.get_trip()}, "
+            f"{self.get_board_stop()} @ {self.get_board_time()}, "
+            f"{self.get_alight_stop()} @ {self.get_alight_time()}, "
+            f"{self.__stop_count})"
+        )
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __len__(self) -> int:
+        return self.__stop_count
+
+    def __iter__(self) -> Iterator:
+        compiled = self.__compiled
+        if self.__walk is not None:
+            dep_loc, arr_loc, dep_time, arr_time = self.__walk
+            yield Footpath(
+                dep_loc,
+                arr_loc,
+                compiled.from_seconds(dep_time),
+                compiled.from_seconds(arr_time),
+            )
+            return
+        next_in_trip = compiled.get_next_in_trip()
+        position = self.__board
+        for _ in range(self.__stop_count):
+            yield compiled.get_connection(position, self.__offset)
+            position = next_in_trip[position]
+
+    def is_walk(self) -> bool:
+        """
+        Get whether the leg is a walk.
+        @return: True for walks.
+        """
+        return self.__walk is not None
+
+    def get_trip(self) -> str | None:
+        """
+        Get the unique identifier of the service ridden.
+        @return: Unique identifier, or None for walks.
+        """
+        if self.__walk is not None:
+            return None
+        compiled = self.__compiled
+        return compiled.get_trip_ids()[compiled.get_columns()[4][self.__board]]
+
+    def get_board_stop(self) -> str:
+        """
+        Get the location identifier the leg starts at.
+        @return: Location identifier.
+        """
+        if self.__walk is not None:
+            return self.__walk[0]
+        compiled = self.__compiled
+        return compiled.get_stop_ids()[compiled.get_columns()[2][self.__board]]
+
+    def get_board_time(self) -> datetime.datetime:
+        """
+        Get the time the leg starts.
+        @return: Departure time.
+        """
+        if self.__walk is not None:
+            return self.__compiled.from_seconds(self.__walk[2])
+        return self.__compiled.from_seconds(
+            self.__compiled.get_columns()[0][self.__board] + self.__offset
+        )
+
+    def get_alight_stop(self) -> str:
+        """
+        Get the location identifier the leg ends at.
+        @return: Location identifier.
+        """
+        if self.__walk is not None:
+            return self.__walk[1]
+        compiled = self.__compiled
+        return compiled.get_stop_ids()[compiled.get_columns()[3][self.__alight]]
+
+    def get_alight_time(self) -> datetime.datetime:
+        """
+        Get the time the leg ends.
+        @return: Arrival time.
+        """
+        if self.__walk is not None:
+            return self.__compiled.from_seconds(self.__walk[3])
+        return self.__compiled.from_seconds(
+            self.__compiled.get_columns()[1][self.__alight] + self.__offset
+        )
+
+    def get_stop_count(self) -> int:
+        """
+        Get the number of connections ridden (1 for walks).
+        @return: Number of connections.
+        """
+        return self.__stop_count
+
+
+class Journey(object):
+    """
+    Itinerary returned by ItineraryEngine.generate_journey(), as a list of
+    legs rather than one entry per connection.
+    """
+
+    __slots__ = ("__legs",)
+
+    def __init__(self, legs: list[Leg]) -> None:
+        """
+        Initialise the Journey object.
+        @param legs: Legs in travel order.
+        """
+        self.__legs = legs
+
+    def __repr__(self) -> str:
+        return f"Journey({self.__legs})"
+
+    def __str__(self) -> str:
+        return f"Journey({self.__legs})"
+
+    def __len__(self) -> int:
+        return len(self.__legs)
+
+    def __iter__(self) -> Iterator[Leg]:
+        return iter(self.__legs)
+
+    def __getitem__(self, index: int) -> Leg:
+        return self.__legs[index]
+
+    def get_legs(self) -> list[Leg]:
+        """
+        Get the legs of the journey.
+        @return: List of Leg objects.
+        """
+        return self.__legs
+
+    def get_dep_time(self) -> datetime.datetime | None:
+        """
+        Get the time the journey starts.
+        @return: Departure time, or None for an empty journey.
+        """
+        return self.__legs[0].get_board_time() if self.__legs else None
+
+    def get_arr_time(self) -> datetime.datetime | None:
+        """
+        Get the time the journey ends.
+        @return: Arrival time, or None for an empty journey.
+        """
+        return self.__legs[-1].get_alight_time() if self.__legs else None
+
+    def get_connection_count(self) -> int:
+        """
+        Get the number of connections (and footpaths) in the journey, without
+        creating them.
+        @return: Number of connections.
+        """
+        return sum(leg.get_stop_count() for leg in self.__legs)
+
+    def get_connections(self) -> list:
+        """
+        Get every connection (and footpath) in the journey.
+        @return: List of Connection and Footpath objects.
+        """
+        return [connection for leg in self.__legs for connection in leg]
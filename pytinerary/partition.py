@@ -0,0 +1,145 @@
+"""
+Pytinerary - Stop partitions and overlays for accelerated connection scans.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from array import array
+from typing import BinaryIO
+
+from .compiled import _read_column, _read_header, _write_binary
+
+_MAGIC = b"PYCP"
+_FORMAT_VERSION = 1
+
+
+class Partition(object):
+    """
+    Split of an engine's locations into cells, with the overlay of
+    connections needed to cross each cell, built by
+    ItineraryEngine.build_partition(). A query then only scans the
+    connections inside the cells of its origin and destination plus the
+    overlay: every connection between cells, and the connections of at least
+    one way through each cell from every connection entering it to every
+    connection leaving it that can be reached from there.
+
+    Like HubProfiles, a partition is only valid for the engine settings and
+    compiled timetable it was built from, which the fingerprint identifies.
+    """
+
+    def __init__(
+        self,
+        fingerprint: int,
+        cell_size: int,
+        cells: array,
+        overlay: bytearray,
+    ) -> None:
+        """
+        Initialise the Partition object. Use ItineraryEngine.build_partition()
+        or Partition.load() rather than calling this directly.
+        @param fingerprint: Fingerprint of the engine the partition was built
+        for.
+        @param cell_size: Number of locations each cell was grown to.
+        @param cells: Cell of each of the engine's locations.
+        @param overlay: 1 for each of the engine's connections in the overlay.
+        """
+        self.__fingerprint = fingerprint
+        self.__cell_size = cell_size
+        self.__cells = cells
+        self.__overlay = overlay
+
+    def __repr__(self) -> str:
+        return f"Partition({self.get_cell_count()} cells, {self.get_overlay_size()} overlay connections)"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def get_fingerprint(self) -> int:
+        """
+        Get the fingerprint of the engine the partition was built for.
+        @return: Fingerprint.
+        """
+        return self.__fingerprint
+
+    def get_cell_size(self) -> int:
+        """
+        Get the number of locations each cell was grown to.
+        @return: Number of locations.
+        """
+        return self.__cell_size
+
+    def get_cells(self) -> array:
+        """
+        Get the cell of each location, in the engine's location order.
+        @return: Array of cell numbers.
+        """
+        return self.__cells
+
+    def get_cell_count(self) -> int:
+        """
+        Get the number of cells.
+        @return: Number of cells.
+        """
+        return max(self.__cells, default=-1) + 1
+
+    def get_overlay(self) -> bytearray:
+        """
+        Get the overlay flags, in the engine's connection order.
+        @return: 1 for each connection in the overlay.
+        """
+        return self.__overlay
+
+    def get_overlay_size(self) -> int:
+        """
+        Get the number of connections in the overlay.
+        @return: Number of connections.
+        """
+        return self.__overlay.count(1)
+
+    def save(self, file: str | BinaryIO) -> None:
+        """
+        Write the partition in the binary compiled format.
+        @param file: Path or binary file.
+        """
+        if isinstance(file, str):
+            with open(file, "wb") as binary_file:
+                return self.save(binary_file)
+        header = {
+            "format": _FORMAT_VERSION,
+            "fingerprint": self.__fingerprint,
+            "cell_size": self.__cell_size,
+            "stops": len(self.__cells),
+            "connections": len(self.__overlay),
+        }
+        _write_binary(
+            file, _MAGIC, header, [self.__cells, array("b", self.__overlay)]
+        )
+
+    @classmethod
+    def load(cls, file: str | BinaryIO) -> "Partition":
+        """
+        Read a partition written by save().
+        @param file: Path or binary file.
+        @return: A Partition object.
+        """
+        if isinstance(file, str):
+            with open(file, "rb") as binary_file:
+                return cls.load(binary_file)
+        description = "partition file"
+        header = _read_header(file, _MAGIC, description)
+        if header["format"] != _FORMAT_VERSION:
+            raise ValueError("Unsupported partition format")
+        return cls(
+            header["fingerprint"],
+            header["cell_size"],
+            _read_column(file, "i", header["stops"], description),
+            bytearray(
+                _read_column(file, "b", header["connections"], description).tobytes()
+            ),
+        )
@@ -0,0 +1,247 @@
+"""
+Pytinerary - Precomputed hub-to-hub profile tables.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from array import array
+from typing import BinaryIO
+
+import bisect
+
+from .compiled import _read_column, _read_header, _write_binary
+
+_MAGIC = b"PYHP"
+_FORMAT_VERSION = 1
+
+
+class HubProfiles(object):
+    """
+    Profiles between every pair of a set of hub locations, built by
+    ItineraryEngine.build_hub_profiles(). The profile of a pair lists every
+    journey that no other journey beats on both a later departure and an
+    earlier arrival, sorted by departure (and so also by arrival), so the
+    best journey for any planned time is found with a bisect.
+
+    Journeys are stored as the legs found by the engine's scans, as positions
+    into the compiled timetable and indexes into the engine's locations. The
+    profiles are only valid for the engine settings and compiled timetable
+    they were built from, which the fingerprint identifies.
+    """
+
+    def __init__(
+        self,
+        fingerprint: int,
+        hub_ids: list[str],
+        start: int | None,
+        end: int | None,
+        covered: bytearray,
+        pair_offsets: array,
+        dep_times: array,
+        arr_times: array,
+        leg_offsets: array,
+        legs: array,
+    ) -> None:
+        """
+        Initialise the HubProfiles object. Use
+        ItineraryEngine.build_hub_profiles() or HubProfiles.load() rather than
+        calling this directly.
+        @param fingerprint: Fingerprint of the engine the profiles were built
+        for.
+        @param hub_ids: Hub location identifiers.
+        @param start: First departure time covered in seconds, or None if the
+        profiles start with the timetable.
+        @param end: Departure time in seconds the profiles stop before, or
+        None if they run to the end of the timetable.
+        @param covered: 1 for each pair of hubs (origin * hubs + destination)
+        answered by the profiles, 0 for pairs left to a scan.
+        @param pair_offsets: Position of the first journey of each pair, and
+        the number of journeys at the end.
+        @param dep_times: Departure time of each journey.
+        @param arr_times: Arrival time of each journey.
+        @param leg_offsets: Position of the first leg of each journey, and the
+        number of legs at the end.
+        @param legs: Four integers per leg: (-1 - first connection, last
+        connection, 0, 0) for rides and (from stop, to stop, departure,
+        arrival) for walks.
+        """
+        self.__fingerprint = fingerprint
+        self.__hub_ids = hub_ids
+        self.__hub_index = {hub_id: i for i, hub_id in enumerate(hub_ids)}
+        self.__start = start
+        self.__end = end
+        self.__covered = covered
+        self.__pair_offsets = pair_offsets
+        self.__dep_times = dep_times
+        self.__arr_times = arr_times
+        self.__leg_offsets = leg_offsets
+        self.__legs = legs
+
+    def __repr__(self) -> str:
+        return f"HubProfiles({len(self.__hub_ids)} hubs, {len(self)} journeys)"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __len__(self) -> int:
+        return len(self.__dep_times)
+
+    def get_fingerprint(self) -> int:
+        """
+        Get the fingerprint of the engine the profiles were built for.
+        @return: Fingerprint.
+        """
+        return self.__fingerprint
+
+    def get_hub_ids(self) -> list[str]:
+        """
+        Get the hub location identifiers.
+        @return: List of location identifiers.
+        """
+        return self.__hub_ids
+
+    def get_period(self) -> tuple[int | None, int | None]:
+        """
+        Get the departure times covered.
+        @return: Tuple of (start, end) in seconds, None where unbounded.
+        """
+        return self.__start, self.__end
+
+    def get_memory_size(self) -> int:
+        """
+        Get the memory used by the tables.
+        @return: Size in bytes.
+        """
+        return sum(
+            column.itemsize * len(column) if isinstance(column, array) else len(column)
+            for column in [
+                self.__covered,
+                self.__pair_offsets,
+                self.__dep_times,
+                self.__arr_times,
+                self.__leg_offsets,
+                self.__legs,
+            ]
+        )
+
+    def lookup(
+        self, origin_id: str, destination_id: str, planned: int, arrive_by: bool
+    ) -> list | None:
+        """
+        Find the best journey between two hubs.
+        @param origin_id: Origin location identifier.
+        @param destination_id: Destination location identifier.
+        @param planned: Planned departure/arrival time in seconds.
+        @param arrive_by: True if planned is an arrival time.
+        @return: List of legs, as produced by the engine's scans, or None if
+        the profiles cannot answer the query and a scan is needed.
+        """
+        origin = self.__hub_index.get(origin_id)
+        destination = self.__hub_index.get(destination_id)
+        if origin is None or destination is None:
+            return None
+        pair = origin * len(self.__hub_ids) + destination
+        if not self.__covered[pair]:
+            return None
+        low = self.__pair_offsets[pair]
+        high = self.__pair_offsets[pair + 1]
+        start, end = self.__start, self.__end
+        if arrive_by == False:
+            if start is not None and planned < start:
+                return None
+            entry = bisect.bisect_left(self.__dep_times, planned, low, high)
+            if entry == high:
+                # Nothing left in the profile, which is only the final answer
+                # if no journey can depart after it ends.
+                return None if end is not None else []
+            if end is not None and self.__arr_times[entry] > end:
+                # A journey departing after the profile ends could arrive
+                # sooner.
+                return None
+        else:
+            if end is not None and planned >= end:
+                return None
+            entry = bisect.bisect_right(self.__arr_times, planned, low, high) - 1
+            if entry < low:
+                return None if start is not None else []
+        return self.__get_legs(entry)
+
+    def __get_legs(self, entry: int) -> list:
+        """
+        Decode the legs of a journey.
+        @param entry: Journey position.
+        @return: List of (first, last) tuples for rides and (from stop, to
+        stop, departure, arrival) tuples for walks.
+        """
+        legs = self.__legs
+        result = []
+        for k in range(self.__leg_offsets[entry], self.__leg_offsets[entry + 1]):
+            a, b, c, d = legs[4 * k : 4 * k + 4]
+            result.append((-1 - a, b) if a < 0 else (a, b, c, d))
+        return result
+
+    def save(self, file: str | BinaryIO) -> None:
+        """
+        Write the profiles in the binary compiled format.
+        @param file: Path or binary file.
+        """
+        if isinstance(file, str):
+            with open(file, "wb") as binary_file:
+                return self.save(binary_file)
+        header = {
+            "format": _FORMAT_VERSION,
+            "fingerprint": self.__fingerprint,
+            "hub_ids": self.__hub_ids,
+            "start": self.__start,
+            "end": self.__end,
+            "journeys": len(self),
+            "legs": len(self.__legs) // 4,
+        }
+        _write_binary(
+            file,
+            _MAGIC,
+            header,
+            [
+                array("b", self.__covered),
+                self.__pair_offsets,
+                self.__dep_times,
+                self.__arr_times,
+                self.__leg_offsets,
+                self.__legs,
+            ],
+        )
+
+    @classmethod
+    def load(cls, file: str | BinaryIO) -> "HubProfiles":
+        """
+        Read profiles written by save().
+        @param file: Path or binary file.
+        @return: A HubProfiles object.
+        """
+        if isinstance(file, str):
+            with open(file, "rb") as binary_file:
+                return cls.load(binary_file)
+        description = "hub profile file"
+        header = _read_header(file, _MAGIC, description)
+        if header["format"] != _FORMAT_VERSION:
+            raise ValueError("Unsupported hub profile format")
+        pairs = len(header["hub_ids"]) ** 2
+        journeys = header["journeys"]
+        return cls(
+            header["fingerprint"],
+            header["hub_ids"],
+            header["start"],
+            header["end"],
+            bytearray(_read_column(file, "b", pairs, description).tobytes()),
+            _read_column(file, "i", pairs + 1, description),
+            _read_column(file, "q", journeys, description),
+            _read_column(file, "q", journeys, description),
+            _read_column(file, "i", journeys + 1, description),
+            _read_column(file, "q", header["legs"] * 4, description),
+        )
@@ -22,11 +22,79 @@ License along with this library; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 USA
 """
+from array import array
+from collections import Counter
 from collections.abc import Iterable
-from typing import Any, List, Callable
+from typing import Any, BinaryIO, List, Callable
 
+import bisect
+import copy
 import datetime
+import heapq
+import itertools
+import json
+import operator
 import sys
+import threading
+import time
+import zlib
+
+from .archive import TimetableArchive
+from .cache import QueryCache
+from .filters import QueryFilter
+from .compiled import (
+    DEFAULT_EPOCH,
+    CompiledTimetable,
+    TimeConverter,
+    _pickle_column,
+    _unpickle_column,
+)
+from .instrumentation import BatchStats, QueryStats
+from .journey import Journey, Leg
+from .partition import Partition
+from .profiles import HubProfiles
+from .transfers import TransferGraph
+from .validation import INVALID_ROW, ValidationIssue, ValidationReport, _find_issues
+
+# Number of connections per ConnectionList chunk.
+_CHUNK_SIZE = 4096
+
+
+def _deep_getsizeof(obj: Any, seen: set) -> int:
+    """
+    Get the size of an object and everything it contains, skipping anything
+    whose id is already in seen.
+    @param obj: Object to measure.
+    @param seen: Set of ids of objects that have already been counted. Updated
+    in place.
+    @return: Size in bytes.
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _deep_getsizeof(key, seen) + _deep_getsizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += _deep_getsizeof(item, seen)
+    return size
+
+
+# Seconds used as "never reached"; far beyond any real timestamp.
+_NEVER = 2**62
+
+
+def _shift(times: list[int], seconds: int) -> list[int]:
+    """
+    Move the times of a scan back by a number of seconds, leaving times that
+    are never reached as they are.
+    @param times: List of times in seconds.
+    @param seconds: Seconds to move the times back by.
+    @return: New list of times.
+    """
+    return [value if abs(value) == _NEVER else value - seconds for value in times]
 
 
 class Connection(object):
@@ -34,6 +102,15 @@ class Connection(object):
     Data format for holding individual connections.
     """
 
+    __slots__ = (
+        "__uid",
+        "__dep_time",
+        "__arr_time",
+        "__dep_loc",
+        "__arr_loc",
+        "__other_data",
+    )
+
     def __init__(
         self,
         uid: str,
@@ -160,6 +237,13 @@ class Connection(object):
         """
         return self.__arr_loc
 
+    def get_other_data(self) -> dict:
+        """
+        Get the other data present in the timetable for this connection.
+        @return: Dict of other data (e.g. mode, operator, etc.)
+        """
+        return self.__other_data
+
     def __dict__(self) -> dict:
         return {
             "uid": self.__uid,
@@ -174,6 +258,20 @@ class Connection(object):
 class ConnectionList(object):
     """
     A memory-efficient way of storing a list of connections.
+
+    The list keeps an index of connection positions by uid, built the first
+    time it is needed. Appending, popping from the end and removing services
+    keep the index up to date; any other change that moves connections marks
+    it stale, and it is rebuilt on the next lookup. Removed services leave
+    holes in the positions the index counts, which are skipped when the
+    positions are read, so removing a service does not renumber every later
+    connection.
+
+    Connections are stored in chunks. snapshot() shares the chunks with an
+    immutable ConnectionSnapshot, and the list copies a chunk the first time
+    it changes it afterwards, so readers of a snapshot never see later changes
+    and a change only copies the chunks it touches. Changes and snapshots are
+    serialised by a lock, so a snapshot never sees half of a change.
     """
 
     def __init__(self, connection_list: list | None = None) -> None:
@@ -181,9 +279,13 @@ class ConnectionList(object):
         Initialise the ConnectionList object.
         """
         if connection_list == None:
-            self.__connection_list = []
-        else:
-            self.__connection_list = connection_list
+            connection_list = []
+        self.__lock = threading.RLock()
+        self.__set_connections(connection_list)
+        self.__version = 0
+        self.__uid_index: dict[str, list[int]] | None = None
+        # Sorted index keys of connections removed since the index was built.
+        self.__holes: list[int] = []
 
     def __check_type(self, connection: Connection) -> None:
         """
@@ -193,34 +295,262 @@ class ConnectionList(object):
         if isinstance(connection, Connection) != True:
             raise TypeError("Connection must be of type Connection")
 
+    def __set_connections(self, connections: list) -> None:
+        """
+        Replace the contents of the list.
+        @param connections: List of connections.
+        """
+        self.__chunks = [
+            connections[i : i + _CHUNK_SIZE]
+            for i in range(0, len(connections), _CHUNK_SIZE)
+        ]
+        # False for chunks shared with a snapshot, which must be copied
+        # before they are changed.
+        self.__owned = [True] * len(self.__chunks)
+        self.__offsets: list[int] | None = None
+        self.__length = len(connections)
+
+    def __get_offsets(self) -> list[int]:
+        """
+        Get the position of the first connection of each chunk, rebuilding
+        them if they are stale.
+        @return: List of positions.
+        """
+        if self.__offsets is None:
+            self.__offsets = _chunk_offsets(self.__chunks)
+        return self.__offsets
+
+    def __locate(self, index: int) -> tuple[int, int]:
+        """
+        Find the chunk holding a position.
+        @param index: Position, negative from the end.
+        @return: Tuple of (chunk, position in the chunk).
+        """
+        if index < 0:
+            index += self.__length
+        if index < 0 or index >= self.__length:
+            raise IndexError("ConnectionList index out of range")
+        offsets = self.__get_offsets()
+        chunk = bisect.bisect_right(offsets, index) - 1
+        return chunk, index - offsets[chunk]
+
+    def __own(self, chunk: int) -> list:
+        """
+        Get a chunk for changing, copying it if a snapshot shares it.
+        @param chunk: Chunk number.
+        @return: The chunk.
+        """
+        if self.__owned[chunk] == False:
+            self.__chunks[chunk] = list(self.__chunks[chunk])
+            self.__owned[chunk] = True
+        return self.__chunks[chunk]
+
+    def __drop_if_empty(self, chunk: int) -> None:
+        """
+        Remove a chunk that no longer holds any connections.
+        @param chunk: Chunk number.
+        """
+        if len(self.__chunks[chunk]) == 0:
+            del self.__chunks[chunk]
+            del self.__owned[chunk]
+            self.__offsets = None
+
+    def __flatten(self) -> list[Connection]:
+        """
+        Copy the connections into a single list.
+        @return: List of connections.
+        """
+        return list(itertools.chain.from_iterable(self.__chunks))
+
     def __len__(self) -> int:
-        return len(self.__connection_list)
+        return self.__length
 
     def __getitem__(self, index: int) -> Connection:
-        return self.__connection_list[index]
+        if isinstance(index, slice):
+            return self.__flatten()[index]  # type: ignore
+        chunk, position = self.__locate(index)
+        return self.__chunks[chunk][position]
 
     def __setitem__(self, index: int, connection: Connection) -> None:
         if isinstance(connection, Connection) != True:
             raise TypeError("Connection must be of type Connection")
-        self.__connection_list[index] = connection
+        with self.__lock:
+            chunk, position = self.__locate(index)
+            previous = self.__chunks[chunk][position]
+            self.__own(chunk)[position] = connection
+            self.__version += 1
+            if (
+                self.__uid_index is not None
+                and previous.get_uid() != connection.get_uid()
+            ):
+                key = self.__key(index % self.__length)
+                self.__unindex(previous.get_uid(), key)
+                keys = self.__uid_index.setdefault(connection.get_uid(), [])
+                bisect.insort(keys, key)
 
     def __delitem__(self, index: int) -> None:
-        del self.__connection_list[index]
+        with self.__lock:
+            if isinstance(index, slice):
+                connections = self.__flatten()
+                del connections[index]
+                self.__set_connections(connections)
+            else:
+                if index == -1 or index == self.__length - 1:
+                    self.pop()
+                    return
+                chunk, position = self.__locate(index)
+                del self.__own(chunk)[position]
+                self.__drop_if_empty(chunk)
+                self.__offsets = None
+                self.__length -= 1
+            self.__version += 1
+            self.__uid_index = None
 
     def __iter__(self):
-        return self.__connection_list.__iter__()
+        return itertools.chain.from_iterable(self.__chunks)
 
     def __reversed__(self) -> Iterable:
-        return reversed(self.__connection_list)
+        return itertools.chain.from_iterable(
+            reversed(chunk) for chunk in reversed(self.__chunks)
+        )
 
     def __contains__(self, connection: Connection, /) -> bool:
-        return connection in self.__connection_list
+        if isinstance(connection, Connection) != True:
+            return False
+        return self.__find(connection, 0, self.__length) != -1
 
     def __repr__(self) -> str:
-        return f"ConnectionList({self.__connection_list})"
+        return f"ConnectionList({self.__flatten()})"
 
     def __str__(self) -> str:
-        return f"ConnectionList({self.__connection_list})"
+        return f"ConnectionList({self.__flatten()})"
+
+    def __reduce_ex__(self, protocol: int) -> tuple:
+        """
+        Pickle the list as tables of its distinct strings, datetimes and other
+        data, and one column per field holding the position of each
+        connection's value in those tables, rather than as Connection
+        objects. The lock and the uid index are not pickled. With protocol 5
+        and above, each column is passed as an out-of-band buffer.
+        @param protocol: Pickle protocol.
+        @return: Tuple of (function rebuilding the object, its arguments).
+        """
+        with self.__lock:
+            connections = self.__flatten()
+
+        def intern(table: dict, keys: Iterable) -> array:
+            return array("i", [table.setdefault(key, len(table)) for key in keys])
+
+        def time_keys(getter: Callable) -> Iterable:
+            # The timezone is part of the key, as aware datetimes in different
+            # timezones compare equal.
+            return ((value, value.tzinfo) for value in map(getter, connections))
+
+        strings: dict[str, int] = {}
+        times: dict[tuple, int] = {}
+        data = list(map(Connection.get_other_data, connections))
+        other_data = {id(value): value for value in data}
+        columns = [
+            intern(strings, map(Connection.get_uid, connections)),
+            intern(times, time_keys(Connection.get_dep_time)),
+            intern(times, time_keys(Connection.get_arr_time)),
+            intern(strings, map(Connection.get_dep_loc, connections)),
+            intern(strings, map(Connection.get_arr_loc, connections)),
+            intern({}, map(id, data)),
+        ]
+        return (
+            _unpickle_connection_list,
+            (
+                list(strings),
+                [time for time, _ in times],
+                list(other_data.values()),
+                [_pickle_column(column, protocol) for column in columns],
+            ),
+        )
+
+    def __get_uid_index(self) -> dict[str, list[int]]:
+        """
+        Get the uid index, rebuilding it if it is stale. Use __positions() to
+        turn its keys into positions.
+        @return: Dict of uid to sorted list of index keys.
+        """
+        if self.__uid_index is None:
+            self.__holes = []
+            uid_index: dict[str, list[int]] = {}
+            for position, uid in enumerate(map(Connection.get_uid, self)):
+                positions = uid_index.get(uid)
+                if positions is None:
+                    uid_index[uid] = [position]
+                else:
+                    positions.append(position)
+            self.__uid_index = uid_index
+        return self.__uid_index
+
+    def __unindex(self, uid: str, key: int) -> None:
+        """
+        Remove a key from the uid index.
+        @param uid: Unique identifier of the connection of the key.
+        @param key: Index key to remove.
+        """
+        keys = self.__uid_index[uid]  # type: ignore
+        keys.pop(bisect.bisect_left(keys, key))
+        if len(keys) == 0:
+            del self.__uid_index[uid]  # type: ignore
+
+    def __key(self, position: int) -> int:
+        """
+        Get the uid index key of a position: the position counting the holes
+        left by removed connections before it.
+        @param position: Position in the list.
+        @return: Index key.
+        """
+        key = position
+        for hole in self.__holes:
+            if hole > key:
+                break
+            key += 1
+        return key
+
+    def __trim_holes(self, top: int) -> None:
+        """
+        Drop the holes after the last connection, so the key of the next
+        connection appended is its position plus the number of holes.
+        @param top: Largest index key in use or left as a hole.
+        """
+        holes = self.__holes
+        while holes and holes[-1] == top:
+            holes.pop()
+            top -= 1
+
+    def __positions(self, keys: list[int]) -> list[int]:
+        """
+        Turn uid index keys into positions in the list.
+        @param keys: Sorted index keys.
+        @return: Sorted positions.
+        """
+        holes = self.__holes
+        if not holes:
+            return keys
+        return [key - bisect.bisect_left(holes, key) for key in keys]
+
+    def __find(self, connection: Connection, start: int, end: int) -> int:
+        """
+        Find the first position of a connection between start and end.
+        @param connection: Connection to find.
+        @param start: First position to look at.
+        @param end: Position to stop looking at.
+        @return: The position, or -1 if the connection was not found.
+        """
+        positions = self.__positions(
+            self.__get_uid_index().get(connection.get_uid(), [])
+        )
+        for i in range(bisect.bisect_left(positions, start), len(positions)):
+            position = positions[i]
+            if position >= end:
+                break
+            if self[position] == connection:
+                return position
+        return -1
 
     def append(self, connection: Connection) -> None:
         """
@@ -228,7 +558,24 @@ class ConnectionList(object):
         @param connection: Connection to append.
         """
         self.__check_type(connection)
-        self.__connection_list.append(connection)
+        with self.__lock:
+            chunks = self.__chunks
+            if chunks and len(chunks[-1]) < _CHUNK_SIZE:
+                self.__own(len(chunks) - 1).append(connection)
+            else:
+                chunks.append([connection])
+                self.__owned.append(True)
+                if self.__offsets is not None:
+                    self.__offsets.append(self.__length)
+            self.__length += 1
+            self.__version += 1
+            if self.__uid_index is not None:
+                keys = self.__uid_index.get(connection.get_uid())
+                key = self.__length - 1 + len(self.__holes)
+                if keys is None:
+                    self.__uid_index[connection.get_uid()] = [key]
+                else:
+                    keys.append(key)
 
     def insert(self, index: int, connection: Connection) -> None:
         """
@@ -237,7 +584,21 @@ class ConnectionList(object):
         @param connection: Connection to insert.
         """
         self.__check_type(connection)
-        self.__connection_list.insert(index, connection)
+        with self.__lock:
+            if index >= self.__length or self.__length == 0:
+                self.append(connection)
+                return
+            chunk, position = self.__locate(max(index, -self.__length))
+            chunk_list = self.__own(chunk)
+            chunk_list.insert(position, connection)
+            if len(chunk_list) > 2 * _CHUNK_SIZE:
+                self.__chunks[chunk + 1 : chunk + 1] = [chunk_list[_CHUNK_SIZE:]]
+                self.__owned.insert(chunk + 1, True)
+                del chunk_list[_CHUNK_SIZE:]
+            self.__offsets = None
+            self.__length += 1
+            self.__version += 1
+            self.__uid_index = None
 
     def pop(self, index: int = -1) -> Connection:
         """
@@ -245,7 +606,23 @@ class ConnectionList(object):
         @param index: (Optional, default -1) Index to remove the connection at.
         @return: The connection at the given index.
         """
-        return self.__connection_list.pop(index)
+        with self.__lock:
+            chunk, position = self.__locate(index)
+            connection = self.__own(chunk).pop(position)
+            last = chunk == len(self.__chunks) - 1
+            self.__drop_if_empty(chunk)
+            if last == False:
+                self.__offsets = None
+            self.__length -= 1
+            self.__version += 1
+            if self.__uid_index is not None:
+                if index == -1 or index == self.__length:
+                    key = self.__length + len(self.__holes)
+                    self.__unindex(connection.get_uid(), key)
+                    self.__trim_holes(key - 1)
+                else:
+                    self.__uid_index = None
+            return connection
 
     def remove(self, connection: Connection) -> None:
         """
@@ -253,13 +630,20 @@ class ConnectionList(object):
         @param connection: Connection to remove.
         """
         self.__check_type(connection)
-        self.__connection_list.remove(connection)
+        with self.__lock:
+            position = self.__find(connection, 0, self.__length)
+            if position == -1:
+                raise ValueError("Connection not in list")
+            del self[position]
 
     def clear(self) -> None:
         """
         Remove all connections from the list.
         """
-        self.__connection_list.clear()
+        with self.__lock:
+            self.__set_connections([])
+            self.__version += 1
+            self.__uid_index = None
 
     def index(self, connection: Connection, start: int = 0, end: int = -1) -> int:
         """
@@ -270,7 +654,11 @@ class ConnectionList(object):
         @return: Index of the first occurrence of the connection.
         """
         self.__check_type(connection)
-        return self.__connection_list.index(connection, start, end)
+        start, end, _ = slice(start, end).indices(self.__length)
+        position = self.__find(connection, start, end)
+        if position == -1:
+            raise ValueError("Connection not in list")
+        return position
 
     def sort(self, key: Callable, reverse: bool = False) -> None:
         """
@@ -278,7 +666,261 @@ class ConnectionList(object):
         @param key: (Optional, default None) Key to sort by.
         @param reverse: (Optional, default False) Whether to sort in reverse.
         """
-        self.__connection_list.sort(key=key, reverse=reverse)
+        with self.__lock:
+            connections = self.__flatten()
+            connections.sort(key=key, reverse=reverse)
+            self.__set_connections(connections)
+            self.__uid_index = None
+
+    def get_service(self, uid: str) -> list[Connection]:
+        """
+        Get every connection belonging to a service, in list order.
+        @param uid: Unique identifier of the service.
+        @return: List of connections, empty if the service is not in the list.
+        """
+        return [
+            self[position]
+            for position in self.__positions(self.__get_uid_index().get(uid, []))
+        ]
+
+    def remove_service(self, uid: str) -> int:
+        """
+        Remove every connection belonging to a service.
+        @param uid: Unique identifier of the service.
+        @return: Number of connections removed.
+        """
+        return self.remove_services([uid])
+
+    def remove_services(self, uids: Iterable[str]) -> int:
+        """
+        Remove every connection belonging to any of the given services. Only
+        the chunks holding them are changed, and their positions are left as
+        holes in the uid index, so the cost depends on the number of
+        connections removed and the chunks they are in, not on the length of
+        the list. The index is renumbered once the holes outnumber an eighth
+        of the list.
+        @param uids: Unique identifiers of the services.
+        @return: Number of connections removed.
+        """
+        with self.__lock:
+            uid_index = self.__get_uid_index()
+            keys = sorted(key for uid in set(uids) for key in uid_index.pop(uid, []))
+            if len(keys) == 0:
+                return 0
+            positions = self.__positions(keys)
+            offsets = self.__get_offsets()
+            # Latest chunks first, so dropping an empty chunk does not move
+            # the chunks still to be changed.
+            for chunk, group in itertools.groupby(
+                reversed(positions),
+                key=lambda position: bisect.bisect_right(offsets, position) - 1,
+            ):
+                removed = {position - offsets[chunk] for position in group}
+                chunk_list = self.__own(chunk)
+                chunk_list[:] = [
+                    connection
+                    for i, connection in enumerate(chunk_list)
+                    if i not in removed
+                ]
+                self.__drop_if_empty(chunk)
+            self.__offsets = None
+            top = self.__length - 1 + len(self.__holes)
+            self.__length -= len(positions)
+            self.__holes = list(heapq.merge(self.__holes, keys))
+            self.__trim_holes(top)
+            if len(self.__holes) > max(_CHUNK_SIZE, self.__length // 8):
+                for uid, uid_keys in uid_index.items():
+                    uid_index[uid] = self.__positions(uid_keys)
+                self.__holes = []
+            self.__version += 1
+            return len(positions)
+
+    def remove_connections(self, connections: Iterable[Connection]) -> int:
+        """
+        Remove the given connection objects, in a single pass over the list.
+        Connections are matched by identity, so an equal connection elsewhere
+        in the list is kept.
+        @param connections: Connection objects to remove.
+        @return: Number of connections removed.
+        """
+        removed = {id(connection) for connection in connections}
+        with self.__lock:
+            connection_list = self.__flatten()
+            kept = [
+                connection
+                for connection in connection_list
+                if id(connection) not in removed
+            ]
+            if len(kept) == len(connection_list):
+                return 0
+            self.__set_connections(kept)
+            self.__uid_index = None
+            self.__version += 1
+            return len(connection_list) - len(kept)
+
+    def get_uids(self) -> list[str]:
+        """
+        Get the unique identifiers of every service in the list.
+        @return: List of unique identifiers.
+        """
+        return list(self.__get_uid_index().keys())
+
+    def get_storage_size(self) -> int:
+        """
+        Get the memory used by the list itself, not counting the connections
+        it holds.
+        @return: Size in bytes.
+        """
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.__chunks)
+            + sum(map(sys.getsizeof, self.__chunks))
+        )
+
+    def get_index_size(self) -> int:
+        """
+        Get the memory used by the uid index, not counting the uid strings
+        themselves (they are shared with the connections).
+        @return: Size in bytes, 0 if the index has not been built.
+        """
+        if self.__uid_index is None:
+            return 0
+        return sys.getsizeof(self.__uid_index) + sys.getsizeof(self.__holes) + sum(
+            sys.getsizeof(positions) + sum(map(sys.getsizeof, positions))
+            for positions in self.__uid_index.values()
+        )
+
+    def get_version(self) -> int:
+        """
+        Get the version of the list, which is incremented every time a
+        connection is added, replaced or removed. Sorting does not change the
+        contents of the list, so it does not change the version.
+        @return: Version of the list.
+        """
+        return self.__version
+
+    def snapshot(self) -> "ConnectionSnapshot":
+        """
+        Get an immutable snapshot of the list as it is now. The snapshot
+        shares the list's chunks, so it is cheap to take, and later changes
+        to the list copy the chunks they touch instead of changing them.
+        @return: A ConnectionSnapshot object.
+        """
+        with self.__lock:
+            self.__owned = [False] * len(self.__chunks)
+            return ConnectionSnapshot(
+                tuple(self.__chunks), self.__length, self.__version
+            )
+
+
+class ConnectionSnapshot(object):
+    """
+    Immutable snapshot of a ConnectionList, returned by
+    ConnectionList.snapshot(). It supports len(), indexing and iteration.
+    """
+
+    def __init__(self, chunks: tuple[list, ...], length: int, version: int) -> None:
+        """
+        Initialise the ConnectionSnapshot object. Use ConnectionList.snapshot()
+        rather than calling this directly.
+        @param chunks: Chunks of connections, never changed after this.
+        @param length: Number of connections.
+        @param version: Version of the list the snapshot was taken from.
+        """
+        self.__chunks = chunks
+        self.__offsets = _chunk_offsets(chunks)
+        self.__length = length
+        self.__version = version
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def __getitem__(self, index: int) -> Connection:
+        if index < 0:
+            index += self.__length
+        if index < 0 or index >= self.__length:
+            raise IndexError("ConnectionSnapshot index out of range")
+        chunk = bisect.bisect_right(self.__offsets, index) - 1
+        return self.__chunks[chunk][index - self.__offsets[chunk]]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.__chunks)
+
+    def __repr__(self) -> str:
+        return f"ConnectionSnapshot(version {self.__version}, {self.__length} connections)"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def get_version(self) -> int:
+        """
+        Get the version of the list the snapshot was taken from.
+        @return: Version of the list.
+        """
+        return self.__version
+
+    def get_memory_size(self) -> int:
+        """
+        Get the memory used by the snapshot itself, not counting its chunks
+        (they are shared with the list while it is unchanged) or connections.
+        @return: Size in bytes.
+        """
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.__chunks)
+            + sys.getsizeof(self.__offsets)
+            + sum(map(sys.getsizeof, self.__offsets))
+        )
+
+
+def _unpickle_connection_list(
+    strings: list[str],
+    times: list[datetime.datetime],
+    other_data: list[dict],
+    columns: list,
+) -> ConnectionList:
+    """
+    Rebuild a connection list pickled by ConnectionList.__reduce_ex__.
+    @param strings: Distinct uids and location identifiers.
+    @param times: Distinct departure and arrival times.
+    @param other_data: Distinct other data dicts.
+    @param columns: Pickled columns of positions in the tables: uid,
+    departure time, arrival time, departure location, arrival location and
+    other data.
+    @return: A ConnectionList object.
+    """
+    uids, dep_times, arr_times, dep_locs, arr_locs, data = [
+        _unpickle_column("i", column) for column in columns
+    ]
+    return ConnectionList(
+        [
+            Connection(
+                strings[uid],
+                times[dep_time],
+                times[arr_time],
+                strings[dep_loc],
+                strings[arr_loc],
+                other_data=other_data[position],
+            )
+            for uid, dep_time, arr_time, dep_loc, arr_loc, position in zip(
+                uids, dep_times, arr_times, dep_locs, arr_locs, data
+            )
+        ]
+    )
+
+
+def _chunk_offsets(chunks: Iterable[list]) -> list[int]:
+    """
+    Get the position of the first item of each chunk.
+    @param chunks: Chunks.
+    @return: List of positions.
+    """
+    offsets = []
+    position = 0
+    for chunk in chunks:
+        offsets.append(position)
+        position += len(chunk)
+    return offsets
 
 
 class TimetableSchema(object):
@@ -377,28 +1019,88 @@ class Timetable(object):
     Class for storing a timetable, which is defined as a list of services.
     """
 
-    def __init__(self, connection_list: ConnectionList | None = None) -> None:
+    def __init__(
+        self,
+        connection_list: ConnectionList | None = None,
+        timezone: datetime.tzinfo | None = None,
+        epoch: datetime.datetime = DEFAULT_EPOCH,
+    ) -> None:
         """
         Initialise a Timetable object with an optional ConnectionList.
         @param connection_list: (Optional, default None) A ConnectionList
+        @param timezone: (Optional, default None) Timezone of the naive
+        datetimes in the timetable. Without one, naive datetimes are used as
+        they are and aware datetimes are converted to UTC.
+        @param epoch: (Optional, default 1970-01-01) Time counted as 0 by the
+        integer times used inside the library.
         """
         if connection_list == None:
             self.__connection_list = ConnectionList()
         else:
             self.__connection_list = connection_list
+        self.__converter = TimeConverter(epoch, timezone)
+        self.__snapshot: TimetableSnapshot | None = None
+        self.__snapshot_lock = threading.Lock()
+        # Intern table of the uids and location identifiers parsed so far:
+        # dense identifier ids, and the identifier of each id.
+        self.__identifier_index: dict[str, int] = {}
+        self.__identifiers: list[str] = []
+
+    def __getstate__(self) -> dict:
+        """
+        Get the state to pickle: a snapshot of the connections, which pickle
+        in a compact form, the time converter and, if the snapshot has
+        already been compiled, its compiled timetable, so that it is not
+        compiled again after unpickling. Locks are not pickled.
+        @return: Dict of state.
+        """
+        snapshot = self.snapshot()
+        return {
+            "connections": ConnectionList(list(snapshot.get_connections())),
+            "converter": self.__converter,
+            "compiled": snapshot.compile() if snapshot.is_compiled() else None,
+            "identifiers": self.__identifiers,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restore the state returned by __getstate__.
+        @param state: Dict of state.
+        """
+        self.__connection_list = state["connections"]
+        self.__converter = state["converter"]
+        self.__snapshot = None
+        self.__snapshot_lock = threading.Lock()
+        self.__identifiers = state["identifiers"]
+        self.__identifier_index = {
+            identifier: i for i, identifier in enumerate(self.__identifiers)
+        }
+        if state["compiled"] is not None:
+            self.__snapshot = TimetableSnapshot(
+                self.__connection_list.snapshot(), self.__converter, state["compiled"]
+            )
 
-    def __parse_service(self, service: dict | list, schema: TimetableSchema) -> None:
+    def __parse_service(
+        self,
+        service: dict | list,
+        schema: TimetableSchema,
+        rejected: list[ValidationIssue] | None = None,
+    ) -> int:
         """
         Parse a service from a dict.
         @param service: A dict of stops.
         @param schema: A TimetableSchema object describing the structure of the
         timetable.
+        @param rejected: (Optional, default None) List to add the rows that
+        cannot be made into a connection to, instead of raising an exception.
+        @return: Number of connections created.
         """
+        created = 0
         uid = ""
         datetime_format = schema.get_datetime_format()
         if schema.get_list_key() != "" and type(service) == dict:
             try:
-                uid = service[schema.get_uid_key()]
+                uid = self.__intern(service[schema.get_uid_key()])
             except KeyError:
                 raise KeyError("Unique identifier not found")
             stops = service[schema.get_list_key()]
@@ -409,7 +1111,7 @@ class Timetable(object):
         for stop in stops:
             if schema.get_list_key() == "" or type(service) == list:
                 try:
-                    uid = stop[schema.get_uid_key()]
+                    uid = self.__intern(stop[schema.get_uid_key()])
                 except KeyError:
                     raise KeyError("Unique identifier not found")
             other_data = {
@@ -423,8 +1125,8 @@ class Timetable(object):
                     ):
                         # Normal stop
                         arr_time = stop[schema.get_arr_time_key()]
-                        arr_loc = stop[schema.get_loc_key()]
-                        self.__create_connections(
+                        arr_loc = self.__intern(stop[schema.get_loc_key()])
+                        created += self.__create_connections(
                             uid,
                             dep_time,
                             arr_time,
@@ -432,17 +1134,18 @@ class Timetable(object):
                             arr_loc,
                             datetime_format,
                             other_data,
+                            rejected,
                         )
                         dep_time = [stop[schema.get_dep_time_key()]]
-                        dep_loc = [stop[schema.get_loc_key()]]
+                        dep_loc = [self.__intern(stop[schema.get_loc_key()])]
                     elif (
                         schema.get_arr_time_key() in stop
                         and schema.get_dep_time_key() not in stop
                     ):
                         # Set down stop only
                         arr_time = stop[schema.get_arr_time_key()]
-                        arr_loc = stop[schema.get_loc_key()]
-                        self.__create_connections(
+                        arr_loc = self.__intern(stop[schema.get_loc_key()])
+                        created += self.__create_connections(
                             uid,
                             dep_time,
                             arr_time,
@@ -450,6 +1153,7 @@ class Timetable(object):
                             arr_loc,
                             datetime_format,
                             other_data,
+                            rejected,
                         )
                     elif (
                         schema.get_arr_time_key() not in stop
@@ -457,7 +1161,21 @@ class Timetable(object):
                     ):
                         # Pick up stop only
                         dep_time.append(stop[schema.get_dep_time_key()])
-                        dep_loc.append(stop[schema.get_loc_key()])
+                        dep_loc.append(self.__intern(stop[schema.get_loc_key()]))
+        return created
+
+    def __intern(self, identifier: str) -> str:
+        """
+        Add an identifier to the intern table if it is not in it yet.
+        @param identifier: A uid or location identifier.
+        @return: The identifier object held by the intern table, so that every
+        connection with the same identifier shares one object.
+        """
+        position = self.__identifier_index.get(identifier)
+        if position is None:
+            position = self.__identifier_index[identifier] = len(self.__identifiers)
+            self.__identifiers.append(identifier)
+        return self.__identifiers[position]
 
     def __create_connections(
         self,
@@ -468,7 +1186,8 @@ class Timetable(object):
         arr_loc: str,
         datetime_format: str = "",
         other_data: dict = {},
-    ) -> None:
+        rejected: list[ValidationIssue] | None = None,
+    ) -> int:
         """
         Create connections from a list of departure times and an arrival time.
         Arrival time is not a list as there is no use case for it.
@@ -477,10 +1196,14 @@ class Timetable(object):
         @param arr_time: Arrival time.
         @param other_data: Other data present in the timetable for this
         connection (e.g. mode, operator, etconnection.)
+        @param rejected: (Optional, default None) List to add the rows that
+        cannot be made into a connection to, instead of raising an exception.
+        @return: Number of connections created.
         """
+        created = 0
         for i in range(len(dep_times)):
-            self.__connection_list.append(
-                Connection(
+            try:
+                connection = Connection(
                     uid,
                     dep_times[i],
                     arr_time,
@@ -489,28 +1212,110 @@ class Timetable(object):
                     datetime_format,
                     other_data,
                 )
-            )
+            except ValueError:
+                if rejected is None:
+                    raise
+                rejected.append(
+                    ValidationIssue(
+                        INVALID_ROW,
+                        -1,
+                        uid,
+                        dep_locs[i],
+                        arr_loc,
+                        dep_times[i],
+                        arr_time,
+                    )
+                )
+                continue
+            self.__connection_list.append(connection)
+            created += 1
+        return created
 
-    def parse_list(self, timetable: list, schema: TimetableSchema) -> None:
+    def parse_list(
+        self, timetable: list, schema: TimetableSchema, quarantine: bool = False
+    ) -> ValidationReport:
         """
         Parse a timetable from a list.
         @param timetable: A list of services.
         @param schema: A TimetableSchema object describing the structure of the
         timetable.
+        @param quarantine: (Optional, default False) Leave out rows that cannot
+        be made into a connection, such as rows arriving before they depart,
+        instead of raising an exception on the first one.
+        @return: A ValidationReport of the rows left out.
         """
+        rejected: list[ValidationIssue] | None = [] if quarantine else None
+        created = 0
         for service in timetable:
-            self.__parse_service(service, schema)
+            created += self.__parse_service(service, schema, rejected)
         # DEBUG
         # print(self.__connection_list)
+        rejected = rejected or []
+        return ValidationReport(rejected, created + len(rejected), len(rejected))
 
-    def stats(self) -> dict:
+    def stats(self, deep: bool = False) -> dict:
         """
         Return statistics about the timetable
+        @param deep: (Optional, default False) Also return a breakdown of the
+        memory used by everything the timetable holds, including the caches
+        built when they are first needed (the uid index, the snapshot and its
+        compiled form and boards). Objects shared between connections are
+        only counted once.
         @return: A list of statistics about the timetable
         """
+        if deep == False:
+            return {
+                "connection_list_length": len(self.__connection_list),
+                "timetable_memory_size": sys.getsizeof(self),
+            }
+
+        connections = self.__connection_list
+        length = len(connections)
+        dep_times = list(map(Connection.get_dep_time, connections))
+        datetimes = {id(x): x for x in dep_times}
+        datetimes.update((id(x), x) for x in map(Connection.get_arr_time, connections))
+        strings = {id(x): x for x in map(Connection.get_uid, connections)}
+        strings.update((id(x), x) for x in map(Connection.get_dep_loc, connections))
+        strings.update((id(x), x) for x in map(Connection.get_arr_loc, connections))
+        other_data = {id(x): x for x in map(Connection.get_other_data, connections)}
+        seen = set(strings)
+
+        memory = {
+            "connection_storage": connections.get_storage_size()
+            + sum(map(sys.getsizeof, connections)),
+            "datetimes": sum(map(sys.getsizeof, datetimes.values())),
+            "other_data": sum(
+                _deep_getsizeof(data, seen) for data in other_data.values()
+            ),
+            "strings": sum(map(sys.getsizeof, strings.values())),
+            "indexes": sys.getsizeof(self.__identifier_index)
+            + sys.getsizeof(self.__identifiers),
+            # Built when they are first needed: the uid index, the snapshot
+            # and its compiled form with the departure and arrival boards.
+            "caches": connections.get_index_size()
+            + (self.__snapshot.get_memory_size() if self.__snapshot is not None else 0),
+            "timetable": sys.getsizeof(self),
+        }
+        total = sum(memory.values())
+        connections_per_day = {
+            day.isoformat(): count
+            for day, count in sorted(
+                Counter(map(datetime.datetime.date, dep_times)).items()
+            )
+        }
+
         return {
-            "connection_list_length": len(self.__connection_list),
-            "timetable_memory_size": sys.getsizeof(self),
+            "connection_list_length": length,
+            "timetable_memory_size": total,
+            "memory": memory,
+            "bytes_per_connection": {
+                key: value / length if length else 0.0
+                for key, value in {**memory, "total": total}.items()
+            },
+            "connections_per_day": connections_per_day,
+            "unique_datetimes": len(datetimes),
+            "unique_strings": len(strings),
+            "unique_other_data": len(other_data),
         }
 
     def get_connections(self) -> ConnectionList:
@@ -520,196 +1325,2855 @@ class Timetable(object):
         """
         return self.__connection_list
 
+    def get_identifier_id(self, identifier: str) -> int:
+        """
+        Get the dense id of a uid or location identifier in the timetable's
+        intern table.
+        @param identifier: A uid or location identifier.
+        @return: Identifier id, or -1 if the identifier has not been parsed.
+        """
+        return self.__identifier_index.get(identifier, -1)
 
-class Location(object):
-    """
-    Class for storing location information
-    """
-
-    def __init__(
-        self, location_id: str, location_name: str, minimum_connection_time: int = 0
-    ) -> None:
+    def get_identifier(self, identifier_id: int) -> str:
         """
-        Initialise a Location object.
-        @param location_id: Location identifier.
-        @param location_name: Location name.
-        @param minimum_connection_time: Minimum connection time between services
-        at this location.
+        Get the uid or location identifier with a dense id.
+        @param identifier_id: Identifier id from get_identifier_id().
+        @return: The identifier.
         """
-        self.__location_id = location_id
-        self.__location_name = location_name
-        self.__mct = minimum_connection_time
+        if identifier_id < 0:
+            raise IndexError("Identifier id must not be negative")
+        return self.__identifiers[identifier_id]
 
-    def __repr__(self) -> str:
-        return f"Location({self.__location_id}, {self.__location_name}, {self.__mct})"
+    def get_identifier_count(self) -> int:
+        """
+        Get the number of distinct uids and location identifiers in the
+        timetable's intern table.
+        @return: Number of identifiers.
+        """
+        return len(self.__identifiers)
 
-    def __str__(self) -> str:
-        return f"Location({self.__location_id}, {self.__location_name}, {self.__mct})"
+    def get_version(self) -> int:
+        """
+        Get the version of the timetable. This changes whenever a connection
+        is added, replaced or removed, including changes made directly through
+        get_connections().
+        @return: Version of the timetable.
+        """
+        return self.__connection_list.get_version()
 
-    def get_location_id(self) -> str:
+    def get_service(self, uid: str) -> list[Connection]:
         """
-        Get the location identifier.
-        @return: Location identifier.
+        Get every connection belonging to a service.
+        @param uid: Unique identifier of the service.
+        @return: List of connections, empty if the service is not in the
+        timetable.
         """
-        return self.__location_id
+        return self.__connection_list.get_service(uid)
 
-    def get_location_name(self) -> str:
+    def remove_service(self, uid: str) -> int:
         """
-        Get the location name.
-        @return: Location name.
+        Remove every connection belonging to a service, for example when it has
+        been cancelled.
+        @param uid: Unique identifier of the service.
+        @return: Number of connections removed.
         """
-        return self.__location_name
+        return self.__connection_list.remove_service(uid)
 
-    def get_minimum_connection_time(self) -> int:
+    def get_converter(self) -> TimeConverter:
         """
-        Get the minimum connection time.
-        @return: Minimum connection time.
+        Get the converter between datetimes and the integer times used inside
+        the library.
+        @return: A TimeConverter object.
         """
-        return self.__mct
+        return self.__converter
 
+    def snapshot(self) -> "TimetableSnapshot":
+        """
+        Get an immutable snapshot of the timetable as it is now. The snapshot
+        is taken again only after the timetable changes, so readers asking
+        for it between two changes share the same snapshot and its compiled
+        form.
+        @return: A TimetableSnapshot object.
+        """
+        with self.__snapshot_lock:
+            snapshot = self.__snapshot
+            if (
+                snapshot is None
+                or snapshot.get_version() != self.__connection_list.get_version()
+            ):
+                snapshot = TimetableSnapshot(
+                    self.__connection_list.snapshot(), self.__converter
+                )
+                self.__snapshot = snapshot
+            return snapshot
 
-class ItineraryEngine(object):
-    """
-    Class for processing timetables for the generation of itineraries.
-    """
+    def compile(self) -> CompiledTimetable:
+        """
+        Get the compiled, column-oriented form of the timetable, with times as
+        integer seconds since the epoch. It is built the first time it is
+        needed and rebuilt after the timetable changes.
+        @return: A CompiledTimetable object.
+        """
+        return self.snapshot().compile()
 
-    def __init__(self, timetable: Timetable, locations: dict[str, Location]) -> None:
+    def validate(
+        self, locations: Iterable[str] | None = None, quarantine: bool = False
+    ) -> ValidationReport:
         """
-        Initialise the ItineraryEngine object.
-        @param timetable: A Timetable object.
-        @param stations: A list of station identifiers.
+        Check every connection of the timetable in bulk, over the columns of
+        its compiled form, and report all the problems found rather than
+        stopping at the first one. The checks are: connections that do not
+        arrive after they depart once converted to integer times (for example
+        across a daylight saving change), connections of a trip leaving a stop
+        before the previous connection of the trip arrives there, connections
+        from or to unknown locations and duplicate connections of a trip (the
+        first one is kept).
+        @param locations: (Optional, default None) Known location identifiers,
+        such as the dict of Location objects given to an engine. Without them,
+        locations are not checked.
+        @param quarantine: (Optional, default False) Remove every connection
+        with an issue from the timetable.
+        @return: A ValidationReport, with positions in the connection list as
+        it was when validation started.
         """
-        self.__timetable = timetable
-        self.__locations = locations
-        self.__in_connection = {k: -1 for k in self.__locations.keys()}
-        self.__earliest_arrival = {
-            k: datetime.datetime.max for k in self.__locations.keys()
+        snapshot = self.snapshot()
+        connections = snapshot.get_connections()
+        compiled = snapshot.compile()
+        list_positions = {
+            id(connection): position for position, connection in enumerate(connections)
         }
+        if len(compiled) > 0 and id(compiled.get_connection(0)) not in list_positions:
+            # The compiled form was loaded without the snapshot's connection
+            # objects, so the rows cannot be matched to the list.
+            compiled = CompiledTimetable.from_connections(connections, self.__converter)
+        compiled_connections = compiled.get_connections()
+        found = _find_issues(
+            compiled,
+            [list_positions[id(connection)] for connection in compiled_connections],
+            None if locations is None else set(locations),
+        )
+        issues = []
+        for check, position in found:
+            connection = compiled_connections[position]
+            issues.append(
+                ValidationIssue(
+                    check,
+                    list_positions[id(connection)],
+                    connection.get_uid(),
+                    connection.get_dep_loc(),
+                    connection.get_arr_loc(),
+                    connection.get_dep_time(),
+                    connection.get_arr_time(),
+                )
+            )
+        removed = 0
+        if quarantine and found:
+            removed = self.__connection_list.remove_connections(
+                compiled_connections[position] for _, position in found
+            )
+        return ValidationReport(issues, len(connections), removed)
 
-    def generate_itinerary(
-        self,
-        origin: Location,
-        destination: Location,
-        planned_time: datetime.datetime,
-        arrive_by: bool = False,
-    ) -> list | None:
+    def save(self, file: str | BinaryIO) -> None:
         """
-        Generate an itinerary based on the initialised timetable and parameters provided.
-        @param origin: Origin location.
-        @param destination: Destination location.
-        @param planned_time: Planned departure/arrival time.
-        @param time_type: True if planned_time is a departure time, False if planned_time is an arrival time.
+        Write the timetable in the binary compiled format.
+        @param file: Path or binary file.
         """
-        if isinstance(origin, Location) != True:
-            raise TypeError("Origin must be of type Location")
-        if origin.get_location_id() not in self.__locations.keys():
-            raise ValueError("Origin location does not exist")
-        if isinstance(destination, Location) != True:
-            raise TypeError("Destination must be of type Location")
-        if destination.get_location_id() not in self.__locations.keys():
-            raise ValueError("Destination location does not exist")
-        if isinstance(planned_time, datetime.datetime) != True:
-            raise TypeError("Planned time must be a datetime object")
-        if arrive_by not in [True, False]:
-            raise TypeError("Time type must be a boolean")
+        self.compile().save(file)
 
-        earliest = datetime.datetime.max
+    @classmethod
+    def load(cls, file: str | BinaryIO) -> "Timetable":
+        """
+        Read a timetable written by save().
+        @param file: Path or binary file.
+        @return: A Timetable object.
+        """
+        return cls.__from_compiled(CompiledTimetable.load(file))
 
-        if arrive_by == False:
-            self.__earliest_arrival = {
-                key: datetime.datetime.max for key in self.__locations.keys()
-            }
-            self.__earliest_arrival[origin.get_location_id()] = planned_time  # type: ignore
-            self.__timetable.get_connections().sort(key=lambda x: x.get_dep_time())
-        else:
-            self.__earliest_arrival = {
-                key: datetime.datetime.min for key in self.__locations.keys()
-            }
-            self.__earliest_arrival[destination.get_location_id()] = planned_time  # type: ignore
-            self.__timetable.get_connections().sort(key=lambda x: x.get_arr_time())
+    def save_archive(self, file: str | BinaryIO, window: int = 86400) -> None:
+        """
+        Write the timetable as a compressed TimetableArchive, split into
+        departure time windows that can be read on their own.
+        @param file: Path or binary file.
+        @param window: (Optional, default 86400) Length of the windows in
+        seconds.
+        """
+        TimetableArchive.write(self.compile(), file, window)
 
-        for index, connection in enumerate(self.__timetable.get_connections()):
-            mct = 0
-            if (
-                self.__timetable.get_connections()[
-                    self.__in_connection[connection.get_arr_loc()]
-                ].get_uid()
-                != connection.get_uid()
-            ):
-                mct = self.__locations[
-                    connection.get_arr_loc()
-                ].get_minimum_connection_time()
+    @classmethod
+    def load_archive(
+        cls,
+        file: str | BinaryIO,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+    ) -> "Timetable":
+        """
+        Read a timetable written by save_archive(), or the part of it
+        departing in a time range. Only the windows overlapping the range are
+        decoded.
+        @param file: Path or seekable binary file.
+        @param start: (Optional, default None) Earliest departure time to
+        include.
+        @param end: (Optional, default None) Departure time to stop before.
+        @return: A Timetable object.
+        """
+        return cls.__from_compiled(TimetableArchive(file).read(start, end))
 
-            if (
-                arrive_by == False
-                and connection.get_dep_time()
-                >= self.__earliest_arrival[connection.get_dep_loc()]
-                + datetime.timedelta(minutes=mct)
-                and connection.get_arr_time()
-                < self.__earliest_arrival[connection.get_arr_loc()]
-            ):
-                self.__earliest_arrival[
-                    connection.get_arr_loc()
-                ] = connection.get_arr_time()
-                self.__in_connection[connection.get_arr_loc()] = index
-
-                if connection.get_arr_loc() == origin.get_location_id():
-                    earliest = min(earliest, connection.get_arr_time())
-            elif (
-                arrive_by
-                and connection.get_arr_time()
-                <= self.__earliest_arrival[connection.get_arr_loc()]
-                + datetime.timedelta(minutes=mct)
-                and connection.get_dep_time()
-                > self.__earliest_arrival[connection.get_dep_loc()]
+    @classmethod
+    def __from_compiled(cls, compiled: CompiledTimetable) -> "Timetable":
+        """
+        Build a timetable around a compiled timetable that was read from a
+        file.
+        @param compiled: A CompiledTimetable object.
+        @return: A Timetable object.
+        """
+        converter = compiled.get_converter()
+        timetable = cls(
+            ConnectionList(list(compiled.get_connections())),
+            converter.get_timezone(),
+            converter.get_epoch(),
+        )
+        timetable.__snapshot = TimetableSnapshot(
+            timetable.__connection_list.snapshot(), converter, compiled
+        )
+        # Connections made from the compiled timetable already share its
+        # identifiers, and later parsing shares them too.
+        for identifier in [*compiled.get_trip_ids(), *compiled.get_stop_ids()]:
+            timetable.__intern(identifier)
+        return timetable
+
+    def departures(
+        self, location_id: str, after: datetime.datetime, limit: int = 10
+    ) -> list[Connection]:
+        """
+        Get the next connections departing from a location.
+        @param location_id: Location identifier.
+        @param after: Earliest departure time to include.
+        @param limit: (Optional, default 10) Maximum number of connections.
+        @return: List of connections in order of departure.
+        """
+        return self.__board(False, location_id, after, limit)
+
+    def arrivals(
+        self, location_id: str, after: datetime.datetime, limit: int = 10
+    ) -> list[Connection]:
+        """
+        Get the next connections arriving at a location.
+        @param location_id: Location identifier.
+        @param after: Earliest arrival time to include.
+        @param limit: (Optional, default 10) Maximum number of connections.
+        @return: List of connections in order of arrival.
+        """
+        return self.__board(True, location_id, after, limit)
+
+    def __board(
+        self, arrivals: bool, location_id: str, after: datetime.datetime, limit: int
+    ) -> list[Connection]:
+        """
+        Look up a departure or arrival board of the compiled timetable.
+        @param arrivals: True for arrivals, False for departures.
+        @param location_id: Location identifier.
+        @param after: Earliest time to include.
+        @param limit: Maximum number of connections.
+        @return: List of connections in time order.
+        """
+        if isinstance(after, datetime.datetime) != True:
+            raise TypeError("Time must be a datetime object")
+        if limit < 0:
+            raise ValueError("Limit must not be negative")
+        compiled = self.compile()
+        times, positions = compiled.get_board(location_id, arrivals)
+        start = bisect.bisect_left(times, compiled.to_seconds(after))
+        return [
+            compiled.get_connection(position)
+            for position in positions[start : start + limit]
+        ]
+
+
+class TimetableSnapshot(object):
+    """
+    Immutable snapshot of a Timetable, returned by Timetable.snapshot().
+    Changes made to the timetable after the snapshot was taken are never seen
+    by it, so a reader can compile and query a snapshot while a writer keeps
+    updating the timetable.
+    """
+
+    def __init__(
+        self,
+        connections: ConnectionSnapshot,
+        converter: TimeConverter,
+        compiled: CompiledTimetable | None = None,
+    ) -> None:
+        """
+        Initialise the TimetableSnapshot object. Use Timetable.snapshot()
+        rather than calling this directly.
+        @param connections: Snapshot of the timetable's connections.
+        @param converter: TimeConverter for the timetable.
+        @param compiled: (Optional, default None) Compiled form of the
+        connections, if it is already known.
+        """
+        self.__connections = connections
+        self.__converter = converter
+        self.__compiled = compiled
+        self.__lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"TimetableSnapshot(version {self.get_version()}, {len(self.__connections)} connections)"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def get_version(self) -> int:
+        """
+        Get the version of the timetable the snapshot was taken from.
+        @return: Version of the timetable.
+        """
+        return self.__connections.get_version()
+
+    def get_connections(self) -> ConnectionSnapshot:
+        """
+        Get the connections of the snapshot.
+        @return: A ConnectionSnapshot object.
+        """
+        return self.__connections
+
+    def get_memory_size(self) -> int:
+        """
+        Get the memory used by the snapshot, including its compiled form and
+        boards if they have been built, not counting the connections.
+        @return: Size in bytes.
+        """
+        size = sys.getsizeof(self) + self.__connections.get_memory_size()
+        if self.__compiled is not None:
+            size += self.__compiled.get_memory_size()
+        return size
+
+    def is_compiled(self) -> bool:
+        """
+        Check whether the compiled form of the snapshot has been built.
+        @return: True if it has been built.
+        """
+        return self.__compiled is not None
+
+    def compile(self) -> CompiledTimetable:
+        """
+        Get the compiled form of the snapshot, building it the first time it
+        is needed.
+        @return: A CompiledTimetable object.
+        """
+        if self.__compiled is None:
+            with self.__lock:
+                if self.__compiled is None:
+                    self.__compiled = CompiledTimetable.from_connections(
+                        self.__connections, self.__converter
+                    )
+        return self.__compiled
+
+
+class Location(object):
+    """
+    Class for storing location information
+    """
+
+    def __init__(
+        self, location_id: str, location_name: str, minimum_connection_time: int = 0
+    ) -> None:
+        """
+        Initialise a Location object.
+        @param location_id: Location identifier.
+        @param location_name: Location name.
+        @param minimum_connection_time: Minimum connection time between services
+        at this location.
+        """
+        self.__location_id = location_id
+        self.__location_name = location_name
+        self.__mct = minimum_connection_time
+
+    def __repr__(self) -> str:
+        return f"Location({self.__location_id}, {self.__location_name}, {self.__mct})"
+
+    def __str__(self) -> str:
+        return f"Location({self.__location_id}, {self.__location_name}, {self.__mct})"
+
+    def get_location_id(self) -> str:
+        """
+        Get the location identifier.
+        @return: Location identifier.
+        """
+        return self.__location_id
+
+    def get_location_name(self) -> str:
+        """
+        Get the location name.
+        @return: Location name.
+        """
+        return self.__location_name
+
+    def get_minimum_connection_time(self) -> int:
+        """
+        Get the minimum connection time.
+        @return: Minimum connection time.
+        """
+        return self.__mct
+
+
+class _EngineState(object):
+    """
+    Everything an ItineraryEngine precomputes from one version of the
+    timetable. Apart from the stop graph, which is built the first time it
+    is needed, a state is never changed once queries can see it: the engine
+    replaces it with a new one instead.
+    """
+
+    __slots__ = (
+        "version",
+        "compiled",
+        "positions",
+        "dep_times",
+        "arr_times",
+        "dep_stops",
+        "arr_stops",
+        "trips",
+        "trip_count",
+        "arr_mcts",
+        "dep_mcts",
+        "arr_order",
+        "arr_order_times",
+        "no_mask",
+        "stop_graph",
+        "profiles",
+        "partition",
+        "cell_connections",
+    )
+
+    def __init__(self, version: int) -> None:
+        """
+        Initialise the _EngineState object. The engine fills in the arrays.
+        @param version: Version of the timetable the state was built from.
+        """
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.version = version
+
+
+class ItineraryEngine(object):
+    """
+    Class for processing timetables for the generation of itineraries.
+    """
+
+    def __init__(
+        self,
+        timetable: Timetable,
+        locations: dict[str, Location],
+        cache: QueryCache | None = None,
+        transfers: TransferGraph | None = None,
+        filter_cache_size: int = 16,
+        goal_directed: bool = False,
+        bound_cache_size: int = 256,
+        hub_profiles: HubProfiles | None = None,
+        partition: Partition | None = None,
+        horizon: int = 0,
+        period: int = 86400,
+    ) -> None:
+        """
+        Initialise the ItineraryEngine object.
+        @param timetable: A Timetable object.
+        @param stations: A list of station identifiers.
+        @param cache: (Optional, default None) A QueryCache used to store
+        results of repeated queries. Caching is disabled if not provided.
+        @param transfers: (Optional, default None) A TransferGraph of
+        footpaths and transfer times between locations. It is compiled for
+        the given locations when the engine is created.
+        @param filter_cache_size: (Optional, default 16) Number of compiled
+        QueryFilter masks kept for reuse.
+        @param goal_directed: (Optional, default False) Skip connections that
+        cannot lead to the destination in time, using lower bounds on the
+        travel time between locations. The bounds are computed the first
+        time each destination (or, for arrive by queries, origin) is queried.
+        @param bound_cache_size: (Optional, default 256) Number of locations
+        whose lower bounds are kept for reuse.
+        @param hub_profiles: (Optional, default None) HubProfiles built by
+        build_hub_profiles() for this engine's timetable, locations and
+        transfers, used to answer queries between hubs without a scan.
+        @param partition: (Optional, default None) Partition built by
+        build_partition() for this engine's timetable, locations and
+        transfers, used to scan only part of the timetable for each query.
+        @param horizon: (Optional, default 0) Number of repetitions of the
+        timetable after the one a query starts in (or, for arrive by queries,
+        before the one it ends in) that a scan may continue into. When it is
+        above 0 the timetable is treated as a pattern repeating every period,
+        so queries on any day are answered and overnight queries carry on
+        into the next day's connections. The repetitions are never
+        materialised; the scan shifts the times of the pattern as it goes.
+        Hub profiles and partitions cannot be used with a horizon.
+        @param period: (Optional, default 86400) Number of seconds after which
+        the timetable repeats when horizon is above 0. The departures, and the
+        arrivals, of the timetable must span less than one period.
+        """
+        if isinstance(horizon, int) != True or horizon < 0:
+            raise ValueError("Horizon must be a non-negative integer")
+        if isinstance(period, int) != True or period <= 0:
+            raise ValueError("Period must be a positive integer")
+        self.__timetable = timetable
+        self.__locations = locations
+        self.__cache = cache
+        self.__transfer_graph = transfers
+        self.__filter_cache_size = filter_cache_size
+        self.__bound_cache_size = bound_cache_size
+        self.__listeners: list[Callable[[QueryStats], Any]] = []
+        self.__stop_ids = list(locations.keys())
+        self.__stop_index = {
+            location_id: i for i, location_id in enumerate(self.__stop_ids)
+        }
+        self.__mct = [
+            location.get_minimum_connection_time() * 60
+            for location in locations.values()
+        ]
+        self.__transfers = None
+        self.__footpaths: list[tuple[int, int, int]] = []
+        if transfers is not None:
+            self.__transfers = transfers.compile(self.__stop_ids)
+            self.__footpaths = [
+                (self.__stop_index[from_id], self.__stop_index[to_id], duration)
+                for from_id, to_id, duration in transfers.get_transfers()
+                if from_id in self.__stop_index and to_id in self.__stop_index
+            ]
+            for i, seconds in enumerate(self.__transfers.get_min_times()):
+                if seconds >= 0:
+                    self.__mct[i] = seconds
+        self.__masks = QueryCache(filter_cache_size, ttl=0)
+        self.__goal_directed = goal_directed
+        self.__bounds = QueryCache(bound_cache_size, ttl=0)
+        self.__horizon = horizon
+        self.__period = period
+        self.__compile_lock = threading.Lock()
+        self.__state = self.__compile(None)
+        if hub_profiles is not None:
+            self.set_hub_profiles(hub_profiles)
+        if partition is not None:
+            self.set_partition(partition)
+
+    def __getstate__(self) -> dict:
+        """
+        Get the state to pickle: the timetable, locations, transfers and
+        settings the engine was created with, and the hub profiles and
+        partition in use. Everything else is rebuilt when the engine is
+        unpickled. The query cache and query listeners are not pickled.
+        @return: Dict of state.
+        """
+        state = self.__pin()
+        return {
+            "timetable": self.__timetable,
+            "locations": self.__locations,
+            "transfers": self.__transfer_graph,
+            "filter_cache_size": self.__filter_cache_size,
+            "goal_directed": self.__goal_directed,
+            "bound_cache_size": self.__bound_cache_size,
+            "hub_profiles": state.profiles,
+            "partition": state.partition,
+            "horizon": self.__horizon,
+            "period": self.__period,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restore the state returned by __getstate__.
+        @param state: Dict of state.
+        """
+        self.__init__(**state)  # type: ignore
+
+    def generate_itinerary(
+        self,
+        origin: Location,
+        destination: Location,
+        planned_time: datetime.datetime,
+        arrive_by: bool = False,
+        query_filter: QueryFilter | None = None,
+        via: Iterable[Location] = (),
+        alternatives: int | None = None,
+    ) -> list | None:
+        """
+        Generate an itinerary based on the initialised timetable and parameters provided.
+        @param origin: Origin location.
+        @param destination: Destination location.
+        @param planned_time: Planned departure/arrival time.
+        @param time_type: True if planned_time is a departure time, False if planned_time is an arrival time.
+        @param query_filter: (Optional, default None) A QueryFilter limiting
+        the modes, operators and locations the itinerary may use.
+        @param via: (Optional, default empty) Locations the itinerary must pass
+        through, in order.
+        @param alternatives: (Optional, default None) Number of itineraries to
+        return. When given, a list of up to that many distinct itineraries is
+        returned instead of a single one, best first. See generate_journey().
+        """
+        if alternatives is not None:
+            return [
+                journey.get_connections()
+                for journey in self.__query_alternatives(
+                    origin,
+                    destination,
+                    planned_time,
+                    arrive_by,
+                    query_filter,
+                    tuple(via),
+                    alternatives,
+                )
+            ]
+        return self.__query(
+            origin, destination, planned_time, arrive_by, query_filter, tuple(via)
+        ).get_connections()
+
+    def generate_journey(
+        self,
+        origin: Location,
+        destination: Location,
+        planned_time: datetime.datetime,
+        arrive_by: bool = False,
+        query_filter: QueryFilter | None = None,
+        via: Iterable[Location] = (),
+        alternatives: int | None = None,
+    ) -> Journey | list[Journey]:
+        """
+        Generate an itinerary as a Journey made of legs, one per service ridden
+        or walk taken. Connection objects are only created when a leg is
+        iterated.
+        @param origin: Origin location.
+        @param destination: Destination location.
+        @param planned_time: Planned departure/arrival time.
+        @param arrive_by: (Optional, default False) True if planned_time is an
+        arrival time.
+        @param query_filter: (Optional, default None) A QueryFilter limiting
+        the modes, operators and locations the itinerary may use.
+        @param via: (Optional, default empty) Locations the itinerary must pass
+        through, in order.
+        @param alternatives: (Optional, default None) Number of journeys to
+        return. When given, a single scan keeps up to that many labels at the
+        destination and a list of up to that many distinct journeys is
+        returned, ranked by arrival time and then by number of transfers.
+        Journeys riding the same services in the same order are duplicates,
+        wherever they change or walk between them. Only departure queries
+        without via locations can ask for alternatives.
+        @return: A Journey object, empty if there is no itinerary, or a list of
+        Journey objects when alternatives are asked for.
+        """
+        if alternatives is not None:
+            return self.__query_alternatives(
+                origin,
+                destination,
+                planned_time,
+                arrive_by,
+                query_filter,
+                tuple(via),
+                alternatives,
+            )
+        return self.__query(
+            origin, destination, planned_time, arrive_by, query_filter, tuple(via)
+        )
+
+    def generate_itineraries(
+        self, queries: Iterable[tuple | list]
+    ) -> tuple[list[list], BatchStats]:
+        """
+        Generate itineraries for a batch of queries, sharing work between them.
+        Departure queries without a filter or via locations that leave the
+        same origin at the same time share one scan to all their destinations.
+        The other queries are run one by one in order of planned time, so that
+        consecutive scans start close together in the timetable. Every query
+        reads the same version of the timetable. Query listeners are not
+        called for batch queries: the BatchStats returned with the results
+        describe the batch instead.
+        @param queries: Iterable of queries, each a tuple of the parameters of
+        generate_itinerary(): origin, destination, planned time and,
+        optionally, arrive by, query filter and via locations.
+        @return: Tuple of (list of itineraries in the order of the queries,
+        BatchStats object).
+        """
+        started = time.perf_counter()
+        batch: list[tuple] = []
+        for query in queries:
+            if isinstance(query, (tuple, list)) != True:
+                raise TypeError("Each query must be a tuple or list")
+            if len(query) < 3 or len(query) > 6:
+                raise ValueError("Queries must have between 3 and 6 parameters")
+            query = (*query, *(False, None, ())[len(query) - 3 :])
+            query = (*query[:5], tuple(query[5]))
+            self.__validate_query(*query)
+            batch.append(query)
+        phase_times = {"validate": time.perf_counter() - started}
+
+        started = time.perf_counter()
+        state = self.__pin()
+        to_seconds = state.compiled.to_seconds
+        planned = [to_seconds(query[2]) for query in batch]
+        results: list = [None] * len(batch)
+        cache_hits = 0
+        profile_lookups = 0
+        groups: dict[tuple[int, int], list[int]] = {}
+        single: list[int] = []
+        for i, query in enumerate(batch):
+            origin, destination, _, arrive_by, query_filter, via = query
+            if self.__cache is not None:
+                route = self.__cache.get(self.__cache_key(*query), state.version)
+                if route is not None:
+                    results[i] = route.get_connections()
+                    cache_hits += 1
+                    continue
+            if arrive_by or query_filter is not None or via or self.__horizon > 0:
+                single.append(i)
+                continue
+            if state.profiles is not None:
+                legs = state.profiles.lookup(
+                    origin.get_location_id(),
+                    destination.get_location_id(),
+                    planned[i],
+                    False,
+                )
+                if legs is not None:
+                    results[i] = self.__store(state, query, legs)
+                    profile_lookups += 1
+                    continue
+            source = self.__stop_index[origin.get_location_id()]
+            groups.setdefault((source, planned[i]), []).append(i)
+        shared = {key: members for key, members in groups.items() if len(members) > 1}
+        single.extend(
+            members[0] for members in groups.values() if len(members) == 1
+        )
+        single.sort(key=lambda i: (batch[i][3], planned[i]))
+        phase_times["setup"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for (source, departure), members in shared.items():
+            targets = list(
+                dict.fromkeys(
+                    self.__stop_index[batch[i][1].get_location_id()] for i in members
+                )
+            )
+            best, reached, rode, walked = self.__scan_profile(
+                state, source, departure, targets, [_NEVER] * len(targets)
+            )
+            for i in members:
+                target = self.__stop_index[batch[i][1].get_location_id()]
+                legs = []
+                if target != source and min(reached[target], best[target]) < _NEVER:
+                    legs = self.__trace_forward(
+                        state,
+                        source,
+                        target,
+                        best,
+                        rode,
+                        walked,
+                        reached[target] <= best[target],
+                    )
+                results[i] = self.__store(state, batch[i], legs)
+        phase_times["shared"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for i in single:
+            route = self.__scan(state, *batch[i], None)
+            if self.__cache is not None:
+                self.__cache.put(self.__cache_key(*batch[i]), state.version, route)
+            results[i] = route.get_connections()
+        phase_times["single"] = time.perf_counter() - started
+
+        stats = BatchStats(
+            len(batch),
+            len(shared),
+            sum(len(members) for members in shared.values()),
+            len(single),
+            profile_lookups,
+            cache_hits,
+            phase_times,
+        )
+        return results, stats
+
+    def __store(self, state: "_EngineState", query: tuple, legs: list) -> list:
+        """
+        Build the journey of a batch query answered without its own scan, and
+        store it in the query cache if caching is enabled.
+        @param state: Pinned engine state.
+        @param query: Query parameters.
+        @param legs: Legs of the journey.
+        @return: List of connections of the journey.
+        """
+        route = self.__build_journey(state, legs)
+        if self.__cache is not None:
+            self.__cache.put(self.__cache_key(*query), state.version, route)
+        return route.get_connections()
+
+    def __query(
+        self,
+        origin: Location,
+        destination: Location,
+        planned_time: datetime.datetime,
+        arrive_by: bool,
+        query_filter: QueryFilter | None,
+        via: tuple[Location, ...],
+    ) -> Journey:
+        """
+        Validate and run a query, collecting statistics if any listener is
+        registered.
+        @param origin: Origin location.
+        @param destination: Destination location.
+        @param planned_time: Planned departure/arrival time.
+        @param arrive_by: True if planned_time is an arrival time.
+        @param query_filter: QueryFilter of the query, or None.
+        @param via: Locations the itinerary must pass through.
+        @return: A Journey object.
+        """
+        query = (origin, destination, planned_time, arrive_by, query_filter, via)
+        if self.__listeners:
+            return self.__instrumented_itinerary(*query)
+        self.__validate_query(*query)
+        return self.__cached_scan(*query, None)
+
+    def __query_alternatives(
+        self,
+        origin: Location,
+        destination: Location,
+        planned_time: datetime.datetime,
+        arrive_by: bool,
+        query_filter: QueryFilter | None,
+        via: tuple[Location, ...],
+        alternatives: int,
+    ) -> list[Journey]:
+        """
+        Validate and run a query for alternative journeys, using the query
+        cache and collecting statistics like any other query.
+        @param origin: Origin location.
+        @param destination: Destination location.
+        @param planned_time: Planned departure time.
+        @param arrive_by: Must be False.
+        @param query_filter: QueryFilter of the query, or None.
+        @param via: Must be empty.
+        @param alternatives: Number of journeys to return.
+        @return: List of Journey objects, best first.
+        """
+        query = (origin, destination, planned_time, arrive_by, query_filter, via)
+        started = time.perf_counter()
+        self.__validate_query(*query)
+        if isinstance(alternatives, int) != True or isinstance(alternatives, bool):
+            raise TypeError("Alternatives must be of type int")
+        if alternatives < 1:
+            raise ValueError("Alternatives must be at least 1")
+        if arrive_by or via:
+            raise ValueError(
+                "Alternatives are only available for departure queries without via locations"
+            )
+        record: dict[str, Any] | None = None
+        if self.__listeners:
+            record = {"phase_times": {"validate": time.perf_counter() - started}}
+            started = time.perf_counter()
+        state = self.__pin()
+        source = self.__stop_index[origin.get_location_id()]
+        target = self.__stop_index[destination.get_location_id()]
+        planned = state.compiled.to_seconds(planned_time)
+        mask = state.no_mask
+        avoid: list[int] = []
+        if query_filter is not None:
+            mask = self.__get_mask(state, query_filter)
+            avoid = [
+                self.__stop_index[location_id]
+                for location_id in query_filter.get_avoid()
+                if location_id in self.__stop_index
+            ]
+        if record is not None:
+            record["phase_times"]["setup"] = time.perf_counter() - started
+            started = time.perf_counter()
+
+        journeys = None
+        if self.__cache is not None:
+            key = self.__cache_key(*query, alternatives)
+            journeys = self.__cache.get(key, state.version)
+            if record is not None:
+                record["phase_times"]["cache"] = time.perf_counter() - started
+                record["cache_hit"] = journeys is not None
+                started = time.perf_counter()
+        if journeys is None:
+            bounds = None
+            if self.__goal_directed:
+                bounds = self.__get_bounds(state, target, False)
+            found, scan = self.__scan_alternatives(
+                state, source, target, planned, mask, avoid, bounds, alternatives
+            )
+            if record is not None:
+                record["phase_times"]["scan"] = time.perf_counter() - started
+                started = time.perf_counter()
+                record["scan_start"], record["scan_stop"] = scan[0], scan[1]
+                record["relaxations"] = scan[2]
+                record["early_termination"] = scan[3]
+                record["connections_scanned"] = scan[4]
+            journeys = [self.__build_journey(state, legs) for legs in found]
+            if record is not None:
+                record["phase_times"]["reconstruct"] = time.perf_counter() - started
+            if self.__cache is not None:
+                self.__cache.put(key, state.version, journeys)
+
+        if record is not None:
+            stats = QueryStats(
+                origin.get_location_id(),
+                destination.get_location_id(),
+                arrive_by,
+                result_length=journeys[0].get_connection_count() if journeys else 0,
+                **record,
+            )
+            for listener in self.__listeners:
+                listener(stats)
+        return list(journeys)
+
+    def build_hub_profiles(
+        self,
+        hubs: Iterable[Location],
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+    ) -> HubProfiles:
+        """
+        Precompute profiles between every pair of hubs and use them for later
+        queries. A scan is run from each hub for every time a journey can
+        start from it, latest first, and the journeys that arrive sooner than
+        any later one are kept. Pairs of hubs joined by a footpath are left
+        to the normal scan. This is slow, so profiles are meant to be built
+        offline, saved, and loaded with the engine.
+        @param hubs: Hub locations.
+        @param start: (Optional, default None) Earliest departure time
+        covered. Defaults to the start of the timetable.
+        @param end: (Optional, default None) Departure time the profiles stop
+        before. Defaults to the end of the timetable.
+        @return: A HubProfiles object.
+        """
+        hubs = list(hubs)
+        for hub in hubs:
+            if isinstance(hub, Location) != True:
+                raise TypeError("Hubs must be of type Location")
+            if hub.get_location_id() not in self.__locations.keys():
+                raise ValueError("Hub location does not exist")
+        state = self.__pin()
+        hub_ids = list(dict.fromkeys(hub.get_location_id() for hub in hubs))
+        hub_stops = [self.__stop_index[hub_id] for hub_id in hub_ids]
+        first = state.compiled.to_seconds(start) if start is not None else None
+        last = state.compiled.to_seconds(end) if end is not None else None
+
+        # Times at which a journey can start from each stop: the departures
+        # from it and, with footpaths, the departures reachable on foot less
+        # the walk.
+        departures: dict[int, set[int]] = {stop: set() for stop in hub_stops}
+        for dep_time, dep_stop in zip(state.dep_times, state.dep_stops):
+            if dep_stop in departures:
+                departures[dep_stop].add(dep_time)
+        walkable: set[tuple[int, int]] = set()
+        if self.__transfers is not None:
+            offsets, targets, durations = self.__transfers.get_arrays()
+            reverse: dict[int, list[tuple[int, int]]] = {}
+            for stop in hub_stops:
+                for k in range(offsets[stop], offsets[stop + 1]):
+                    walkable.add((stop, targets[k]))
+                    reverse.setdefault(targets[k], []).append((stop, durations[k]))
+            for dep_time, dep_stop in zip(state.dep_times, state.dep_stops):
+                for stop, duration in reverse.get(dep_stop, ()):
+                    departures[stop].add(dep_time - duration)
+
+        dep_times = state.dep_times
+        covered = bytearray(len(hub_stops) ** 2)
+        pair_offsets = array("i", [0])
+        profile_deps = array("q")
+        profile_arrs = array("q")
+        leg_offsets = array("i", [0])
+        legs = array("q")
+        for i, source in enumerate(hub_stops):
+            profiles: list[list[tuple]] = [[] for _ in hub_stops]
+            times = sorted(
+                planned
+                for planned in departures[source]
+                if (first is None or planned >= first)
+                and (last is None or planned < last)
+            )
+            # Hubs that cannot be reached even leaving as early as possible
+            # are left out, so that they do not keep every scan going to the
+            # end of the timetable.
+            targets = [-1] * len(hub_stops)
+            if times:
+                best, _, _, _ = self.__scan_profile(
+                    state, source, times[0], hub_stops, [_NEVER] * len(hub_stops)
+                )
+                targets = [
+                    target if target != source and best[target] < _NEVER else -1
+                    for target in hub_stops
+                ]
+            # Arrival of the journey found for the latest departure so far,
+            # which a journey leaving earlier must beat.
+            limits = [_NEVER] * len(hub_stops)
+            for planned in reversed(times):
+                best, reached, rode, walked = self.__scan_profile(
+                    state, source, planned, targets, limits
+                )
+                for j, target in enumerate(targets):
+                    if target == -1:
+                        continue
+                    arrival = min(reached[target], best[target])
+                    if arrival >= limits[j]:
+                        continue
+                    limits[j] = arrival
+                    journey = self.__trace_forward(
+                        state,
+                        source,
+                        target,
+                        best,
+                        rode,
+                        walked,
+                        reached[target] <= best[target],
+                    )
+                    if len(journey[0]) == 4:
+                        departure = journey[0][2]
+                    else:
+                        departure = dep_times[journey[0][0]]
+                    profiles[j].append((departure, arrival, journey))
+            for j, target in enumerate(hub_stops):
+                if target != source and (source, target) not in walkable:
+                    covered[i * len(hub_stops) + j] = 1
+                for departure, arrival, journey in reversed(profiles[j]):
+                    profile_deps.append(departure)
+                    profile_arrs.append(arrival)
+                    for leg in journey:
+                        if len(leg) == 4:
+                            legs.extend(leg)
+                        else:
+                            legs.extend((-1 - leg[0], leg[1], 0, 0))
+                    leg_offsets.append(len(legs) // 4)
+                pair_offsets.append(len(profile_deps))
+
+        profiles = HubProfiles(
+            self.__get_fingerprint(state),
+            hub_ids,
+            first,
+            last,
+            covered,
+            pair_offsets,
+            profile_deps,
+            profile_arrs,
+            leg_offsets,
+            legs,
+        )
+        self.__publish(state, profiles=profiles)
+        return profiles
+
+    def set_hub_profiles(self, profiles: HubProfiles | None) -> None:
+        """
+        Use precomputed hub profiles for later queries, or stop using them.
+        Profiles are dropped when the timetable changes.
+        @param profiles: A HubProfiles object, or None.
+        """
+        state = self.__pin()
+        if profiles is not None:
+            if isinstance(profiles, HubProfiles) != True:
+                raise TypeError("Hub profiles must be of type HubProfiles")
+            if self.__horizon > 0:
+                raise ValueError("Hub profiles cannot be used with a horizon")
+            if profiles.get_fingerprint() != self.__get_fingerprint(state):
+                raise ValueError(
+                    "Hub profiles were built for a different timetable, locations or transfers"
+                )
+        self.__publish(state, profiles=profiles)
+
+    def get_hub_profiles(self) -> HubProfiles | None:
+        """
+        Get the hub profiles in use.
+        @return: A HubProfiles object, or None.
+        """
+        return self.__state.profiles
+
+    def build_partition(self, cell_size: int = 64) -> Partition:
+        """
+        Split the locations into cells and use them for later queries. Each
+        unfiltered query then only scans the connections inside the cells of
+        its origin and destination and the overlay, which holds every
+        connection between cells and enough of the connections inside each
+        cell to cross it, and finds the same itineraries as a full scan.
+        Cells are grown one at a time, in location order, along the busiest
+        connections, so the split only depends on the timetable. Locations
+        joined by a footpath are kept in the same cell. When the timetable
+        changes, only the overlay of the cells served by changed connections
+        is rebuilt.
+        @param cell_size: (Optional, default 64) Number of locations to grow
+        each cell to.
+        @return: A Partition object.
+        """
+        if isinstance(cell_size, int) != True:
+            raise TypeError("Cell size must be of type int")
+        if cell_size < 1:
+            raise ValueError("Cell size must be at least 1")
+        if self.__horizon > 0:
+            # The overlay only holds ways through cells within one repetition
+            # of the timetable, not overnight ones.
+            raise ValueError("A partition cannot be used with a horizon")
+        state = self.__pin()
+        cells = self.__split_stops(state, cell_size)
+        overlay = bytearray(len(state.dep_times))
+        self.__mark_overlay(state, cells, overlay, set(cells))
+        partition = Partition(
+            self.__get_fingerprint(state), cell_size, array("i", cells), overlay
+        )
+        self.__publish(state, partition=partition)
+        return partition
+
+    def set_partition(self, partition: Partition | None) -> None:
+        """
+        Use a partition for later queries, or stop using it. The partition is
+        updated when the timetable changes.
+        @param partition: A Partition object, or None.
+        """
+        state = self.__pin()
+        if partition is not None:
+            if isinstance(partition, Partition) != True:
+                raise TypeError("Partition must be of type Partition")
+            if self.__horizon > 0:
+                raise ValueError("A partition cannot be used with a horizon")
+            if partition.get_fingerprint() != self.__get_fingerprint(state):
+                raise ValueError(
+                    "Partition was built for a different timetable, locations or transfers"
+                )
+        self.__publish(state, partition=partition)
+
+    def get_partition(self) -> Partition | None:
+        """
+        Get the partition in use, updated to the current timetable.
+        @return: A Partition object, or None.
+        """
+        state = self.__state
+        if state.partition is not None:
+            state = self.__pin()
+        return state.partition
+
+    def get_cache(self) -> QueryCache | None:
+        """
+        Get the query cache.
+        @return: The query cache, or None if caching is disabled.
+        """
+        return self.__cache
+
+    def get_locations(self) -> dict[str, Location]:
+        """
+        Get the locations the engine was created with.
+        @return: Dict of Location objects keyed by location identifier.
+        """
+        return self.__locations
+
+    def add_query_listener(self, listener: Callable[[QueryStats], Any]) -> None:
+        """
+        Register a function to be called with a QueryStats object after every
+        query. Statistics are only collected while at least one listener is
+        registered.
+        @param listener: Function taking a QueryStats object, for example a
+        QueryStatsAggregator.
+        """
+        if callable(listener) != True:
+            raise TypeError("Listener must be callable")
+        self.__listeners.append(listener)
+
+    def remove_query_listener(self, listener: Callable[[QueryStats], Any]) -> None:
+        """
+        Unregister a query listener.
+        @param listener: Listener previously passed to add_query_listener.
+        """
+        self.__listeners.remove(listener)
+
+    def __validate_query(
+        self,
+        origin: Location,
+        destination: Location,
+        planned_time: datetime.datetime,
+        arrive_by: bool,
+        query_filter: QueryFilter | None,
+        via: tuple[Location, ...],
+    ) -> None:
+        """
+        Check the parameters of a query, raising an exception if any are invalid.
+        @param origin: Origin location.
+        @param destination: Destination location.
+        @param planned_time: Planned departure/arrival time.
+        @param arrive_by: True if planned_time is an arrival time.
+        @param query_filter: QueryFilter of the query, or None.
+        @param via: Locations the itinerary must pass through.
+        """
+        if isinstance(origin, Location) != True:
+            raise TypeError("Origin must be of type Location")
+        if origin.get_location_id() not in self.__locations.keys():
+            raise ValueError("Origin location does not exist")
+        if isinstance(destination, Location) != True:
+            raise TypeError("Destination must be of type Location")
+        if destination.get_location_id() not in self.__locations.keys():
+            raise ValueError("Destination location does not exist")
+        if isinstance(planned_time, datetime.datetime) != True:
+            raise TypeError("Planned time must be a datetime object")
+        if arrive_by not in [True, False]:
+            raise TypeError("Time type must be a boolean")
+        for location in via:
+            if isinstance(location, Location) != True:
+                raise TypeError("Via locations must be of type Location")
+            if location.get_location_id() not in self.__locations.keys():
+                raise ValueError("Via location does not exist")
+        if query_filter is not None:
+            if isinstance(query_filter, QueryFilter) != True:
+                raise TypeError("Query filter must be of type QueryFilter")
+            for location in (origin, destination, *via):
+                if location.get_location_id() in query_filter.get_avoid():
+                    raise ValueError("Cannot avoid the origin, destination or via locations")
+
+    def __instrumented_itinerary(
+        self,
+        origin: Location,
+        destination: Location,
+        planned_time: datetime.datetime,
+        arrive_by: bool,
+        query_filter: QueryFilter | None,
+        via: tuple[Location, ...],
+        state: "_EngineState | None" = None,
+    ) -> Journey:
+        """
+        Run a query while collecting statistics, then pass them to every
+        registered listener.
+        @param origin: Origin location.
+        @param destination: Destination location.
+        @param planned_time: Planned departure/arrival time.
+        @param arrive_by: True if planned_time is an arrival time.
+        @param query_filter: QueryFilter of the query, or None.
+        @param via: Locations the itinerary must pass through.
+        @param state: (Optional, default None) Engine state already pinned by
+        a batch, or None to pin the current one.
+        @return: A Journey object.
+        """
+        query = (origin, destination, planned_time, arrive_by, query_filter, via)
+        started = time.perf_counter()
+        self.__validate_query(*query)
+        record: dict[str, Any] = {
+            "phase_times": {"validate": time.perf_counter() - started}
+        }
+        route = self.__cached_scan(*query, record, state)
+        stats = QueryStats(
+            origin.get_location_id(),
+            destination.get_location_id(),
+            arrive_by,
+            result_length=route.get_connection_count(),
+            **record,
+        )
+        for listener in self.__listeners:
+            listener(stats)
+        return route
+
+    def __cached_scan(
+        self,
+        origin: Location,
+        destination: Location,
+        planned_time: datetime.datetime,
+        arrive_by: bool,
+        query_filter: QueryFilter | None,
+        via: tuple[Location, ...],
+        record: dict | None,
+        state: "_EngineState | None" = None,
+    ) -> Journey:
+        """
+        Return the result from the query cache if there is one, otherwise run
+        the scan (and store its result if caching is enabled).
+        @param origin: Origin location.
+        @param destination: Destination location.
+        @param planned_time: Planned departure/arrival time.
+        @param arrive_by: True if planned_time is an arrival time.
+        @param query_filter: QueryFilter of the query, or None.
+        @param via: Locations the itinerary must pass through.
+        @param record: Dict collecting query statistics, or None when
+        statistics are not being collected.
+        @param state: (Optional, default None) Engine state already pinned by
+        a batch, or None to pin the current one.
+        @return: A Journey object.
+        """
+        query = (origin, destination, planned_time, arrive_by, query_filter, via)
+        if record is not None:
+            started = time.perf_counter()
+        # Everything the query reads comes from one version of the engine,
+        # even if the timetable changes while it runs.
+        if state is None:
+            state = self.__pin()
+        if record is not None:
+            record["phase_times"]["setup"] = time.perf_counter() - started
+        if self.__cache is None:
+            return self.__scan(state, *query, record)
+
+        if record is not None:
+            started = time.perf_counter()
+        version = state.version
+        key = self.__cache_key(*query)
+        route = self.__cache.get(key, version)
+        if record is not None:
+            record["phase_times"]["cache"] = time.perf_counter() - started
+            record["cache_hit"] = route is not None
+        if route is None:
+            route = self.__scan(state, *query, record)
+            self.__cache.put(key, version, route)
+        return route
+
+    def __cache_key(
+        self,
+        origin: Location,
+        destination: Location,
+        planned_time: datetime.datetime,
+        arrive_by: bool,
+        query_filter: QueryFilter | None,
+        via: tuple[Location, ...],
+        alternatives: int | None = None,
+    ) -> tuple:
+        """
+        Get the query cache key of a query.
+        @param origin: Origin location.
+        @param destination: Destination location.
+        @param planned_time: Planned departure/arrival time.
+        @param arrive_by: True if planned_time is an arrival time.
+        @param query_filter: QueryFilter of the query, or None.
+        @param via: Locations the itinerary must pass through.
+        @param alternatives: (Optional, default None) Number of alternative
+        journeys asked for, or None for a single itinerary.
+        @return: Cache key.
+        """
+        options: tuple = (
+            query_filter.get_key() if query_filter is not None else None,
+            tuple(location.get_location_id() for location in via),
+        )
+        if alternatives is not None:
+            options += (alternatives,)
+        return self.__cache.make_key(  # type: ignore
+            origin.get_location_id(),
+            destination.get_location_id(),
+            planned_time,
+            arrive_by,
+            options,
+        )
+
+    def __pin(self) -> "_EngineState":
+        """
+        Get the engine state for the current version of the timetable,
+        compiling it first if the timetable has changed. A query pins the
+        state once and reads nothing else, so it sees a single version from
+        start to finish while another thread updates the timetable.
+        @return: An _EngineState object.
+        """
+        state = self.__state
+        if state.version != self.__timetable.get_version():
+            with self.__compile_lock:
+                state = self.__state
+                if state.version != self.__timetable.get_version():
+                    state = self.__compile(state)
+                    self.__state = state
+        return state
+
+    def __publish(self, state: "_EngineState", **changes: Any) -> None:
+        """
+        Replace the engine state with a copy of a state with some attributes
+        changed. Queries already running keep the state they pinned.
+        @param state: Engine state to copy.
+        @param changes: Attributes to change.
+        """
+        state = copy.copy(state)
+        for name, value in changes.items():
+            setattr(state, name, value)
+        if "partition" in changes:
+            self.__index_partition(state)
+        self.__state = state
+
+    def __compile(self, previous: "_EngineState | None") -> "_EngineState":
+        """
+        Precompute the arrays used by the scan from a snapshot of the
+        timetable: integer departure/arrival times, stops interned in the
+        engine's location order, trips, and the minimum connection time in
+        seconds that applies after arriving on each connection. Connections
+        serving locations the engine does not know about are left out.
+        @param previous: Engine state of the previous version, whose hub
+        profiles and partition are carried over, or None.
+        @return: A new _EngineState object.
+        """
+        snapshot = self.__timetable.snapshot()
+        state = _EngineState(snapshot.get_version())
+        compiled = snapshot.compile()
+        dep_times, arr_times, dep_stops, arr_stops, trips = compiled.get_columns()
+        stop_map = [
+            self.__stop_index.get(stop_id, -1) for stop_id in compiled.get_stop_ids()
+        ]
+        dep_stops = [stop_map[stop] for stop in dep_stops]
+        arr_stops = [stop_map[stop] for stop in arr_stops]
+        if -1 in stop_map:
+            positions = [
+                i
+                for i in range(len(compiled))
+                if dep_stops[i] != -1 and arr_stops[i] != -1
+            ]
+            state.positions = positions
+            state.dep_times = [dep_times[i] for i in positions]
+            state.arr_times = [arr_times[i] for i in positions]
+            state.dep_stops = [dep_stops[i] for i in positions]
+            state.arr_stops = [arr_stops[i] for i in positions]
+            state.trips = [trips[i] for i in positions]
+        else:
+            state.positions = None
+            state.dep_times = dep_times.tolist()
+            state.arr_times = arr_times.tolist()
+            state.dep_stops = dep_stops
+            state.arr_stops = arr_stops
+            state.trips = trips.tolist()
+        state.compiled = compiled
+        state.trip_count = len(compiled.get_trip_ids())
+        mct = self.__mct
+        state.arr_mcts = [mct[stop] for stop in state.arr_stops]
+        state.dep_mcts = [mct[stop] for stop in state.dep_stops]
+        # Positions sorted by arrival, latest first, for arrive by scans.
+        arr_times = state.arr_times
+        dep_times = state.dep_times
+        state.arr_order = sorted(
+            range(len(arr_times)), key=lambda i: (-arr_times[i], -dep_times[i])
+        )
+        state.arr_order_times = [-arr_times[i] for i in state.arr_order]
+        state.no_mask = bytearray(b"\x01") * len(arr_times)
+        if self.__horizon > 0 and dep_times and (
+            dep_times[-1] - dep_times[0] >= self.__period
+            or arr_times[state.arr_order[0]] - arr_times[state.arr_order[-1]]
+            >= self.__period
+        ):
+            # Repetitions would overlap, and a scan could not finish one
+            # before starting the next.
+            raise ValueError("Timetable must span less than one period to repeat")
+        if previous is None:
+            return state
+        if previous.profiles is not None and (
+            previous.profiles.get_fingerprint() == self.__get_fingerprint(state)
+        ):
+            # Profiles of the previous timetable would give wrong answers, so
+            # they are only kept if nothing they depend on has changed.
+            state.profiles = previous.profiles
+        if previous.partition is not None:
+            self.__update_partition(state, previous)
+        return state
+
+    def __get_fingerprint(self, state: "_EngineState") -> int:
+        """
+        Get a checksum of everything hub profiles depend on: the compiled
+        timetable, the engine's locations, their minimum connection times and
+        the footpaths between them.
+        @param state: Pinned engine state.
+        @return: CRC-32 checksum.
+        """
+        settings = [state.compiled.get_fingerprint(), self.__stop_ids, self.__mct]
+        if self.__transfers is not None:
+            settings.extend(map(list, self.__transfers.get_arrays()))
+        return zlib.crc32(json.dumps(settings).encode("utf-8"))
+
+    def __connection_keys(self, state: "_EngineState") -> list[tuple]:
+        """
+        Identify the engine's connections independently of their positions,
+        so that they can be matched across timetable versions.
+        @param state: Pinned engine state.
+        @return: List of (trip identifier, departure, arrival, from stop, to
+        stop) tuples in connection order.
+        """
+        trip_ids = state.compiled.get_trip_ids()
+        return list(
+            zip(
+                [trip_ids[trip] for trip in state.trips],
+                state.dep_times,
+                state.arr_times,
+                state.dep_stops,
+                state.arr_stops,
+            )
+        )
+
+    def __update_partition(
+        self, state: "_EngineState", previous: "_EngineState"
+    ) -> None:
+        """
+        Carry the partition over to a new timetable version. Cells do not
+        change, as they only depend on the engine's locations, and the
+        overlay is rebuilt for the cells served by connections that were
+        added or removed.
+        @param state: Engine state of the new version, not yet in use.
+        @param previous: Engine state of the previous version.
+        """
+        partition = previous.partition
+        cells = partition.get_cells()  # type: ignore
+        old_overlay = partition.get_overlay()  # type: ignore
+        old_positions = {
+            key: index for index, key in enumerate(self.__connection_keys(previous))
+        }
+        overlay = bytearray(len(state.dep_times))
+        changed = set()
+        for index, key in enumerate(self.__connection_keys(state)):
+            old = old_positions.pop(key, None)
+            if old is None:
+                changed.update((cells[key[3]], cells[key[4]]))
+            else:
+                overlay[index] = old_overlay[old]
+        for key in old_positions:
+            changed.update((cells[key[3]], cells[key[4]]))
+        if changed:
+            for index, (dep_stop, arr_stop) in enumerate(
+                zip(state.dep_stops, state.arr_stops)
             ):
-                self.__earliest_arrival[
-                    connection.get_dep_loc()
-                ] = connection.get_dep_time()
-                self.__in_connection[connection.get_dep_loc()] = index
-
-                if connection.get_dep_loc() == destination.get_location_id():
-                    earliest = min(earliest, connection.get_dep_time())
-            elif connection.get_arr_time() > earliest:
-                # No point in searching anymore
+                if cells[dep_stop] == cells[arr_stop] and cells[dep_stop] in changed:
+                    overlay[index] = 0
+            self.__mark_overlay(state, cells, overlay, changed)
+        state.partition = Partition(
+            self.__get_fingerprint(state),
+            partition.get_cell_size(),  # type: ignore
+            cells,
+            overlay,
+        )
+        self.__index_partition(state)
+
+    def __split_stops(self, state: "_EngineState", cell_size: int) -> list[int]:
+        """
+        Grow cells of locations one at a time. Each cell starts from the
+        first location not in a cell yet and takes next the location with the
+        largest share of its connections going to the cell (the lowest index
+        on a tie) until it holds cell_size locations. Locations joined by
+        footpaths join a cell together. A cell that runs out of locations
+        with connections to it before it is full takes locations from
+        elsewhere, so a few passes then move each location to the cell most
+        of its connections go to, and cells are numbered by their first
+        location.
+        @param state: Pinned engine state.
+        @param cell_size: Number of locations to grow each cell to.
+        @return: Cell of each stop.
+        """
+        count = len(self.__stop_ids)
+        group = list(range(count))
+
+        def find(stop: int) -> int:
+            while group[stop] != stop:
+                group[stop] = group[group[stop]]
+                stop = group[stop]
+            return stop
+
+        for from_stop, to_stop, _ in self.__footpaths:
+            first, second = sorted((find(from_stop), find(to_stop)))
+            group[second] = first
+        members: dict[int, list[int]] = {}
+        for stop in range(count):
+            members.setdefault(find(stop), []).append(stop)
+        neighbours: list[Counter] = [Counter() for _ in range(count)]
+        for dep_stop, arr_stop in zip(state.dep_stops, state.arr_stops):
+            if dep_stop != arr_stop:
+                neighbours[dep_stop][arr_stop] += 1
+                neighbours[arr_stop][dep_stop] += 1
+        degrees = [sum(counts.values()) for counts in neighbours]
+
+        cells = [-1] * count
+        cell = 0
+        for seed in range(count):
+            if cells[seed] != -1:
+                continue
+            size = 0
+            gains: Counter = Counter()
+            heap = [(0, seed)]
+            while heap and size < cell_size:
+                _, stop = heapq.heappop(heap)
+                if cells[stop] != -1:
+                    continue
+                for member in members[find(stop)]:
+                    cells[member] = cell
+                    size += 1
+                    for other, weight in neighbours[member].items():
+                        if cells[other] == -1:
+                            gains[other] += weight
+                            heapq.heappush(
+                                heap, (-gains[other] / degrees[other], other)
+                            )
+            cell += 1
+
+        for _ in range(8):
+            moved = False
+            for root, group_members in members.items():
+                weights: Counter = Counter()
+                for member in group_members:
+                    for other, weight in neighbours[member].items():
+                        if find(other) != root:
+                            weights[cells[other]] += weight
+                if not weights:
+                    continue
+                cell, weight = max(weights.items(), key=lambda item: (item[1], -item[0]))
+                if weight > weights[cells[root]]:
+                    for member in group_members:
+                        cells[member] = cell
+                    moved = True
+            if not moved:
                 break
+        numbers: dict[int, int] = {}
+        return [numbers.setdefault(cell, len(numbers)) for cell in cells]
+
+    def __mark_overlay(
+        self, state: "_EngineState", cells: list, overlay: bytearray, marked: set
+    ) -> None:
+        """
+        Add the connections between cells to the overlay, and for each of the
+        given cells, a way through the cell from every connection entering it
+        to every connection leaving it that can be reached from there. Any
+        itinerary crossing the cell can then be rerouted over the overlay,
+        entering and leaving the cell on the same connections, so it arrives
+        just as soon.
+        @param state: Pinned engine state.
+        @param cells: Cell of each stop.
+        @param overlay: Overlay flags to update, indexed by connection.
+        @param marked: Cells to add ways through.
+        """
+        inside: dict[int, list[int]] = {cell: [] for cell in marked}
+        entries: dict[int, list[int]] = {cell: [] for cell in marked}
+        for index, (dep_stop, arr_stop) in enumerate(
+            zip(state.dep_stops, state.arr_stops)
+        ):
+            dep_cell = cells[dep_stop]
+            arr_cell = cells[arr_stop]
+            if dep_cell != arr_cell:
+                overlay[index] = 1
+                if arr_cell in entries:
+                    entries[arr_cell].append(index)
+            if dep_cell in inside:
+                inside[dep_cell].append(index)
+        # Rides are followed along the compiled next-in-trip pointers, which
+        # may pass through locations the engine does not know about.
+        next_in_trip = state.compiled.get_next_in_trip()
+        positions = state.positions
+        engine_index = (
+            {position: index for index, position in enumerate(positions)}
+            if positions is not None
+            else None
+        )
+
+        def mark_ride(cell: int, first: int, last: int) -> None:
+            if positions is not None:
+                first, last = positions[first], positions[last]
+            position = first
+            while position != -1:
+                index = position if engine_index is None else engine_index.get(position, -1)
+                if (
+                    index != -1
+                    and cells[state.dep_stops[index]] == cell
+                    and cells[state.arr_stops[index]] == cell
+                ):
+                    overlay[index] = 1
+                if position == last:
+                    break
+                position = next_in_trip[position]
+
+        for cell in sorted(marked):
+            connections = inside[cell]
+            # Nothing departing after the last connection leaving the cell
+            # needs a way through it.
+            while connections and overlay[connections[-1]] == 0:
+                connections.pop()
+            times = [state.dep_times[index] for index in connections]
+            for entry in entries[cell]:
+                self.__mark_crossings(
+                    state, cell, entry, connections, times, cells, mark_ride
+                )
+
+    def __mark_crossings(
+        self,
+        state: "_EngineState",
+        cell: int,
+        entry: int,
+        connections: list[int],
+        times: list[int],
+        cells: list,
+        mark_ride: Callable[[int, int, int], None],
+    ) -> None:
+        """
+        Earliest arrival scan inside a cell, starting on board the connection
+        entering it, with the same rules as __scan_forward. Every connection
+        leaving the cell that can be ridden is traced back to the entry and
+        the rides on the way are marked.
+        @param state: Pinned engine state.
+        @param cell: Cell number.
+        @param entry: Position of the connection entering the cell.
+        @param connections: Positions of the connections departing inside
+        the cell, in order.
+        @param times: Departure times of those connections.
+        @param cells: Cell of each stop.
+        @param mark_ride: Function marking the connections of a ride inside
+        the cell.
+        """
+        dep_times = state.dep_times
+        arr_times = state.arr_times
+        dep_stops = state.dep_stops
+        arr_stops = state.arr_stops
+        trips = state.trips
+        arr_mcts = state.arr_mcts
+        transfers = self.__transfers
+
+        origin = arr_stops[entry]
+        arrival = arr_times[entry]
+        best = {origin: arrival + arr_mcts[entry]}
+        reached = {origin: arrival}
+        boarded = {trips[entry]: entry}
+        rode: dict[int, tuple[int, int]] = {}
+        # Stop each walk started from.
+        walked: dict[int, int] = {}
+
+        def walk(stop: int, arrival: int) -> None:
+            offsets, targets, durations = transfers.get_arrays()  # type: ignore
+            for k in range(offsets[stop], offsets[stop + 1]):
+                other = targets[k]
+                if arrival + durations[k] < best.get(other, _NEVER):
+                    best[other] = arrival + durations[k]
+                    walked[other] = stop
 
+        if transfers is not None:
+            walk(origin, arrival)
+        for k in range(bisect.bisect_left(times, arrival), len(connections)):
+            index = connections[k]
+            trip = trips[index]
+            first = boarded.get(trip)
+            if first is None:
+                if best.get(dep_stops[index], _NEVER) > dep_times[index]:
+                    continue
+                first = boarded[trip] = index
+            stop = arr_stops[index]
+            if cells[stop] != cell:
+                mark_ride(cell, first, index)
+                while first != entry:
+                    stop = dep_stops[first]
+                    if stop in walked:
+                        # Walks only start where a ride ended (or at the
+                        # entry).
+                        stop = walked[stop]
+                        if stop == origin:
+                            break
+                    elif stop == origin:
+                        break
+                    first, last = rode[stop]
+                    mark_ride(cell, first, last)
+                continue
+            arr_time = arr_times[index]
+            if arr_time < reached.get(stop, _NEVER):
+                reached[stop] = arr_time
+                rode[stop] = (first, index)
+                if arr_time + arr_mcts[index] < best.get(stop, _NEVER):
+                    best[stop] = arr_time + arr_mcts[index]
+                    walked.pop(stop, None)
+                if transfers is not None:
+                    walk(stop, arr_time)
+
+    def __index_partition(self, state: "_EngineState") -> None:
+        """
+        Group the connections outside the overlay by cell, in departure order
+        and in arrival order, for building the subsets scanned by queries.
+        @param state: Pinned engine state.
+        """
+        if state.partition is None:
+            state.cell_connections = None
+            return
+        cells = state.partition.get_cells()
+        overlay = state.partition.get_overlay()
+        count = state.partition.get_cell_count()
+        by_departure: list[list[int]] = [[] for _ in range(count + 1)]
+        for index, dep_stop in enumerate(state.dep_stops):
+            by_departure[count if overlay[index] else cells[dep_stop]].append(index)
+        by_arrival: list[list[int]] = [[] for _ in range(count + 1)]
+        for position, index in enumerate(state.arr_order):
+            by_arrival[count if overlay[index] else cells[state.dep_stops[index]]].append(
+                position
+            )
+        state.cell_connections = (cells, by_departure, by_arrival)
+
+    def __get_subset(
+        self, state: "_EngineState", source: int, target: int, arrive_by: bool
+    ) -> list[list[int]]:
+        """
+        Get the connections scanned between two stops: the overlay and the
+        connections inside the cells of both stops.
+        @param state: Pinned engine state.
+        @param source: Origin stop index.
+        @param target: Destination stop index.
+        @param arrive_by: True for positions in arrival order, False for
+        positions in departure order.
+        @return: List of sorted lists of positions.
+        """
+        cells, by_departure, by_arrival = state.cell_connections  # type: ignore
+        groups = by_arrival if arrive_by else by_departure
+        subset = [groups[-1], groups[cells[source]]]
+        if cells[target] != cells[source]:
+            subset.append(groups[cells[target]])
+        return subset
+
+    def __merge_subset(self, subset: list[list[int]], start: int) -> Iterable[int]:
+        """
+        Merge the groups of a subset from a position on. The merge is lazy, so
+        a scan that terminates early does not pay for the rest of the day.
+        @param subset: Groups of sorted positions.
+        @param start: First position to include.
+        @return: Iterator over the positions in order.
+        """
+        return heapq.merge(
+            *[
+                itertools.islice(group, bisect.bisect_left(group, start), None)
+                for group in subset
+            ]
+        )
+
+    def __count_scanned(
+        self, subset: list[list[int]] | None, start: int, stop: int
+    ) -> int:
+        """
+        Count the connections a scan went through.
+        @param subset: Groups of sorted positions scanned, or None if every
+        position was.
+        @param start: First position of the scan.
+        @param stop: Last position scanned, start - 1 if there were none.
+        @return: Number of connections.
+        """
+        if stop < start:
+            return 0
+        if subset is None:
+            return stop - start + 1
+        return sum(
+            bisect.bisect_right(group, stop) - bisect.bisect_left(group, start)
+            for group in subset
+        )
+
+    def __get_copies(
+        self, state: "_EngineState", planned: int, arrive_by: bool
+    ) -> list[tuple[int, int]]:
+        """
+        Get the repetitions of the timetable a scan goes through, in scan
+        order. Without a horizon only the timetable itself is scanned. With
+        one, the scan starts in the repetition the planned time falls in and
+        carries on into the next horizon ones (earlier ones for arrive by).
+        @param state: Pinned engine state.
+        @param planned: Planned departure/arrival time in seconds.
+        @param arrive_by: True if planned is an arrival time.
+        @return: List of (offset in seconds, first position to scan) tuples.
+        The position is into the departure order, or the arrival order for
+        arrive by scans.
+        """
+        period = self.__period
         if arrive_by == False:
-            print(self.__in_connection)
-            if self.__in_connection[destination.get_location_id()] == -1:  # type: ignore
-                return []
-            else:
-                route = []
+            times = state.dep_times
+            if self.__horizon == 0 or not times:
+                return [(0, bisect.bisect_left(times, planned))]
+            copy = (planned - times[0]) // period
+            start = bisect.bisect_left(times, planned - copy * period)
+            step = 1
+        else:
+            times = state.arr_order_times
+            if self.__horizon == 0 or not times:
+                return [(0, bisect.bisect_left(times, -planned))]
+            # The latest arrival is the last time of its repetition.
+            copy = -((-times[0] - planned) // period)
+            start = bisect.bisect_left(times, copy * period - planned)
+            step = -1
+        return [(copy * period, start)] + [
+            ((copy + step * i) * period, 0) for i in range(1, self.__horizon + 1)
+        ]
 
-                last_connection_index = self.__in_connection[destination.get_location_id()]  # type: ignore
+    def __scan(
+        self,
+        state: "_EngineState",
+        origin: Location,
+        destination: Location,
+        planned_time: datetime.datetime,
+        arrive_by: bool,
+        query_filter: QueryFilter | None,
+        via: tuple[Location, ...],
+        record: dict | None,
+    ) -> Journey:
+        """
+        Run the connection scan for a validated query. Queries with via
+        locations run one scan per section, each starting from where the
+        previous one arrived (or, for arrive by queries, ending where the next
+        one departed). Unfiltered queries between two hubs are answered from
+        the hub profiles when they cover the planned time.
+        @param state: Pinned engine state.
+        @param origin: Origin location.
+        @param destination: Destination location.
+        @param planned_time: Planned departure/arrival time.
+        @param arrive_by: True if planned_time is an arrival time.
+        @param query_filter: QueryFilter of the query, or None.
+        @param via: Locations the itinerary must pass through.
+        @param record: Dict collecting query statistics, or None when
+        statistics are not being collected.
+        @return: A Journey object.
+        """
+        if record is not None:
+            started = time.perf_counter()
+        stops = [
+            self.__stop_index[location.get_location_id()]
+            for location in (origin, *via, destination)
+        ]
+        planned = state.compiled.to_seconds(planned_time)
+        mask = state.no_mask
+        avoid: list[int] = []
+        if query_filter is not None:
+            mask = self.__get_mask(state, query_filter)
+            avoid = [
+                self.__stop_index[location_id]
+                for location_id in query_filter.get_avoid()
+                if location_id in self.__stop_index
+            ]
 
-                while last_connection_index != -1:
-                    connection = self.__timetable.get_connections()[
-                        last_connection_index
-                    ]
-                    route.append(connection)
-                    last_connection_index = self.__in_connection[
-                        connection.get_dep_loc()
-                    ]
+        if record is not None:
+            phase_times = record["phase_times"]
+            phase_times["setup"] += time.perf_counter() - started
+            started = time.perf_counter()
 
-                corrected_route = list(reversed(route))
-                return corrected_route
+        legs: list | None = None
+        scans: list[tuple] = []
+        if state.profiles is not None and query_filter is None and not via:
+            legs = state.profiles.lookup(
+                origin.get_location_id(), destination.get_location_id(), planned, arrive_by
+            )
+        if legs is None:
+            legs = self.__scan_sections(
+                state, stops, planned, arrive_by, mask, avoid, scans
+            )
+
+        if record is not None:
+            phase_times["scan"] = time.perf_counter() - started
+            started = time.perf_counter()
+            record["connections_scanned"] = sum(scan[4] for scan in scans)
+            record["relaxations"] = sum(scan[2] for scan in scans)
+            record["scan_start"] = scans[0][0] if scans else -1
+            record["scan_stop"] = scans[-1][1] if scans else -1
+            record["early_termination"] = any(scan[3] for scan in scans)
+            route = self.__build_journey(state, legs)
+            phase_times["reconstruct"] = time.perf_counter() - started
+            return route
+        return self.__build_journey(state, legs)
+
+    def __scan_sections(
+        self,
+        state: "_EngineState",
+        stops: list[int],
+        planned: int,
+        arrive_by: bool,
+        mask: bytearray,
+        avoid: list,
+        scans: list,
+    ) -> list:
+        """
+        Scan each section between the origin, the via locations and the
+        destination.
+        @param state: Pinned engine state.
+        @param stops: Stop indexes of the origin, via locations and
+        destination.
+        @param planned: Planned departure/arrival time in seconds.
+        @param arrive_by: True if planned is an arrival time.
+        @param mask: Connection mask, 0 for connections that must not be used.
+        @param avoid: Stop indexes that must not be reached.
+        @param scans: List the statistics of each scan are appended to.
+        @return: List of legs, empty if any section cannot be travelled.
+        """
+        legs: list = []
+        sections = list(zip(stops, stops[1:]))
+        # Leaving out connections cannot stop a filtered ride from passing
+        # through connections it must not use, so filtered queries scan
+        # everything.
+        partitioned = state.partition is not None and mask is state.no_mask
+        subset = None
+        # (connection, offset) of the ride reaching (leaving) the via location
+        # between sections, whose trip the next section may stay on without
+        # the minimum connection time that any other trip must allow.
+        carry = None
+        if arrive_by == False:
+            for source, target in sections:
+                if source == target:
+                    continue
+                bounds = None
+                if self.__goal_directed:
+                    bounds = self.__get_bounds(state, target, False)
+                if partitioned:
+                    subset = self.__get_subset(state, source, target, False)
+                section, scan = self.__scan_forward(
+                    state, source, target, planned, mask, avoid, bounds, subset, carry
+                )
+                scans.append(scan)
+                if not section:
+                    return []
+                if carry is not None and len(section[0]) < 4:
+                    if section[0][0] == carry[0]:
+                        # Stayed on at the via location: one ride, not two.
+                        section[0] = (legs.pop()[0], *section[0][1:])
+                legs.extend(section)
+                last = section[-1]
+                if len(last) == 4:
+                    planned = last[3]
+                    carry = None
+                else:
+                    offset = last[2] if len(last) == 3 else 0
+                    planned = state.arr_times[last[1]] + offset
+                    carry = (last[1], offset)
         else:
-            print(self.__in_connection)
-            if self.__in_connection[origin.get_location_id()] == -1:
-                return []
+            for source, target in reversed(sections):
+                if source == target:
+                    continue
+                bounds = None
+                if self.__goal_directed:
+                    bounds = self.__get_bounds(state, source, True)
+                if partitioned:
+                    subset = self.__get_subset(state, source, target, True)
+                section, scan = self.__scan_backward(
+                    state, source, target, planned, mask, avoid, bounds, subset, carry
+                )
+                scans.append(scan)
+                if not section:
+                    return []
+                if carry is not None and len(section[-1]) < 4:
+                    if section[-1][1] == carry[0]:
+                        section[-1] = (section[-1][0], *legs.pop(0)[1:])
+                legs[:0] = section
+                first = section[0]
+                if len(first) == 4:
+                    planned = first[2]
+                    carry = None
+                else:
+                    offset = first[2] if len(first) == 3 else 0
+                    planned = state.dep_times[first[0]] + offset
+                    carry = (first[0], offset)
+        return legs
+
+    def __get_bounds(
+        self, state: "_EngineState", stop: int, from_stop: bool
+    ) -> tuple[list[int], int]:
+        """
+        Get lower bounds on the travel time between a stop and every other
+        stop, computing them if they are not in the bound cache.
+        @param state: Pinned engine state.
+        @param stop: Stop index.
+        @param from_stop: True for bounds from the stop to every other stop,
+        False for bounds from every other stop to it.
+        @return: Tuple of (list of seconds indexed by stop, _NEVER where the
+        stops are not connected; smallest bound of any other stop).
+        """
+        key = (stop, from_stop)
+        bounds = self.__bounds.get(key, state.version)
+        if bounds is None:
+            times = self.__shortest_times(state, stop, from_stop)
+            slack = min(
+                (time for other, time in enumerate(times) if other != stop),
+                default=_NEVER,
+            )
+            bounds = (times, slack)
+            self.__bounds.put(key, state.version, bounds)
+        return bounds
+
+    def __shortest_times(
+        self, state: "_EngineState", stop: int, from_stop: bool
+    ) -> list[int]:
+        """
+        Dijkstra on the time-independent stop graph, whose edges are the
+        shortest ride between each pair of stops and every footpath. Waiting
+        and minimum connection times are ignored, so the results never exceed
+        the real travel time.
+        @param state: Pinned engine state.
+        @param stop: Stop index.
+        @param from_stop: True to search forwards from the stop, False to
+        search backwards to it.
+        @return: List of seconds indexed by stop.
+        """
+        if state.stop_graph is None:
+            state.stop_graph = self.__build_stop_graph(state)
+        forward, backward = state.stop_graph
+        edges = forward if from_stop else backward
+        times = [_NEVER] * len(self.__stop_ids)
+        times[stop] = 0
+        heap = [(0, stop)]
+        while heap:
+            elapsed, current = heapq.heappop(heap)
+            if elapsed > times[current]:
+                continue
+            for other, duration in edges[current]:
+                if elapsed + duration < times[other]:
+                    times[other] = elapsed + duration
+                    heapq.heappush(heap, (elapsed + duration, other))
+        return times
+
+    def __build_stop_graph(self, state: "_EngineState") -> tuple[list, list]:
+        """
+        Build the time-independent stop graph used for lower bounds.
+        @param state: Pinned engine state.
+        @return: Tuple of (outgoing edges, incoming edges), each a list indexed
+        by stop of (other stop, shortest duration in seconds) pairs.
+        """
+        shortest: dict[tuple[int, int], int] = {}
+        for dep_stop, arr_stop, dep_time, arr_time in zip(
+            state.dep_stops, state.arr_stops, state.dep_times, state.arr_times
+        ):
+            pair = (dep_stop, arr_stop)
+            duration = arr_time - dep_time
+            if duration < shortest.get(pair, _NEVER):
+                shortest[pair] = duration
+        # The footpaths as given, rather than their transitive closure, keep
+        # the graph small without changing any shortest path.
+        for dep_stop, arr_stop, duration in self.__footpaths:
+            pair = (dep_stop, arr_stop)
+            if duration < shortest.get(pair, _NEVER):
+                shortest[pair] = duration
+        forward: list = [[] for _ in self.__stop_ids]
+        backward: list = [[] for _ in self.__stop_ids]
+        for (dep_stop, arr_stop), duration in shortest.items():
+            forward[dep_stop].append((arr_stop, duration))
+            backward[arr_stop].append((dep_stop, duration))
+        return forward, backward
+
+    def __get_mask(self, state: "_EngineState", query_filter: QueryFilter) -> bytearray:
+        """
+        Get the mask of a filter over the engine's connections, compiling it
+        if it is not in the mask cache.
+        @param state: Pinned engine state.
+        @param query_filter: A QueryFilter object.
+        @return: Mask indexed by connection, 1 where the connection may be
+        used.
+        """
+        key = query_filter.get_key()
+        mask = self.__masks.get(key, state.version)
+        if mask is None:
+            mask = query_filter.compile(state.compiled)
+            if state.positions is not None:
+                mask = bytearray(mask[position] for position in state.positions)
+            self.__masks.put(key, state.version, mask)
+        return mask
+
+    def __scan_forward(
+        self,
+        state: "_EngineState",
+        source: int,
+        target: int,
+        planned: int,
+        mask: bytearray,
+        avoid: list,
+        bounds: tuple[list[int], int] | None,
+        subset: list[list[int]] | None,
+        carry: tuple[int, int] | None = None,
+    ) -> tuple:
+        """
+        Earliest arrival scan over connections sorted by departure.
+        best[stop] holds the time from which a new trip can be boarded at the
+        stop: the arrival time plus the minimum connection time when the stop
+        was reached on a vehicle, or the plain arrival time at the target,
+        at the origin and at stops reached on foot.
+        @param state: Pinned engine state.
+        @param source: Origin stop index.
+        @param target: Destination stop index.
+        @param planned: Departure time in seconds.
+        @param mask: Connection mask, 0 for connections that must not be used.
+        @param avoid: Stop indexes that must not be reached.
+        @param bounds: Lower bounds on the travel time from each stop to the
+        destination and the smallest of them, or None to scan without
+        pruning.
+        @param subset: Groups of sorted positions of the connections to scan,
+        or None to scan them all.
+        @param carry: (Optional, default None) (connection, offset) of the ride
+        that reached the origin, whose trip can be stayed on without the
+        minimum connection time, or None. planned is then its plain arrival
+        time, and other trips are boarded from the minimum connection time
+        after it.
+        @return: Tuple of (legs from origin to destination, scan statistics).
+        """
+        dep_times = state.dep_times
+        arr_times = state.arr_times
+        dep_stops = state.dep_stops
+        arr_stops = state.arr_stops
+        trips = state.trips
+        arr_mcts = state.arr_mcts
+        transfers = self.__transfers
+        stop_bounds, slack = bounds if bounds is not None else (None, 0)
+        copies = self.__get_copies(state, planned, False)
+        # Times are kept relative to the repetition of the timetable being
+        # scanned, so the connections' own times can be compared with them.
+        offset = copies[0][0]
+        planned -= offset
+
+        best = [_NEVER] * len(self.__stop_ids)
+        boarded = [-1] * state.trip_count
+        # (first connection, last connection) of the ride reaching each stop,
+        # and (stop, duration) of the walk reaching it if that was better.
+        rode: list = [None] * len(self.__stop_ids)
+        walked: list = [None] * len(self.__stop_ids)
+        # Earliest plain arrival of a ride at each stop, which footpaths start
+        # from even when a walk gives the stop a better boarding time.
+        reached = [_NEVER] * len(self.__stop_ids)
+        for stop in avoid:
+            # Nothing arrives earlier than this, so the stop is never reached.
+            best[stop] = -_NEVER
+        best[source] = planned
+        if carry is not None:
+            best[source] += arr_mcts[carry[0]]
+            if carry[1] == offset:
+                boarded[trips[carry[0]]] = carry[0]
+        if transfers is not None:
+            self.__walk_forward(source, planned, best, walked)
+        best_target = best[target]
+        # Nothing departing at or after the cutoff can reach the destination
+        # before best_target, as every connection ends somewhere at least
+        # slack seconds away from it.
+        cutoff = best_target - slack
+
+        start = copies[0][1]
+        index = start - 1
+        relaxations = 0
+        scanned = 0
+        early_termination = False
+        for copy_offset, copy_start in copies:
+            if early_termination:
+                break
+            if copy_offset != offset:
+                best = _shift(best, copy_offset - offset)
+                reached = _shift(reached, copy_offset - offset)
+                best_target = best[target]
+                cutoff = best_target - slack
+                offset = copy_offset
+                # Trips of one repetition are never continued in the next.
+                boarded = [-1] * state.trip_count
+            if subset is None:
+                indexes: Iterable[int] = range(copy_start, len(dep_times))
+            else:
+                indexes = self.__merge_subset(subset, copy_start)
+            index = copy_start - 1
+            for index in indexes:
+                dep_time = dep_times[index]
+                if dep_time >= cutoff:
+                    # Connections are sorted by departure, so nothing from here
+                    # on can reach the destination any sooner.
+                    early_termination = True
+                    break
+                if not mask[index]:
+                    # The service cannot be ridden on past a connection that
+                    # must not be used.
+                    boarded[trips[index]] = -1
+                    continue
+                trip = trips[index]
+                first = boarded[trip]
+                if first == -1:
+                    if best[dep_stops[index]] > dep_time:
+                        continue
+                    if (
+                        stop_bounds is not None
+                        and dep_time + stop_bounds[dep_stops[index]] >= best_target
+                    ):
+                        # Even the fastest way on from here arrives too late.
+                        continue
+                    first = boarded[trip] = index
+                stop = arr_stops[index]
+                if stop == target:
+                    arr_time = arr_times[index]
+                    if arr_time < best_target:
+                        best[stop] = best_target = arr_time
+                        cutoff = best_target - slack
+                        rode[stop] = (first, index, offset)
+                        walked[stop] = None
+                        relaxations += 1
+                else:
+                    arr_time = arr_times[index]
+                    if arr_time + arr_mcts[index] < best[stop]:
+                        if (
+                            stop_bounds is not None
+                            and arr_time + stop_bounds[stop] >= best_target
+                        ):
+                            continue
+                        best[stop] = arr_time + arr_mcts[index]
+                        rode[stop] = (first, index, offset)
+                        walked[stop] = None
+                        relaxations += 1
+                        if transfers is not None:
+                            reached[stop] = arr_time
+                            self.__walk_forward(stop, arr_time, best, walked)
+                            best_target = best[target]
+                            cutoff = best_target - slack
+                    elif transfers is not None and arr_time < reached[stop]:
+                        # The stop was reached sooner on foot, but walking on
+                        # from this ride may still be faster than from that
+                        # walk.
+                        if (
+                            stop_bounds is not None
+                            and arr_time + stop_bounds[stop] >= best_target
+                        ):
+                            continue
+                        reached[stop] = arr_time
+                        rode[stop] = (first, index, offset)
+                        relaxations += 1
+                        self.__walk_forward(stop, arr_time, best, walked)
+                        best_target = best[target]
+                        cutoff = best_target - slack
+            scanned += self.__count_scanned(subset, copy_start, index)
+
+        scan = (
+            start if scanned else -1,
+            index if scanned else -1,
+            relaxations,
+            early_termination,
+            scanned,
+        )
+        if best_target == _NEVER or target == source:
+            return [], scan
+        if offset != 0:
+            best = _shift(best, -offset)
+        journey = self.__trace_forward(
+            state, source, target, best, rode, walked, False, carry
+        )
+        return journey, scan
+
+    def __trace_forward(
+        self,
+        state: "_EngineState",
+        source: int,
+        target: int,
+        best: list,
+        rode: list,
+        walked: list,
+        by_ride: bool,
+        carry: tuple[int, int] | None = None,
+    ) -> list:
+        """
+        Follow the rides and walks of a forward scan back from a stop.
+        @param state: Pinned engine state.
+        @param source: Origin stop index.
+        @param target: Stop index to trace back from.
+        @param best: Best times of the scan.
+        @param rode: Ride reaching each stop in the scan.
+        @param walked: Walk reaching each stop in the scan.
+        @param by_ride: True to end with the ride reaching the target even if
+        a walk gave it a better time.
+        @param carry: (Optional, default None) (connection, offset) of the ride
+        that reached the origin, or None. A ride boarded at that connection
+        stayed on it at the origin and is the first leg.
+        @return: List of legs from the origin.
+        """
+        dep_stops = state.dep_stops
+        legs = []
+        stop = target
+        while stop != source:
+            if walked[stop] is not None and not by_ride:
+                # Walks only start where a ride ended (or at the origin).
+                walk_from, duration = walked[stop]
+                legs.append((walk_from, stop, best[stop] - duration, best[stop]))
+                stop = walk_from
+                if stop == source:
+                    break
+            by_ride = False
+            ride = rode[stop]
+            carried = carry is not None and (ride[0], ride[2]) == carry
+            if len(ride) == 3 and ride[2] == 0:
+                # Rides on a repetition of the timetable keep their offset.
+                ride = ride[:2]
+            legs.append(ride)
+            if carried:
+                # The ride boarded before the origin, on the previous section.
+                break
+            stop = dep_stops[ride[0]]
+        legs.reverse()
+        return legs
+
+    def __scan_alternatives(
+        self,
+        state: "_EngineState",
+        source: int,
+        target: int,
+        planned: int,
+        mask: bytearray,
+        avoid: list,
+        bounds: tuple[list[int], int] | None,
+        count: int,
+    ) -> tuple:
+        """
+        Earliest arrival scan that keeps the count best distinct labels at
+        the destination instead of a single best time. Every other stop keeps
+        its best label, as in __scan_forward(), but labels are persistent
+        (leg, previous label, rides) chains, so a trip reaching the
+        destination after the best one can still be traced back. Every trip
+        arriving at the destination, and every walk to it, offers a label
+        there; labels are ranked by arrival time and then by rides, and
+        labels riding the same services in the same order are duplicates.
+        The scan stops once nothing can beat the count-th best label.
+        @param state: Pinned engine state.
+        @param source: Origin stop index.
+        @param target: Destination stop index.
+        @param planned: Departure time in seconds.
+        @param mask: Connection mask, 0 for connections that must not be used.
+        @param avoid: Stop indexes that must not be reached.
+        @param bounds: Lower bounds on the travel time from each stop to the
+        destination and the smallest of them, or None to scan without
+        pruning.
+        @param count: Number of labels to keep at the destination.
+        @return: Tuple of (list of legs from origin to destination for each
+        journey found, best first, scan statistics).
+        """
+        dep_times = state.dep_times
+        arr_times = state.arr_times
+        dep_stops = state.dep_stops
+        arr_stops = state.arr_stops
+        trips = state.trips
+        arr_mcts = state.arr_mcts
+        transfers = self.__transfers
+        stop_bounds = bounds[0] if bounds is not None else None
+        if transfers is not None:
+            offsets, walk_targets, durations = transfers.get_arrays()
+
+        best = [_NEVER] * len(self.__stop_ids)
+        labels: list = [None] * len(self.__stop_ids)
+        reached = [_NEVER] * len(self.__stop_ids)
+        for stop in avoid:
+            best[stop] = -_NEVER
+        # (arrival, rides, services ridden, label) at the destination, best
+        # first.
+        found: list = []
+        # Arrival of the count-th best label at the destination.
+        latest = _NEVER
+        relaxations = 0
+
+        def offer(arrival: int, label: tuple) -> None:
+            nonlocal latest, relaxations
+            rides = label[2]
+            if len(found) == count and (arrival, rides) >= found[-1][:2]:
+                return
+            ridden = []
+            previous = label
+            while previous[0] is not None:
+                leg = previous[0]
+                if len(leg) != 4:
+                    ridden.append((trips[leg[0]], leg[2] if len(leg) == 3 else 0))
+                previous = previous[1]
+            services = tuple(reversed(ridden))
+            for i, entry in enumerate(found):
+                if entry[2] == services:
+                    if entry[:2] <= (arrival, rides):
+                        return
+                    del found[i]
+                    break
+            bisect.insort(
+                found, (arrival, rides, services, label), key=operator.itemgetter(0, 1)
+            )
+            del found[count:]
+            relaxations += 1
+            if len(found) == count:
+                latest = found[-1][0]
+
+        def walk(stop: int, arrival: int, label: tuple) -> None:
+            nonlocal relaxations
+            for k in range(offsets[stop], offsets[stop + 1]):
+                other = walk_targets[k]
+                walk_end = arrival + durations[k]
+                walked = ((stop, other, arrival, walk_end), label, label[2])
+                if other == target:
+                    offer(walk_end, walked)
+                elif walk_end < best[other]:
+                    best[other] = walk_end
+                    labels[other] = walked
+                    relaxations += 1
+
+        root = (None, None, 0)
+        best[source] = planned
+        labels[source] = root
+        if source != target and transfers is not None:
+            walk(source, planned, root)
+
+        copies = self.__get_copies(state, planned, False)
+        start = copies[0][1]
+        index = start - 1
+        scanned = 0
+        early_termination = False
+        for offset, copy_start in copies:
+            if early_termination or source == target:
+                break
+            # (first connection, label boarded from) of each trip.
+            boarded: list = [None] * state.trip_count
+            index = copy_start - 1
+            for index in range(copy_start, len(dep_times)):
+                dep_time = dep_times[index] + offset
+                if dep_time > latest:
+                    early_termination = True
+                    break
+                trip = trips[index]
+                if not mask[index]:
+                    boarded[trip] = None
+                    continue
+                ride = boarded[trip]
+                if ride is None:
+                    stop = dep_stops[index]
+                    if best[stop] > dep_time:
+                        continue
+                    if (
+                        stop_bounds is not None
+                        and dep_time + stop_bounds[stop] > latest
+                    ):
+                        continue
+                    ride = boarded[trip] = (index, labels[stop])
+                stop = arr_stops[index]
+                arr_time = arr_times[index] + offset
+                if stop == target:
+                    leg = (ride[0], index, offset) if offset else (ride[0], index)
+                    offer(arr_time, (leg, ride[1], ride[1][2] + 1))
+                    continue
+                if stop_bounds is not None and arr_time + stop_bounds[stop] > latest:
+                    continue
+                label = None
+                if arr_time + arr_mcts[index] < best[stop]:
+                    best[stop] = arr_time + arr_mcts[index]
+                    leg = (ride[0], index, offset) if offset else (ride[0], index)
+                    label = labels[stop] = (leg, ride[1], ride[1][2] + 1)
+                    relaxations += 1
+                if transfers is not None and arr_time < reached[stop]:
+                    # Walks leave from the plain arrival, which may come from
+                    # a ride that did not give the stop a better time.
+                    reached[stop] = arr_time
+                    if label is None:
+                        leg = (ride[0], index, offset) if offset else (ride[0], index)
+                        label = (leg, ride[1], ride[1][2] + 1)
+                    walk(stop, arr_time, label)
+            scanned += self.__count_scanned(None, copy_start, index)
+
+        scan = (
+            start if scanned else -1,
+            index if scanned else -1,
+            relaxations,
+            early_termination,
+            scanned,
+        )
+        journeys = []
+        for _, _, _, label in found:
+            legs = []
+            while label[0] is not None:
+                legs.append(label[0])
+                label = label[1]
+            legs.reverse()
+            journeys.append(legs)
+        return journeys, scan
+
+    def __scan_profile(
+        self,
+        state: "_EngineState",
+        source: int,
+        planned: int,
+        targets: list[int],
+        limits: list[int],
+    ) -> tuple:
+        """
+        Earliest arrival scan to several targets at once, used to build hub
+        profiles. best[stop] has the same meaning as in __scan_forward at every
+        stop but the origin, and reached[stop] holds the earliest plain arrival
+        of a ride. The scan stops once nothing can reach any target sooner
+        than both its arrival so far and its limit.
+        @param state: Pinned engine state.
+        @param source: Origin stop index.
+        @param planned: Departure time in seconds.
+        @param targets: Stop indexes to reach, -1 for none.
+        @param limits: Time each target must be reached before to be of use.
+        @return: Tuple of (best, reached, rode, walked).
+        """
+        dep_times = state.dep_times
+        arr_times = state.arr_times
+        dep_stops = state.dep_stops
+        arr_stops = state.arr_stops
+        trips = state.trips
+        arr_mcts = state.arr_mcts
+        transfers = self.__transfers
+
+        best = [_NEVER] * len(self.__stop_ids)
+        reached = [_NEVER] * len(self.__stop_ids)
+        boarded = [-1] * state.trip_count
+        rode: list = [None] * len(self.__stop_ids)
+        walked: list = [None] * len(self.__stop_ids)
+        best[source] = planned
+        if transfers is not None:
+            self.__walk_forward(source, planned, best, walked)
+        goals = [
+            (target, limit)
+            for target, limit in zip(targets, limits)
+            if target != -1 and target != source
+        ]
+        goal_stops = {target for target, _ in goals}
+        # Upper bound on the time the last target still to be improved can be
+        # reached, recomputed after a target (or, with footpaths, any stop)
+        # improves. Until every target has been reached it is _NEVER.
+        latest = -_NEVER
+        stale = True
+        for index in range(bisect.bisect_left(dep_times, planned), len(dep_times)):
+            dep_time = dep_times[index]
+            if stale:
+                latest = max(
+                    (min(reached[target], best[target], limit) for target, limit in goals),
+                    default=-_NEVER,
+                )
+                stale = False
+            if dep_time >= latest:
+                break
+            trip = trips[index]
+            first = boarded[trip]
+            if first == -1:
+                if best[dep_stops[index]] > dep_time:
+                    continue
+                first = boarded[trip] = index
+            stop = arr_stops[index]
+            arr_time = arr_times[index]
+            if arr_time < reached[stop]:
+                reached[stop] = arr_time
+                rode[stop] = (first, index)
+                if arr_time + arr_mcts[index] < best[stop]:
+                    best[stop] = arr_time + arr_mcts[index]
+                    walked[stop] = None
+                if transfers is not None:
+                    self.__walk_forward(stop, arr_time, best, walked)
+                    stale = True
+                elif stop in goal_stops:
+                    stale = True
+        return best, reached, rode, walked
+
+    def __walk_forward(self, stop: int, arrival: int, best: list, walked: list) -> None:
+        """
+        Relax the footpaths leaving a stop whose arrival time just improved.
+        @param stop: Stop index.
+        @param arrival: Arrival time at the stop in seconds.
+        @param best: Best times of the current scan.
+        @param walked: Walk reaching each stop in the current scan.
+        """
+        offsets, targets, durations = self.__transfers.get_arrays()  # type: ignore
+        for k in range(offsets[stop], offsets[stop + 1]):
+            other = targets[k]
+            walk_end = arrival + durations[k]
+            if walk_end < best[other]:
+                best[other] = walk_end
+                walked[other] = (stop, durations[k])
+
+    def __scan_backward(
+        self,
+        state: "_EngineState",
+        source: int,
+        target: int,
+        planned: int,
+        mask: bytearray,
+        avoid: list,
+        bounds: tuple[list[int], int] | None,
+        subset: list[list[int]] | None,
+        carry: tuple[int, int] | None = None,
+    ) -> tuple:
+        """
+        Latest departure scan over connections sorted by arrival, latest
+        first. best[stop] holds the latest time the stop can be reached to
+        still arrive at the destination in time: the departure time less the
+        minimum connection time when leaving the stop on a vehicle, or the
+        plain departure time at the origin and at stops left on foot.
+        @param state: Pinned engine state.
+        @param source: Origin stop index.
+        @param target: Destination stop index.
+        @param planned: Arrival time in seconds.
+        @param mask: Connection mask, 0 for connections that must not be used.
+        @param avoid: Stop indexes that must not be reached.
+        @param bounds: Lower bounds on the travel time from the origin to each
+        stop and the smallest of them, or None to scan without pruning.
+        @param subset: Groups of sorted positions in arrival order of the
+        connections to scan, or None to scan them all.
+        @param carry: (Optional, default None) (connection, offset) of the ride
+        that leaves the destination, whose trip can be stayed on without the
+        minimum connection time, or None. planned is then its plain departure
+        time, and other trips must arrive the minimum connection time before
+        it.
+        @return: Tuple of (legs from origin to destination, scan statistics).
+        """
+        dep_times = state.dep_times
+        arr_times = state.arr_times
+        dep_stops = state.dep_stops
+        arr_stops = state.arr_stops
+        trips = state.trips
+        dep_mcts = state.dep_mcts
+        order = state.arr_order
+        transfers = self.__transfers
+        stop_bounds, slack = bounds if bounds is not None else (None, 0)
+        copies = self.__get_copies(state, planned, True)
+        # Times are kept relative to the repetition of the timetable being
+        # scanned, as in __scan_forward.
+        offset = copies[0][0]
+        planned -= offset
+
+        best = [-_NEVER] * len(self.__stop_ids)
+        alighted = [-1] * state.trip_count
+        # (first connection, last connection) of the ride leaving each stop,
+        # and (stop, duration) of the walk leaving it if that was better.
+        rode: list = [None] * len(self.__stop_ids)
+        walked: list = [None] * len(self.__stop_ids)
+        # Latest plain departure of a ride from each stop, which footpaths end
+        # at even when a walk gives the stop a better time.
+        left = [-_NEVER] * len(self.__stop_ids)
+        for stop in avoid:
+            # Nothing leaves later than this, so the stop is never reached.
+            best[stop] = _NEVER
+        best[target] = planned
+        if carry is not None:
+            best[target] -= dep_mcts[carry[0]]
+            if carry[1] == offset:
+                alighted[trips[carry[0]]] = carry[0]
+        if transfers is not None:
+            self.__walk_backward(target, planned, best, walked)
+        best_source = best[source]
+        cutoff = best_source + slack
+
+        start = copies[0][1]
+        position = start - 1
+        relaxations = 0
+        scanned = 0
+        early_termination = False
+        for copy_offset, copy_start in copies:
+            if early_termination:
+                break
+            if copy_offset != offset:
+                best = _shift(best, copy_offset - offset)
+                left = _shift(left, copy_offset - offset)
+                best_source = best[source]
+                cutoff = best_source + slack
+                offset = copy_offset
+                # Trips of one repetition are never continued in the previous.
+                alighted = [-1] * state.trip_count
+            if subset is None:
+                positions: Iterable[int] = range(copy_start, len(order))
             else:
-                route = []
+                positions = self.__merge_subset(subset, copy_start)
+            position = copy_start - 1
+            for position in positions:
+                index = order[position]
+                arr_time = arr_times[index]
+                if arr_time <= cutoff:
+                    # Connections are sorted by arrival, latest first, so
+                    # nothing from here on can leave the origin any later.
+                    early_termination = True
+                    break
+                if not mask[index]:
+                    alighted[trips[index]] = -1
+                    continue
+                trip = trips[index]
+                last = alighted[trip]
+                if last == -1:
+                    if best[arr_stops[index]] < arr_time:
+                        continue
+                    if (
+                        stop_bounds is not None
+                        and arr_time - stop_bounds[arr_stops[index]] <= best_source
+                    ):
+                        # Even the fastest way here leaves the origin too early.
+                        continue
+                    last = alighted[trip] = index
+                stop = dep_stops[index]
+                dep_time = dep_times[index]
+                if stop == source:
+                    if dep_time > best_source:
+                        best[stop] = best_source = dep_time
+                        cutoff = best_source + slack
+                        rode[stop] = (index, last, offset)
+                        walked[stop] = None
+                        relaxations += 1
+                elif dep_time - dep_mcts[index] > best[stop]:
+                    if (
+                        stop_bounds is not None
+                        and dep_time - stop_bounds[stop] <= best_source
+                    ):
+                        continue
+                    best[stop] = dep_time - dep_mcts[index]
+                    rode[stop] = (index, last, offset)
+                    walked[stop] = None
+                    relaxations += 1
+                    if transfers is not None:
+                        left[stop] = dep_time
+                        self.__walk_backward(stop, dep_time, best, walked)
+                        best_source = best[source]
+                        cutoff = best_source + slack
+                elif transfers is not None and dep_time > left[stop]:
+                    # The stop can be left later on foot, but walking here to
+                    # catch this ride may still leave the origin later.
+                    if (
+                        stop_bounds is not None
+                        and dep_time - stop_bounds[stop] <= best_source
+                    ):
+                        continue
+                    left[stop] = dep_time
+                    rode[stop] = (index, last, offset)
+                    relaxations += 1
+                    self.__walk_backward(stop, dep_time, best, walked)
+                    best_source = best[source]
+                    cutoff = best_source + slack
+            scanned += self.__count_scanned(subset, copy_start, position)
 
-                last_connection_index = self.__in_connection[origin.get_location_id()]
+        scan = (
+            start if scanned else -1,
+            position if scanned else -1,
+            relaxations,
+            early_termination,
+            scanned,
+        )
+        if best_source == -_NEVER or target == source:
+            return [], scan
+        if offset != 0:
+            best = _shift(best, -offset)
+        legs = []
+        stop = source
+        while stop != target:
+            if walked[stop] is not None:
+                # Walks only end where a ride starts (or at the destination).
+                walk_to, duration = walked[stop]
+                legs.append((stop, walk_to, best[stop], best[stop] + duration))
+                stop = walk_to
+                if stop == target:
+                    break
+            ride = rode[stop]
+            legs.append(ride if ride[2] else ride[:2])
+            if carry is not None and (ride[1], ride[2]) == carry:
+                # The ride alights after the destination, on the next section.
+                break
+            stop = arr_stops[ride[1]]
+        return legs, scan
 
-                while last_connection_index != -1:
-                    connection = self.__timetable.get_connections()[
-                        last_connection_index
-                    ]
-                    route.append(connection)
-                    last_connection_index = self.__in_connection[
-                        connection.get_arr_loc()
-                    ]
+    def __walk_backward(
+        self, stop: int, departure: int, best: list, walked: list
+    ) -> None:
+        """
+        Relax the footpaths arriving at a stop whose departure time just
+        improved.
+        @param stop: Stop index.
+        @param departure: Departure time from the stop in seconds.
+        @param best: Best times of the current scan.
+        @param walked: Walk leaving each stop in the current scan.
+        """
+        offsets, sources, durations = self.__transfers.get_reverse_arrays()  # type: ignore
+        for k in range(offsets[stop], offsets[stop + 1]):
+            other = sources[k]
+            walk_start = departure - durations[k]
+            if walk_start > best[other]:
+                best[other] = walk_start
+                walked[other] = (stop, durations[k])
 
-                return route
+    def __build_journey(self, state: "_EngineState", legs: list) -> Journey:
+        """
+        Build the journey from the legs found by a scan. Rides are followed
+        along the next-in-trip pointers of the compiled timetable from the
+        boarding connection to the stop where the last connection arrives.
+        @param state: Pinned engine state.
+        @param legs: List of (first connection, last connection) positions for
+        each ride, with the offset in seconds of the repetition of the
+        timetable ridden as a third item when it is not 0, or (from stop, to
+        stop, departure, arrival) for each walk.
+        @return: A Journey object.
+        """
+        compiled = state.compiled
+        positions = state.positions
+        result = []
+        if legs:
+            next_in_trip = compiled.get_next_in_trip()
+            arr_stops = compiled.get_columns()[3]
+        for leg in legs:
+            if len(leg) == 4:
+                from_stop, to_stop, departure, arrival = leg
+                walk = (
+                    self.__stop_ids[from_stop],
+                    self.__stop_ids[to_stop],
+                    departure,
+                    arrival,
+                )
+                result.append(Leg(compiled, -1, -1, 1, walk))
+                continue
+            first, last = leg[0], leg[1]
+            if positions is not None:
+                first, last = positions[first], positions[last]
+            alight_stop = arr_stops[last]
+            position = first
+            stop_count = 1
+            while arr_stops[position] != alight_stop and next_in_trip[position] != -1:
+                position = next_in_trip[position]
+                stop_count += 1
+            offset = leg[2] if len(leg) == 3 else 0
+            result.append(Leg(compiled, first, position, stop_count, offset=offset))
+        return Journey(result)
@@ -0,0 +1,652 @@
+"""
+Pytinerary - Round-based (RAPTOR) itinerary engine.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from collections.abc import Iterable
+
+import bisect
+import datetime
+
+from .cache import QueryCache
+from .filters import QueryFilter
+from .pytinerary import _NEVER, Location, Timetable
+from .transfers import Footpath, TransferGraph
+
+
+class RaptorEngine(object):
+    """
+    Alternative to ItineraryEngine using the round-based RAPTOR algorithm.
+    Services are grouped into route patterns (trips with the same stop
+    sequence that never overtake each other), and each round scans every
+    route serving a stop improved in the previous round, so round k finds the
+    best itineraries with k - 1 changes. Results follow the same rules as
+    ItineraryEngine: minimum connection times apply when changing services,
+    and footpaths only start where a ride ends.
+    """
+
+    def __init__(
+        self,
+        timetable: Timetable,
+        locations: dict[str, Location],
+        transfers: TransferGraph | None = None,
+        max_transfers: int = 8,
+        filter_cache_size: int = 16,
+    ) -> None:
+        """
+        Initialise the RaptorEngine object.
+        @param timetable: A Timetable object.
+        @param locations: Dict of Location objects keyed by identifier.
+        @param transfers: (Optional, default None) A TransferGraph of
+        footpaths and transfer times between locations.
+        @param max_transfers: (Optional, default 8) Maximum number of changes
+        between services. Itineraries needing more are not found.
+        @param filter_cache_size: (Optional, default 16) Number of compiled
+        QueryFilter masks kept for reuse.
+        """
+        if max_transfers < 0:
+            raise ValueError("Maximum number of transfers must not be negative")
+        self.__timetable = timetable
+        self.__locations = locations
+        self.__rounds = max_transfers + 1
+        self.__masks = QueryCache(filter_cache_size, ttl=0)
+        self.__stop_ids = list(locations.keys())
+        self.__stop_index = {
+            location_id: i for i, location_id in enumerate(self.__stop_ids)
+        }
+        self.__mct = [
+            location.get_minimum_connection_time() * 60
+            for location in locations.values()
+        ]
+        self.__transfers = None
+        if transfers is not None:
+            self.__transfers = transfers.compile(self.__stop_ids)
+            for i, seconds in enumerate(self.__transfers.get_min_times()):
+                if seconds >= 0:
+                    self.__mct[i] = seconds
+        self.__build_routes()
+
+    def get_route_count(self) -> int:
+        """
+        Get the number of route patterns built from the timetable.
+        @return: Number of routes.
+        """
+        return len(self.__route_stops)
+
+    def generate_itinerary(
+        self,
+        origin: Location,
+        destination: Location,
+        planned_time: datetime.datetime,
+        arrive_by: bool = False,
+        query_filter: QueryFilter | None = None,
+        via: Iterable[Location] = (),
+    ) -> list:
+        """
+        Generate an itinerary based on the initialised timetable and parameters provided.
+        @param origin: Origin location.
+        @param destination: Destination location.
+        @param planned_time: Planned departure/arrival time.
+        @param arrive_by: (Optional, default False) True if planned_time is an
+        arrival time.
+        @param query_filter: (Optional, default None) A QueryFilter limiting
+        the modes, operators and locations the itinerary may use.
+        @param via: (Optional, default empty) Locations the itinerary must pass
+        through, in order.
+        @return: List of connections (and Footpath objects for walks) making
+        up the itinerary, empty if there is none.
+        """
+        via = tuple(via)
+        if isinstance(origin, Location) != True:
+            raise TypeError("Origin must be of type Location")
+        if origin.get_location_id() not in self.__locations.keys():
+            raise ValueError("Origin location does not exist")
+        if isinstance(destination, Location) != True:
+            raise TypeError("Destination must be of type Location")
+        if destination.get_location_id() not in self.__locations.keys():
+            raise ValueError("Destination location does not exist")
+        if isinstance(planned_time, datetime.datetime) != True:
+            raise TypeError("Planned time must be a datetime object")
+        if arrive_by not in [True, False]:
+            raise TypeError("Time type must be a boolean")
+        for location in via:
+            if isinstance(location, Location) != True:
+                raise TypeError("Via locations must be of type Location")
+            if location.get_location_id() not in self.__locations.keys():
+                raise ValueError("Via location does not exist")
+        if query_filter is not None:
+            if isinstance(query_filter, QueryFilter) != True:
+                raise TypeError("Query filter must be of type QueryFilter")
+            for location in (origin, destination, *via):
+                if location.get_location_id() in query_filter.get_avoid():
+                    raise ValueError("Cannot avoid the origin, destination or via locations")
+        if self.__built_version != self.__timetable.get_version():
+            self.__build_routes()
+        stops = [
+            self.__stop_index[location.get_location_id()]
+            for location in (origin, *via, destination)
+        ]
+        planned = self.__compiled.to_seconds(planned_time)
+        mask = None
+        avoid: list[int] = []
+        if query_filter is not None:
+            mask = self.__get_mask(query_filter)
+            avoid = [
+                self.__stop_index[location_id]
+                for location_id in query_filter.get_avoid()
+                if location_id in self.__stop_index
+            ]
+
+        # Via locations split the query into sections, each scanned from where
+        # the previous one arrived (or, arriving by, to where the next one
+        # departed). The service of the ride reaching (leaving) the via
+        # location is carried into the next section as (route, trip, stop
+        # position), so it can be stayed on without the minimum connection
+        # time that any other service must allow.
+        legs: list = []
+        sections = list(zip(stops, stops[1:]))
+        carry = None
+        if arrive_by == False:
+            for source, target in sections:
+                if source == target:
+                    continue
+                section = self.__scan_forward(
+                    source, target, planned, mask, avoid, carry
+                )
+                if not section:
+                    return []
+                ride = section[0]
+                if carry is not None and isinstance(ride, tuple) and ride[:3] == carry:
+                    # Stayed on at the via location: one ride, not two.
+                    section[0] = (ride[0], ride[1], legs.pop()[2], ride[3])
+                legs.extend(section)
+                last = section[-1]
+                planned = self.__leg_times(last)[1]
+                carry = None if isinstance(last, list) else (last[0], last[1], last[3])
+        else:
+            for source, target in reversed(sections):
+                if source == target:
+                    continue
+                section = self.__scan_backward(
+                    source, target, planned, mask, avoid, carry
+                )
+                if not section:
+                    return []
+                ride = section[-1]
+                if (
+                    carry is not None
+                    and isinstance(ride, tuple)
+                    and (ride[0], ride[1], ride[3]) == carry
+                ):
+                    section[-1] = (ride[0], ride[1], ride[2], legs.pop(0)[3])
+                legs[:0] = section
+                first = section[0]
+                planned = self.__leg_times(first)[0]
+                carry = None if isinstance(first, list) else first[:3]
+        return self.__reconstruct(legs)
+
+    def __get_mask(self, query_filter: QueryFilter) -> bytearray:
+        """
+        Get the mask of a filter over the compiled timetable, compiling it if
+        it is not in the mask cache.
+        @param query_filter: A QueryFilter object.
+        @return: Mask indexed by compiled position, 1 where the connection may
+        be used.
+        """
+        key = query_filter.get_key()
+        mask = self.__masks.get(key, self.__built_version)
+        if mask is None:
+            mask = query_filter.compile(self.__compiled)
+            self.__masks.put(key, self.__built_version, mask)
+        return mask
+
+    def __leg_times(self, leg: tuple | list) -> tuple[int, int]:
+        """
+        Get the departure and arrival time of a leg found by a scan.
+        @param leg: Leg as returned by __scan_forward or __scan_backward.
+        @return: Tuple of (departure, arrival) in seconds.
+        """
+        if isinstance(leg, list):
+            return leg[2], leg[3]
+        route, trip, board, alight = leg
+        return self.__route_deps[route][board][trip], self.__route_arrs[route][alight - 1][trip]
+
+    def __build_routes(self) -> None:
+        """
+        Group the services of the compiled timetable into route patterns. Each
+        service is followed along the next-in-trip pointers; services with the
+        same stop sequence share a route, split further where one would
+        overtake another so that the times at every stop stay sorted by trip.
+        """
+        snapshot = self.__timetable.snapshot()
+        compiled = snapshot.compile()
+        self.__compiled = compiled
+        self.__built_version = snapshot.get_version()
+        dep_times, arr_times, dep_stops, arr_stops, _ = compiled.get_columns()
+        next_in_trip = compiled.get_next_in_trip()
+        stop_map = [
+            self.__stop_index.get(stop_id, -1) for stop_id in compiled.get_stop_ids()
+        ]
+        known = [
+            stop_map[dep_stop] != -1 and stop_map[arr_stop] != -1
+            for dep_stop, arr_stop in zip(dep_stops, arr_stops)
+        ]
+        continued = bytearray(len(compiled))
+        for position, following in enumerate(next_in_trip):
+            if following != -1 and known[position]:
+                continued[following] = 1
+
+        patterns: dict[tuple, list[list[int]]] = {}
+        for position in range(len(compiled)):
+            if continued[position] or not known[position]:
+                continue
+            chain = [position]
+            following = next_in_trip[position]
+            while following != -1 and known[following]:
+                chain.append(following)
+                following = next_in_trip[following]
+            stops = tuple(
+                [stop_map[dep_stops[chain[0]]]]
+                + [stop_map[arr_stops[link]] for link in chain]
+            )
+            patterns.setdefault(stops, []).append(chain)
+
+        self.__route_stops: list[list[int]] = []
+        self.__route_deps: list[list[list[int]]] = []
+        self.__route_arrs: list[list[list[int]]] = []
+        self.__route_trips: list[list[list[int]]] = []
+        for stops, chains in patterns.items():
+            # Chains were found in departure order, so each split route keeps
+            # its trips sorted by departure from the first stop.
+            routes: list[list[tuple[list[int], list[int], list[int]]]] = []
+            for chain in chains:
+                deps = [dep_times[link] for link in chain]
+                arrs = [arr_times[link] for link in chain]
+                for trips in routes:
+                    last_deps, last_arrs, _ = trips[-1]
+                    if all(map(int.__ge__, deps, last_deps)) and all(
+                        map(int.__ge__, arrs, last_arrs)
+                    ):
+                        trips.append((deps, arrs, chain))
+                        break
+                else:
+                    routes.append([(deps, arrs, chain)])
+            for trips in routes:
+                self.__route_stops.append(list(stops))
+                # Column i holds, for every trip, the departure from stop i
+                # (or the arrival at stop i + 1).
+                self.__route_deps.append([list(x) for x in zip(*(t[0] for t in trips))])
+                self.__route_arrs.append([list(x) for x in zip(*(t[1] for t in trips))])
+                self.__route_trips.append([t[2] for t in trips])
+
+        self.__stop_routes: list[list[tuple[int, int]]] = [[] for _ in self.__stop_ids]
+        for route, stops in enumerate(self.__route_stops):
+            for i, stop in enumerate(stops):
+                self.__stop_routes[stop].append((route, i))
+
+    def __scan_forward(
+        self,
+        source: int,
+        target: int,
+        planned: int,
+        mask: bytearray | None,
+        avoid: list,
+        carry: tuple[int, int, int] | None = None,
+    ) -> list:
+        """
+        Earliest arrival rounds. labels[k][stop] is the time from which a
+        service can be boarded at the stop after k rides, with the same
+        meaning as the best times of ItineraryEngine's forward scan.
+        @param source: Origin stop index.
+        @param target: Destination stop index.
+        @param planned: Departure time in seconds.
+        @param mask: Connection mask over compiled positions, 0 for
+        connections that must not be used, or None to use every connection.
+        @param avoid: Stop indexes that must not be reached.
+        @param carry: (Optional, default None) (route, trip, stop position) of
+        the ride that reached the origin, whose service can be stayed on in the
+        first round without the minimum connection time, or None. planned is
+        then its plain arrival time.
+        @return: List of legs, (route, trip, board, alight) tuples for rides
+        and [from stop, to stop, departure, arrival] lists for walks.
+        """
+        stop_count = len(self.__stop_ids)
+        mct = self.__mct
+        route_stops = self.__route_stops
+        route_deps = self.__route_deps
+        route_arrs = self.__route_arrs
+        route_trips = self.__route_trips
+        stop_routes = self.__stop_routes
+        held_route, held_trip, held_stop = carry if carry is not None else (-1, -1, -1)
+
+        best = [_NEVER] * stop_count
+        # Earliest plain arrival of a ride at each stop. Footpaths start from
+        # it even when a walk gives the stop a better boarding time.
+        reached = [_NEVER] * stop_count
+        for stop in avoid:
+            # Nothing arrives earlier than this, so the stop is never reached.
+            best[stop] = reached[stop] = -_NEVER
+        best[source] = planned
+        if carry is not None:
+            best[source] += mct[source]
+        labels = [list(best)]
+        rides: list[dict[int, tuple]] = [{}]
+        ridden: list[set[int]] = [set()]
+        walks: list[dict[int, tuple]] = [{}]
+        marked = {source}
+        if self.__transfers is not None:
+            marked |= self.__walk_forward({source: planned}, best, labels[0], walks[0])
+
+        for _ in range(self.__rounds):
+            if not marked:
+                break
+            previous = labels[-1]
+            current = list(previous)
+            ride_parents: dict[int, tuple] = {}
+            improved: set[int] = set()
+            walk_parents: dict[int, tuple] = {}
+            queue: dict[int, int] = {}
+            for stop in marked:
+                for route, i in stop_routes[stop]:
+                    if i < queue.get(route, _NEVER):
+                        queue[route] = i
+            arrivals: dict[int, int] = {}
+            for route, first in queue.items():
+                stops = route_stops[route]
+                deps = route_deps[route]
+                arrs = route_arrs[route]
+                chains = route_trips[route]
+                trip = -1
+                board = -1
+                held = held_stop if route == held_route else -1
+                for i in range(first, len(stops)):
+                    stop = stops[i]
+                    if trip != -1:
+                        arr_time = arrs[i - 1][trip]
+                        ready = arr_time if stop == target else arr_time + mct[stop]
+                        if arr_time < reached[stop] and arr_time < best[target]:
+                            reached[stop] = arrivals[stop] = arr_time
+                            ride_parents[stop] = (route, trip, board, i)
+                            if ready < best[stop]:
+                                best[stop] = current[stop] = ready
+                                improved.add(stop)
+                    if i == len(stops) - 1:
+                        break
+                    if mask is not None and trip != -1 and not mask[chains[trip][i]]:
+                        # The service cannot be ridden on past a connection
+                        # that must not be used.
+                        trip = -1
+                    if (
+                        i == held
+                        and (trip == -1 or held_trip < trip)
+                        and (mask is None or mask[chains[held_trip][i]])
+                    ):
+                        # Staying on the service that reached the origin.
+                        trip = held_trip
+                        board = i
+                    label = previous[stop]
+                    if -_NEVER < label < _NEVER and (trip == -1 or label <= deps[i][trip]):
+                        column = deps[i]
+                        earlier = bisect.bisect_left(column, label)
+                        if mask is not None:
+                            while earlier < len(column) and not mask[chains[earlier][i]]:
+                                earlier += 1
+                        if earlier < len(column) and (trip == -1 or earlier < trip):
+                            trip = earlier
+                            board = i
+            held_route = -1
+            marked = set(improved)
+            if self.__transfers is not None and arrivals:
+                marked |= self.__walk_forward(arrivals, best, current, walk_parents)
+            labels.append(current)
+            rides.append(ride_parents)
+            ridden.append(improved)
+            walks.append(walk_parents)
+
+        if best[target] == _NEVER:
+            return []
+        legs = []
+        stop = target
+        k = len(labels) - 1
+        while True:
+            while stop not in walks[k] and stop not in ridden[k]:
+                if k == 0:
+                    break
+                k -= 1
+            if k == 0 and stop not in walks[0]:
+                break
+            if stop in walks[k]:
+                # The walk starts where a ride of the same round ended.
+                walk_from, duration = walks[k][stop]
+                arrival = labels[k][stop]
+                legs.append([walk_from, stop, arrival - duration, arrival])
+                stop = walk_from
+                if k == 0:
+                    break
+            route, trip, board, alight = rides[k][stop]
+            legs.append((route, trip, board, alight))
+            stop = route_stops[route][board]
+            k -= 1
+        legs.reverse()
+        return legs
+
+    def __walk_forward(
+        self, arrivals: dict[int, int], best: list, labels: list, parents: dict
+    ) -> set:
+        """
+        Relax the footpaths leaving the stops reached in this round.
+        @param arrivals: Dict of stop index to arrival time of the ride (or
+        the departure time at the origin).
+        @param best: Best times over every round.
+        @param labels: Times of the current round.
+        @param parents: Walk reaching each stop in the current round.
+        @return: Set of stops improved by walking.
+        """
+        offsets, targets, durations = self.__transfers.get_arrays()  # type: ignore
+        improved = set()
+        for stop, arrival in arrivals.items():
+            for k in range(offsets[stop], offsets[stop + 1]):
+                other = targets[k]
+                walk_end = arrival + durations[k]
+                if walk_end < best[other]:
+                    best[other] = labels[other] = walk_end
+                    parents[other] = (stop, durations[k])
+                    improved.add(other)
+        return improved
+
+    def __scan_backward(
+        self,
+        source: int,
+        target: int,
+        planned: int,
+        mask: bytearray | None,
+        avoid: list,
+        carry: tuple[int, int, int] | None = None,
+    ) -> list:
+        """
+        Latest departure rounds, the mirror image of __scan_forward.
+        labels[k][stop] is the latest time the stop can be reached to still
+        arrive at the destination in time after k rides.
+        @param source: Origin stop index.
+        @param target: Destination stop index.
+        @param planned: Arrival time in seconds.
+        @param mask: Connection mask over compiled positions, 0 for
+        connections that must not be used, or None to use every connection.
+        @param avoid: Stop indexes that must not be reached.
+        @param carry: (Optional, default None) (route, trip, stop position) of
+        the ride that leaves the destination, whose service can be stayed on in
+        the first round without the minimum connection time, or None. planned
+        is then its plain departure time.
+        @return: List of legs, (route, trip, board, alight) tuples for rides
+        and [from stop, to stop, departure, arrival] lists for walks.
+        """
+        stop_count = len(self.__stop_ids)
+        mct = self.__mct
+        route_stops = self.__route_stops
+        route_deps = self.__route_deps
+        route_arrs = self.__route_arrs
+        route_trips = self.__route_trips
+        stop_routes = self.__stop_routes
+        held_route, held_trip, held_stop = carry if carry is not None else (-1, -1, -1)
+
+        best = [-_NEVER] * stop_count
+        left = [-_NEVER] * stop_count
+        for stop in avoid:
+            # Nothing leaves later than this, so the stop is never reached.
+            best[stop] = left[stop] = _NEVER
+        best[target] = planned
+        if carry is not None:
+            best[target] -= mct[target]
+        labels = [list(best)]
+        rides: list[dict[int, tuple]] = [{}]
+        ridden: list[set[int]] = [set()]
+        walks: list[dict[int, tuple]] = [{}]
+        marked = {target}
+        if self.__transfers is not None:
+            marked |= self.__walk_backward({target: planned}, best, labels[0], walks[0])
+
+        for _ in range(self.__rounds):
+            if not marked:
+                break
+            previous = labels[-1]
+            current = list(previous)
+            ride_parents: dict[int, tuple] = {}
+            improved: set[int] = set()
+            walk_parents: dict[int, tuple] = {}
+            queue: dict[int, int] = {}
+            for stop in marked:
+                for route, i in stop_routes[stop]:
+                    if i > queue.get(route, -1):
+                        queue[route] = i
+            departures: dict[int, int] = {}
+            for route, last in queue.items():
+                stops = route_stops[route]
+                deps = route_deps[route]
+                arrs = route_arrs[route]
+                chains = route_trips[route]
+                trip = -1
+                alight = -1
+                held = held_stop if route == held_route else -1
+                for i in range(last, -1, -1):
+                    stop = stops[i]
+                    if trip != -1:
+                        dep_time = deps[i][trip]
+                        ready = dep_time if stop == source else dep_time - mct[stop]
+                        if dep_time > left[stop] and dep_time > best[source]:
+                            left[stop] = departures[stop] = dep_time
+                            ride_parents[stop] = (route, trip, i, alight)
+                            if ready > best[stop]:
+                                best[stop] = current[stop] = ready
+                                improved.add(stop)
+                    if i == 0:
+                        break
+                    if mask is not None and trip != -1 and not mask[chains[trip][i - 1]]:
+                        trip = -1
+                    if (
+                        i == held
+                        and (trip == -1 or held_trip > trip)
+                        and (mask is None or mask[chains[held_trip][i - 1]])
+                    ):
+                        # Staying on the service that leaves the destination.
+                        trip = held_trip
+                        alight = i
+                    label = previous[stop]
+                    if -_NEVER < label < _NEVER and (trip == -1 or label >= arrs[i - 1][trip]):
+                        column = arrs[i - 1]
+                        later = bisect.bisect_right(column, label) - 1
+                        if mask is not None:
+                            while later >= 0 and not mask[chains[later][i - 1]]:
+                                later -= 1
+                        if later >= 0 and (trip == -1 or later > trip):
+                            trip = later
+                            alight = i
+            held_route = -1
+            marked = set(improved)
+            if self.__transfers is not None and departures:
+                marked |= self.__walk_backward(departures, best, current, walk_parents)
+            labels.append(current)
+            rides.append(ride_parents)
+            ridden.append(improved)
+            walks.append(walk_parents)
+
+        if best[source] == -_NEVER:
+            return []
+        legs = []
+        stop = source
+        k = len(labels) - 1
+        while True:
+            while stop not in walks[k] and stop not in ridden[k]:
+                if k == 0:
+                    break
+                k -= 1
+            if k == 0 and stop not in walks[0]:
+                break
+            if stop in walks[k]:
+                walk_to, duration = walks[k][stop]
+                departure = labels[k][stop]
+                legs.append([stop, walk_to, departure, departure + duration])
+                stop = walk_to
+                if k == 0:
+                    break
+            route, trip, board, alight = rides[k][stop]
+            legs.append((route, trip, board, alight))
+            stop = route_stops[route][alight]
+            k -= 1
+        return legs
+
+    def __walk_backward(
+        self, departures: dict[int, int], best: list, labels: list, parents: dict
+    ) -> set:
+        """
+        Relax the footpaths arriving at the stops reached in this round.
+        @param departures: Dict of stop index to departure time of the ride
+        (or the arrival time at the destination).
+        @param best: Best times over every round.
+        @param labels: Times of the current round.
+        @param parents: Walk leaving each stop in the current round.
+        @return: Set of stops improved by walking.
+        """
+        offsets, sources, durations = self.__transfers.get_reverse_arrays()  # type: ignore
+        improved = set()
+        for stop, departure in departures.items():
+            for k in range(offsets[stop], offsets[stop + 1]):
+                other = sources[k]
+                walk_start = departure - durations[k]
+                if walk_start > best[other]:
+                    best[other] = labels[other] = walk_start
+                    parents[other] = (stop, durations[k])
+                    improved.add(other)
+        return improved
+
+    def __reconstruct(self, legs: list) -> list:
+        """
+        Build the itinerary from the legs found by a scan.
+        @param legs: List of rides, as (route, trip, board, alight) tuples, and
+        walks, as (from stop, to stop, departure, arrival) lists.
+        @return: List of connections and Footpath objects.
+        """
+        compiled = self.__compiled
+        itinerary: list = []
+        for leg in legs:
+            if isinstance(leg, list):
+                from_stop, to_stop, departure, arrival = leg
+                itinerary.append(
+                    Footpath(
+                        self.__stop_ids[from_stop],
+                        self.__stop_ids[to_stop],
+                        compiled.from_seconds(departure),
+                        compiled.from_seconds(arrival),
+                    )
+                )
+                continue
+            route, trip, board, alight = leg
+            chain = self.__route_trips[route][trip]
+            itinerary.extend(map(compiled.get_connection, chain[board:alight]))
+        return itinerary
@@ -0,0 +1,415 @@
+"""
+Pytinerary - Footpaths and per-pair transfer times between locations.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from array import array
+from collections.abc import Iterable
+from typing import IO
+
+import csv
+import datetime
+import heapq
+
+
+class Footpath(object):
+    """
+    A walk between two locations in a generated itinerary. Footpaths offer the
+    same getters as a Connection, with None for the unique identifier.
+    """
+
+    __slots__ = ("__dep_loc", "__arr_loc", "__dep_time", "__arr_time")
+
+    def __init__(
+        self,
+        dep_loc: str,
+        arr_loc: str,
+        dep_time: datetime.datetime,
+        arr_time: datetime.datetime,
+    ) -> None:
+        """
+        Initialise the Footpath object.
+        @param dep_loc: Location identifier the walk starts at.
+        @param arr_loc: Location identifier the walk ends at.
+        @param dep_time: Time the walk starts.
+        @param arr_time: Time the walk ends.
+        """
+        self.__dep_loc = dep_loc
+        self.__arr_loc = arr_loc
+        self.__dep_time = dep_time
+        self.__arr_time = arr_time
+
+    def __repr__(self) -> str:
+        return f"Footpath({self.__dep_loc} @ {self.__dep_time}, {self.__arr_loc} @ {self.__arr_time})"
+
+    def __str__(self) -> str:
+        return f"Footpath({self.__dep_loc} @ {self.__dep_time}, {self.__arr_loc} @ {self.__arr_time})"
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Footpath):
+            return (
+                self.__dep_loc == other.get_dep_loc()
+                and self.__arr_loc == other.get_arr_loc()
+                and self.__dep_time == other.get_dep_time()
+                and self.__arr_time == other.get_arr_time()
+            )
+        return False
+
+    def get_uid(self) -> None:
+        """
+        Footpaths do not belong to a service.
+        @return: None.
+        """
+        return None
+
+    def get_dep_loc(self) -> str:
+        """
+        Get the location identifier the walk starts at.
+        @return: Location identifier.
+        """
+        return self.__dep_loc
+
+    def get_arr_loc(self) -> str:
+        """
+        Get the location identifier the walk ends at.
+        @return: Location identifier.
+        """
+        return self.__arr_loc
+
+    def get_dep_time(self) -> datetime.datetime:
+        """
+        Get the time the walk starts.
+        @return: Start time.
+        """
+        return self.__dep_time
+
+    def get_arr_time(self) -> datetime.datetime:
+        """
+        Get the time the walk ends.
+        @return: End time.
+        """
+        return self.__arr_time
+
+    def get_duration(self) -> datetime.timedelta:
+        """
+        Get the duration of the walk.
+        @return: Duration.
+        """
+        return self.__arr_time - self.__dep_time
+
+
+class TransferTable(object):
+    """
+    Compiled, read-only form of a TransferGraph for a fixed list of locations.
+    Footpaths are stored in compressed sparse row arrays: the footpaths
+    leaving the location at position i are targets[offsets[i]:offsets[i + 1]]
+    with matching durations, sorted by duration. The same layout, reversed,
+    holds the footpaths arriving at each location. Minimum connection times at
+    a location (transfers from a location to itself) are kept in min_times.
+    All times are in seconds.
+    """
+
+    def __init__(
+        self,
+        location_ids: list[str],
+        offsets: array,
+        targets: array,
+        durations: array,
+        reverse_offsets: array,
+        reverse_targets: array,
+        reverse_durations: array,
+        min_times: array,
+    ) -> None:
+        """
+        Initialise the TransferTable object. Use TransferGraph.compile() rather
+        than calling this directly.
+        """
+        self.__location_ids = location_ids
+        self.__location_index = {
+            location_id: i for i, location_id in enumerate(location_ids)
+        }
+        self.__offsets = offsets
+        self.__targets = targets
+        self.__durations = durations
+        self.__reverse_offsets = reverse_offsets
+        self.__reverse_targets = reverse_targets
+        self.__reverse_durations = reverse_durations
+        self.__min_times = min_times
+
+    def __len__(self) -> int:
+        return len(self.__targets)
+
+    def get_location_ids(self) -> list[str]:
+        """
+        Get the location identifiers, in the order used by the arrays.
+        @return: List of location identifiers.
+        """
+        return self.__location_ids
+
+    def get_location_index(self, location_id: str) -> int:
+        """
+        Get the position of a location in the arrays.
+        @param location_id: Location identifier.
+        @return: Position, or -1 if the location is unknown.
+        """
+        return self.__location_index.get(location_id, -1)
+
+    def get_arrays(self) -> tuple[array, array, array]:
+        """
+        Get the arrays of footpaths leaving each location.
+        @return: Tuple of (offsets, targets, durations).
+        """
+        return self.__offsets, self.__targets, self.__durations
+
+    def get_reverse_arrays(self) -> tuple[array, array, array]:
+        """
+        Get the arrays of footpaths arriving at each location.
+        @return: Tuple of (offsets, sources, durations).
+        """
+        return self.__reverse_offsets, self.__reverse_targets, self.__reverse_durations
+
+    def get_min_times(self) -> array:
+        """
+        Get the minimum connection time at each location, -1 where the
+        transfer graph does not set one.
+        @return: Array of seconds.
+        """
+        return self.__min_times
+
+    def get_footpaths(self, location_id: str) -> list[tuple[str, int]]:
+        """
+        Get the footpaths leaving a location.
+        @param location_id: Location identifier.
+        @return: List of (location identifier, seconds), shortest first.
+        """
+        i = self.get_location_index(location_id)
+        if i == -1:
+            return []
+        return [
+            (self.__location_ids[self.__targets[k]], self.__durations[k])
+            for k in range(self.__offsets[i], self.__offsets[i + 1])
+        ]
+
+    def get_transfer_time(self, from_id: str, to_id: str) -> int | None:
+        """
+        Get the time needed to transfer between two locations.
+        @param from_id: Location identifier the transfer starts at.
+        @param to_id: Location identifier the transfer ends at.
+        @return: Seconds, or None if there is no transfer between them.
+        """
+        if from_id == to_id:
+            i = self.get_location_index(from_id)
+            if i == -1 or self.__min_times[i] < 0:
+                return None
+            return self.__min_times[i]
+        for location_id, duration in self.get_footpaths(from_id):
+            if location_id == to_id:
+                return duration
+        return None
+
+
+class TransferGraph(object):
+    """
+    Class for storing footpaths and transfer times between locations. Durations
+    are in seconds. A transfer from a location to itself sets the minimum
+    connection time at that location, overriding the one on the Location.
+    """
+
+    def __init__(self, max_duration: int | None = None) -> None:
+        """
+        Initialise the TransferGraph object.
+        @param max_duration: (Optional, default None) Longest chain of
+        footpaths, in seconds, kept when the graph is transitively closed.
+        Unlimited if not provided.
+        """
+        self.__edges: dict[str, dict[str, int]] = {}
+        self.__max_duration = max_duration
+
+    def __len__(self) -> int:
+        return sum(len(targets) for targets in self.__edges.values())
+
+    def add_transfer(
+        self, from_id: str, to_id: str, duration: int, bidirectional: bool = False
+    ) -> None:
+        """
+        Add a footpath, or a minimum connection time if both locations are the
+        same. If the pair already has a transfer, the shorter one is kept.
+        @param from_id: Location identifier the transfer starts at.
+        @param to_id: Location identifier the transfer ends at.
+        @param duration: Transfer time in seconds.
+        @param bidirectional: (Optional, default False) Also add the transfer
+        in the opposite direction.
+        """
+        if isinstance(duration, int) != True or duration < 0:
+            raise ValueError("Transfer duration must be a non-negative integer")
+        targets = self.__edges.setdefault(from_id, {})
+        if duration < targets.get(to_id, duration + 1):
+            targets[to_id] = duration
+        if bidirectional and from_id != to_id:
+            self.add_transfer(to_id, from_id, duration)
+
+    @classmethod
+    def from_list(
+        cls,
+        transfers: Iterable,
+        bidirectional: bool = False,
+        max_duration: int | None = None,
+    ) -> "TransferGraph":
+        """
+        Create a transfer graph from a list of transfers.
+        @param transfers: Iterable of (from_id, to_id, seconds) tuples or of
+        dicts with "from", "to" and "duration" keys.
+        @param bidirectional: (Optional, default False) Add every transfer in
+        both directions.
+        @param max_duration: (Optional, default None) See __init__.
+        @return: A TransferGraph object.
+        """
+        graph = cls(max_duration)
+        for transfer in transfers:
+            if isinstance(transfer, dict):
+                try:
+                    from_id = transfer["from"]
+                    to_id = transfer["to"]
+                    duration = transfer["duration"]
+                except KeyError as error:
+                    raise KeyError(f"Transfer is missing {error}")
+            else:
+                from_id, to_id, duration = transfer
+            graph.add_transfer(from_id, to_id, duration, bidirectional)
+        return graph
+
+    @classmethod
+    def from_gtfs(
+        cls, transfers_file: str | IO, max_duration: int | None = None
+    ) -> "TransferGraph":
+        """
+        Create a transfer graph from a GTFS transfers.txt file. Transfers that
+        are not possible (transfer_type 3) and transfers restricted to given
+        routes or trips are skipped. Rows without a min_transfer_time are
+        treated as taking no time.
+        @param transfers_file: Path or open text file.
+        @param max_duration: (Optional, default None) See __init__.
+        @return: A TransferGraph object.
+        """
+        if isinstance(transfers_file, str):
+            with open(transfers_file, encoding="utf-8-sig", newline="") as file:
+                return cls.from_gtfs(file, max_duration)
+        graph = cls(max_duration)
+        for row in csv.DictReader(transfers_file):
+            if (row.get("transfer_type") or "0").strip() == "3":
+                continue
+            if any(
+                (row.get(key) or "").strip()
+                for key in ["from_route_id", "to_route_id", "from_trip_id", "to_trip_id"]
+            ):
+                continue
+            try:
+                from_id = row["from_stop_id"].strip()
+                to_id = row["to_stop_id"].strip()
+            except KeyError as error:
+                raise KeyError(f"Transfer is missing {error}")
+            duration = int((row.get("min_transfer_time") or "0").strip() or 0)
+            graph.add_transfer(from_id, to_id, duration)
+        return graph
+
+    def get_transfers(self) -> list[tuple[str, str, int]]:
+        """
+        Get the footpaths as they were added, before transitive closure.
+        Minimum connection times (transfers from a location to itself) are
+        left out.
+        @return: List of (from_id, to_id, seconds) tuples.
+        """
+        return [
+            (from_id, to_id, duration)
+            for from_id, targets in self.__edges.items()
+            for to_id, duration in targets.items()
+            if from_id != to_id
+        ]
+
+    def compile(self, location_ids: list[str]) -> TransferTable:
+        """
+        Compile the graph for a list of locations. Footpaths are transitively
+        closed, so every location reachable by a chain of footpaths gets a
+        direct entry with the shortest total walking time. Transfers involving
+        locations that are not in the list are ignored.
+        @param location_ids: Location identifiers, in the order the arrays
+        should use.
+        @return: A TransferTable object.
+        """
+        location_index = {location_id: i for i, location_id in enumerate(location_ids)}
+        min_times = array("l", [-1]) * len(location_ids)
+        closed: list[list[tuple[int, int]]] = [[] for _ in location_ids]
+        for from_id in self.__edges:
+            source = location_index.get(from_id)
+            if source is None:
+                continue
+            if from_id in self.__edges[from_id]:
+                min_times[source] = self.__edges[from_id][from_id]
+            closed[source] = [
+                (duration, location_index[to_id])
+                for to_id, duration in self.__shortest_paths(from_id).items()
+                if to_id in location_index
+            ]
+
+        offsets = array("l", [0])
+        targets = array("l")
+        durations = array("l")
+        reverse: list[list[tuple[int, int]]] = [[] for _ in location_ids]
+        for source, footpaths in enumerate(closed):
+            footpaths.sort()
+            for duration, target in footpaths:
+                targets.append(target)
+                durations.append(duration)
+                reverse[target].append((duration, source))
+            offsets.append(len(targets))
+
+        reverse_offsets = array("l", [0])
+        reverse_targets = array("l")
+        reverse_durations = array("l")
+        for footpaths in reverse:
+            footpaths.sort()
+            for duration, source in footpaths:
+                reverse_targets.append(source)
+                reverse_durations.append(duration)
+            reverse_offsets.append(len(reverse_targets))
+
+        return TransferTable(
+            list(location_ids),
+            offsets,
+            targets,
+            durations,
+            reverse_offsets,
+            reverse_targets,
+            reverse_durations,
+            min_times,
+        )
+
+    def __shortest_paths(self, from_id: str) -> dict[str, int]:
+        """
+        Find the shortest walking time from a location to every location
+        reachable by footpaths (Dijkstra's algorithm).
+        @param from_id: Location identifier to start from.
+        @return: Dict of location identifier to seconds, excluding from_id.
+        """
+        best = {from_id: 0}
+        queue = [(0, from_id)]
+        while queue:
+            duration, location_id = heapq.heappop(queue)
+            if duration > best[location_id]:
+                continue
+            for to_id, step in self.__edges.get(location_id, {}).items():
+                total = duration + step
+                if self.__max_duration is not None and total > self.__max_duration:
+                    continue
+                if total < best.get(to_id, total + 1):
+                    best[to_id] = total
+                    heapq.heappush(queue, (total, to_id))
+        del best[from_id]
+        return best
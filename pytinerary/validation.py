@@ -0,0 +1,307 @@
+"""
+Pytinerary - Bulk validation of timetables.
+@Author: Robert Topolowski
+@License: LGPLv2.1
+
+Copyright (C) 2023 Robert Topolowski
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Lesser General Public
+License as published by the Free Software Foundation; either
+version 2.1 of the License, or (at your option) any later version.
+"""
+from typing import Any
+
+from .compiled import CompiledTimetable
+
+# Checks run by Timetable.validate(), in the order issues are reported.
+NON_POSITIVE_DURATION = "non_positive_duration"
+NON_MONOTONIC = "non_monotonic"
+UNKNOWN_STOP = "unknown_stop"
+DUPLICATE = "duplicate"
+# Rows that could not be made into a connection while parsing.
+INVALID_ROW = "invalid_row"
+
+_CHECK_ORDER = {
+    check: i
+    for i, check in enumerate(
+        [INVALID_ROW, NON_POSITIVE_DURATION, NON_MONOTONIC, UNKNOWN_STOP, DUPLICATE]
+    )
+}
+
+
+class ValidationIssue(object):
+    """
+    One problem found in a timetable: the check that failed and the row it
+    failed on.
+    """
+
+    __slots__ = (
+        "__check",
+        "__position",
+        "__uid",
+        "__dep_loc",
+        "__arr_loc",
+        "__dep_time",
+        "__arr_time",
+    )
+
+    def __init__(
+        self,
+        check: str,
+        position: int,
+        uid: str,
+        dep_loc: str,
+        arr_loc: str,
+        dep_time: Any,
+        arr_time: Any,
+    ) -> None:
+        """
+        Initialise the ValidationIssue object.
+        @param check: Name of the check that failed.
+        @param position: Position of the connection in the timetable's
+        connection list, -1 for a row that was never added to it.
+        @param uid: Unique identifier of the service.
+        @param dep_loc: Departure location identifier.
+        @param arr_loc: Arrival location identifier.
+        @param dep_time: Departure time, as a datetime or as it was given.
+        @param arr_time: Arrival time, as a datetime or as it was given.
+        """
+        self.__check = check
+        self.__position = position
+        self.__uid = uid
+        self.__dep_loc = dep_loc
+        self.__arr_loc = arr_loc
+        self.__dep_time = dep_time
+        self.__arr_time = arr_time
+
+    def __repr__(self) -> str:
+        return f"ValidationIssue({self.to_dict()})"
+
+    def __str__(self) -> str:
+        return f"ValidationIssue({self.to_dict()})"
+
+    def get_check(self) -> str:
+        """
+        Get the name of the check that failed.
+        @return: Name of the check.
+        """
+        return self.__check
+
+    def get_position(self) -> int:
+        """
+        Get the position of the connection in the connection list it was
+        validated in.
+        @return: Position, -1 for a row that was never added to the list.
+        """
+        return self.__position
+
+    def get_uid(self) -> str:
+        """
+        Get the unique identifier of the service.
+        @return: Unique identifier.
+        """
+        return self.__uid
+
+    def get_dep_loc(self) -> str:
+        """
+        Get the departure location identifier.
+        @return: Location identifier.
+        """
+        return self.__dep_loc
+
+    def get_arr_loc(self) -> str:
+        """
+        Get the arrival location identifier.
+        @return: Location identifier.
+        """
+        return self.__arr_loc
+
+    def get_dep_time(self) -> Any:
+        """
+        Get the departure time.
+        @return: Departure time.
+        """
+        return self.__dep_time
+
+    def get_arr_time(self) -> Any:
+        """
+        Get the arrival time.
+        @return: Arrival time.
+        """
+        return self.__arr_time
+
+    def to_dict(self) -> dict:
+        """
+        Get the issue as a dict.
+        @return: Dict of the issue.
+        """
+        return {
+            "check": self.__check,
+            "position": self.__position,
+            "uid": self.__uid,
+            "dep_loc": self.__dep_loc,
+            "arr_loc": self.__arr_loc,
+            "dep_time": self.__dep_time,
+            "arr_time": self.__arr_time,
+        }
+
+
+class ValidationReport(object):
+    """
+    Result of validating a timetable: every issue found, in connection list
+    order, and how many connections were checked and removed.
+    """
+
+    def __init__(
+        self, issues: list[ValidationIssue], checked: int, removed: int = 0
+    ) -> None:
+        """
+        Initialise the ValidationReport object.
+        @param issues: List of ValidationIssue objects.
+        @param checked: Number of connections or rows checked.
+        @param removed: (Optional, default 0) Number of connections removed
+        from the timetable, or rows left out of it, in quarantine mode.
+        """
+        self.__issues = sorted(
+            issues,
+            key=lambda issue: (issue.get_position(), _CHECK_ORDER[issue.get_check()]),
+        )
+        self.__checked = checked
+        self.__removed = removed
+
+    def __repr__(self) -> str:
+        return f"ValidationReport({self.get_counts()}, {self.__checked} checked, {self.__removed} removed)"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __len__(self) -> int:
+        return len(self.__issues)
+
+    def __iter__(self):
+        return iter(self.__issues)
+
+    def is_valid(self) -> bool:
+        """
+        Check whether no issues were found.
+        @return: True if no issues were found.
+        """
+        return len(self.__issues) == 0
+
+    def get_issues(self, check: str | None = None) -> list[ValidationIssue]:
+        """
+        Get the issues found.
+        @param check: (Optional, default None) Only get the issues of this
+        check.
+        @return: List of ValidationIssue objects in connection list order.
+        """
+        if check is None:
+            return list(self.__issues)
+        return [issue for issue in self.__issues if issue.get_check() == check]
+
+    def get_counts(self) -> dict[str, int]:
+        """
+        Get the number of issues found by each check.
+        @return: Dict of counts keyed by check name, without checks that found
+        nothing.
+        """
+        counts: dict[str, int] = {}
+        for issue in self.__issues:
+            counts[issue.get_check()] = counts.get(issue.get_check(), 0) + 1
+        return counts
+
+    def get_checked(self) -> int:
+        """
+        Get the number of connections or rows checked.
+        @return: Number checked.
+        """
+        return self.__checked
+
+    def get_removed(self) -> int:
+        """
+        Get the number of connections removed in quarantine mode.
+        @return: Number removed.
+        """
+        return self.__removed
+
+    def to_dict(self) -> dict:
+        """
+        Get the report as a dict.
+        @return: Dict of the report.
+        """
+        return {
+            "checked": self.__checked,
+            "removed": self.__removed,
+            "counts": self.get_counts(),
+            "issues": [issue.to_dict() for issue in self.__issues],
+        }
+
+
+def _find_issues(
+    compiled: CompiledTimetable,
+    list_positions: list[int],
+    location_ids: set[str] | None,
+) -> list[tuple[str, int]]:
+    """
+    Run every check over the columns of a compiled timetable, one pass per
+    check, without creating any Connection objects.
+    @param compiled: CompiledTimetable to check.
+    @param list_positions: For each compiled position, the position of the
+    connection in the connection list. Duplicates and trips are checked in
+    list order, which is the order the stops of each trip were given in.
+    @param location_ids: Known location identifiers, or None to skip the
+    unknown stop check.
+    @return: List of (check name, compiled position) tuples.
+    """
+    dep_times, arr_times, dep_stops, arr_stops, trips = compiled.get_columns()
+    issues = [
+        (NON_POSITIVE_DURATION, position)
+        for position, (dep_time, arr_time) in enumerate(zip(dep_times, arr_times))
+        if arr_time <= dep_time
+    ]
+    if location_ids is not None:
+        unknown = {
+            stop
+            for stop, stop_id in enumerate(compiled.get_stop_ids())
+            if stop_id not in location_ids
+        }
+        if unknown:
+            issues.extend(
+                (UNKNOWN_STOP, position)
+                for position, (dep_stop, arr_stop) in enumerate(
+                    zip(dep_stops, arr_stops)
+                )
+                if dep_stop in unknown or arr_stop in unknown
+            )
+    order = [0] * len(list_positions)
+    for position, list_position in enumerate(list_positions):
+        order[list_position] = position
+    seen: set[tuple] = set()
+    # Last connection of each trip seen so far, in list order.
+    last: dict[int, int] = {}
+    for position in order:
+        trip = trips[position]
+        key = (
+            trip,
+            dep_times[position],
+            arr_times[position],
+            dep_stops[position],
+            arr_stops[position],
+        )
+        if key in seen:
+            issues.append((DUPLICATE, position))
+            continue
+        seen.add(key)
+        previous = last.get(trip)
+        # Connections picked up at several stops share their arrival, so only
+        # a connection leaving from where the previous one arrived must leave
+        # after it arrives.
+        if (
+            previous is not None
+            and arr_stops[previous] == dep_stops[position]
+            and dep_times[position] < arr_times[previous]
+        ):
+            issues.append((NON_MONOTONIC, position))
+        last[trip] = position
+    return issues
@@ -0,0 +1,176 @@
+from unittest import TestCase, mock
+
+import pytinerary
+from pytinerary import __main__ as command_line
+
+import contextlib
+import datetime
+import io
+import json
+import os
+import tempfile
+
+
+class CommandLineTestCases(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queries = os.path.join(self.directory.name, "queries.jsonl")
+        self.output = os.path.join(self.directory.name, "results.jsonl")
+        with open(self.queries, "w", encoding="utf-8") as queries_file:
+            for query in [
+                {
+                    "id": 1,
+                    "origin": "A",
+                    "destination": "C",
+                    "time": "2023-09-01 00:00:00",
+                },
+                {
+                    "id": 2,
+                    "origin": "B",
+                    "destination": "C",
+                    "time": "2023-09-01T00:30:00",
+                    "arrive_by": True,
+                },
+                {
+                    "id": 3,
+                    "origin": "A",
+                    "destination": "Z",
+                    "time": "2023-09-01 00:00",
+                },
+            ]:
+                queries_file.write(json.dumps(query) + "\n\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_main(self, timetable: str, *options: str) -> tuple[list, dict]:
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            code = command_line.main(
+                [timetable, "--queries", self.queries, "--output", self.output]
+                + list(options)
+            )
+        self.assertEqual(code, 0)
+        with open(self.output, encoding="utf-8") as output_file:
+            results = [json.loads(line) for line in output_file]
+        return results, json.loads(stderr.getvalue())
+
+    def test_json_timetable(self):
+        results, summary = self.run_main("./tests/helper_files/timetable.json")
+        self.assertEqual([result["id"] for result in results], [1, 2, 3])
+        self.assertEqual([leg["uid"] for leg in results[0]["itinerary"]], ["2"])
+        self.assertEqual(results[1]["itinerary"][0]["dep_time"], "2023-09-01T00:22:00")
+        self.assertEqual(results[2]["error"], "Location Z does not exist")
+        self.assertEqual(summary["queries"], 3)
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["latency_ms"]["count"], 2)
+
+    def test_json_timetable_after_long_whitespace(self):
+        path = os.path.join(self.directory.name, "timetable.json")
+        with open("./tests/helper_files/timetable.json", encoding="utf-8") as data_file:
+            data = data_file.read()
+        with open(path, "w", encoding="utf-8") as timetable_file:
+            timetable_file.write(" " * 100 + "\n" * 100 + data)
+        expected, _ = self.run_main("./tests/helper_files/timetable.json")
+        results, _ = self.run_main(path)
+        self.assertEqual(results, expected)
+
+    def test_binary_timetable_with_workers(self):
+        timetable = pytinerary.Timetable()
+        with open("./tests/helper_files/timetable.json", encoding="utf-8") as data_file:
+            timetable.parse_list(
+                json.load(data_file),
+                pytinerary.TimetableSchema(
+                    "uid",
+                    "dep_time",
+                    "arr_time",
+                    "location",
+                    "%Y-%m-%d %H:%M:%S",
+                    "locations",
+                ),
+            )
+        path = os.path.join(self.directory.name, "timetable.bin")
+        timetable.save(path)
+        expected, _ = self.run_main("./tests/helper_files/timetable.json")
+        results, summary = self.run_main(path, "--workers", "2", "--chunk-size", "1")
+        self.assertEqual(results, expected)
+        self.assertEqual(summary["workers"], 2)
+
+    def test_archive_timetable(self):
+        timetable = pytinerary.Timetable()
+        with open("./tests/helper_files/timetable.json", encoding="utf-8") as data_file:
+            timetable.parse_list(
+                json.load(data_file),
+                pytinerary.TimetableSchema(
+                    "uid",
+                    "dep_time",
+                    "arr_time",
+                    "location",
+                    "%Y-%m-%d %H:%M:%S",
+                    "locations",
+                ),
+            )
+        path = os.path.join(self.directory.name, "timetable.pyta")
+        timetable.save_archive(path, window=600)
+        expected, _ = self.run_main("./tests/helper_files/timetable.json")
+        results, _ = self.run_main(path)
+        self.assertEqual(results, expected)
+        results, _ = self.run_main(path, "--start", "2023-09-01T00:20:00")
+        self.assertEqual([leg["uid"] for leg in results[1]["itinerary"]], ["4"])
+        self.assertEqual(results[0]["itinerary"], [])
+
+    def test_archive_window_loaded_from_path(self):
+        timetable = pytinerary.Timetable()
+        with open("./tests/helper_files/timetable.json", encoding="utf-8") as data_file:
+            timetable.parse_list(
+                json.load(data_file),
+                pytinerary.TimetableSchema(
+                    "uid",
+                    "dep_time",
+                    "arr_time",
+                    "location",
+                    "%Y-%m-%d %H:%M:%S",
+                    "locations",
+                ),
+            )
+        path = os.path.join(self.directory.name, "timetable.pyta")
+        timetable.save_archive(path, window=300)
+        reads = []
+
+        class RecordingFile(io.FileIO):
+            def read(self, size=-1):
+                reads.append(size)
+                return super().read(size)
+
+        def recording_open(file, *args, **kwargs):
+            if file == path:
+                return RecordingFile(file)
+            return open(file, *args, **kwargs)
+
+        with mock.patch.object(
+            pytinerary.Timetable,
+            "load_archive",
+            wraps=pytinerary.Timetable.load_archive,
+        ) as load_archive, mock.patch.object(
+            command_line, "open", recording_open, create=True
+        ):
+            results, _ = self.run_main(
+                path, "--start", "2023-09-01T00:05:00", "--end", "2023-09-01T00:20:00"
+            )
+        # Only a prefix is read to detect the format.
+        self.assertEqual(reads, [64])
+        load_archive.assert_called_once_with(
+            path,
+            datetime.datetime(2023, 9, 1, 0, 5),
+            datetime.datetime(2023, 9, 1, 0, 20),
+        )
+        self.assertEqual([leg["uid"] for leg in results[0]["itinerary"]], ["2"])
+        self.assertEqual([leg["uid"] for leg in results[1]["itinerary"]], ["1"])
+
+    def test_profile(self):
+        path = os.path.join(self.directory.name, "metrics.prom")
+        self.run_main("./tests/helper_files/timetable.json", "--profile", path)
+        with open(path, encoding="utf-8") as metrics_file:
+            metrics = metrics_file.read()
+        self.assertIn("pytinerary_queries_total 2\n", metrics)
+        self.assertIn('pytinerary_phase_calls_total{phase="scan"} 2\n', metrics)
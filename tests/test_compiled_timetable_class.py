@@ -0,0 +1,103 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+import io
+import json
+import zoneinfo
+
+
+class CompiledTimetableTestCases(TestCase):
+    def setUp(self):
+        self.timetable = pytinerary.Timetable()
+        self.schema = pytinerary.TimetableSchema(
+            "uid", "dep_time", "arr_time", "location", "%Y-%m-%d %H:%M:%S", "locations"
+        )
+        with open("./tests/helper_files/timetable.json", encoding="utf-8") as data_file:
+            self.data = json.loads(data_file.read())
+        self.timetable.parse_list(self.data, self.schema)
+
+    def test_columns_sorted_by_departure(self):
+        compiled = self.timetable.compile()
+        dep_times, arr_times, dep_stops, arr_stops, trips = compiled.get_columns()
+        self.assertEqual(len(compiled), 5)
+        self.assertEqual(list(dep_times), sorted(dep_times))
+        self.assertEqual(
+            [compiled.from_seconds(x) for x in dep_times],
+            [
+                connection.get_dep_time()
+                for connection in sorted(
+                    self.timetable.get_connections(), key=lambda x: x.get_dep_time()
+                )
+            ],
+        )
+        self.assertEqual(compiled.get_stop_ids()[dep_stops[0]], "A")
+        self.assertEqual(compiled.get_trip_ids()[trips[0]], "1")
+
+    def test_times_are_seconds_since_epoch(self):
+        compiled = self.timetable.compile()
+        self.assertEqual(
+            compiled.get_columns()[0][0],
+            (datetime.datetime(2023, 9, 1, 0, 1) - datetime.datetime(1970, 1, 1))
+            // datetime.timedelta(seconds=1),
+        )
+        other = pytinerary.Timetable(
+            self.timetable.get_connections(), epoch=datetime.datetime(2023, 9, 1)
+        )
+        self.assertEqual(other.compile().get_columns()[0][0], 60)
+
+    def test_compile_is_reused_until_timetable_changes(self):
+        compiled = self.timetable.compile()
+        self.assertIs(self.timetable.compile(), compiled)
+        self.timetable.remove_service("4")
+        self.assertIsNot(self.timetable.compile(), compiled)
+        self.assertEqual(len(self.timetable.compile()), 4)
+
+    def test_get_connection_returns_timetable_objects(self):
+        compiled = self.timetable.compile()
+        self.assertIs(compiled.get_connection(0), self.timetable.get_connections()[0])
+
+    def test_save_and_load(self):
+        buffer = io.BytesIO()
+        self.timetable.save(buffer)
+        buffer.seek(0)
+        loaded = pytinerary.Timetable.load(buffer)
+        self.assertEqual(
+            sorted(map(str, loaded.get_connections())),
+            sorted(map(str, self.timetable.get_connections())),
+        )
+        self.assertEqual(
+            list(loaded.compile().get_columns()[0]),
+            list(self.timetable.compile().get_columns()[0]),
+        )
+
+    def test_load_creates_connections_from_columns(self):
+        buffer = io.BytesIO()
+        self.timetable.compile().save(buffer)
+        buffer.seek(0)
+        compiled = pytinerary.CompiledTimetable.load(buffer)
+        connection = compiled.get_connection(0)
+        self.assertEqual(connection.get_uid(), "1")
+        self.assertEqual(connection.get_dep_loc(), "A")
+        self.assertEqual(connection.get_dep_time(), datetime.datetime(2023, 9, 1, 0, 1))
+
+    def test_save_and_load_keeps_timezone(self):
+        timetable = pytinerary.Timetable(
+            self.timetable.get_connections(), zoneinfo.ZoneInfo("Europe/Warsaw")
+        )
+        buffer = io.BytesIO()
+        timetable.save(buffer)
+        buffer.seek(0)
+        loaded = pytinerary.Timetable.load(buffer)
+        self.assertEqual(
+            loaded.get_converter().get_timezone(), zoneinfo.ZoneInfo("Europe/Warsaw")
+        )
+        self.assertEqual(
+            list(loaded.compile().get_columns()[0]),
+            list(timetable.compile().get_columns()[0]),
+        )
+
+    def test_load_rejects_other_files(self):
+        with self.assertRaises(ValueError):
+            pytinerary.CompiledTimetable.load(io.BytesIO(b"not a timetable"))
@@ -187,3 +187,7 @@ class ConnectionTestCases(TestCase):
     def test_ge_with_non_connection(self):
         with self.assertRaises(TypeError):
             self.assertGreaterEqual("string", self.connection)
+
+    def test_correct_other_data_returned(self):
+        other_data = self.connection.get_other_data()
+        self.assertEqual(other_data, {"mode": "Train", "operator": "DB"})
@@ -2,6 +2,9 @@ from unittest import TestCase
 
 import pytinerary
 
+import datetime
+import pickle
+
 
 class ConnectionListTestCases(TestCase):
     def setUp(self):
@@ -311,3 +314,191 @@ class ConnectionListTestCases(TestCase):
                     "%Y-%m-%d %H:%M:%S",
                 )
             )
+
+    def test_version_changes_on_modification(self):
+        version = self.connection_list.get_version()
+        self.connection_list.pop()
+        self.assertGreater(self.connection_list.get_version(), version)
+
+    def test_version_unchanged_by_sort(self):
+        version = self.connection_list.get_version()
+        self.connection_list.sort(key=lambda x: x.get_arr_time())
+        self.assertEqual(self.connection_list.get_version(), version)
+
+    def test_get_service(self):
+        service = self.connection_list.get_service("1")
+        self.assertEqual(len(service), 2)
+        self.assertEqual(service[0].get_dep_loc(), "A")
+        self.assertEqual(service[1].get_dep_loc(), "B")
+
+    def test_get_unknown_service(self):
+        self.assertEqual(self.connection_list.get_service("9"), [])
+
+    def test_service_index_follows_append_and_pop(self):
+        self.connection_list.get_service("1")
+        new_connection = pytinerary.Connection(
+            "1",
+            "2023-09-01 00:21:00",
+            "2023-09-01 00:25:00",
+            "C",
+            "D",
+            "%Y-%m-%d %H:%M:%S",
+        )
+        self.connection_list.append(new_connection)
+        self.assertEqual(len(self.connection_list.get_service("1")), 3)
+        self.connection_list.pop()
+        self.assertEqual(len(self.connection_list.get_service("1")), 2)
+        self.connection_list.pop()
+        self.assertEqual(self.connection_list.get_service("4"), [])
+
+    def test_service_index_follows_insert_and_delete(self):
+        self.connection_list.get_service("1")
+        del self.connection_list[0]
+        self.assertEqual(len(self.connection_list.get_service("1")), 1)
+        self.connection_list.insert(
+            0,
+            pytinerary.Connection(
+                "4",
+                "2023-09-01 00:00:00",
+                "2023-09-01 00:01:00",
+                "D",
+                "A",
+                "%Y-%m-%d %H:%M:%S",
+            ),
+        )
+        self.assertEqual(len(self.connection_list.get_service("4")), 2)
+        self.assertEqual(
+            self.connection_list.get_service("1")[0], self.connection_list[1]
+        )
+
+    def test_service_index_follows_set_item(self):
+        self.connection_list.get_service("2")
+        self.connection_list[2] = pytinerary.Connection(
+            "3",
+            "2023-09-01 00:10:00",
+            "2023-09-01 00:15:00",
+            "A",
+            "C",
+            "%Y-%m-%d %H:%M:%S",
+        )
+        self.assertEqual(self.connection_list.get_service("2"), [])
+        self.assertEqual(len(self.connection_list.get_service("3")), 2)
+
+    def test_remove_service(self):
+        version = self.connection_list.get_version()
+        removed = self.connection_list.remove_service("1")
+        self.assertEqual(removed, 2)
+        self.assertEqual(len(self.connection_list), 3)
+        self.assertEqual(self.connection_list.get_service("1"), [])
+        self.assertEqual(len(self.connection_list.get_service("4")), 1)
+        self.assertGreater(self.connection_list.get_version(), version)
+
+    def test_remove_services_at_end(self):
+        removed = self.connection_list.remove_services(["3", "4"])
+        self.assertEqual(removed, 2)
+        self.assertEqual(len(self.connection_list), 3)
+        self.assertEqual(len(self.connection_list.get_service("1")), 2)
+
+    def test_service_index_follows_remove_services(self):
+        connections = list(self.connection_list)
+        snapshot = self.connection_list.snapshot()
+        self.connection_list.remove_service("2")
+        self.connection_list.remove_service("1")
+        self.assertEqual(list(self.connection_list), connections[3:])
+        self.assertEqual(list(snapshot), connections)
+        self.assertEqual(self.connection_list.get_service("3"), [connections[3]])
+        self.assertEqual(self.connection_list.index(connections[4], 0, 2), 1)
+        self.connection_list.append(connections[0])
+        self.connection_list.pop()
+        self.connection_list.append(connections[2])
+        self.connection_list[0] = connections[1]
+        self.assertEqual(self.connection_list.get_service("1"), [connections[1]])
+        self.assertEqual(self.connection_list.get_service("2"), [connections[2]])
+        self.assertEqual(self.connection_list.get_service("3"), [])
+        self.assertEqual(self.connection_list.index(connections[2], 0, 3), 2)
+
+    def test_remove_connections_by_identity(self):
+        version = self.connection_list.get_version()
+        first = self.connection_list[0]
+        equal = pytinerary.Connection(
+            "1",
+            first.get_dep_time(),
+            first.get_arr_time(),
+            first.get_dep_loc(),
+            first.get_arr_loc(),
+        )
+        self.assertEqual(self.connection_list.remove_connections([equal]), 0)
+        self.assertEqual(self.connection_list.get_version(), version)
+        removed = self.connection_list.remove_connections(
+            [first, self.connection_list[2]]
+        )
+        self.assertEqual(removed, 2)
+        self.assertEqual(len(self.connection_list), 3)
+        self.assertEqual(len(self.connection_list.get_service("1")), 1)
+        self.assertNotEqual(self.connection_list.get_version(), version)
+
+    def test_remove_unknown_service(self):
+        version = self.connection_list.get_version()
+        self.assertEqual(self.connection_list.remove_service("9"), 0)
+        self.assertEqual(self.connection_list.get_version(), version)
+
+    def test_contains_non_connection(self):
+        self.assertNotIn("string", self.connection_list)
+
+    def test_get_uids(self):
+        self.assertEqual(sorted(self.connection_list.get_uids()), ["1", "2", "3", "4"])
+
+    def test_snapshot_unchanged_after_changes(self):
+        connections = list(self.connection_list)
+        snapshot = self.connection_list.snapshot()
+        self.connection_list.remove_service("1")
+        self.connection_list[0] = connections[0]
+        self.connection_list.insert(1, connections[1])
+        self.connection_list.pop()
+        self.assertEqual(list(snapshot), connections)
+        self.assertEqual(len(snapshot), 5)
+        self.assertEqual(snapshot[-1], connections[-1])
+        self.assertLess(snapshot.get_version(), self.connection_list.get_version())
+        with self.assertRaises(IndexError):
+            snapshot[5]
+
+    def test_snapshot_of_unchanged_list(self):
+        first = self.connection_list.snapshot()
+        second = self.connection_list.snapshot()
+        self.assertEqual(first.get_version(), second.get_version())
+        self.assertEqual(list(first), list(second))
+
+    def test_pickle(self):
+        utc = datetime.timezone.utc
+        plus_two = datetime.timezone(datetime.timedelta(hours=2))
+        # The same time in two timezones, which compare equal.
+        for uid, dep_time, arr_time in [
+            (
+                "5",
+                datetime.datetime(2023, 9, 1, 1, 0, tzinfo=utc),
+                datetime.datetime(2023, 9, 1, 4, 0, tzinfo=plus_two),
+            ),
+            (
+                "6",
+                datetime.datetime(2023, 9, 1, 2, 0, tzinfo=utc),
+                datetime.datetime(2023, 9, 1, 3, 0, tzinfo=utc),
+            ),
+        ]:
+            self.connection_list.append(
+                pytinerary.Connection(
+                    uid, dep_time, arr_time, "A", "C", other_data={"mode": "rail"}
+                )
+            )
+        for protocol in [4, 5]:
+            buffers = []
+            data = pickle.dumps(
+                self.connection_list,
+                protocol=protocol,
+                buffer_callback=buffers.append if protocol == 5 else None,
+            )
+            self.assertEqual(len(buffers), 6 if protocol == 5 else 0)
+            loaded = pickle.loads(data, buffers=buffers)
+            self.assertEqual(list(loaded), list(self.connection_list))
+            self.assertEqual(len(loaded.get_service("1")), 2)
+            self.assertEqual(loaded[-2].get_arr_time().tzinfo, plus_two)
+            self.assertEqual(loaded[-1].get_dep_time().tzinfo, utc)
@@ -0,0 +1,178 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+import io
+import json
+
+
+class HubProfilesTestCases(TestCase):
+    def setUp(self):
+        self.timetable = pytinerary.Timetable()
+        self.schema = pytinerary.TimetableSchema(
+            "uid", "dep_time", "arr_time", "location", "%Y-%m-%d %H:%M:%S", "locations"
+        )
+        with open("./tests/helper_files/timetable.json", encoding="utf-8") as data_file:
+            self.data = json.loads(data_file.read())
+        self.timetable.parse_list(self.data, self.schema)
+        self.locations = {
+            "A": pytinerary.Location("A", "Location A", 0),
+            "B": pytinerary.Location("B", "Location B", 0),
+            "C": pytinerary.Location("C", "Location C", 0),
+        }
+        self.engine = pytinerary.ItineraryEngine(self.timetable, self.locations)
+        self.hubs = list(self.locations.values())
+
+    def queries(self):
+        for origin in "ABC":
+            for destination in "ABC":
+                for minute in [0, 1, 5, 11, 14, 15, 20, 22, 30, 40]:
+                    planned_time = datetime.datetime(2023, 9, 1, 0, minute, 0)
+                    for arrive_by in [False, True]:
+                        yield (
+                            self.locations[origin],
+                            self.locations[destination],
+                            planned_time,
+                            arrive_by,
+                        )
+
+    def test_profiles_match_scan(self):
+        engine = pytinerary.ItineraryEngine(self.timetable, self.locations)
+        engine.build_hub_profiles(self.hubs)
+        for query in self.queries():
+            expected = self.engine.generate_itinerary(*query)
+            route = engine.generate_itinerary(*query)
+            if query[3]:
+                self.assertEqual(
+                    route[0].get_dep_time() if route else None,
+                    expected[0].get_dep_time() if expected else None,
+                )
+            else:
+                self.assertEqual(
+                    route[-1].get_arr_time() if route else None,
+                    expected[-1].get_arr_time() if expected else None,
+                )
+
+    def test_profile_contents(self):
+        profiles = self.engine.build_hub_profiles(self.hubs)
+        self.assertEqual(profiles.get_hub_ids(), ["A", "B", "C"])
+        self.assertEqual(profiles.get_period(), (None, None))
+        # A to B: services 1 and 3. A to C: service 2, which beats both 1 and
+        # 3 then 4. B to C: services 1 and 4.
+        self.assertEqual(len(profiles), 5)
+        planned = self.timetable.compile().to_seconds(datetime.datetime(2023, 9, 1, 0, 2, 0))
+        self.assertEqual(len(profiles.lookup("A", "C", planned, False)), 1)
+        self.assertIsNone(profiles.lookup("A", "D", planned, False))
+        self.assertIsNone(profiles.lookup("A", "A", planned, False))
+
+    def test_lookup_skips_scan(self):
+        stats = []
+        self.engine.add_query_listener(stats.append)
+        self.engine.build_hub_profiles(self.hubs)
+        route = self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual([c.get_uid() for c in route], ["2"])
+        self.assertEqual(stats[0].get_connections_scanned(), 0)
+
+    def test_filtered_queries_scanned(self):
+        stats = []
+        self.engine.add_query_listener(stats.append)
+        self.engine.build_hub_profiles(self.hubs)
+        self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+            query_filter=pytinerary.QueryFilter(avoid=["B"]),
+        )
+        self.assertGreater(stats[0].get_connections_scanned(), 0)
+
+    def test_period_falls_back_to_scan(self):
+        profiles = self.engine.build_hub_profiles(
+            self.hubs,
+            datetime.datetime(2023, 9, 1, 0, 5, 0),
+            datetime.datetime(2023, 9, 1, 0, 20, 0),
+        )
+        compiled = self.timetable.compile()
+        for minute, arrive_by, covered in [
+            (0, False, False),
+            (5, False, True),
+            (11, False, False),
+            (15, True, True),
+            (12, True, False),
+            (20, True, False),
+        ]:
+            planned = compiled.to_seconds(datetime.datetime(2023, 9, 1, 0, minute, 0))
+            result = profiles.lookup("A", "C", planned, arrive_by)
+            self.assertEqual(result is not None, covered, (minute, arrive_by))
+        route = self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 11, 0),
+        )
+        self.assertEqual(route, [])
+
+    def test_pairs_joined_by_footpath_not_covered(self):
+        transfers = pytinerary.TransferGraph.from_list([("A", "B", 600)])
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, self.locations, transfers=transfers
+        )
+        profiles = engine.build_hub_profiles(self.hubs)
+        self.assertIsNone(profiles.lookup("A", "B", 0, False))
+        self.assertIsNotNone(profiles.lookup("A", "C", 0, False))
+
+    def test_save_and_load(self):
+        profiles = self.engine.build_hub_profiles(self.hubs)
+        buffer = io.BytesIO()
+        profiles.save(buffer)
+        buffer.seek(0)
+        loaded = pytinerary.HubProfiles.load(buffer)
+        self.assertEqual(loaded.get_fingerprint(), profiles.get_fingerprint())
+        self.assertEqual(len(loaded), len(profiles))
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, self.locations, hub_profiles=loaded
+        )
+        for query in self.queries():
+            self.assertEqual(
+                engine.generate_itinerary(*query), self.engine.generate_itinerary(*query)
+            )
+
+    def test_load_invalid_file_raises_exception(self):
+        with self.assertRaises(ValueError):
+            pytinerary.HubProfiles.load(io.BytesIO(b"not profiles"))
+
+    def test_profiles_for_other_engine_raise_exception(self):
+        profiles = self.engine.build_hub_profiles(self.hubs)
+        locations = {**self.locations, "B": pytinerary.Location("B", "Location B", 5)}
+        engine = pytinerary.ItineraryEngine(self.timetable, locations)
+        with self.assertRaises(ValueError):
+            engine.set_hub_profiles(profiles)
+        with self.assertRaises(TypeError):
+            engine.set_hub_profiles("profiles")
+
+    def test_profiles_dropped_when_timetable_changes(self):
+        self.engine.build_hub_profiles(self.hubs)
+        self.timetable.get_connections().append(
+            pytinerary.Connection(
+                "5",
+                "2023-09-01 00:02:00",
+                "2023-09-01 00:04:00",
+                "A",
+                "C",
+                "%Y-%m-%d %H:%M:%S",
+            )
+        )
+        route = self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual([c.get_uid() for c in route], ["5"])
+        self.assertIsNone(self.engine.get_hub_profiles())
+
+    def test_invalid_hub_raises_exception(self):
+        with self.assertRaises(ValueError):
+            self.engine.build_hub_profiles([pytinerary.Location("D", "Location D", 0)])
@@ -2,8 +2,12 @@ from unittest import TestCase
 
 import pytinerary
 
+import contextlib
 import datetime
+import io
 import json
+import pickle
+import threading
 
 
 class ItineraryEngineTestCases(TestCase):
@@ -131,3 +135,757 @@ class ItineraryEngineTestCases(TestCase):
                 datetime.datetime(2023, 9, 1, 0, 0, 0),
                 123,  # type: ignore
             )
+
+    def test_cached_itinerary_returned(self):
+        cache = pytinerary.QueryCache()
+        engine = pytinerary.ItineraryEngine(self.timetable, self.locations, cache)
+        planned_time = datetime.datetime(2023, 9, 1, 0, 0, 0)
+        first = engine.generate_itinerary(
+            self.locations["A"], self.locations["C"], planned_time
+        )
+        second = engine.generate_itinerary(
+            self.locations["A"], self.locations["C"], planned_time
+        )
+        self.assertEqual(first, second)
+        self.assertEqual(cache.get_hits(), 1)
+        self.assertEqual(cache.get_misses(), 1)
+
+    def test_cache_invalidated_by_timetable_change(self):
+        cache = pytinerary.QueryCache()
+        engine = pytinerary.ItineraryEngine(self.timetable, self.locations, cache)
+        planned_time = datetime.datetime(2023, 9, 1, 0, 0, 0)
+        engine.generate_itinerary(
+            self.locations["A"], self.locations["C"], planned_time
+        )
+        self.timetable.get_connections().append(
+            pytinerary.Connection(
+                "5",
+                "2023-09-01 00:02:00",
+                "2023-09-01 00:04:00",
+                "A",
+                "C",
+                "%Y-%m-%d %H:%M:%S",
+            )
+        )
+        route = engine.generate_itinerary(
+            self.locations["A"], self.locations["C"], planned_time
+        )
+        self.assertEqual(cache.get_hits(), 0)
+        self.assertEqual(route[-1].get_uid(), "5")
+
+    def test_query_listener_receives_stats(self):
+        received = []
+        self.engine.add_query_listener(received.append)
+        self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual(len(received), 1)
+        stats = received[0]
+        self.assertEqual(stats.get_result_length(), 1)
+        self.assertEqual(stats.get_scan_start(), 0)
+        self.assertTrue(stats.get_early_termination())
+        self.assertEqual(stats.get_scan_stop(), 4)
+        self.assertGreater(stats.get_relaxations(), 0)
+        self.assertEqual(
+            set(stats.get_phase_times()), {"validate", "setup", "scan", "reconstruct"}
+        )
+
+    def test_removed_listener_not_called(self):
+        received = []
+        self.engine.add_query_listener(received.append)
+        self.engine.remove_query_listener(received.append)
+        self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual(received, [])
+
+    def test_aggregator_records_cache_hits(self):
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, self.locations, pytinerary.QueryCache()
+        )
+        aggregator = pytinerary.QueryStatsAggregator()
+        engine.add_query_listener(aggregator)
+        for _ in range(2):
+            engine.generate_itinerary(
+                self.locations["A"],
+                self.locations["C"],
+                datetime.datetime(2023, 9, 1, 0, 0, 0),
+            )
+        self.assertEqual(aggregator.snapshot()["cache_hits"], 1)
+
+    def test_non_callable_listener_raises_exception(self):
+        with self.assertRaises(TypeError):
+            self.engine.add_query_listener("listener")  # type: ignore
+
+    def test_no_output_printed(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.engine.generate_itinerary(
+                self.locations["A"],
+                self.locations["C"],
+                datetime.datetime(2023, 9, 1, 0, 0, 0),
+            )
+        self.assertEqual(output.getvalue(), "")
+
+    def test_itinerary_ends_with_footpath(self):
+        locations = {**self.locations, "D": pytinerary.Location("D", "Location D", 0)}
+        transfers = pytinerary.TransferGraph.from_list([("C", "D", 120)])
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, locations, transfers=transfers
+        )
+        route = engine.generate_itinerary(
+            locations["A"], locations["D"], datetime.datetime(2023, 9, 1, 0, 0, 0)
+        )
+        self.assertEqual([c.get_uid() for c in route], ["2", None])
+        self.assertEqual(
+            route[-1],
+            pytinerary.Footpath(
+                "C",
+                "D",
+                datetime.datetime(2023, 9, 1, 0, 15, 0),
+                datetime.datetime(2023, 9, 1, 0, 17, 0),
+            ),
+        )
+
+    def test_itinerary_starts_with_footpath(self):
+        locations = {**self.locations, "E": pytinerary.Location("E", "Location E", 0)}
+        transfers = pytinerary.TransferGraph.from_list([("E", "A", 60)])
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, locations, transfers=transfers
+        )
+        route = engine.generate_itinerary(
+            locations["E"], locations["C"], datetime.datetime(2023, 9, 1, 0, 0, 0)
+        )
+        self.assertEqual([c.get_uid() for c in route], [None, "2"])
+        self.assertEqual(route[0].get_duration(), datetime.timedelta(minutes=1))
+
+    def test_arrive_by_itinerary_with_footpath(self):
+        locations = {**self.locations, "E": pytinerary.Location("E", "Location E", 0)}
+        transfers = pytinerary.TransferGraph.from_list([("E", "A", 60)])
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, locations, transfers=transfers
+        )
+        route = engine.generate_itinerary(
+            locations["E"],
+            locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 15, 0),
+            arrive_by=True,
+        )
+        self.assertEqual([c.get_uid() for c in route], [None, "2"])
+        self.assertEqual(route[0].get_dep_time(), datetime.datetime(2023, 9, 1, 0, 9, 0))
+
+    def test_walk_only_itinerary(self):
+        transfers = pytinerary.TransferGraph.from_list([("A", "B", 60)])
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, self.locations, transfers=transfers
+        )
+        route = engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["B"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual(len(route), 1)
+        self.assertIsInstance(route[0], pytinerary.Footpath)
+
+    def make_transfer_engine(self, mct, transfers=None):
+        connections = pytinerary.ConnectionList()
+        for uid, dep_time, arr_time, dep_loc, arr_loc in [
+            ("X", "00:00", "00:10", "A", "B"),
+            ("Y", "00:15", "00:20", "B", "C"),
+            ("Z", "00:25", "00:30", "B", "C"),
+        ]:
+            connections.append(
+                pytinerary.Connection(
+                    uid,
+                    f"2023-09-01 {dep_time}",
+                    f"2023-09-01 {arr_time}",
+                    dep_loc,
+                    arr_loc,
+                    "%Y-%m-%d %H:%M",
+                )
+            )
+        locations = {
+            "A": pytinerary.Location("A", "Location A", 0),
+            "B": pytinerary.Location("B", "Location B", mct),
+            "C": pytinerary.Location("C", "Location C", 0),
+        }
+        engine = pytinerary.ItineraryEngine(
+            pytinerary.Timetable(connections), locations, transfers=transfers
+        )
+        return engine, locations
+
+    def test_minimum_connection_time_respected(self):
+        for mct, expected in [(0, "Y"), (5, "Y"), (6, "Z")]:
+            engine, locations = self.make_transfer_engine(mct)
+            route = engine.generate_itinerary(
+                locations["A"],
+                locations["C"],
+                datetime.datetime(2023, 9, 1, 0, 0, 0),
+            )
+            self.assertEqual([c.get_uid() for c in route], ["X", expected])
+
+    def test_minimum_connection_time_respected_arrive_by(self):
+        for mct, expected in [(0, ["X", "Y"]), (6, [])]:
+            engine, locations = self.make_transfer_engine(mct)
+            route = engine.generate_itinerary(
+                locations["A"],
+                locations["C"],
+                datetime.datetime(2023, 9, 1, 0, 20, 0),
+                arrive_by=True,
+            )
+            self.assertEqual([c.get_uid() for c in route], expected)
+
+    def test_transfer_graph_overrides_minimum_connection_time(self):
+        transfers = pytinerary.TransferGraph.from_list([("B", "B", 360)])
+        engine, locations = self.make_transfer_engine(0, transfers)
+        route = engine.generate_itinerary(
+            locations["A"], locations["C"], datetime.datetime(2023, 9, 1, 0, 0, 0)
+        )
+        self.assertEqual([c.get_uid() for c in route], ["X", "Z"])
+
+    def test_footpath_from_ride_when_stop_reached_sooner_on_foot(self):
+        transfers = pytinerary.TransferGraph.from_list([("A", "B", 720), ("B", "C", 180)])
+        engine, locations = self.make_transfer_engine(5, transfers)
+        route = engine.generate_itinerary(
+            locations["A"], locations["C"], datetime.datetime(2023, 9, 1, 0, 0, 0)
+        )
+        self.assertEqual([c.get_uid() for c in route], ["X", None])
+        self.assertEqual(route[-1].get_arr_time(), datetime.datetime(2023, 9, 1, 0, 13, 0))
+
+    def test_footpath_times_match_aware_timetable(self):
+        connections = pytinerary.ConnectionList()
+        for uid, dep_time, arr_time, dep_loc, arr_loc in [
+            ("X", "10:00", "10:10", "A", "B"),
+            ("Y", "10:20", "10:30", "C", "D"),
+        ]:
+            connections.append(
+                pytinerary.Connection(
+                    uid,
+                    f"2023-09-01 {dep_time}+0200",
+                    f"2023-09-01 {arr_time}+0200",
+                    dep_loc,
+                    arr_loc,
+                    "%Y-%m-%d %H:%M%z",
+                )
+            )
+        locations = {
+            name: pytinerary.Location(name, f"Location {name}", 0) for name in "ABCD"
+        }
+        transfers = pytinerary.TransferGraph.from_list([("B", "C", 300)])
+        local = datetime.timezone(datetime.timedelta(hours=2))
+        for timezone, expected in [(None, datetime.timezone.utc), (local, local)]:
+            engine = pytinerary.ItineraryEngine(
+                pytinerary.Timetable(connections, timezone),
+                locations,
+                transfers=transfers,
+            )
+            route = engine.generate_itinerary(
+                locations["A"],
+                locations["D"],
+                datetime.datetime(2023, 9, 1, 7, 0, tzinfo=datetime.timezone.utc),
+            )
+            self.assertEqual([c.get_uid() for c in route], ["X", None, "Y"])
+            self.assertEqual(route[1].get_dep_time().tzinfo, expected)
+            self.assertEqual(route[1].get_dep_time(), route[0].get_arr_time())
+            self.assertEqual(
+                route[2].get_dep_time() - route[1].get_arr_time(),
+                datetime.timedelta(minutes=5),
+            )
+
+    def test_no_minimum_connection_time_on_same_service(self):
+        locations = {**self.locations, "B": pytinerary.Location("B", "Location B", 30)}
+        engine = pytinerary.ItineraryEngine(self.timetable, locations)
+        route = engine.generate_itinerary(
+            locations["A"],
+            locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual([c.get_uid() for c in route], ["2"])
+        route = engine.generate_itinerary(
+            locations["B"],
+            locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual([c.get_uid() for c in route], ["1"])
+
+    def test_multi_leg_itinerary_returned(self):
+        route = self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 11, 0),
+        )
+        self.assertEqual(route, [])
+        route = self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["B"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual([c.get_uid() for c in route], ["1"])
+
+    def test_timetable_not_reordered_by_queries(self):
+        before = str(self.timetable.get_connections())
+        self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+            arrive_by=True,
+        )
+        self.assertEqual(str(self.timetable.get_connections()), before)
+
+    def test_timetable_changes_picked_up(self):
+        self.timetable.get_connections().append(
+            pytinerary.Connection(
+                "5",
+                "2023-09-01 00:02:00",
+                "2023-09-01 00:04:00",
+                "A",
+                "C",
+                "%Y-%m-%d %H:%M:%S",
+            )
+        )
+        route = self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual([c.get_uid() for c in route], ["5"])
+
+    def test_queries_during_timetable_changes(self):
+        connection = pytinerary.Connection(
+            "5",
+            "2023-09-01 00:02:00",
+            "2023-09-01 00:04:00",
+            "A",
+            "C",
+            "%Y-%m-%d %H:%M:%S",
+        )
+        routes = []
+        errors = []
+
+        def query():
+            try:
+                for _ in range(200):
+                    route = self.engine.generate_itinerary(
+                        self.locations["A"],
+                        self.locations["C"],
+                        datetime.datetime(2023, 9, 1, 0, 0, 0),
+                    )
+                    routes.append(tuple(c.get_uid() for c in route))
+            except Exception as error:
+                errors.append(error)
+
+        readers = [threading.Thread(target=query) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for _ in range(200):
+            self.timetable.get_connections().append(connection)
+            self.timetable.remove_service("5")
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+        # Every query sees the timetable either with or without service 5.
+        self.assertEqual(set(routes) - {("5",), ("2",)}, set())
+
+    def test_pickle(self):
+        transfers = pytinerary.TransferGraph.from_list([("B", "C", 60)])
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, self.locations, transfers=transfers, goal_directed=True
+        )
+        # Listeners are not pickled, so they need not be picklable.
+        engine.add_query_listener(lambda stats: None)
+        buffers = []
+        loaded = pickle.loads(
+            pickle.dumps(engine, protocol=5, buffer_callback=buffers.append),
+            buffers=buffers,
+        )
+        for arrive_by in [False, True]:
+            query = (
+                self.locations["A"],
+                self.locations["C"],
+                datetime.datetime(2023, 9, 1, 0, 30 if arrive_by else 0, 0),
+                arrive_by,
+            )
+            self.assertEqual(
+                loaded.generate_itinerary(*query), engine.generate_itinerary(*query)
+            )
+
+    def test_planned_time_in_timetable_timezone(self):
+        timetable = pytinerary.Timetable(
+            self.timetable.get_connections(),
+            datetime.timezone(datetime.timedelta(hours=2)),
+        )
+        engine = pytinerary.ItineraryEngine(timetable, self.locations)
+        route = engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 8, 31, 22, 6, tzinfo=datetime.timezone.utc),
+        )
+        self.assertEqual([x.get_uid() for x in route], ["2"])
+
+    def test_via_location(self):
+        engine, locations = self.make_transfer_engine(0)
+        route = engine.generate_itinerary(
+            locations["A"],
+            locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+            via=[locations["B"]],
+        )
+        self.assertEqual([c.get_uid() for c in route], ["X", "Y"])
+        route = engine.generate_itinerary(
+            locations["A"],
+            locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 30, 0),
+            arrive_by=True,
+            via=[locations["B"]],
+        )
+        self.assertEqual([c.get_uid() for c in route], ["X", "Z"])
+
+    def test_via_location_unreachable(self):
+        engine, locations = self.make_transfer_engine(0)
+        route = engine.generate_itinerary(
+            locations["B"],
+            locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+            via=[locations["A"]],
+        )
+        self.assertEqual(route, [])
+
+    def make_via_engine(self, rows):
+        connections = pytinerary.ConnectionList()
+        for uid, dep_time, arr_time, dep_loc, arr_loc in rows:
+            connections.append(
+                pytinerary.Connection(
+                    uid,
+                    f"2023-09-01 {dep_time}",
+                    f"2023-09-01 {arr_time}",
+                    dep_loc,
+                    arr_loc,
+                    "%Y-%m-%d %H:%M",
+                )
+            )
+        locations = {
+            name: pytinerary.Location(name, f"Location {name}", 10) for name in "AVB"
+        }
+        engine = pytinerary.ItineraryEngine(
+            pytinerary.Timetable(connections), locations
+        )
+        return engine, locations
+
+    def test_via_location_respects_minimum_connection_time(self):
+        engine, locations = self.make_via_engine(
+            [
+                ("T1", "09:00", "10:00", "A", "V"),
+                ("T2", "10:05", "10:30", "V", "B"),
+                ("T3", "10:20", "10:50", "V", "B"),
+            ]
+        )
+        for via in [[], [locations["V"]]]:
+            route = engine.generate_itinerary(
+                locations["A"],
+                locations["B"],
+                datetime.datetime(2023, 9, 1, 8, 0, 0),
+                via=via,
+            )
+            self.assertEqual([c.get_uid() for c in route], ["T1", "T3"])
+        route = engine.generate_itinerary(
+            locations["A"],
+            locations["B"],
+            datetime.datetime(2023, 9, 1, 10, 35, 0),
+            arrive_by=True,
+            via=[locations["V"]],
+        )
+        self.assertEqual(route, [])
+
+    def test_via_location_stays_on_service(self):
+        engine, locations = self.make_via_engine(
+            [
+                ("T1", "09:00", "10:00", "A", "V"),
+                ("T1", "10:00", "10:25", "V", "B"),
+                ("T2", "10:05", "10:30", "V", "B"),
+            ]
+        )
+        journey = engine.generate_journey(
+            locations["A"],
+            locations["B"],
+            datetime.datetime(2023, 9, 1, 8, 0, 0),
+            via=[locations["V"]],
+        )
+        self.assertEqual(len(journey.get_legs()), 1)
+        self.assertEqual(journey.get_arr_time(), datetime.datetime(2023, 9, 1, 10, 25))
+        journey = engine.generate_journey(
+            locations["A"],
+            locations["B"],
+            datetime.datetime(2023, 9, 1, 10, 25, 0),
+            arrive_by=True,
+            via=[locations["V"]],
+        )
+        self.assertEqual(len(journey.get_legs()), 1)
+        self.assertEqual(journey.get_dep_time(), datetime.datetime(2023, 9, 1, 9, 0))
+
+    def test_invalid_via_raises_exception(self):
+        with self.assertRaises(TypeError):
+            self.engine.generate_itinerary(
+                self.locations["A"],
+                self.locations["C"],
+                datetime.datetime(2023, 9, 1, 0, 0, 0),
+                via=["B"],
+            )
+
+    def test_goal_directed_matches_plain_scan(self):
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, self.locations, goal_directed=True
+        )
+        for origin, destination, planned_time, arrive_by in [
+            ("A", "C", datetime.datetime(2023, 9, 1, 0, 0, 0), False),
+            ("A", "C", datetime.datetime(2023, 9, 1, 0, 11, 0), False),
+            ("B", "C", datetime.datetime(2023, 9, 1, 0, 0, 0), False),
+            ("A", "C", datetime.datetime(2023, 9, 1, 0, 30, 0), True),
+            ("A", "B", datetime.datetime(2023, 9, 1, 0, 30, 0), True),
+        ]:
+            self.assertEqual(
+                engine.generate_itinerary(
+                    self.locations[origin],
+                    self.locations[destination],
+                    planned_time,
+                    arrive_by,
+                ),
+                self.engine.generate_itinerary(
+                    self.locations[origin],
+                    self.locations[destination],
+                    planned_time,
+                    arrive_by,
+                ),
+            )
+
+    def test_goal_directed_skips_dead_ends(self):
+        connections = pytinerary.ConnectionList()
+        for uid, dep_time, arr_time, dep_loc, arr_loc in [
+            ("X", "00:02", "00:10", "A", "C"),
+            ("Y", "00:00", "00:05", "A", "B"),
+        ]:
+            connections.append(
+                pytinerary.Connection(
+                    uid,
+                    f"2023-09-01 {dep_time}",
+                    f"2023-09-01 {arr_time}",
+                    dep_loc,
+                    arr_loc,
+                    "%Y-%m-%d %H:%M",
+                )
+            )
+        stats = []
+        for goal_directed in [False, True]:
+            engine = pytinerary.ItineraryEngine(
+                pytinerary.Timetable(connections),
+                self.locations,
+                goal_directed=goal_directed,
+            )
+            engine.add_query_listener(stats.append)
+            route = engine.generate_itinerary(
+                self.locations["A"],
+                self.locations["C"],
+                datetime.datetime(2023, 9, 1, 0, 0, 0),
+            )
+            self.assertEqual([c.get_uid() for c in route], ["X"])
+        self.assertEqual(stats[0].get_relaxations(), 2)
+        self.assertEqual(stats[1].get_relaxations(), 1)
+
+    def test_batch_matches_single_queries(self):
+        cache = pytinerary.QueryCache()
+        engine = pytinerary.ItineraryEngine(self.timetable, self.locations, cache)
+        stats = []
+        engine.add_query_listener(stats.append)
+        queries = []
+        for minute in [0, 5, 11]:
+            planned_time = datetime.datetime(2023, 9, 1, 0, minute, 0)
+            for origin in "ABC":
+                for destination in "ABC":
+                    queries.append(
+                        (
+                            self.locations[origin],
+                            self.locations[destination],
+                            planned_time,
+                        )
+                    )
+        queries.append((self.locations["B"], self.locations["C"], queries[0][2], True))
+        via = [self.locations["B"]]
+        queries.append(
+            [self.locations["A"], self.locations["C"], queries[0][2], False, None, via]
+        )
+        results, batch_stats = engine.generate_itineraries(queries)
+        self.assertEqual(stats, [])
+        self.assertEqual(
+            results, [self.engine.generate_itinerary(*query) for query in queries]
+        )
+        self.assertEqual(batch_stats.get_queries(), len(queries))
+        self.assertEqual(batch_stats.get_shared_scans(), 9)
+        self.assertEqual(batch_stats.get_shared_queries(), 27)
+        self.assertEqual(batch_stats.get_single_queries(), 2)
+        self.assertEqual(batch_stats.get_cache_hits(), 0)
+        results, batch_stats = engine.generate_itineraries(queries)
+        self.assertEqual(batch_stats.get_cache_hits(), len(queries))
+        self.assertEqual(engine.generate_itinerary(*queries[1]), results[1])
+
+    def test_batch_with_footpaths_same_arrivals(self):
+        transfers = pytinerary.TransferGraph.from_list([("B", "C", 60)])
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, self.locations, transfers=transfers
+        )
+        planned_time = datetime.datetime(2023, 9, 1, 0, 0, 0)
+        queries = [
+            (self.locations["A"], self.locations[destination], planned_time)
+            for destination in "ABC"
+        ]
+        results, batch_stats = engine.generate_itineraries(queries)
+        self.assertEqual(batch_stats.get_shared_scans(), 1)
+        for query, route in zip(queries, results):
+            expected = engine.generate_itinerary(*query)
+            self.assertEqual(
+                route[-1].get_arr_time() if route else None,
+                expected[-1].get_arr_time() if expected else None,
+            )
+
+    def test_invalid_batch_query_raises_exception(self):
+        planned_time = datetime.datetime(2023, 9, 1, 0, 0, 0)
+        with self.assertRaises(TypeError):
+            self.engine.generate_itineraries(["A"])
+        with self.assertRaises(ValueError):
+            self.engine.generate_itineraries([(self.locations["A"], planned_time)])
+        with self.assertRaises(ValueError):
+            self.engine.generate_itineraries(
+                [
+                    (
+                        self.locations["A"],
+                        pytinerary.Location("D", "Location D", 0),
+                        planned_time,
+                    )
+                ]
+            )
+
+    def test_horizon_continues_into_next_day(self):
+        planned_time = datetime.datetime(2023, 9, 1, 0, 25, 0)
+        route = self.engine.generate_itinerary(
+            self.locations["A"], self.locations["C"], planned_time
+        )
+        self.assertEqual(route, [])
+        engine = pytinerary.ItineraryEngine(self.timetable, self.locations, horizon=1)
+        expected = [
+            pytinerary.Connection(
+                "2",
+                "2023-09-02 00:10:00",
+                "2023-09-02 00:15:00",
+                "A",
+                "C",
+                "%Y-%m-%d %H:%M:%S",
+            )
+        ]
+        route = engine.generate_itinerary(
+            self.locations["A"], self.locations["C"], planned_time
+        )
+        self.assertEqual(route, expected)
+        journey = engine.generate_journey(
+            self.locations["A"], self.locations["C"], planned_time
+        )
+        self.assertEqual(
+            journey.get_dep_time(), datetime.datetime(2023, 9, 2, 0, 10, 0)
+        )
+        unpickled = pickle.loads(pickle.dumps(engine))
+        route = unpickled.generate_itinerary(
+            self.locations["A"], self.locations["C"], planned_time
+        )
+        self.assertEqual(route, expected)
+        # Later days are answered from the same timetable.
+        route = engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 5, 0, 0, 0),
+        )
+        self.assertEqual(route[0].get_dep_time(), datetime.datetime(2023, 9, 5, 0, 10))
+
+    def test_horizon_arrive_by_previous_day(self):
+        engine = pytinerary.ItineraryEngine(self.timetable, self.locations, horizon=1)
+        route = engine.generate_itinerary(
+            self.locations["B"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 2, 0, 15, 0),
+            arrive_by=True,
+        )
+        self.assertEqual(
+            route,
+            [
+                pytinerary.Connection(
+                    "4",
+                    "2023-09-01 00:22:00",
+                    "2023-09-01 00:30:00",
+                    "B",
+                    "C",
+                    "%Y-%m-%d %H:%M:%S",
+                )
+            ],
+        )
+
+    def test_invalid_horizon_raises_exception(self):
+        with self.assertRaises(ValueError):
+            pytinerary.ItineraryEngine(self.timetable, self.locations, horizon=-1)
+        with self.assertRaises(ValueError):
+            pytinerary.ItineraryEngine(
+                self.timetable, self.locations, horizon=1, period=600
+            )
+        engine = pytinerary.ItineraryEngine(self.timetable, self.locations, horizon=1)
+        with self.assertRaises(ValueError):
+            engine.set_hub_profiles(
+                engine.build_hub_profiles([self.locations["A"], self.locations["C"]])
+            )
+        with self.assertRaises(ValueError):
+            engine.build_partition()
+
+    def test_alternatives(self):
+        planned_time = datetime.datetime(2023, 9, 1, 0, 0, 0)
+        routes = self.engine.generate_itinerary(
+            self.locations["A"], self.locations["C"], planned_time, alternatives=3
+        )
+        self.assertEqual(
+            [[connection.get_uid() for connection in route] for route in routes],
+            [["2"], ["1", "1"], ["1", "4"]],
+        )
+        route = self.engine.generate_itinerary(
+            self.locations["A"], self.locations["C"], planned_time
+        )
+        self.assertEqual(routes[0], route)
+        self.assertEqual(
+            routes[2][-1].get_arr_time(), datetime.datetime(2023, 9, 1, 0, 30, 0)
+        )
+        journeys = self.engine.generate_journey(
+            self.locations["A"], self.locations["C"], planned_time, alternatives=2
+        )
+        self.assertEqual([len(journey) for journey in journeys], [1, 1])
+        routes = self.engine.generate_itinerary(
+            self.locations["C"], self.locations["A"], planned_time, alternatives=3
+        )
+        self.assertEqual(routes, [])
+
+    def test_alternatives_cached(self):
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, self.locations, pytinerary.QueryCache()
+        )
+        planned_time = datetime.datetime(2023, 9, 1, 0, 0, 0)
+        query = (self.locations["A"], self.locations["C"], planned_time)
+        single = engine.generate_itinerary(*query)
+        routes = engine.generate_itinerary(*query, alternatives=2)
+        self.assertEqual(len(routes), 2)
+        self.assertEqual(engine.generate_itinerary(*query, alternatives=2), routes)
+        self.assertEqual(engine.generate_itinerary(*query), single)
+
+    def test_invalid_alternatives_raises_exception(self):
+        planned_time = datetime.datetime(2023, 9, 1, 0, 0, 0)
+        query = (self.locations["A"], self.locations["C"], planned_time)
+        with self.assertRaises(TypeError):
+            self.engine.generate_itinerary(*query, alternatives="3")
+        with self.assertRaises(ValueError):
+            self.engine.generate_itinerary(*query, alternatives=0)
+        with self.assertRaises(ValueError):
+            self.engine.generate_itinerary(*query, arrive_by=True, alternatives=3)
@@ -0,0 +1,152 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+import io
+
+
+class JourneyTestCases(TestCase):
+    def setUp(self):
+        connections = pytinerary.ConnectionList()
+        for uid, dep_time, arr_time, dep_loc, arr_loc in [
+            ("X", "00:00", "00:05", "A", "B"),
+            ("X", "00:06", "00:10", "B", "C"),
+            ("X", "00:11", "00:15", "C", "D"),
+            ("X", "00:16", "00:20", "D", "E"),
+            ("Y", "00:25", "00:30", "E", "F"),
+        ]:
+            connections.append(
+                pytinerary.Connection(
+                    uid,
+                    f"2023-09-01 {dep_time}",
+                    f"2023-09-01 {arr_time}",
+                    dep_loc,
+                    arr_loc,
+                    "%Y-%m-%d %H:%M",
+                )
+            )
+        self.timetable = pytinerary.Timetable(connections)
+        self.locations = {
+            location_id: pytinerary.Location(location_id, f"Location {location_id}")
+            for location_id in "ABCDEF"
+        }
+        self.engine = pytinerary.ItineraryEngine(self.timetable, self.locations)
+
+    def test_journey_has_one_leg_per_service(self):
+        journey = self.engine.generate_journey(
+            self.locations["A"],
+            self.locations["F"],
+            datetime.datetime(2023, 9, 1, 0, 0),
+        )
+        self.assertEqual(len(journey), 2)
+        leg = journey[0]
+        self.assertEqual(leg.get_trip(), "X")
+        self.assertEqual(leg.get_board_stop(), "A")
+        self.assertEqual(leg.get_board_time(), datetime.datetime(2023, 9, 1, 0, 0))
+        self.assertEqual(leg.get_alight_stop(), "E")
+        self.assertEqual(leg.get_alight_time(), datetime.datetime(2023, 9, 1, 0, 20))
+        self.assertEqual(leg.get_stop_count(), 4)
+        self.assertEqual(journey[1].get_trip(), "Y")
+        self.assertEqual(journey.get_dep_time(), datetime.datetime(2023, 9, 1, 0, 0))
+        self.assertEqual(journey.get_arr_time(), datetime.datetime(2023, 9, 1, 0, 30))
+        self.assertEqual(journey.get_connection_count(), 5)
+
+    def test_leg_ends_where_the_ride_ends(self):
+        journey = self.engine.generate_journey(
+            self.locations["B"],
+            self.locations["D"],
+            datetime.datetime(2023, 9, 1, 0, 0),
+        )
+        self.assertEqual(len(journey), 1)
+        self.assertEqual(journey[0].get_stop_count(), 2)
+        self.assertEqual(
+            [(c.get_dep_loc(), c.get_arr_loc()) for c in journey[0]],
+            [("B", "C"), ("C", "D")],
+        )
+
+    def test_journey_connections_match_itinerary(self):
+        for arrive_by, planned_time in [
+            (False, datetime.datetime(2023, 9, 1, 0, 0)),
+            (True, datetime.datetime(2023, 9, 1, 0, 40)),
+        ]:
+            journey = self.engine.generate_journey(
+                self.locations["A"], self.locations["F"], planned_time, arrive_by
+            )
+            route = self.engine.generate_itinerary(
+                self.locations["A"], self.locations["F"], planned_time, arrive_by
+            )
+            self.assertEqual(journey.get_connections(), route)
+
+    def test_legs_of_loaded_timetable_create_connections(self):
+        buffer = io.BytesIO()
+        self.timetable.compile().save(buffer)
+        buffer.seek(0)
+        engine = pytinerary.ItineraryEngine(
+            pytinerary.Timetable.load(buffer), self.locations
+        )
+        journey = engine.generate_journey(
+            self.locations["A"],
+            self.locations["E"],
+            datetime.datetime(2023, 9, 1, 0, 0),
+        )
+        self.assertEqual(
+            [str(c) for c in journey[0]],
+            [str(c) for c in self.timetable.get_service("X")],
+        )
+
+    def test_empty_journey(self):
+        journey = self.engine.generate_journey(
+            self.locations["F"],
+            self.locations["A"],
+            datetime.datetime(2023, 9, 1, 0, 0),
+        )
+        self.assertEqual(len(journey), 0)
+        self.assertIsNone(journey.get_dep_time())
+        self.assertEqual(journey.get_connections(), [])
+
+    def test_walk_leg(self):
+        transfers = pytinerary.TransferGraph()
+        transfers.add_transfer("E", "F", 120)
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, self.locations, transfers=transfers
+        )
+        journey = engine.generate_journey(
+            self.locations["A"],
+            self.locations["F"],
+            datetime.datetime(2023, 9, 1, 0, 0),
+        )
+        self.assertTrue(journey[1].is_walk())
+        self.assertIsNone(journey[1].get_trip())
+        self.assertEqual(journey[1].get_alight_time(), datetime.datetime(2023, 9, 1, 0, 22))
+        self.assertIsInstance(list(journey[1])[0], pytinerary.Footpath)
+
+    def test_leg_times_match_aware_connections(self):
+        connections = pytinerary.ConnectionList()
+        for connection in self.timetable.get_connections():
+            connections.append(
+                pytinerary.Connection(
+                    connection.get_uid(),
+                    connection.get_dep_time().strftime("%Y-%m-%d %H:%M+0200"),
+                    connection.get_arr_time().strftime("%Y-%m-%d %H:%M+0200"),
+                    connection.get_dep_loc(),
+                    connection.get_arr_loc(),
+                    "%Y-%m-%d %H:%M%z",
+                )
+            )
+        timetable = pytinerary.Timetable(connections)
+        buffer = io.BytesIO()
+        timetable.compile().save(buffer)
+        buffer.seek(0)
+        for timetable in [timetable, pytinerary.Timetable.load(buffer)]:
+            engine = pytinerary.ItineraryEngine(timetable, self.locations)
+            journey = engine.generate_journey(
+                self.locations["A"],
+                self.locations["F"],
+                datetime.datetime(2023, 8, 31, 22, 0, tzinfo=datetime.timezone.utc),
+            )
+            for leg in journey:
+                self.assertEqual(leg.get_board_time(), next(iter(leg)).get_dep_time())
+                self.assertEqual(leg.get_alight_time(), list(leg)[-1].get_arr_time())
+            self.assertEqual(journey.get_dep_time(), journey[0].get_board_time())
+            self.assertIsNotNone(journey.get_arr_time().utcoffset())
@@ -0,0 +1,215 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+import io
+import json
+import pickle
+
+
+class PartitionTestCases(TestCase):
+    def setUp(self):
+        self.timetable = pytinerary.Timetable()
+        self.schema = pytinerary.TimetableSchema(
+            "uid", "dep_time", "arr_time", "location", "%Y-%m-%d %H:%M:%S", "locations"
+        )
+        with open("./tests/helper_files/timetable.json", encoding="utf-8") as data_file:
+            self.data = json.loads(data_file.read())
+        self.timetable.parse_list(self.data, self.schema)
+        self.locations = {
+            "A": pytinerary.Location("A", "Location A", 0),
+            "B": pytinerary.Location("B", "Location B", 0),
+            "C": pytinerary.Location("C", "Location C", 0),
+        }
+        self.engine = pytinerary.ItineraryEngine(self.timetable, self.locations)
+
+    def make_towns(self):
+        # Two towns of three locations with their own services, joined by an
+        # intercity service between their first locations.
+        connections = pytinerary.ConnectionList()
+        for uid, hour, stops in [
+            ("X1", 0, "P1 P2 P3"),
+            ("X2", 1, "P3 P2 P1"),
+            ("X3", 2, "P1 P2 P3"),
+            ("Y1", 0, "Q1 Q2 Q3"),
+            ("Y2", 1, "Q3 Q2 Q1"),
+            ("Y3", 2, "Q1 Q2 Q3"),
+            ("I1", 0, "P1 Q1"),
+            ("I2", 1, "Q1 P1"),
+        ]:
+            stops = stops.split()
+            for k in range(len(stops) - 1):
+                connections.append(
+                    pytinerary.Connection(
+                        uid,
+                        f"2023-09-01 {hour:02}:{20 * k:02}",
+                        f"2023-09-01 {hour:02}:{20 * k + 15:02}",
+                        stops[k],
+                        stops[k + 1],
+                        "%Y-%m-%d %H:%M",
+                    )
+                )
+        locations = {
+            location_id: pytinerary.Location(location_id, location_id, 0)
+            for location_id in ["P1", "P2", "P3", "Q1", "Q2", "Q3"]
+        }
+        return pytinerary.Timetable(connections), locations
+
+    def queries(self, locations):
+        for origin in locations:
+            for destination in locations:
+                for hour in [0, 1, 2]:
+                    for minute in [0, 14, 30]:
+                        planned_time = datetime.datetime(2023, 9, 1, hour, minute, 0)
+                        for arrive_by in [False, True]:
+                            yield (
+                                locations[origin],
+                                locations[destination],
+                                planned_time,
+                                arrive_by,
+                            )
+
+    def test_partition_matches_full_scan(self):
+        for cell_size in [1, 2, 3]:
+            engine = pytinerary.ItineraryEngine(self.timetable, self.locations)
+            engine.build_partition(cell_size)
+            for query in self.queries(self.locations):
+                self.assertEqual(
+                    engine.generate_itinerary(*query),
+                    self.engine.generate_itinerary(*query),
+                )
+            self.assertEqual(
+                engine.generate_itinerary(
+                    *next(self.queries(self.locations)), via=[self.locations["B"]]
+                ),
+                self.engine.generate_itinerary(
+                    *next(self.queries(self.locations)), via=[self.locations["B"]]
+                ),
+            )
+
+    def test_towns_split_into_cells(self):
+        timetable, locations = self.make_towns()
+        full = pytinerary.ItineraryEngine(timetable, locations)
+        engine = pytinerary.ItineraryEngine(timetable, locations)
+        partition = engine.build_partition(3)
+        self.assertEqual(list(partition.get_cells()), [0, 0, 0, 1, 1, 1])
+        # Only the intercity connections are needed to cross a town.
+        self.assertEqual(partition.get_overlay_size(), 2)
+        for query in self.queries(locations):
+            self.assertEqual(
+                engine.generate_itinerary(*query), full.generate_itinerary(*query)
+            )
+
+    def test_fewer_connections_scanned(self):
+        timetable, locations = self.make_towns()
+        stats = []
+        engine = pytinerary.ItineraryEngine(timetable, locations)
+        engine.add_query_listener(stats.append)
+        query = (locations["P2"], locations["P3"], datetime.datetime(2023, 9, 1, 0, 0, 0))
+        engine.generate_itinerary(*query)
+        engine.build_partition(3)
+        route = engine.generate_itinerary(*query)
+        self.assertEqual([c.get_uid() for c in route], ["X1"])
+        self.assertLess(
+            stats[1].get_connections_scanned(), stats[0].get_connections_scanned()
+        )
+
+    def test_filtered_queries_scan_everything(self):
+        timetable, locations = self.make_towns()
+        stats = []
+        engine = pytinerary.ItineraryEngine(timetable, locations)
+        engine.add_query_listener(stats.append)
+        query_filter = pytinerary.QueryFilter(avoid=["Q2"])
+        query = (locations["P2"], locations["P3"], datetime.datetime(2023, 9, 1, 0, 0, 0))
+        engine.generate_itinerary(*query, query_filter=query_filter)
+        engine.build_partition(3)
+        engine.generate_itinerary(*query, query_filter=query_filter)
+        self.assertEqual(
+            stats[1].get_connections_scanned(), stats[0].get_connections_scanned()
+        )
+
+    def test_partition_is_deterministic(self):
+        timetable, locations = self.make_towns()
+        first = pytinerary.ItineraryEngine(timetable, locations).build_partition(3)
+        second = pytinerary.ItineraryEngine(timetable, locations).build_partition(3)
+        self.assertEqual(first.get_cells(), second.get_cells())
+        self.assertEqual(first.get_overlay(), second.get_overlay())
+        self.assertEqual(first.get_fingerprint(), second.get_fingerprint())
+
+    def test_footpath_keeps_locations_in_one_cell(self):
+        timetable, locations = self.make_towns()
+        transfers = pytinerary.TransferGraph.from_list([("P3", "Q3", 300)])
+        engine = pytinerary.ItineraryEngine(timetable, locations, transfers=transfers)
+        partition = engine.build_partition(1)
+        cells = partition.get_cells()
+        self.assertEqual(cells[2], cells[5])
+        full = pytinerary.ItineraryEngine(timetable, locations, transfers=transfers)
+        for query in self.queries(locations):
+            self.assertEqual(
+                engine.generate_itinerary(*query), full.generate_itinerary(*query)
+            )
+
+    def test_partition_updated_when_timetable_changes(self):
+        timetable, locations = self.make_towns()
+        engine = pytinerary.ItineraryEngine(timetable, locations)
+        partition = engine.build_partition(3)
+        timetable.get_connections().remove_service("I2")
+        timetable.get_connections().append(
+            pytinerary.Connection(
+                "Z", "2023-09-01 02:00", "2023-09-01 02:10", "P2", "Q2", "%Y-%m-%d %H:%M"
+            )
+        )
+        updated = engine.get_partition()
+        self.assertNotEqual(updated.get_fingerprint(), partition.get_fingerprint())
+        self.assertEqual(updated.get_cells(), partition.get_cells())
+        rebuilt = pytinerary.ItineraryEngine(timetable, locations).build_partition(3)
+        self.assertEqual(updated.get_overlay(), rebuilt.get_overlay())
+        route = engine.generate_itinerary(
+            locations["P2"], locations["Q2"], datetime.datetime(2023, 9, 1, 1, 30, 0)
+        )
+        self.assertEqual([c.get_uid() for c in route], ["Z"])
+
+    def test_save_and_load(self):
+        timetable, locations = self.make_towns()
+        partition = pytinerary.ItineraryEngine(timetable, locations).build_partition(3)
+        buffer = io.BytesIO()
+        partition.save(buffer)
+        buffer.seek(0)
+        loaded = pytinerary.Partition.load(buffer)
+        self.assertEqual(loaded.get_fingerprint(), partition.get_fingerprint())
+        self.assertEqual(loaded.get_cell_size(), 3)
+        self.assertEqual(loaded.get_cells(), partition.get_cells())
+        self.assertEqual(loaded.get_overlay(), partition.get_overlay())
+        engine = pytinerary.ItineraryEngine(timetable, locations, partition=loaded)
+        self.assertIs(engine.get_partition(), loaded)
+
+    def test_pickled_engine_keeps_partition(self):
+        timetable, locations = self.make_towns()
+        engine = pytinerary.ItineraryEngine(timetable, locations)
+        partition = engine.build_partition(3)
+        loaded = pickle.loads(pickle.dumps(engine))
+        self.assertEqual(loaded.get_partition().get_overlay(), partition.get_overlay())
+        for query in self.queries(locations):
+            self.assertEqual(
+                loaded.generate_itinerary(*query), engine.generate_itinerary(*query)
+            )
+
+    def test_load_invalid_file_raises_exception(self):
+        with self.assertRaises(ValueError):
+            pytinerary.Partition.load(io.BytesIO(b"not a partition"))
+
+    def test_partition_for_other_engine_raises_exception(self):
+        partition = self.engine.build_partition(2)
+        locations = {**self.locations, "B": pytinerary.Location("B", "Location B", 5)}
+        engine = pytinerary.ItineraryEngine(self.timetable, locations)
+        with self.assertRaises(ValueError):
+            engine.set_partition(partition)
+        with self.assertRaises(TypeError):
+            engine.set_partition("partition")
+
+    def test_invalid_cell_size_raises_exception(self):
+        with self.assertRaises(ValueError):
+            self.engine.build_partition(0)
+        with self.assertRaises(TypeError):
+            self.engine.build_partition("64")
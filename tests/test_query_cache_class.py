@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class QueryCacheTestCases(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = pytinerary.QueryCache(max_size=2, ttl=10, clock=self.clock)
+        self.time = datetime.datetime(2023, 9, 1, 0, 0, 0)
+
+    def test_miss_then_hit(self):
+        key = self.cache.make_key("A", "C", self.time, False)
+        self.assertIsNone(self.cache.get(key, 0))
+        self.cache.put(key, 0, ["route"])
+        self.assertEqual(self.cache.get(key, 0), ["route"])
+        self.assertEqual(self.cache.get_hits(), 1)
+        self.assertEqual(self.cache.get_misses(), 1)
+
+    def test_least_recently_used_evicted(self):
+        keys = [self.cache.make_key("A", x, self.time, False) for x in "BCD"]
+        self.cache.put(keys[0], 0, 1)
+        self.cache.put(keys[1], 0, 2)
+        self.cache.get(keys[0], 0)
+        self.cache.put(keys[2], 0, 3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get(keys[1], 0))
+        self.assertEqual(self.cache.get(keys[0], 0), 1)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_expired_entry_not_returned(self):
+        key = self.cache.make_key("A", "C", self.time, False)
+        self.cache.put(key, 0, 1)
+        self.clock.now = 9.9
+        self.assertEqual(self.cache.get(key, 0), 1)
+        self.clock.now = 10.0
+        self.assertIsNone(self.cache.get(key, 0))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_version_change_invalidates_entries(self):
+        key = self.cache.make_key("A", "C", self.time, False)
+        self.cache.put(key, 0, 1)
+        self.assertIsNone(self.cache.get(key, 1))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+
+    def test_time_bucket_shares_keys(self):
+        cache = pytinerary.QueryCache(time_bucket=300)
+        first = cache.make_key("A", "C", self.time, False)
+        second = cache.make_key(
+            "A", "C", self.time + datetime.timedelta(minutes=4), False
+        )
+        third = cache.make_key(
+            "A", "C", self.time + datetime.timedelta(minutes=5), False
+        )
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+
+    def test_exact_key_without_bucket(self):
+        first = self.cache.make_key("A", "C", self.time, False)
+        second = self.cache.make_key(
+            "A", "C", self.time + datetime.timedelta(seconds=1), False
+        )
+        self.assertNotEqual(first, second)
+
+    def test_invalid_size_raises_exception(self):
+        with self.assertRaises(ValueError):
+            pytinerary.QueryCache(max_size=0)
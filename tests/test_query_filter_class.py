@@ -0,0 +1,141 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+
+
+class QueryFilterTestCases(TestCase):
+    def setUp(self):
+        connections = pytinerary.ConnectionList()
+        for uid, dep_time, arr_time, dep_loc, arr_loc, other_data in [
+            ("X", "00:00", "00:10", "A", "C", {"mode": "rail", "operator": "P"}),
+            ("Y", "00:00", "00:05", "A", "B", {"mode": "bus", "operator": "Q"}),
+            ("Y", "00:06", "00:20", "B", "C", {"mode": "bus", "operator": "Q"}),
+            ("Z", "00:01", "00:30", "A", "C", {"mode": "bus", "operator": "R"}),
+        ]:
+            connections.append(
+                pytinerary.Connection(
+                    uid,
+                    f"2023-09-01 {dep_time}",
+                    f"2023-09-01 {arr_time}",
+                    dep_loc,
+                    arr_loc,
+                    "%Y-%m-%d %H:%M",
+                    other_data,
+                )
+            )
+        self.timetable = pytinerary.Timetable(connections)
+        self.locations = {
+            location_id: pytinerary.Location(location_id, f"Location {location_id}")
+            for location_id in "ABC"
+        }
+        self.engine = pytinerary.ItineraryEngine(self.timetable, self.locations)
+
+    def query(self, query_filter, arrive_by=False):
+        planned_time = datetime.datetime(2023, 9, 1, 0, 40 if arrive_by else 0)
+        route = self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            planned_time,
+            arrive_by,
+            query_filter=query_filter,
+        )
+        return [connection.get_uid() for connection in route]
+
+    def test_no_filter(self):
+        self.assertEqual(self.query(None), ["X"])
+
+    def test_modes(self):
+        self.assertEqual(self.query(pytinerary.QueryFilter(modes=["bus"])), ["Y", "Y"])
+        self.assertEqual(
+            self.query(pytinerary.QueryFilter(exclude_modes=["rail"])), ["Y", "Y"]
+        )
+
+    def test_operators(self):
+        self.assertEqual(self.query(pytinerary.QueryFilter(operators=["R"])), ["Z"])
+        self.assertEqual(
+            self.query(pytinerary.QueryFilter(exclude_operators=["P", "Q"])), ["Z"]
+        )
+
+    def test_avoid(self):
+        query_filter = pytinerary.QueryFilter(modes=["bus"], avoid=["B"])
+        self.assertEqual(self.query(query_filter), ["Z"])
+        self.assertEqual(self.query(query_filter, arrive_by=True), ["Z"])
+
+    def test_avoided_location_not_passed_on_board(self):
+        for dep_time, arr_time, dep_loc, arr_loc in [
+            ("00:00", "00:02", "A", "D"),
+            ("00:02", "00:04", "D", "B"),
+            ("00:04", "00:06", "B", "E"),
+            ("00:06", "00:08", "E", "C"),
+        ]:
+            self.timetable.get_connections().append(
+                pytinerary.Connection(
+                    "W",
+                    f"2023-09-01 {dep_time}",
+                    f"2023-09-01 {arr_time}",
+                    dep_loc,
+                    arr_loc,
+                    "%Y-%m-%d %H:%M",
+                    {"mode": "rail", "operator": "P"},
+                )
+            )
+        for location_id in "DE":
+            self.locations[location_id] = pytinerary.Location(
+                location_id, f"Location {location_id}"
+            )
+        self.engine = pytinerary.ItineraryEngine(self.timetable, self.locations)
+        self.assertEqual(self.query(None), ["W", "W", "W", "W"])
+        query_filter = pytinerary.QueryFilter(avoid=["B"])
+        self.assertEqual(self.query(query_filter), ["X"])
+        self.assertEqual(self.query(query_filter, arrive_by=True), ["Z"])
+
+    def test_no_itinerary(self):
+        self.assertEqual(self.query(pytinerary.QueryFilter(modes=["ferry"])), [])
+
+    def test_avoiding_origin_raises_exception(self):
+        with self.assertRaises(ValueError):
+            self.query(pytinerary.QueryFilter(avoid=["A"]))
+
+    def test_invalid_filter_raises_exception(self):
+        with self.assertRaises(TypeError):
+            self.query({"modes": ["bus"]})
+
+    def test_equal_filters_share_key(self):
+        self.assertEqual(
+            pytinerary.QueryFilter(modes=["bus", "rail"]),
+            pytinerary.QueryFilter(modes=["rail", "bus"]),
+        )
+        self.assertNotEqual(
+            pytinerary.QueryFilter(modes=["bus"]),
+            pytinerary.QueryFilter(operators=["bus"]),
+        )
+
+    def test_compile(self):
+        mask = pytinerary.QueryFilter(modes=["bus"]).compile(self.timetable.compile())
+        self.assertEqual(list(mask), [1, 0, 1, 1])
+
+    def test_mask_follows_timetable_changes(self):
+        query_filter = pytinerary.QueryFilter(modes=["bus"])
+        self.assertEqual(self.query(query_filter), ["Y", "Y"])
+        self.timetable.remove_service("Y")
+        self.assertEqual(self.query(query_filter), ["Z"])
+
+    def test_filtered_results_cached_separately(self):
+        engine = pytinerary.ItineraryEngine(
+            self.timetable, self.locations, pytinerary.QueryCache()
+        )
+        planned_time = datetime.datetime(2023, 9, 1, 0, 0)
+        for query_filter, expected in [
+            (None, ["X"]),
+            (pytinerary.QueryFilter(operators=["R"]), ["Z"]),
+            (None, ["X"]),
+        ]:
+            route = engine.generate_itinerary(
+                self.locations["A"],
+                self.locations["C"],
+                planned_time,
+                query_filter=query_filter,
+            )
+            self.assertEqual([connection.get_uid() for connection in route], expected)
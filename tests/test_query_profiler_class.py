@@ -0,0 +1,154 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+import io
+import json
+import sys
+import threading
+import time
+
+
+class QueryProfilerTestCases(TestCase):
+    def setUp(self):
+        self.profiler = pytinerary.QueryProfiler()
+        timetable = pytinerary.Timetable()
+        schema = pytinerary.TimetableSchema(
+            "uid", "dep_time", "arr_time", "location", "%Y-%m-%d %H:%M:%S", "locations"
+        )
+        with open("./tests/helper_files/timetable.json", encoding="utf-8") as data_file:
+            timetable.parse_list(json.loads(data_file.read()), schema)
+        self.locations = {
+            location_id: pytinerary.Location(location_id, location_id, 0)
+            for location_id in ["A", "B", "C", "D"]
+        }
+        self.engine = pytinerary.ItineraryEngine(timetable, self.locations)
+
+    def tearDown(self):
+        self.profiler.stop()
+
+    def query(self):
+        return self.engine.generate_itinerary(
+            self.locations["A"], self.locations["C"], datetime.datetime(2023, 9, 1)
+        )
+
+    def test_phase_times_recorded(self):
+        self.profiler(
+            pytinerary.QueryStats(
+                "A",
+                "C",
+                False,
+                connections_scanned=10,
+                phase_times={"scan": 0.001, "reconstruct": 0.0005},
+            )
+        )
+        snapshot = self.profiler.snapshot()
+        self.assertEqual(snapshot["queries"], 1)
+        self.assertEqual(snapshot["connections_scanned"], 10)
+        self.assertEqual(snapshot["phase_ns"], {"scan": 1000000, "reconstruct": 500000})
+        self.assertEqual(snapshot["latency_ms"]["count"], 1)
+
+    def test_engine_queries_profiled(self):
+        self.engine.add_query_listener(self.profiler)
+        self.query()
+        self.query()
+        snapshot = self.profiler.snapshot()
+        self.assertEqual(snapshot["queries"], 2)
+        self.assertEqual(snapshot["phase_calls"]["scan"], 2)
+
+    def test_sample_records_engine_method(self):
+        self.engine.add_query_listener(lambda stats: self.profiler.sample())
+        self.query()
+        samples = self.profiler.get_samples()
+        self.assertEqual(len(samples), 1)
+        self.assertEqual(samples[0][2], "instrumented_itinerary")
+        self.assertEqual(samples[0][3], -1)
+        self.assertEqual(self.profiler.snapshot()["sample_counts"], {samples[0][2]: 1})
+        # Nothing is recorded outside the engine.
+        self.assertEqual(self.profiler.sample(), 0)
+
+    def test_ring_buffer_keeps_latest_samples(self):
+        profiler = pytinerary.QueryProfiler(capacity=2)
+        self.engine.add_query_listener(lambda stats: profiler.sample())
+        for _ in range(3):
+            self.query()
+        self.assertEqual(len(profiler.get_samples()), 2)
+        self.assertEqual(
+            profiler.snapshot()["sample_counts"], {"instrumented_itinerary": 3}
+        )
+
+    def test_sampler_records_scan_position(self):
+        profiler = pytinerary.QueryProfiler(interval=0.0001)
+        profiler.start()
+        self.assertTrue(profiler.is_sampling())
+        deadline = time.monotonic() + 10
+        try:
+            while time.monotonic() < deadline:
+                self.query()
+                if any(
+                    sample[2] == "scan_forward" for sample in profiler.get_samples()
+                ):
+                    break
+        finally:
+            profiler.stop()
+        self.assertFalse(profiler.is_sampling())
+        scans = [
+            sample for sample in profiler.get_samples() if sample[2] == "scan_forward"
+        ]
+        self.assertNotEqual(scans, [])
+        self.assertTrue(all(isinstance(sample[3], int) for sample in scans))
+
+    def test_snapshot_while_sampling_queries(self):
+        profiler = pytinerary.QueryProfiler(interval=0.0001)
+        self.engine.add_query_listener(profiler)
+        stopping = threading.Event()
+
+        def run_queries():
+            while not stopping.is_set():
+                self.query()
+
+        threads = [threading.Thread(target=run_queries) for _ in range(2)]
+        # Switching threads often makes the sampler append mid-snapshot.
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        profiler.start()
+        for thread in threads:
+            thread.start()
+        try:
+            deadline = time.monotonic() + 1
+            while time.monotonic() < deadline:
+                snapshot = profiler.snapshot()
+                profiler.to_prometheus()
+        finally:
+            stopping.set()
+            for thread in threads:
+                thread.join()
+            profiler.stop()
+            sys.setswitchinterval(interval)
+        self.assertNotEqual(snapshot["samples"], [])
+        self.assertGreater(profiler.snapshot()["queries"], 0)
+
+    def test_prometheus_text(self):
+        self.engine.add_query_listener(self.profiler)
+        self.query()
+        text = self.profiler.to_prometheus()
+        self.assertIn("# TYPE pytinerary_queries_total counter\n", text)
+        self.assertIn("pytinerary_queries_total 1\n", text)
+        self.assertIn('pytinerary_phase_calls_total{phase="scan"} 1\n', text)
+        self.assertIn('pytinerary_query_duration_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn("pytinerary_query_duration_seconds_count 1\n", text)
+        output = io.StringIO()
+        self.profiler.write_prometheus(output)
+        self.assertEqual(output.getvalue(), text)
+
+    def test_start_twice_raises_exception(self):
+        self.profiler.start()
+        with self.assertRaises(ValueError):
+            self.profiler.start()
+
+    def test_invalid_settings_raise_exception(self):
+        with self.assertRaises(ValueError):
+            pytinerary.QueryProfiler(interval=0)
+        with self.assertRaises(ValueError):
+            pytinerary.QueryProfiler(capacity=0)
@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+import pytinerary
+
+import math
+
+
+class QueryStatsAggregatorTestCases(TestCase):
+    def setUp(self):
+        self.aggregator = pytinerary.QueryStatsAggregator()
+
+    def make_stats(self, seconds, cache_hit=False):
+        return pytinerary.QueryStats(
+            "A",
+            "C",
+            False,
+            connections_scanned=10,
+            relaxations=4,
+            cache_hit=cache_hit,
+            phase_times={"scan": seconds},
+        )
+
+    def test_queries_counted(self):
+        self.aggregator(self.make_stats(0.001))
+        self.aggregator(self.make_stats(0.002, cache_hit=True))
+        snapshot = self.aggregator.snapshot()
+        self.assertEqual(snapshot["queries"], 2)
+        self.assertEqual(snapshot["cache_hits"], 1)
+        self.assertEqual(snapshot["mean_connections_scanned"], 10)
+
+    def test_phase_histogram_recorded(self):
+        self.aggregator(self.make_stats(0.001))
+        histogram = self.aggregator.get_histogram("scan")
+        self.assertEqual(len(histogram), 1)
+        self.assertAlmostEqual(histogram.to_dict()["sum"], 1.0)
+
+    def test_unknown_phase_raises_exception(self):
+        with self.assertRaises(KeyError):
+            self.aggregator.get_histogram("unknown")
+
+    def test_histogram_percentiles(self):
+        histogram = pytinerary.LatencyHistogram((1.0, 10.0, math.inf))
+        for milliseconds in [0.5] * 90 + [5.0] * 9 + [50.0]:
+            histogram.record(milliseconds)
+        self.assertEqual(histogram.percentile(0.5), 1.0)
+        self.assertEqual(histogram.percentile(0.95), 10.0)
+        self.assertEqual(histogram.percentile(1.0), 50.0)
+
+    def test_unsorted_buckets_raise_exception(self):
+        with self.assertRaises(ValueError):
+            pytinerary.LatencyHistogram((10.0, 1.0))
+
+    def test_stats_to_dict(self):
+        stats = self.make_stats(0.001).to_dict()
+        self.assertEqual(stats["relaxations"], 4)
+        self.assertAlmostEqual(stats["total_time"], 0.001)
@@ -0,0 +1,285 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+import json
+
+
+class RaptorEngineTestCases(TestCase):
+    def setUp(self):
+        self.timetable = pytinerary.Timetable()
+        self.schema = pytinerary.TimetableSchema(
+            "uid", "dep_time", "arr_time", "location", "%Y-%m-%d %H:%M:%S", "locations"
+        )
+        with open("./tests/helper_files/timetable.json", encoding="utf-8") as data_file:
+            self.data = json.loads(data_file.read())
+        self.timetable.parse_list(self.data, self.schema)
+        self.locations = {
+            "A": pytinerary.Location("A", "Location A", 0),
+            "B": pytinerary.Location("B", "Location B", 0),
+            "C": pytinerary.Location("C", "Location C", 0),
+        }
+        self.engine = pytinerary.RaptorEngine(self.timetable, self.locations)
+
+    def make_change_engine(self, **kwargs):
+        connections = pytinerary.ConnectionList()
+        for uid, dep_time, arr_time, dep_loc, arr_loc in [
+            ("X", "00:00", "00:10", "A", "B"),
+            ("Y", "00:15", "00:20", "B", "C"),
+            ("Z", "00:01", "00:40", "A", "C"),
+        ]:
+            connections.append(
+                pytinerary.Connection(
+                    uid,
+                    f"2023-09-01 {dep_time}",
+                    f"2023-09-01 {arr_time}",
+                    dep_loc,
+                    arr_loc,
+                    "%Y-%m-%d %H:%M",
+                    {"mode": "rail" if uid == "Y" else "bus"},
+                )
+            )
+        return pytinerary.RaptorEngine(
+            pytinerary.Timetable(connections), self.locations, **kwargs
+        )
+
+    def test_correct_itinerary_returned(self):
+        route = self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual(
+            route,
+            [
+                pytinerary.Connection(
+                    "2",
+                    "2023-09-01 00:10:00",
+                    "2023-09-01 00:15:00",
+                    "A",
+                    "C",
+                    "%Y-%m-%d %H:%M:%S",
+                )
+            ],
+        )
+
+    def test_correct_itinerary_by_arrive_time_returned(self):
+        route = self.engine.generate_itinerary(
+            self.locations["B"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 30, 0),
+            arrive_by=True,
+        )
+        self.assertEqual([c.get_uid() for c in route], ["4"])
+
+    def test_impossible_journey_returns_empty_list(self):
+        route = self.engine.generate_itinerary(
+            self.locations["C"],
+            self.locations["A"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual(route, [])
+
+    def test_matches_itinerary_engine(self):
+        engine = pytinerary.ItineraryEngine(self.timetable, self.locations)
+        for origin, destination, planned_time, arrive_by in [
+            ("A", "C", datetime.datetime(2023, 9, 1, 0, 0, 0), False),
+            ("A", "C", datetime.datetime(2023, 9, 1, 0, 11, 0), False),
+            ("A", "B", datetime.datetime(2023, 9, 1, 0, 0, 0), False),
+            ("B", "C", datetime.datetime(2023, 9, 1, 0, 0, 0), False),
+            ("A", "C", datetime.datetime(2023, 9, 1, 0, 30, 0), True),
+            ("A", "B", datetime.datetime(2023, 9, 1, 0, 30, 0), True),
+        ]:
+            self.assertEqual(
+                self.engine.generate_itinerary(
+                    self.locations[origin],
+                    self.locations[destination],
+                    planned_time,
+                    arrive_by,
+                ),
+                engine.generate_itinerary(
+                    self.locations[origin],
+                    self.locations[destination],
+                    planned_time,
+                    arrive_by,
+                ),
+            )
+
+    def test_route_patterns_built(self):
+        self.assertEqual(self.engine.get_route_count(), 4)
+
+    def test_max_transfers(self):
+        for max_transfers, expected in [(0, ["Z"]), (1, ["X", "Y"])]:
+            engine = self.make_change_engine(max_transfers=max_transfers)
+            route = engine.generate_itinerary(
+                self.locations["A"],
+                self.locations["C"],
+                datetime.datetime(2023, 9, 1, 0, 0, 0),
+            )
+            self.assertEqual([c.get_uid() for c in route], expected)
+
+    def test_negative_max_transfers_raises_exception(self):
+        with self.assertRaises(ValueError):
+            pytinerary.RaptorEngine(self.timetable, self.locations, max_transfers=-1)
+
+    def test_minimum_connection_time_respected(self):
+        self.locations["B"] = pytinerary.Location("B", "Location B", 6)
+        engine = self.make_change_engine()
+        route = engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual([c.get_uid() for c in route], ["Z"])
+
+    def test_itinerary_ends_with_footpath(self):
+        locations = {**self.locations, "D": pytinerary.Location("D", "Location D", 0)}
+        transfers = pytinerary.TransferGraph.from_list([("C", "D", 120)])
+        engine = pytinerary.RaptorEngine(self.timetable, locations, transfers=transfers)
+        route = engine.generate_itinerary(
+            locations["A"], locations["D"], datetime.datetime(2023, 9, 1, 0, 0, 0)
+        )
+        self.assertEqual([c.get_uid() for c in route], ["2", None])
+        self.assertEqual(
+            route[-1],
+            pytinerary.Footpath(
+                "C",
+                "D",
+                datetime.datetime(2023, 9, 1, 0, 15, 0),
+                datetime.datetime(2023, 9, 1, 0, 17, 0),
+            ),
+        )
+
+    def test_arrive_by_itinerary_with_footpath(self):
+        locations = {**self.locations, "E": pytinerary.Location("E", "Location E", 0)}
+        transfers = pytinerary.TransferGraph.from_list([("E", "A", 60)])
+        engine = pytinerary.RaptorEngine(self.timetable, locations, transfers=transfers)
+        route = engine.generate_itinerary(
+            locations["E"],
+            locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 15, 0),
+            arrive_by=True,
+        )
+        self.assertEqual([c.get_uid() for c in route], [None, "2"])
+        self.assertEqual(route[0].get_dep_time(), datetime.datetime(2023, 9, 1, 0, 9, 0))
+
+    def test_query_filter(self):
+        engine = self.make_change_engine()
+        route = engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+            query_filter=pytinerary.QueryFilter(exclude_modes=["rail"]),
+        )
+        self.assertEqual([c.get_uid() for c in route], ["Z"])
+
+    def test_avoiding_origin_raises_exception(self):
+        with self.assertRaises(ValueError):
+            self.engine.generate_itinerary(
+                self.locations["A"],
+                self.locations["C"],
+                datetime.datetime(2023, 9, 1, 0, 0, 0),
+                query_filter=pytinerary.QueryFilter(avoid=["A"]),
+            )
+
+    def test_via_location(self):
+        route = self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+            via=[self.locations["B"]],
+        )
+        self.assertEqual([c.get_uid() for c in route], ["1", "1"])
+
+    def test_via_location_matches_itinerary_engine(self):
+        connections = pytinerary.ConnectionList()
+        for uid, dep_time, arr_time, dep_loc, arr_loc in [
+            ("T1", "09:00", "10:00", "A", "V"),
+            ("T1", "10:00", "10:25", "V", "B"),
+            ("T2", "09:30", "10:02", "A", "V"),
+            ("T3", "10:05", "10:30", "V", "B"),
+            ("T4", "10:20", "10:50", "V", "B"),
+        ]:
+            connections.append(
+                pytinerary.Connection(
+                    uid,
+                    f"2023-09-01 {dep_time}",
+                    f"2023-09-01 {arr_time}",
+                    dep_loc,
+                    arr_loc,
+                    "%Y-%m-%d %H:%M",
+                )
+            )
+        timetable = pytinerary.Timetable(connections)
+        locations = {
+            name: pytinerary.Location(name, f"Location {name}", 10) for name in "AVB"
+        }
+        raptor = pytinerary.RaptorEngine(timetable, locations)
+        engine = pytinerary.ItineraryEngine(timetable, locations)
+        for planned_time, arrive_by in [
+            (datetime.datetime(2023, 9, 1, 8, 0, 0), False),
+            (datetime.datetime(2023, 9, 1, 9, 10, 0), False),
+            (datetime.datetime(2023, 9, 1, 10, 25, 0), True),
+            (datetime.datetime(2023, 9, 1, 10, 35, 0), True),
+            (datetime.datetime(2023, 9, 1, 11, 0, 0), True),
+        ]:
+            route = raptor.generate_itinerary(
+                locations["A"],
+                locations["B"],
+                planned_time,
+                arrive_by,
+                via=[locations["V"]],
+            )
+            self.assertEqual(
+                route,
+                engine.generate_itinerary(
+                    locations["A"],
+                    locations["B"],
+                    planned_time,
+                    arrive_by,
+                    via=[locations["V"]],
+                ),
+            )
+        self.assertEqual([c.get_uid() for c in route], ["T2", "T4"])
+
+    def test_invalid_via_raises_exception(self):
+        with self.assertRaises(TypeError):
+            self.engine.generate_itinerary(
+                self.locations["A"],
+                self.locations["C"],
+                datetime.datetime(2023, 9, 1, 0, 0, 0),
+                via=["B"],
+            )
+
+    def test_invalid_origin_type_raises_exception(self):
+        with self.assertRaises(TypeError):
+            self.engine.generate_itinerary(
+                "A", self.locations["C"], datetime.datetime(2023, 9, 1, 0, 0, 0)
+            )
+
+    def test_non_existent_destination_raises_exception(self):
+        with self.assertRaises(ValueError):
+            self.engine.generate_itinerary(
+                self.locations["A"],
+                pytinerary.Location("D", "Location D", 0),
+                datetime.datetime(2023, 9, 1, 0, 0, 0),
+            )
+
+    def test_timetable_changes_picked_up(self):
+        self.timetable.get_connections().append(
+            pytinerary.Connection(
+                "5",
+                "2023-09-01 00:02:00",
+                "2023-09-01 00:04:00",
+                "A",
+                "C",
+                "%Y-%m-%d %H:%M:%S",
+            )
+        )
+        route = self.engine.generate_itinerary(
+            self.locations["A"],
+            self.locations["C"],
+            datetime.datetime(2023, 9, 1, 0, 0, 0),
+        )
+        self.assertEqual([c.get_uid() for c in route], ["5"])
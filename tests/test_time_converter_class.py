@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+import zoneinfo
+
+
+class TimeConverterTestCases(TestCase):
+    def test_naive_round_trip(self):
+        converter = pytinerary.TimeConverter()
+        value = datetime.datetime(2023, 9, 1, 12, 30)
+        self.assertEqual(converter.from_seconds(converter.to_seconds(value)), value)
+
+    def test_aware_converted_to_utc_without_timezone(self):
+        converter = pytinerary.TimeConverter()
+        value = datetime.datetime(
+            2023, 9, 1, 14, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=2))
+        )
+        self.assertEqual(
+            converter.to_seconds(value),
+            converter.to_seconds(datetime.datetime(2023, 9, 1, 12, 30)),
+        )
+
+    def test_timezone_handles_daylight_saving(self):
+        converter = pytinerary.TimeConverter(
+            timezone=zoneinfo.ZoneInfo("Europe/Warsaw")
+        )
+        before = converter.to_seconds(datetime.datetime(2023, 10, 29, 1, 0))
+        after = converter.to_seconds(datetime.datetime(2023, 10, 29, 4, 0))
+        self.assertEqual(after - before, 4 * 3600)
+        self.assertEqual(
+            converter.from_seconds(after), datetime.datetime(2023, 10, 29, 4, 0)
+        )
+
+    def test_timezone_converts_aware_times_exactly(self):
+        converter = pytinerary.TimeConverter(
+            timezone=zoneinfo.ZoneInfo("Europe/Warsaw")
+        )
+        self.assertEqual(
+            converter.to_seconds(
+                datetime.datetime(2023, 9, 1, 10, 0, tzinfo=datetime.timezone.utc)
+            ),
+            converter.to_seconds(datetime.datetime(2023, 9, 1, 12, 0)),
+        )
+
+    def test_aware_converter_returns_aware_datetimes(self):
+        value = datetime.datetime(2023, 9, 1, 10, 0, tzinfo=datetime.timezone.utc)
+        converter = pytinerary.TimeConverter(aware=True)
+        self.assertEqual(converter.from_seconds(converter.to_seconds(value)), value)
+        self.assertEqual(converter.from_seconds(0).tzinfo, datetime.timezone.utc)
+        warsaw = zoneinfo.ZoneInfo("Europe/Warsaw")
+        converter = pytinerary.TimeConverter(timezone=warsaw, aware=True)
+        self.assertEqual(
+            converter.from_seconds(converter.to_seconds(value)),
+            datetime.datetime(2023, 9, 1, 12, 0, tzinfo=warsaw),
+        )
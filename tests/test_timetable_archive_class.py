@@ -0,0 +1,137 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+import io
+import json
+import os
+import tempfile
+import zoneinfo
+
+
+class TimetableArchiveTestCases(TestCase):
+    def setUp(self):
+        self.timetable = pytinerary.Timetable()
+        self.schema = pytinerary.TimetableSchema(
+            "uid", "dep_time", "arr_time", "location", "%Y-%m-%d %H:%M:%S", "locations"
+        )
+        with open("./tests/helper_files/timetable.json", encoding="utf-8") as data_file:
+            self.data = json.loads(data_file.read())
+        self.timetable.parse_list(self.data, self.schema)
+
+    def archive(self, window: int = 86400) -> pytinerary.TimetableArchive:
+        buffer = io.BytesIO()
+        self.timetable.save_archive(buffer, window)
+        buffer.seek(0)
+        return pytinerary.TimetableArchive(buffer)
+
+    def test_save_and_load(self):
+        buffer = io.BytesIO()
+        self.timetable.save_archive(buffer)
+        buffer.seek(0)
+        loaded = pytinerary.Timetable.load_archive(buffer)
+        self.assertEqual(
+            sorted(map(str, loaded.get_connections())),
+            sorted(map(str, self.timetable.get_connections())),
+        )
+        self.assertEqual(
+            list(map(list, loaded.compile().get_columns())),
+            list(map(list, self.timetable.compile().get_columns())),
+        )
+
+    def test_save_and_load_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "timetable.pyta")
+            self.timetable.save_archive(path)
+            archive = pytinerary.TimetableArchive(path)
+            self.assertEqual(len(archive), 5)
+            self.assertEqual(len(archive.read()), 5)
+
+    def test_windows(self):
+        archive = self.archive(600)
+        self.assertEqual(archive.get_window(), 600)
+        self.assertEqual(
+            archive.get_windows(),
+            [
+                (
+                    datetime.datetime(2023, 9, 1, 0, 0),
+                    datetime.datetime(2023, 9, 1, 0, 10),
+                    2,
+                ),
+                (
+                    datetime.datetime(2023, 9, 1, 0, 10),
+                    datetime.datetime(2023, 9, 1, 0, 20),
+                    2,
+                ),
+                (
+                    datetime.datetime(2023, 9, 1, 0, 20),
+                    datetime.datetime(2023, 9, 1, 0, 30),
+                    1,
+                ),
+            ],
+        )
+
+    def test_read_time_range(self):
+        archive = self.archive(600)
+        compiled = archive.read(
+            datetime.datetime(2023, 9, 1, 0, 5), datetime.datetime(2023, 9, 1, 0, 22)
+        )
+        self.assertEqual(
+            [str(connection) for connection in compiled.get_connections()],
+            [
+                str(connection)
+                for connection in self.timetable.compile().get_connections()
+                if datetime.datetime(2023, 9, 1, 0, 5)
+                <= connection.get_dep_time()
+                < datetime.datetime(2023, 9, 1, 0, 22)
+            ],
+        )
+        self.assertEqual(len(compiled), 3)
+        # Interned positions are the same as in the whole timetable.
+        self.assertEqual(
+            compiled.get_stop_ids(), self.timetable.compile().get_stop_ids()
+        )
+        self.assertEqual(len(archive.read(datetime.datetime(2023, 9, 2))), 0)
+
+    def test_save_and_load_keeps_timezone(self):
+        timetable = pytinerary.Timetable(timezone=zoneinfo.ZoneInfo("Europe/Warsaw"))
+        timetable.parse_list(self.data, self.schema)
+        buffer = io.BytesIO()
+        timetable.save_archive(buffer)
+        buffer.seek(0)
+        loaded = pytinerary.Timetable.load_archive(buffer)
+        self.assertEqual(
+            loaded.get_converter().get_timezone(), zoneinfo.ZoneInfo("Europe/Warsaw")
+        )
+        self.assertEqual(
+            list(loaded.compile().get_columns()[0]),
+            list(timetable.compile().get_columns()[0]),
+        )
+
+    def test_engine_on_loaded_archive(self):
+        buffer = io.BytesIO()
+        self.timetable.save_archive(buffer)
+        buffer.seek(0)
+        loaded = pytinerary.Timetable.load_archive(buffer)
+        locations = {
+            location_id: pytinerary.Location(location_id, location_id, 0)
+            for location_id in ["A", "B", "C", "D"]
+        }
+        route = pytinerary.ItineraryEngine(loaded, locations).generate_itinerary(
+            locations["A"], locations["C"], datetime.datetime(2023, 9, 1)
+        )
+        self.assertEqual([connection.get_uid() for connection in route], ["2"])
+
+    def test_invalid_window_raises_exception(self):
+        with self.assertRaises(TypeError):
+            self.timetable.save_archive(io.BytesIO(), "day")
+        with self.assertRaises(ValueError):
+            self.timetable.save_archive(io.BytesIO(), 0)
+
+    def test_load_rejects_other_files(self):
+        buffer = io.BytesIO()
+        self.timetable.save(buffer)
+        buffer.seek(0)
+        with self.assertRaises(ValueError):
+            pytinerary.TimetableArchive(buffer)
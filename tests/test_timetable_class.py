@@ -2,7 +2,9 @@ from unittest import TestCase
 
 import pytinerary
 
+import datetime
 import json
+import pickle
 
 
 class TimetableTestCases(TestCase):
@@ -69,3 +71,126 @@ class TimetableTestCases(TestCase):
         second_timetable = pytinerary.Timetable(connection_list)
         stats = second_timetable.stats()
         self.assertEqual(stats["connection_list_length"], 5)
+
+    def test_deep_statistics_returned(self):
+        stats = self.timetable.stats(deep=True)
+        self.assertEqual(stats["connection_list_length"], 5)
+        self.assertEqual(stats["connections_per_day"], {"2023-09-01": 5})
+        memory = stats["memory"]
+        self.assertEqual(stats["timetable_memory_size"], sum(memory.values()))
+        self.assertGreater(memory["datetimes"], 0)
+        self.assertGreater(memory["strings"], 0)
+        self.assertAlmostEqual(
+            stats["bytes_per_connection"]["datetimes"], memory["datetimes"] / 5
+        )
+
+    def test_deep_statistics_count_caches(self):
+        before = self.timetable.stats(deep=True)["memory"]["caches"]
+        self.timetable.get_service("1")
+        self.timetable.compile()
+        compiled = self.timetable.stats(deep=True)["memory"]["caches"]
+        self.assertGreater(compiled, before)
+        self.assertGreaterEqual(
+            compiled - before, self.timetable.compile().get_memory_size()
+        )
+        self.timetable.departures("A", datetime.datetime(2023, 9, 1))
+        boards = self.timetable.stats(deep=True)["memory"]["caches"]
+        self.assertGreater(boards, compiled)
+
+    def test_deep_statistics_grow_with_timetable(self):
+        small = self.timetable.stats(deep=True)["timetable_memory_size"]
+        self.timetable.parse_list(self.data, self.schema)
+        large = self.timetable.stats(deep=True)["timetable_memory_size"]
+        self.assertGreater(large, small)
+
+    def test_deep_statistics_of_empty_timetable(self):
+        stats = pytinerary.Timetable().stats(deep=True)
+        self.assertEqual(stats["connection_list_length"], 0)
+        self.assertEqual(stats["bytes_per_connection"]["total"], 0.0)
+
+    def test_get_service(self):
+        service = self.timetable.get_service("1")
+        self.assertEqual([c.get_arr_loc() for c in service], ["B", "C"])
+
+    def test_remove_service(self):
+        self.assertEqual(self.timetable.remove_service("1"), 2)
+        self.assertEqual(self.timetable.stats()["connection_list_length"], 3)
+        self.assertEqual(self.timetable.get_service("1"), [])
+
+    def test_departures(self):
+        departures = self.timetable.departures(
+            "A", datetime.datetime(2023, 9, 1, 0, 5, 0), 2
+        )
+        self.assertEqual([c.get_uid() for c in departures], ["3", "2"])
+
+    def test_departures_after_last(self):
+        departures = self.timetable.departures(
+            "A", datetime.datetime(2023, 9, 1, 1, 0, 0)
+        )
+        self.assertEqual(departures, [])
+
+    def test_departures_unknown_location(self):
+        departures = self.timetable.departures(
+            "Z", datetime.datetime(2023, 9, 1, 0, 0, 0)
+        )
+        self.assertEqual(departures, [])
+
+    def test_arrivals(self):
+        arrivals = self.timetable.arrivals("C", datetime.datetime(2023, 9, 1, 0, 0, 0))
+        self.assertEqual([c.get_uid() for c in arrivals], ["2", "1", "4"])
+
+    def test_departures_follow_timetable_changes(self):
+        self.timetable.departures("B", datetime.datetime(2023, 9, 1, 0, 0, 0))
+        self.timetable.remove_service("4")
+        departures = self.timetable.departures(
+            "B", datetime.datetime(2023, 9, 1, 0, 0, 0)
+        )
+        self.assertEqual([c.get_uid() for c in departures], ["1"])
+
+    def test_departures_invalid_time_raises_exception(self):
+        with self.assertRaises(TypeError):
+            self.timetable.departures("A", "2023-09-01 00:00:00")  # type: ignore
+
+    def test_snapshot_shared_until_timetable_changes(self):
+        snapshot = self.timetable.snapshot()
+        self.assertIs(self.timetable.snapshot(), snapshot)
+        self.assertIs(self.timetable.compile(), snapshot.compile())
+        length = len(snapshot.compile())
+        self.timetable.remove_service("4")
+        self.assertIsNot(self.timetable.snapshot(), snapshot)
+        self.assertEqual(len(snapshot.compile()), length)
+        self.assertEqual(len(self.timetable.compile()), length - 1)
+        self.assertEqual(len(snapshot.get_connections()), length)
+
+    def test_pickle_keeps_compiled_timetable(self):
+        self.timetable.compile()
+        loaded = pickle.loads(pickle.dumps(self.timetable, protocol=5))
+        self.assertTrue(loaded.snapshot().is_compiled())
+        self.assertEqual(
+            loaded.compile().get_fingerprint(), self.timetable.compile().get_fingerprint()
+        )
+        self.assertEqual(
+            list(loaded.get_connections()), list(self.timetable.get_connections())
+        )
+        self.assertEqual(
+            [c.get_uid() for c in loaded.departures("A", datetime.datetime(2023, 9, 1))],
+            ["1", "3", "2"],
+        )
+        loaded.remove_service("4")
+        self.assertEqual(len(loaded.compile()), 4)
+        self.assertEqual(len(self.timetable.compile()), 5)
+
+    def test_identifiers_interned(self):
+        connections = self.timetable.get_connections()
+        # Connections 0 and 2 both depart from A, 0 and 1 belong to service 1.
+        self.assertIs(connections[0].get_dep_loc(), connections[2].get_dep_loc())
+        self.assertIs(connections[0].get_uid(), connections[1].get_uid())
+        self.assertIs(connections[0].get_arr_loc(), connections[1].get_dep_loc())
+        self.assertEqual(self.timetable.get_identifier_count(), 7)
+        identifier_id = self.timetable.get_identifier_id("B")
+        self.assertEqual(self.timetable.get_identifier(identifier_id), "B")
+        self.assertEqual(self.timetable.get_identifier_id("Z"), -1)
+        with self.assertRaises(IndexError):
+            self.timetable.get_identifier(-1)
+        loaded = pickle.loads(pickle.dumps(self.timetable))
+        self.assertEqual(loaded.get_identifier_id("B"), identifier_id)
@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+import pytinerary
+
+import io
+
+
+class TransferGraphTestCases(TestCase):
+    def setUp(self):
+        self.graph = pytinerary.TransferGraph.from_list(
+            [("A", "B", 60), ("B", "C", 120), ("C", "C", 300)]
+        )
+        self.table = self.graph.compile(["A", "B", "C", "D"])
+
+    def test_transitive_footpath_added(self):
+        self.assertEqual(self.table.get_transfer_time("A", "C"), 180)
+
+    def test_get_transfers_returns_footpaths_as_added(self):
+        self.assertEqual(
+            sorted(self.graph.get_transfers()), [("A", "B", 60), ("B", "C", 120)]
+        )
+
+    def test_footpaths_sorted_by_duration(self):
+        self.assertEqual(self.table.get_footpaths("A"), [("B", 60), ("C", 180)])
+
+    def test_footpaths_are_directed(self):
+        self.assertIsNone(self.table.get_transfer_time("B", "A"))
+
+    def test_reverse_arrays(self):
+        offsets, sources, durations = self.table.get_reverse_arrays()
+        c = self.table.get_location_index("C")
+        self.assertEqual(
+            sorted(zip(sources[offsets[c] : offsets[c + 1]], durations[offsets[c] : offsets[c + 1]])),
+            [(0, 180), (1, 120)],
+        )
+
+    def test_minimum_connection_time_stored(self):
+        self.assertEqual(self.table.get_transfer_time("C", "C"), 300)
+        self.assertIsNone(self.table.get_transfer_time("A", "A"))
+        self.assertEqual(list(self.table.get_min_times()), [-1, -1, 300, -1])
+
+    def test_shorter_transfer_kept(self):
+        self.graph.add_transfer("A", "C", 100)
+        table = self.graph.compile(["A", "B", "C"])
+        self.assertEqual(table.get_transfer_time("A", "C"), 100)
+
+    def test_bidirectional_transfer(self):
+        graph = pytinerary.TransferGraph.from_list(
+            [{"from": "A", "to": "B", "duration": 30}], bidirectional=True
+        )
+        table = graph.compile(["A", "B"])
+        self.assertEqual(table.get_transfer_time("B", "A"), 30)
+
+    def test_max_duration_limits_closure(self):
+        graph = pytinerary.TransferGraph.from_list(
+            [("A", "B", 60), ("B", "C", 120)], max_duration=150
+        )
+        table = graph.compile(["A", "B", "C"])
+        self.assertIsNone(table.get_transfer_time("A", "C"))
+        self.assertEqual(table.get_transfer_time("B", "C"), 120)
+
+    def test_unknown_locations_ignored(self):
+        table = self.graph.compile(["A", "C"])
+        self.assertEqual(table.get_footpaths("A"), [("C", 180)])
+
+    def test_negative_duration_raises_exception(self):
+        with self.assertRaises(ValueError):
+            self.graph.add_transfer("A", "B", -1)
+
+    def test_missing_key_raises_exception(self):
+        with self.assertRaises(KeyError):
+            pytinerary.TransferGraph.from_list([{"from": "A", "to": "B"}])
+
+    def test_from_gtfs(self):
+        transfers_file = io.StringIO(
+            "from_stop_id,to_stop_id,transfer_type,min_transfer_time,from_trip_id\n"
+            "A,B,2,90,\n"
+            "B,B,2,240,\n"
+            "B,C,3,,\n"
+            "C,A,0,,\n"
+            "A,C,2,30,T1\n"
+        )
+        table = pytinerary.TransferGraph.from_gtfs(transfers_file).compile(
+            ["A", "B", "C"]
+        )
+        self.assertEqual(table.get_transfer_time("A", "B"), 90)
+        self.assertEqual(table.get_transfer_time("B", "B"), 240)
+        self.assertIsNone(table.get_transfer_time("B", "C"))
+        self.assertEqual(table.get_transfer_time("C", "A"), 0)
+        self.assertEqual(table.get_transfer_time("A", "C"), None)
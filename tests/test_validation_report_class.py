@@ -0,0 +1,138 @@
+from unittest import TestCase
+
+import pytinerary
+
+import datetime
+import pickle
+import zoneinfo
+
+
+class ValidationReportTestCases(TestCase):
+    def setUp(self):
+        datetime_format = "%Y-%m-%d %H:%M"
+        rows = [
+            ("1", "00:00", "00:10", "A", "B"),
+            # Leaves B before the previous connection of the trip arrives.
+            ("1", "00:05", "00:20", "B", "C"),
+            ("2", "00:00", "00:10", "A", "X"),
+            ("3", "00:00", "00:10", "A", "B"),
+            ("3", "00:00", "00:10", "A", "B"),
+            # Picked up at P and Q, so both connections arrive together.
+            ("4", "00:00", "00:10", "P", "C"),
+            ("4", "00:05", "00:10", "Q", "C"),
+            ("4", "00:11", "00:20", "C", "A"),
+        ]
+        self.timetable = pytinerary.Timetable(
+            pytinerary.ConnectionList(
+                [
+                    pytinerary.Connection(
+                        uid,
+                        f"2023-09-01 {dep_time}",
+                        f"2023-09-01 {arr_time}",
+                        dep_loc,
+                        arr_loc,
+                        datetime_format,
+                    )
+                    for uid, dep_time, arr_time, dep_loc, arr_loc in rows
+                ]
+            )
+        )
+        self.locations = {
+            location_id: pytinerary.Location(location_id, location_id, 0)
+            for location_id in ["A", "B", "C", "P", "Q"]
+        }
+
+    def test_issues_reported_in_list_order(self):
+        report = self.timetable.validate(self.locations)
+        self.assertFalse(report.is_valid())
+        self.assertEqual(report.get_checked(), 8)
+        self.assertEqual(report.get_removed(), 0)
+        self.assertEqual(
+            [(issue.get_check(), issue.get_position()) for issue in report],
+            [
+                (pytinerary.NON_MONOTONIC, 1),
+                (pytinerary.UNKNOWN_STOP, 2),
+                (pytinerary.DUPLICATE, 4),
+            ],
+        )
+        self.assertEqual(
+            report.get_counts(),
+            {
+                pytinerary.NON_MONOTONIC: 1,
+                pytinerary.UNKNOWN_STOP: 1,
+                pytinerary.DUPLICATE: 1,
+            },
+        )
+        issue = report.get_issues(pytinerary.UNKNOWN_STOP)[0]
+        self.assertEqual(issue.get_uid(), "2")
+        self.assertEqual(issue.get_arr_loc(), "X")
+        self.assertEqual(issue.get_dep_time(), datetime.datetime(2023, 9, 1, 0, 0))
+        self.assertEqual(report.to_dict()["issues"][0]["check"], "non_monotonic")
+
+    def test_locations_not_checked_without_locations(self):
+        report = self.timetable.validate()
+        self.assertEqual(report.get_issues(pytinerary.UNKNOWN_STOP), [])
+        self.assertEqual(len(report), 2)
+
+    def test_quarantine_removes_connections(self):
+        report = self.timetable.validate(self.locations, quarantine=True)
+        self.assertEqual(report.get_removed(), 3)
+        self.assertEqual(len(self.timetable.get_connections()), 5)
+        self.assertEqual(len(self.timetable.get_service("3")), 1)
+        self.assertTrue(self.timetable.validate(self.locations).is_valid())
+
+    def test_pickled_timetable_validated(self):
+        self.timetable.compile()
+        loaded = pickle.loads(pickle.dumps(self.timetable))
+        report = loaded.validate(self.locations, quarantine=True)
+        self.assertEqual(len(report), 3)
+        self.assertEqual(len(loaded.get_connections()), 5)
+
+    def test_non_positive_duration_across_clock_change(self):
+        # 02:50 after the clocks go back is an hour after 02:55 before.
+        timetable = pytinerary.Timetable(
+            pytinerary.ConnectionList(
+                [
+                    pytinerary.Connection(
+                        "1",
+                        datetime.datetime(2023, 10, 29, 2, 50, fold=1),
+                        datetime.datetime(2023, 10, 29, 2, 55),
+                        "A",
+                        "B",
+                    )
+                ]
+            ),
+            timezone=zoneinfo.ZoneInfo("Europe/Warsaw"),
+        )
+        report = timetable.validate()
+        self.assertEqual(report.get_counts(), {pytinerary.NON_POSITIVE_DURATION: 1})
+
+    def test_parse_list_quarantine(self):
+        schema = pytinerary.TimetableSchema(
+            "uid", "dep_time", "arr_time", "location", "%Y-%m-%d %H:%M", "locations"
+        )
+        data = [
+            {
+                "uid": "1",
+                "locations": [
+                    {"dep_time": "2023-09-01 00:10", "location": "A"},
+                    {
+                        "arr_time": "2023-09-01 00:05",
+                        "dep_time": "2023-09-01 00:06",
+                        "location": "B",
+                    },
+                    {"arr_time": "2023-09-01 00:20", "location": "C"},
+                ],
+            }
+        ]
+        with self.assertRaises(ValueError):
+            pytinerary.Timetable().parse_list(data, schema)
+        timetable = pytinerary.Timetable()
+        report = timetable.parse_list(data, schema, quarantine=True)
+        self.assertEqual(len(timetable.get_connections()), 1)
+        self.assertEqual(report.get_checked(), 2)
+        self.assertEqual(report.get_removed(), 1)
+        issue = report.get_issues()[0]
+        self.assertEqual(issue.get_check(), pytinerary.INVALID_ROW)
+        self.assertEqual(issue.get_position(), -1)
+        self.assertEqual(issue.get_arr_time(), "2023-09-01 00:05")